@@ -0,0 +1,325 @@
+"""
+End-to-end benchmark and load test of the agent server.
+
+Starts the real server (uvicorn, ``--workers`` processes) with the scripted
+model from fakes.py and a fake Linkup API, then drives ``--clinicians``
+simulated clinicians concurrently. Each runs ``--sessions`` patient sessions
+of three turns:
+
+1. dictation over ``/run_sse`` with token streaming -> soap_draft
+2. "find illustrations" over ``/run_sse`` -> tool fan-out -> exercise_selection
+3. image selection over ``/run`` -> final_report (assembled by the server)
+
+Reports p50/p95/p99 latency per turn, time to first byte on ``/run_sse``, tool
+fan-out time and throughput as JSON (stdout, or ``--output``) so builds can be
+compared. Run from the backend directory:
+
+    python benchmarks/bench_e2e.py --clinicians 8 --sessions 3 --output e2e.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+BENCH_DIR = Path(__file__).parent
+BACKEND_DIR = BENCH_DIR.parent
+
+sys.path.insert(0, str(BENCH_DIR))
+
+from fakes import ILLUSTRATION_REQUEST, create_fake_linkup_app
+
+EXERCISE_POOL = [
+    "Cat-cow exercises", "Bridge exercises", "Bird dog", "Clamshells", "Dead bug",
+    "Knee to chest stretch", "Pelvic tilts", "Side plank", "Wall sits", "Heel slides",
+    "Seated Banded L Ankle Dorsiflexion", "Calf raises", "Straight leg raise",
+    "Hamstring stretch", "Piriformis stretch", "Chin tucks", "Scapular squeezes",
+    "Thoracic extension over foam roller", "Monster walks", "Step ups",
+]
+
+DICTATION = (
+    "Patient is a 45 year old with lower back pain, 7/10, for 3 days. Limited flexion, positive SLR "
+    "on the left. Treated with manual therapy and gave her home exercises. Exercises: {exercises}"
+)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentiles(samples: List[float]) -> Dict[str, Optional[float]]:
+    """Summarize samples (seconds) as count, mean and nearest-rank percentiles in milliseconds."""
+    if not samples:
+        return {"count": 0, "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None, "max_ms": None}
+    ordered = sorted(samples)
+
+    def rank(p: float) -> float:
+        return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": sum(ordered) / len(ordered) * 1000,
+        "p50_ms": rank(50),
+        "p95_ms": rank(95),
+        "p99_ms": rank(99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def start_fake_linkup(args: argparse.Namespace) -> str:
+    """Serve the fake Linkup API on a background thread and return its base URL."""
+    import uvicorn
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    app = create_fake_linkup_app(
+        latency=args.linkup_latency,
+        jitter=args.linkup_jitter,
+        images_per_exercise=args.images_per_exercise,
+        base_url=base_url,
+        seed=args.seed,
+        error_rate=args.linkup_error_rate,
+        stall_rate=args.linkup_stall_rate,
+        stall_seconds=args.linkup_stall_seconds,
+    )
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, name="fake-linkup", daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return base_url
+
+
+def start_server(args: argparse.Namespace, linkup_url: str, workdir: Path, events_file: Path) -> "tuple[subprocess.Popen, str]":
+    """Start the agent server with the scripted model and return it with its URL."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join([str(BACKEND_DIR / "src"), str(BENCH_DIR)]),
+        "MODEL_GEMINI_2_0_FLASH": "bench-scripted",
+        "LINKUP_API_KEY": "bench",
+        "LINKUP_BASE_URL": linkup_url,
+        "MOTION_CACHE_DIR": str(workdir / "cache"),
+        "MOTION_IMAGE_PROXY": "1" if args.image_proxy else "0",
+        # The fake image host is local, which the proxy otherwise refuses
+        "MOTION_IMAGE_ALLOWED_HOSTS": "127.0.0.1",
+        "MOTION_PUBLIC_BASE_URL": url,
+        "BENCH_EVENTS_FILE": str(events_file),
+        "BENCH_LLM_FIRST_TOKEN_SECONDS": str(args.llm_first_token),
+        "BENCH_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+    }
+    if args.workers > 1:
+        env["MOTION_SESSION_STORE"] = f"sqlite:///{workdir / 'sessions.sqlite3'}"
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "fakes:create_bench_app", "--factory",
+            "--host", "127.0.0.1", "--port", str(port), "--workers", str(args.workers),
+            "--log-level", "warning",
+        ],
+        cwd=str(BACKEND_DIR),
+        env=env,
+    )
+    return process, url
+
+
+async def wait_healthy(client: Any, url: str, process: subprocess.Popen, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if (await client.get(f"{url}/healthz")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server did not become healthy within {timeout:g}s")
+
+
+def _run_body(user_id: str, session_id: str, text: str, streaming: bool = False) -> Dict[str, Any]:
+    return {
+        "app_name": "soap_agents",
+        "user_id": user_id,
+        "session_id": session_id,
+        "new_message": {"role": "user", "parts": [{"text": text}]},
+        "streaming": streaming,
+    }
+
+
+async def _sse_turn(client: Any, url: str, body: Dict[str, Any]) -> "tuple[float, float, Optional[Dict[str, Any]]]":
+    """Run one /run_sse turn; return (ttfb, total, last complete structured message)."""
+    started = time.monotonic()
+    ttfb = None
+    last: Optional[Dict[str, Any]] = None
+    async with client.stream("POST", f"{url}/run_sse", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if ttfb is None:
+                ttfb = time.monotonic() - started
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if event.get("partial"):
+                continue
+            for part in (event.get("content") or {}).get("parts") or []:
+                if part.get("text", "").startswith("{"):
+                    last = json.loads(part["text"])
+    return ttfb or 0.0, time.monotonic() - started, last
+
+
+async def clinician(client: Any, url: str, index: int, args: argparse.Namespace, results: Dict[str, List[float]]) -> None:
+    rng = random.Random(args.seed * 1000 + index)
+    user_id = f"clinician-{index}"
+    for session in range(args.sessions):
+        session_id = f"bench-{index}-{session}"
+        try:
+            response = await client.post(f"{url}/apps/soap_agents/users/{user_id}/sessions/{session_id}", json={})
+            response.raise_for_status()
+
+            exercises = rng.sample(EXERCISE_POOL, args.exercises)
+            text = DICTATION.format(exercises=json.dumps(exercises))
+            ttfb, total, message = await _sse_turn(client, url, _run_body(user_id, session_id, text, streaming=True))
+            if not message or message.get("type") != "soap_draft":
+                raise RuntimeError(f"expected soap_draft, got {message and message.get('type')}")
+            results["ttfb_run_sse"].append(ttfb)
+            results["turn_draft"].append(total)
+            await asyncio.sleep(args.think_time)
+
+            _, total, message = await _sse_turn(client, url, _run_body(user_id, session_id, ILLUSTRATION_REQUEST))
+            if not message or message.get("type") != "exercise_selection":
+                raise RuntimeError(f"expected exercise_selection, got {message and message.get('type')}")
+            results["turn_selection"].append(total)
+            await asyncio.sleep(args.think_time)
+
+            selected = [exercise["images"][0]["id"] for exercise in message["exercises"] if exercise["images"]]
+            selection = json.dumps({"selected_image_ids": selected, "message_type": "image_selection"})
+            started = time.monotonic()
+            response = await client.post(f"{url}/run", json=_run_body(user_id, session_id, selection))
+            response.raise_for_status()
+            final = json.loads(response.json()[-1]["content"]["parts"][0]["text"])
+            if final.get("type") != "final_report":
+                raise RuntimeError(f"expected final_report, got {final.get('type')}")
+            results["turn_final"].append(time.monotonic() - started)
+            results["sessions"].append(1.0)
+        except Exception as e:
+            results["errors"].append(1.0)
+            print(f"clinician {index} session {session}: {e}", file=sys.stderr)
+
+
+async def run_load(url: str, process: subprocess.Popen, args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+
+    results: Dict[str, List[float]] = {
+        key: [] for key in ("ttfb_run_sse", "turn_draft", "turn_selection", "turn_final", "sessions", "errors")
+    }
+    limits = httpx.Limits(max_connections=args.clinicians * 2)
+    async with httpx.AsyncClient(timeout=args.request_timeout, limits=limits) as client:
+        await wait_healthy(client, url, process, args.startup_timeout)
+        started = time.monotonic()
+        await asyncio.gather(*(clinician(client, url, i, args, results) for i in range(args.clinicians)))
+        wall = time.monotonic() - started
+    return {"results": results, "wall_seconds": wall}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=str(BACKEND_DIR), capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the agent server")
+    parser.add_argument("--clinicians", type=int, default=4, help="Concurrent simulated clinicians")
+    parser.add_argument("--sessions", type=int, default=3, help="Patient sessions per clinician")
+    parser.add_argument("--workers", type=int, default=1, help="Server worker processes")
+    parser.add_argument("--exercises", type=int, default=6, help="Exercises per SOAP draft")
+    parser.add_argument("--images-per-exercise", type=int, default=5)
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Model seconds to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--linkup-latency", type=float, default=0.8, help="Mean Linkup search seconds")
+    parser.add_argument("--linkup-jitter", type=float, default=0.2)
+    parser.add_argument("--linkup-error-rate", type=float, default=0.0, help="Fraction of searches answering 503")
+    parser.add_argument("--linkup-stall-rate", type=float, default=0.0, help="Fraction of searches that stall")
+    parser.add_argument("--linkup-stall-seconds", type=float, default=30.0, help="Delay of a stalled search")
+    parser.add_argument("--image-proxy", action="store_true", help="Run the image proxy against the fake image host")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Seconds a clinician waits between turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="motion-bench-") as tmp:
+        workdir = Path(tmp)
+        events_file = workdir / "events.jsonl"
+        linkup_url = start_fake_linkup(args)
+        process, url = start_server(args, linkup_url, workdir, events_file)
+        try:
+            outcome = asyncio.run(run_load(url, process, args))
+        finally:
+            process.terminate()
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        events = [json.loads(line) for line in events_file.read_text().splitlines()] if events_file.exists() else []
+
+    results = outcome["results"]
+    wall = outcome["wall_seconds"]
+    turns = len(results["turn_draft"]) + len(results["turn_selection"]) + len(results["turn_final"])
+    report = {
+        "benchmark": "e2e",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "wall_seconds": wall,
+        "throughput": {
+            "sessions_per_second": len(results["sessions"]) / wall if wall else None,
+            "turns_per_second": turns / wall if wall else None,
+            "completed_sessions": len(results["sessions"]),
+            "errors": len(results["errors"]),
+        },
+        "latency": {
+            "turn_draft": percentiles(results["turn_draft"]),
+            "turn_selection": percentiles(results["turn_selection"]),
+            "turn_final": percentiles(results["turn_final"]),
+            "ttfb_run_sse": percentiles(results["ttfb_run_sse"]),
+            "tool_fanout": percentiles([e["seconds"] for e in events if e.get("kind") == "tool_fanout"]),
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n")
+    else:
+        print(text)
+    print(
+        f"{report['throughput']['completed_sessions']} sessions in {wall:.1f}s, "
+        f"{report['throughput']['errors']} errors; "
+        + ", ".join(
+            f"{name} p50={stats['p50_ms']:.0f}ms p95={stats['p95_ms']:.0f}ms"
+            for name, stats in report["latency"].items() if stats["count"]
+        ),
+        file=sys.stderr,
+    )
+    return 1 if results["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+"""
+Micro-benchmarks for structured message creation and serialization.
+
+Run from the backend directory:
+
+    python benchmarks/bench_message_types.py
+    python benchmarks/bench_message_types.py --json > message_types.json
+
+Payload sizes mirror real reports: a full SOAP draft with six exercises and an
+exercise selection with five candidate images per exercise.
+"""
+
+import argparse
+import json
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from motion.agents.soap_agents.message_types import (
+    SoapDraftMessage,
+    create_exercise_selection_message,
+    create_exercise_with_images,
+    create_soap_draft_message,
+)
+from motion.serialization import JSON_BACKEND
+
+
+EXERCISES = [
+    ("Cat-cow exercises", "10 repetitions, 3 times daily, move slowly through the full range"),
+    ("Bridge exercises", "Hold for 10 seconds, 10 repetitions, 2 times daily"),
+    ("Seated Banded L Ankle Dorsiflexion", "Red band, 3 sets of 15, once daily"),
+    ("Clamshells", "Side lying, 3 sets of 12 each side, daily"),
+    ("Bird dog", "Alternate sides, 10 repetitions, hold 5 seconds"),
+    ("Knee to chest stretch", "Hold 30 seconds, 3 repetitions each side, twice daily"),
+]
+
+SOAP_REPORT = {
+    "patient_name": "Jane Doe",
+    "patient_age": "45",
+    "condition": "Lower back pain",
+    "session_date": "2024-01-15",
+    "subjective": (
+        "Patient reports lower back pain, 7/10 intensity, duration 3 days. Pain worsens with "
+        "prolonged sitting and forward bending, eases when walking. Reports disturbed sleep "
+        "and difficulty putting on socks. No bladder or bowel changes, no saddle anaesthesia. "
+    ) * 3,
+    "objective": (
+        "Limited lumbar flexion (50% normal range), positive straight leg raise test at 60 "
+        "degrees on the left, tender L4-L5 region, reduced hip abduction strength 4/5. "
+    ) * 3,
+    "assessment": (
+        "Acute lumbar strain with possible disc involvement. Functional limitations in ADLs "
+        "including dressing and prolonged sitting at work. "
+    ) * 2,
+    "plan": (
+        "Continue manual therapy, home exercise programme, postural education and graded "
+        "return to activity. Review in 1 week. "
+    ) * 2,
+    "exercises": [{"name": name, "description": description} for name, description in EXERCISES],
+}
+
+SELECTION_EXERCISES = [
+    create_exercise_with_images(
+        f"exercise_{i + 1}",
+        name,
+        description,
+        [
+            {
+                "type": "image",
+                "name": f"{name} demonstration {n + 1}",
+                "url": f"https://images.example.com/exercises/{i}/{n}/full-size-illustration.jpg",
+            }
+            for n in range(5)
+        ],
+    )
+    for i, (name, description) in enumerate(EXERCISES)
+]
+
+CASES = {
+    "create_soap_draft_message": lambda: create_soap_draft_message(SOAP_REPORT),
+    "create_exercise_selection_message": lambda: create_exercise_selection_message(SELECTION_EXERCISES),
+    "SoapDraftMessage.to_bytes": lambda: SoapDraftMessage(SOAP_REPORT).to_bytes(),
+    "SoapDraftMessage.to_json(pretty)": lambda: SoapDraftMessage(SOAP_REPORT).to_json(pretty=True),
+}
+
+
+def run(repeat: int, number: int) -> dict:
+    results = {}
+    for name, case in CASES.items():
+        best = min(timeit.repeat(case, repeat=repeat, number=number)) / number
+        payload = case()
+        results[name] = {
+            "us_per_call": best * 1e6,
+            "payload_bytes": len(payload if isinstance(payload, bytes) else payload.encode()),
+        }
+    return {"json_backend": JSON_BACKEND, "repeat": repeat, "number": number, "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--number", type=int, default=2000)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    report = run(args.repeat, args.number)
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"JSON backend: {report['json_backend']}")
+    for name, result in report["results"].items():
+        print(f"  {name:<36} {result['us_per_call']:8.2f} us/call  {result['payload_bytes']:6d} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""
+Deterministic stand-ins for the model and Linkup, used by bench_e2e.py.
+
+ScriptedLlm is registered with ADK's model registry under ``bench-*`` model
+names, so the real agent (prompts, router, callbacks, tools) runs unchanged
+with ``MODEL_GEMINI_2_0_FLASH=bench-scripted``. It replays a clinician's
+session:
+
+- a dictation turn produces a realistic soap_draft,
+- a follow-up asking for illustrations produces one call to
+  search_exercise_illustrations_batch, and the tool result an
+  exercise_selection,
+- anything else produces a short chat_message,
+
+streamed at ``BENCH_LLM_TOKENS_PER_SECOND`` after ``BENCH_LLM_FIRST_TOKEN_SECONDS``.
+The time between emitting the tool call and receiving its result is appended to
+``BENCH_EVENTS_FILE`` as the tool fan-out time.
+
+create_fake_linkup_app() serves ``POST /search`` with ``latency`` seconds of
+(seeded, jittered) delay and ``GET /img/{name}.png`` with a small distinct PNG
+per name, for runs with the image proxy enabled. Faults can be injected: a
+fraction of searches answer 503, and a fraction stall for ``stall_seconds``
+to exercise hedging, deadlines and the circuit breaker.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Any, AsyncGenerator, Dict, List
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_CHUNK = 8
+
+ILLUSTRATION_REQUEST = "Find illustrations for the exercises"
+
+# Monotonic time each tool call was emitted, by function call ID. Module-level:
+# ADK creates a new model instance for every request.
+_tool_calls: Dict[str, float] = {}
+
+
+def _draft(exercise_names: List[str]) -> Dict[str, Any]:
+    return {
+        "type": "soap_draft",
+        "timestamp": datetime.now().isoformat(),
+        "soap_report": {
+            "patient_name": None,
+            "patient_age": "45",
+            "condition": "Lower back pain",
+            "session_date": None,
+            "subjective": (
+                "Patient reports lower back pain, 7/10 intensity, duration 3 days. Pain worsens with "
+                "prolonged sitting and forward bending, eases when walking. Reports disturbed sleep. "
+            ) * 3,
+            "objective": (
+                "Limited lumbar flexion (50% normal range), positive straight leg raise test at 60 "
+                "degrees on the left, tender L4-L5 region, reduced hip abduction strength 4/5. "
+            ) * 2,
+            "assessment": "Acute lumbar strain with possible disc involvement. Functional limitations in ADLs. " * 2,
+            "plan": "Manual therapy, home exercise programme, postural education. Review in 1 week. " * 2,
+            "exercises": [
+                {"name": name, "description": "10 repetitions, 3 times daily, move slowly"}
+                for name in exercise_names
+            ],
+        },
+    }
+
+
+def _selection(batch: Dict[str, Any]) -> Dict[str, Any]:
+    exercises = []
+    for i, entry in enumerate(batch.get("exercises", [])):
+        exercises.append({
+            "id": f"exercise_{i + 1}",
+            "name": entry.get("exercise_name", ""),
+            "description": "10 repetitions, 3 times daily",
+            "images": [
+                {
+                    "id": f"img_exercise_{i + 1}_{j}",
+                    "url": result.get("url", ""),
+                    "thumbnail_url": result.get("thumbnail_url"),
+                    "name": result.get("name", ""),
+                    "selected": False,
+                }
+                for j, result in enumerate(entry.get("results", []))
+            ],
+        })
+    return {
+        "type": "exercise_selection",
+        "timestamp": datetime.now().isoformat(),
+        "exercises": exercises,
+        "requires_selection": True,
+    }
+
+
+def _chat() -> Dict[str, Any]:
+    return {
+        "type": "chat_message",
+        "timestamp": datetime.now().isoformat(),
+        "content": "For lower back pain, a combination of mobility work, core strengthening and graded activity "
+                   "usually helps. Cat-cow, bird dog and glute bridges are good starting points.",
+    }
+
+
+def _last_draft_exercises(contents: List[types.Content]) -> List[str]:
+    for content in reversed(contents):
+        for part in content.parts or []:
+            if content.role == "model" and part.text and part.text.startswith("{"):
+                try:
+                    message = json.loads(part.text)
+                except ValueError:
+                    continue
+                if message.get("type") == "soap_draft":
+                    return [exercise["name"] for exercise in message["soap_report"].get("exercises", [])]
+    return []
+
+
+def _record(event: Dict[str, Any]) -> None:
+    path = os.getenv("BENCH_EVENTS_FILE")
+    if path:
+        # One short O_APPEND write per line, safe across worker processes
+        with open(path, "a") as f:
+            f.write(json.dumps(event) + "\n")
+
+
+class ScriptedLlm(BaseLlm):
+    """Deterministic model replaying a clinician session at a configurable token rate."""
+
+    @classmethod
+    def supported_models(cls) -> List[str]:
+        return [r"bench-.*"]
+
+    async def generate_content_async(self, llm_request: Any, stream: bool = False) -> AsyncGenerator[LlmResponse, None]:
+        first_token = float(os.getenv("BENCH_LLM_FIRST_TOKEN_SECONDS", "0.3"))
+        tokens_per_second = float(os.getenv("BENCH_LLM_TOKENS_PER_SECOND", "80"))
+        await asyncio.sleep(first_token)
+
+        last = llm_request.contents[-1] if llm_request.contents else None
+        parts = last.parts or [] if last else []
+        response = next((part.function_response for part in parts if part.function_response), None)
+        text = "".join(part.text for part in parts if part.text)
+
+        if response is not None:
+            started = _tool_calls.pop(response.id or "", None)
+            if started is not None:
+                _record({"kind": "tool_fanout", "seconds": time.monotonic() - started})
+            reply = json.dumps(_selection(response.response or {}))
+        elif text.startswith(ILLUSTRATION_REQUEST):
+            names = _last_draft_exercises(llm_request.contents)
+            call_id = f"bench-{hashlib.sha1(f'{time.monotonic()}{names}'.encode()).hexdigest()[:12]}"
+            _tool_calls[call_id] = time.monotonic()
+            call = types.FunctionCall(id=call_id, name="search_exercise_illustrations_batch", args={"exercise_names": names})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(function_call=call)]))
+            return
+        elif text.startswith("Patient"):
+            reply = json.dumps(_draft(json.loads(text.split("Exercises: ", 1)[1])))
+        else:
+            reply = json.dumps(_chat())
+
+        chunk_chars = TOKENS_PER_CHUNK * CHARS_PER_TOKEN
+        if stream:
+            for start in range(0, len(reply), chunk_chars):
+                await asyncio.sleep(TOKENS_PER_CHUNK / tokens_per_second)
+                chunk = reply[start:start + chunk_chars]
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+        else:
+            await asyncio.sleep(len(reply) / CHARS_PER_TOKEN / tokens_per_second)
+        prompt_chars = sum(len(part.text or "") for content in llm_request.contents for part in content.parts or [])
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // CHARS_PER_TOKEN,
+            candidates_token_count=len(reply) // CHARS_PER_TOKEN,
+        )
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=reply)]),
+            usage_metadata=usage,
+            turn_complete=True,
+        )
+
+
+def create_bench_app() -> Any:
+    """uvicorn factory: the real agent server with ScriptedLlm registered."""
+    from google.adk.models.registry import LLMRegistry
+
+    from motion.api.app import create_app
+
+    LLMRegistry.register(ScriptedLlm)
+    return create_app()
+
+
+def _png(seed: str, size: int = 32) -> bytes:
+    """Grayscale noise PNG, distinct (and perceptually different) per seed."""
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + bytes(rng.randrange(256) for _ in range(size)) for _ in range(size))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", size, size, 8, 0, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b"")
+
+
+def create_fake_linkup_app(
+    latency: float,
+    jitter: float,
+    images_per_exercise: int,
+    base_url: str,
+    seed: int = 0,
+    error_rate: float = 0.0,
+    stall_rate: float = 0.0,
+    stall_seconds: float = 30.0,
+) -> Any:
+    """
+    Build the fake Linkup API.
+
+    Args:
+        latency: Mean seconds before a search responds.
+        jitter: Uniform +/- jitter in seconds around ``latency``.
+        images_per_exercise: Image results per search.
+        base_url: URL the fake server is reachable at, used in image URLs.
+        seed: Seed for the jitter and fault sequences.
+        error_rate: Fraction of searches answered with a 503 after the usual delay.
+        stall_rate: Fraction of searches delayed by ``stall_seconds`` instead.
+        stall_seconds: Delay of a stalled search.
+
+    ``app.state`` counts ``searches``, ``errors`` and ``stalls``; setting
+    ``app.state.error_rate`` or ``app.state.stall_rate`` changes them at runtime,
+    e.g. to take the fake down and bring it back.
+    """
+    from fastapi import FastAPI, Request, Response
+    from fastapi.responses import JSONResponse
+
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.searches = 0
+    app.state.errors = 0
+    app.state.stalls = 0
+    app.state.error_rate = error_rate
+    app.state.stall_rate = stall_rate
+
+    @app.post("/search")
+    async def search(request: Request) -> Any:
+        body = await request.json()
+        app.state.searches += 1
+        if rng.random() < app.state.stall_rate:
+            app.state.stalls += 1
+            await asyncio.sleep(stall_seconds)
+        else:
+            await asyncio.sleep(max(0.0, latency + rng.uniform(-jitter, jitter)))
+        if rng.random() < app.state.error_rate:
+            app.state.errors += 1
+            return JSONResponse({"error": "injected failure"}, status_code=503)
+        exercise = body.get("q", "").rsplit(" - ", 1)[-1]
+        slug = hashlib.sha1(exercise.lower().encode()).hexdigest()[:10]
+        return {
+            "results": [
+                {"type": "image", "name": f"{exercise} {j + 1}", "url": f"{base_url}/img/{slug}-{j}.png"}
+                for j in range(images_per_exercise)
+            ]
+        }
+
+    @app.get("/img/{name}.png")
+    async def image(name: str) -> Response:
+        return Response(_png(name), media_type="image/png")
+
+    return app
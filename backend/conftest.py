@@ -2,9 +2,11 @@
 Global pytest configuration and fixtures.
 """
 
+import asyncio
+import io
 import os
 import pytest
-from unittest.mock import Mock, patch
+from unittest.mock import AsyncMock, Mock, patch
 from typing import Dict, Any, List, Generator
 import json
 
@@ -59,10 +61,14 @@ def sample_exercise_search_results() -> List[Dict[str, Any]]:
 
 @pytest.fixture
 def mock_linkup_client():
-    """Mock LinkupClient for testing."""
-    with patch('motion.tools.exercise_illustration_tool.LinkupClient') as mock_client:
+    """Mock the shared Linkup client for testing."""
+    with patch('motion.tools.exercise_illustration_tool.get_linkup_client') as mock_get_client:
         mock_instance = Mock()
-        mock_client.return_value = mock_instance
+        mock_get_client.return_value = mock_instance
+        
+        # Searches are awaited; sync callers are routed through run_sync
+        mock_instance.search = AsyncMock()
+        mock_instance.run_sync.side_effect = lambda coro, timeout=None: asyncio.run(coro)
         
         # Default successful response
         mock_instance.search.return_value = {
@@ -81,7 +87,8 @@ def mock_linkup_client():
 @pytest.fixture
 def mock_agent():
     """Mock Google ADK Agent for testing."""
-    with patch('motion.agents.soap_agents.agent.Agent') as mock_agent_class:
+    with patch('google.adk.agents.Agent') as mock_agent_class, \
+            patch('motion.agents.soap_agents.agent._root_agent', None):
         mock_agent_instance = Mock()
         mock_agent_class.return_value = mock_agent_instance
         
@@ -147,4 +154,148 @@ def exercise_selection_json() -> str:
         ],
         "requires_selection": True,
         "timestamp": "2024-01-01T10:00:00Z"
-    })
\ No newline at end of file
+    })
+
+@pytest.fixture
+def scripted_agent(monkeypatch):
+    """
+    Replace the SOAP agent with one that answers every turn with queued replies.
+
+    Replies are message dictionaries (sent as JSON text), plain strings, ADK
+    events (sent as they are), exceptions (raised) or a list of those for a
+    turn that yields several events. When the queue is empty the agent answers
+    with a chat_message echoing the user.
+    """
+    from google.adk.agents import BaseAgent
+    from google.adk.events import Event
+    from google.genai import types
+
+    from motion.agents.soap_agents import agent as agent_module
+
+    class ScriptedAgent(BaseAgent):
+        replies: List[Any] = []
+
+        async def _run_async_impl(self, ctx):
+            user_text = "".join(part.text or "" for part in ctx.user_content.parts or [])
+            reply = self.replies.pop(0) if self.replies else {
+                "type": "chat_message",
+                "content": f"echo: {user_text}",
+                "timestamp": "2024-01-01T10:00:00Z",
+            }
+            for item in reply if isinstance(reply, list) else [reply]:
+                if isinstance(item, Exception):
+                    raise item
+                if isinstance(item, Event):
+                    yield item.model_copy(update={"author": self.name, "invocation_id": ctx.invocation_id})
+                    continue
+                text = item if isinstance(item, str) else json.dumps(item)
+                yield Event(
+                    author=self.name,
+                    invocation_id=ctx.invocation_id,
+                    content=types.Content(role="model", parts=[types.Part(text=text)]),
+                )
+
+    scripted = ScriptedAgent(name="soap_agent")
+    monkeypatch.setattr(agent_module, "get_root_agent", lambda: scripted)
+    return scripted
+
+
+@pytest.fixture
+def api_client(scripted_agent, monkeypatch, tmp_path):
+    """TestClient for the agent server, backed by the scripted agent and in-memory sessions."""
+    from fastapi.testclient import TestClient
+
+    from motion.api.app import create_app
+
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.delenv("MOTION_SESSION_STORE", raising=False)
+    monkeypatch.delenv("MOTION_SESSION_DB_URL", raising=False)
+
+    with TestClient(create_app()) as client:
+        yield client
+
+
+# The address public_resolver() answers with for hosts it was not told about
+PUBLIC_ADDRESS = "93.184.216.34"
+
+
+class StandIn:
+    """
+    Local HTTP stand-in: serves canned responses by URL and records requests.
+
+    Requests are matched by the URL they ask for (host from the Host header);
+    the address they actually connected to is recorded in ``connections``.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []
+        self.connections = []
+        self.extensions = []
+
+    def __call__(self, request):
+        import httpx
+
+        url = f"{request.url.scheme}://{request.headers['host']}{request.url.raw_path.decode()}"
+        self.requests.append(url)
+        self.connections.append(request.url.host)
+        self.extensions.append(request.extensions)
+        route = self.routes.get(url)
+        if route is None:
+            return httpx.Response(404)
+        if callable(route):
+            return route(request)
+        return route
+
+
+@pytest.fixture
+def picture():
+    """Make a gradient picture, distinctive enough for perceptual hashing."""
+    from PIL import Image
+
+    def make(size=(400, 300), fmt="PNG", shade=0):
+        image = Image.new("RGB", size)
+        image.putdata([((x * 255 // size[0] + shade) % 256, (y * 255 // size[1]) % 256, 90)
+                       for y in range(size[1]) for x in range(size[0])])
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt)
+        return buffer.getvalue()
+
+    return make
+
+
+@pytest.fixture
+def public_resolver():
+    """Make a resolver answering from ``addresses`` by host, and with a public address otherwise."""
+    def make(addresses=None):
+        async def resolve(host, port):
+            return (addresses or {}).get(host, [PUBLIC_ADDRESS])
+
+        return resolve
+
+    return make
+
+
+@pytest.fixture
+def make_proxy(tmp_path, public_resolver):
+    """Make image proxies that fetch from a StandIn serving ``routes``; returns ``(proxy, server)``."""
+    import httpx
+
+    from motion.tools.image_proxy import ImageProxy
+
+    proxies = []
+
+    def make(routes, resolver=None, **kwargs):
+        server = StandIn(routes)
+        proxy = ImageProxy(
+            tmp_path / "images",
+            transport=httpx.MockTransport(server),
+            resolver=resolver or public_resolver(),
+            **kwargs,
+        )
+        proxies.append(proxy)
+        return proxy, server
+
+    yield make
+    for proxy in proxies:
+        proxy.close()
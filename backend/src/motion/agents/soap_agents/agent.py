@@ -1,17 +1,71 @@
 import os
-from dotenv import load_dotenv
+import threading
+from typing import TYPE_CHECKING, Any, Optional
 
-from google.adk.agents import Agent
 
-from motion.agents.soap_agents.prompts import INSTRUCTION
-from motion.tools.exercise_illustration_tool import search_exercise_illustrations
+if TYPE_CHECKING:
+    from google.adk.agents import Agent
 
-load_dotenv()
 
-root_agent = Agent(
-    name="soap_agent",
-    model= os.environ['MODEL_GEMINI_2_0_FLASH'],
-    description="The main orchestrating agent that generates the SOAP report from the provided transcription and enhances it with exercise illustrations.",
-    instruction= INSTRUCTION,
-    tools=[search_exercise_illustrations],
-)
\ No newline at end of file
+_root_agent: Optional["Agent"] = None
+_root_agent_lock = threading.Lock()
+
+
+def create_root_agent() -> "Agent":
+    """
+    Build a new SOAP agent.
+
+    The ADK and tool modules are imported here rather than at module import time,
+    so importing this package (e.g. for message_types) stays cheap.
+    """
+    from dotenv import load_dotenv
+    from google.adk.agents import Agent
+
+    from motion.agents.soap_agents.answer_cache import (
+        answer_from_cache,
+        note_cacheable_question,
+        remember_chat_answer,
+    )
+    from motion.agents.soap_agents.dictation import answer_dictated_draft
+    from motion.agents.soap_agents.history import compact_history
+    from motion.agents.soap_agents.model_metrics import record_model_response, start_model_timer
+    from motion.agents.soap_agents.output_parser import canonicalize_model_response
+    from motion.agents.soap_agents.prefetch import prefetch_illustrations
+    from motion.agents.soap_agents.report_assembly import (
+        answer_image_selection,
+        remember_structured_reply,
+    )
+    from motion.agents.soap_agents.router import apply_mode, mode_instruction, route_turn
+    from motion.tools.exercise_illustration_tool import (
+        search_exercise_illustrations,
+        search_exercise_illustrations_batch,
+    )
+
+    load_dotenv()
+
+    return Agent(
+        name="soap_agent",
+        model= os.environ['MODEL_GEMINI_2_0_FLASH'],
+        description="The main orchestrating agent that generates the SOAP report from the provided transcription and enhances it with exercise illustrations.",
+        instruction= mode_instruction,
+        tools=[search_exercise_illustrations_batch, search_exercise_illustrations],
+        before_agent_callback=[answer_image_selection, answer_dictated_draft, route_turn, answer_from_cache],
+        before_model_callback=[apply_mode, note_cacheable_question, compact_history, start_model_timer],
+        after_model_callback=[record_model_response, canonicalize_model_response, remember_structured_reply, remember_chat_answer, prefetch_illustrations],
+    )
+
+
+def get_root_agent() -> "Agent":
+    """Return the process-wide SOAP agent, building it on first use."""
+    global _root_agent
+    with _root_agent_lock:
+        if _root_agent is None:
+            _root_agent = create_root_agent()
+        return _root_agent
+
+
+def __getattr__(name: str) -> Any:
+    # `root_agent` is what ADK tooling (and existing imports) look up on this module
+    if name == "root_agent":
+        return get_root_agent()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
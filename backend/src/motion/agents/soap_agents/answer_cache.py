@@ -0,0 +1,456 @@
+"""
+Semantic cache of chat-mode answers to general questions.
+
+Many chat turns are the same handful of questions ("best exercises for lower
+back pain", "how do I progress a bridge?") in different words. Each answered
+question is embedded with a hashing vectorizer (word unigrams and bigrams plus
+character trigrams, so paraphrases and typos land close together), and a later
+question whose cosine similarity reaches the threshold is answered from the
+cache without calling the model. A match must also use the same content words,
+give or take a typo in a longer word, so "upper back" never answers "lower back".
+
+Only answers that cannot carry patient details are cached:
+
+- the turn ran in chat mode, as the first turn of its conversation, so the
+  answer depends on nothing but the question;
+- the question matched no clinical router signal (patient presentation, pain
+  scales, findings, treatment given, ...), refers to no one ("his knee",
+  "my patient"), and contains no names, dates, ages, phone numbers or emails;
+- the answer contains no dates, phone numbers or emails.
+
+Questions are answered from the cache only in turns the router sent to chat
+mode (follow-ups that edit an open SOAP draft go to SOAP mode), and only when
+they pass the same checks.
+
+Vectors are scored with NumPy when it is installed (``pip install .[cache]``)
+and with sparse dot products in pure Python otherwise.
+
+Environment:
+    MOTION_ANSWER_CACHE: set to ``0`` to disable the cache.
+    MOTION_ANSWER_CACHE_THRESHOLD: minimum cosine similarity (default 0.6).
+    MOTION_ANSWER_CACHE_TTL: seconds an answer is served (default 86400).
+    MOTION_ANSWER_CACHE_ENTRIES: answers kept, least recently used evicted (default 500).
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from types import ModuleType
+from typing import Any, Dict, List, Optional, Set, Tuple, cast
+
+from motion.agents.soap_agents.message_types import MessageType
+from motion.agents.soap_agents.router import MODE_KEY, ROUTER_ENABLED, Mode, route_message
+from motion.serialization import dumps
+from motion.telemetry import REGISTRY
+from motion.tools.exercise_catalog import normalize_catalog_name
+
+try:
+    import numpy as _np
+except ImportError:  # pragma: no cover - depends on the environment
+    _np = None  # type: ignore[assignment]
+
+np: Optional[ModuleType] = _np
+
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("MOTION_ANSWER_CACHE", "1") != "0"
+
+DEFAULT_THRESHOLD = 0.6
+DEFAULT_TTL_SECONDS = 24 * 3600
+DEFAULT_MAX_ENTRIES = 500
+
+# Hashed feature space; collisions are rare for questions of a few dozen
+# features, and the dense NumPy matrix stays at 16 KiB per entry
+DIMENSIONS = 1 << 12
+
+# Feature weights: words and word order carry the meaning, trigrams absorb
+# spelling; _same_words() then rules out near misses such as lower/upper
+_UNIGRAM_WEIGHT = 1.0
+_BIGRAM_WEIGHT = 0.5
+_TRIGRAM_WEIGHT = 1.0
+
+# Two content words are the same word, misspelled, at this trigram similarity;
+# high enough to keep abduction/adduction and internal/external apart
+_SAME_WORD_SIMILARITY = 0.75
+
+MAX_QUESTION_CHARS = 300
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "for", "to", "in", "on", "at", "with", "by", "from", "about",
+    "what", "which", "how", "why", "when", "who", "is", "are", "was", "be", "can", "could", "should",
+    "would", "do", "does", "did", "i", "you", "we", "there", "some", "any", "good", "best", "way",
+    "ways", "please", "tell", "explain", "me", "give", "list", "recommend", "recommended",
+}
+
+# Router signals that put clinical content in a question; symptoms alone are generic
+_CLINICAL_SIGNALS = {
+    "pain_scale", "strength_grade", "range_in_degrees", "clinical_finding", "patient_presentation",
+    "treatment_given", "documentation_intent", "draft_follow_up",
+}
+
+# References to a particular person or to earlier turns
+_REFERENCES = re.compile(
+    r"\b(?:he|she|him|her|his|hers|they|them|their|my|mine|our|us|it|its|this|these|those|"
+    r"above|previous|earlier|same)\b",
+    re.IGNORECASE,
+)
+
+_PERSONAL_DATA = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.]+"                                   # email
+    r"|\+?\d[\d ().-]{7,}\d"                                     # phone number
+    r"|\b\d{1,4}[/.-]\d{1,2}[/.-]\d{1,4}\b"                      # date
+    r"|\b(?:mr|mrs|ms|miss|dr|mx)\b\.?\s+[a-z]"                  # honorific and name
+    r"|\b(?:dob|d\.o\.b|nhs|mrn|medicare|date of birth)\b",
+    re.IGNORECASE,
+)
+
+# A capitalized word after the start of a sentence may be a name; acronyms are fine
+_CAPITALIZED = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][a-z]+\b")
+
+_LOOKUPS = REGISTRY.counter(
+    "motion_answer_cache_total", "Chat answer cache lookups and writes by outcome", ("outcome",)
+)
+
+
+def _hash(feature: str) -> Tuple[int, float]:
+    value = zlib.crc32(feature.encode("utf-8"))
+    return value % DIMENSIONS, 1.0 if value & (1 << 31) else -1.0
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def content_words(text: str) -> List[str]:
+    """
+    Normalize a question into its content words.
+
+    Exercise names get the catalog's synonyms ("glute bridge" -> "bridge");
+    stopwords and question words are dropped and plurals reduced.
+    """
+    words = []
+    for word in _WORD.findall(normalize_catalog_name(text)):
+        if word in _STOPWORDS:
+            continue
+        if len(word) > 4 and word.endswith("ies"):
+            word = word[:-3] + "y"
+        elif len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+
+def embed(words: List[str]) -> Dict[int, float]:
+    """Hash content words into an L2-normalized sparse vector."""
+    vector: Dict[int, float] = {}
+
+    def add(feature: str, weight: float) -> None:
+        index, sign = _hash(feature)
+        vector[index] = vector.get(index, 0.0) + sign * weight
+
+    for word in words:
+        add("w:" + word, _UNIGRAM_WEIGHT)
+        grams = _trigrams(word)
+        for gram in grams:
+            add("c:" + gram, _TRIGRAM_WEIGHT / len(grams) ** 0.5)
+    for first, second in zip(words, words[1:]):
+        add(f"b:{first} {second}", _BIGRAM_WEIGHT)
+
+    norm = sum(weight * weight for weight in vector.values()) ** 0.5
+    return {index: weight / norm for index, weight in vector.items()} if norm else {}
+
+
+def _same_words(words: List[str], other: List[str]) -> bool:
+    """Whether every content word of each question appears, maybe misspelled, in the other."""
+    def covered(word: str, candidates: Set[str]) -> bool:
+        if word in candidates:
+            return True
+        grams = _trigrams(word)
+        return any(
+            2 * len(grams & _trigrams(candidate)) / (len(grams) + len(_trigrams(candidate)))
+            >= _SAME_WORD_SIMILARITY
+            for candidate in candidates
+        )
+
+    first, second = set(words), set(other)
+    return all(covered(word, second) for word in first) and all(covered(word, first) for word in second)
+
+
+def is_general_question(text: str) -> bool:
+    """
+    Whether a chat message is a general question whose answer may be shared.
+
+    False for anything that may carry patient details or depend on context:
+    clinical router signals, references to people or earlier turns, names,
+    dates and other personal data.
+    """
+    if not text or len(text) > MAX_QUESTION_CHARS:
+        return False
+    decision = route_message(text)
+    if _CLINICAL_SIGNALS.intersection(decision.signals):
+        return False
+    if _REFERENCES.search(text) or _PERSONAL_DATA.search(text) or _CAPITALIZED.search(text.strip()):
+        return False
+    return len(content_words(text)) >= 2
+
+
+class _Entry:
+    __slots__ = ("question", "words", "vector", "message", "expires_at")
+
+    def __init__(self, question: str, words: List[str], vector: Dict[int, float],
+                 message: Dict[str, Any], expires_at: float):
+        self.question = question
+        self.words = words
+        self.vector = vector
+        self.message = message
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    Near-duplicate question lookup over a bounded set of answers.
+
+    Entries live in fixed slots; with NumPy their vectors are rows of a dense
+    matrix scored with one matrix-vector product per lookup. Thread-safe.
+    """
+
+    def __init__(
+        self,
+        threshold: float = DEFAULT_THRESHOLD,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+
+        self._lock = threading.Lock()
+        self._slots: List[Optional[_Entry]] = [None] * self.max_entries
+        # Slot numbers by recency of use, least recent first
+        self._recency: "OrderedDict[int, None]" = OrderedDict()
+        self._matrix: Optional[Any] = np.zeros((self.max_entries, DIMENSIONS), dtype=np.float32) if np is not None else None
+        self._counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the answer to a near-duplicate question.
+
+        Args:
+            question: The user's message.
+
+        Returns:
+            A copy of the cached message, or None.
+        """
+        words = content_words(question)
+        vector = embed(words)
+        now = time.time()
+        with self._lock:
+            for slot, similarity in self._candidates(vector):
+                entry = self._entry(slot)
+                if entry.expires_at <= now:
+                    self._evict(slot)
+                    self._counters["expirations"] += 1
+                    continue
+                if _same_words(words, entry.words):
+                    self._recency.move_to_end(slot)
+                    self._counters["hits"] += 1
+                    logger.debug("Answer cache hit (similarity=%.3f)", similarity)
+                    return dict(entry.message)
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, question: str, message: Dict[str, Any]) -> None:
+        """Store the answer to a question, replacing the answer to a near-duplicate one."""
+        words = content_words(question)
+        vector = embed(words)
+        if not vector:
+            return
+        entry = _Entry(question, words, vector, message, time.time() + self.ttl_seconds)
+        with self._lock:
+            for slot, _ in self._candidates(vector):
+                if _same_words(words, self._entry(slot).words):
+                    self._evict(slot)
+                    break
+            if len(self._recency) >= self.max_entries:
+                self._evict(next(iter(self._recency)))
+                self._counters["evictions"] += 1
+            slot = self._slots.index(None)
+            self._slots[slot] = entry
+            self._recency[slot] = None
+            if self._matrix is not None:
+                for index, weight in vector.items():
+                    self._matrix[slot, index] = weight
+            self._counters["writes"] += 1
+
+    def clear(self) -> None:
+        """Drop every answer."""
+        with self._lock:
+            for slot in list(self._recency):
+                self._evict(slot)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit, miss, write and eviction counters and the entry count."""
+        with self._lock:
+            return {**self._counters, "entries": len(self._recency)}
+
+    def _candidates(self, vector: Dict[int, float]) -> List[Tuple[int, float]]:
+        """Occupied slots at or above the similarity threshold, most similar first."""
+        if not vector or not self._recency:
+            return []
+        if self._matrix is not None and np is not None:
+            indices = np.fromiter(vector.keys(), dtype=np.intp, count=len(vector))
+            weights = np.fromiter(vector.values(), dtype=np.float32, count=len(vector))
+            scores = self._matrix[:, indices] @ weights
+            slots = np.flatnonzero(scores >= self.threshold)
+            ranked = [(int(slot), float(scores[slot])) for slot in slots]
+        else:
+            ranked = []
+            for slot in self._recency:
+                other = self._entry(slot).vector
+                score = sum(weight * other.get(index, 0.0) for index, weight in vector.items())
+                if score >= self.threshold:
+                    ranked.append((slot, score))
+        ranked.sort(key=lambda item: -item[1])
+        return ranked
+
+    def _entry(self, slot: int) -> _Entry:
+        # Only called for slots listed in _recency, which are occupied
+        return cast(_Entry, self._slots[slot])
+
+    def _evict(self, slot: int) -> None:
+        self._slots[slot] = None
+        self._recency.pop(slot, None)
+        if self._matrix is not None:
+            self._matrix[slot] = 0.0
+
+
+_cache: Optional[SemanticAnswerCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    """
+    Return the process-wide answer cache, creating it on first use.
+
+    Configured through ``MOTION_ANSWER_CACHE_THRESHOLD``,
+    ``MOTION_ANSWER_CACHE_TTL`` and ``MOTION_ANSWER_CACHE_ENTRIES``.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticAnswerCache(
+                threshold=float(os.getenv("MOTION_ANSWER_CACHE_THRESHOLD", DEFAULT_THRESHOLD)),
+                ttl_seconds=float(os.getenv("MOTION_ANSWER_CACHE_TTL", DEFAULT_TTL_SECONDS)),
+                max_entries=int(os.getenv("MOTION_ANSWER_CACHE_ENTRIES", DEFAULT_MAX_ENTRIES)),
+            )
+        return _cache
+
+
+def get_answer_cache_stats() -> Dict[str, Any]:
+    """Return the answer cache's counters."""
+    return get_answer_cache().stats()
+
+
+REGISTRY.register_stats("motion_answer_cache", get_answer_cache_stats)
+
+
+def _user_text(callback_context: Any) -> str:
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return ""
+    return "".join(part.text for part in user_content.parts if part.text)
+
+
+def _in_chat_mode(callback_context: Any) -> bool:
+    return (
+        ANSWER_CACHE_ENABLED
+        and ROUTER_ENABLED
+        and callback_context.state.get(MODE_KEY) == Mode.CHAT.value
+    )
+
+
+def answer_from_cache(callback_context: Any) -> Optional[Any]:
+    """
+    ADK before-agent callback that answers repeated general questions from the cache.
+
+    Runs after route_turn, which sets the turn's mode.
+
+    Returns:
+        Model content holding the cached chat_message, or None to run the agent.
+    """
+    if not _in_chat_mode(callback_context):
+        return None
+    text = _user_text(callback_context)
+    if not is_general_question(text):
+        _LOOKUPS.inc("skipped")
+        return None
+    message = get_answer_cache().get(text)
+    if message is None:
+        _LOOKUPS.inc("miss")
+        return None
+    _LOOKUPS.inc("hit")
+
+    from google.genai import types
+
+    message["timestamp"] = datetime.now().isoformat()
+    return types.Content(role="model", parts=[types.Part(text=dumps(message))])
+
+
+# Questions whose answer may be cached, by invocation; bounded like model_metrics' timers
+_pending: "OrderedDict[str, str]" = OrderedDict()
+_MAX_PENDING = 1024
+
+
+def note_cacheable_question(callback_context: Any, llm_request: Any) -> Optional[Any]:
+    """
+    ADK before-model callback that notes turns whose answer may be cached.
+
+    A turn qualifies when it is a general question in chat mode with no
+    earlier conversation in the request. Registered before compact_history,
+    which may shorten the history.
+    """
+    if not _in_chat_mode(callback_context) or len(llm_request.contents) != 1:
+        return None
+    text = _user_text(callback_context)
+    if is_general_question(text):
+        _pending[callback_context.invocation_id] = text
+        while len(_pending) > _MAX_PENDING:
+            _pending.popitem(last=False)
+    return None
+
+
+def remember_chat_answer(callback_context: Any, llm_response: Any) -> None:
+    """
+    ADK after-model callback that caches the answer to a noted question.
+
+    Runs after canonicalize_model_response, so the reply is canonical JSON.
+    Only plain chat_message answers without personal data are stored.
+    """
+    if llm_response.partial:
+        return None
+    question = _pending.pop(callback_context.invocation_id, None)
+    if question is None or llm_response.error_code or not llm_response.content or not llm_response.content.parts:
+        return None
+    if any(part.function_call for part in llm_response.content.parts):
+        return None
+    text = "".join(part.text for part in llm_response.content.parts if part.text and not part.thought)
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if message.get("type") != MessageType.CHAT_MESSAGE.value or _PERSONAL_DATA.search(message.get("content") or ""):
+        _LOOKUPS.inc("rejected")
+        return None
+    get_answer_cache().put(question, message)
+    _LOOKUPS.inc("stored")
+    return None
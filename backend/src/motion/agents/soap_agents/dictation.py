@@ -0,0 +1,542 @@
+"""
+Incremental ingestion of a transcript while the clinician is still dictating.
+
+The speech recognizer on the device produces the transcript progressively.
+Each update is posted to the dictation endpoint and folded into a
+``Dictation``:
+
+- The transcript is split into sentences and each sentence is assigned to the
+  S/O/A/P section it most likely belongs to. Only the sentences touched by an
+  update are re-segmented; the recognizer usually revises just the last few
+  words.
+- Exercise names are extracted as they are spoken, from explicit lists
+  ("exercises: bridges, clams and dead bugs") and from catalog names, and
+  illustration lookups start for them straight away.
+- When the clinician pauses, a speculative soap_draft is generated in the
+  background from the transcript so far, scheduled as background work.
+
+When dictation ends the client submits the final transcript as a normal turn.
+If a speculative draft was started for exactly that transcript,
+``answer_dictated_draft`` answers the turn with it, waiting for the rest of the
+generation if it is still running, instead of starting a new one (a draft
+still queued in the scheduler is dropped instead). If the
+transcript changed after the last pause, the turn runs as usual, with its
+illustrations already cached. Drafts are matched by transcript only.
+
+Dictations live in the memory of the worker that received them, so every
+update of a session must reach the same worker: a ``delta`` landing on another
+worker would be appended to the wrong transcript. With several workers the
+endpoint is therefore refused (see dictation_available()) unless the load
+balancer routes each session to one worker and ``MOTION_STICKY_SESSIONS=1``
+says so; clients then submit the final transcript as a normal turn.
+
+Environment:
+    MOTION_DICTATION_SPECULATIVE_DRAFT: set to ``0`` to never draft ahead.
+    MOTION_DICTATION_DRAFT_DELAY: seconds without updates before a speculative
+        draft starts (default 1.5).
+    MOTION_DICTATION_DRAFT_MIN_CHARS: shortest transcript worth drafting
+        (default 120).
+    MOTION_DICTATION_TTL: seconds an idle dictation is kept (default 1800).
+    MOTION_WORKERS: worker processes serving the app (exported by motion.main).
+    MOTION_STICKY_SESSIONS: set to ``1`` when each session is routed to one worker.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from motion.agents.soap_agents.message_types import MessageType
+from motion.agents.soap_agents.prefetch import prefetch_exercise
+from motion.agents.soap_agents.report_assembly import LAST_EXERCISE_SELECTION_KEY, LAST_SOAP_DRAFT_KEY
+from motion.agents.soap_agents.router import MODE_KEY, Mode, route_message
+from motion.scheduler import Priority, SchedulerRejected, scheduled
+from motion.telemetry import REGISTRY, span
+from motion.tools.exercise_catalog import get_exercise_catalog
+from motion.tools.illustration_cache import normalize_exercise_name
+
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_DRAFT_ENABLED = os.getenv("MOTION_DICTATION_SPECULATIVE_DRAFT", "1") != "0"
+DRAFT_DELAY = float(os.getenv("MOTION_DICTATION_DRAFT_DELAY", "1.5"))
+DRAFT_MIN_CHARS = int(os.getenv("MOTION_DICTATION_DRAFT_MIN_CHARS", "120"))
+DICTATION_TTL = float(os.getenv("MOTION_DICTATION_TTL", "1800"))
+SERVER_WORKERS = int(os.getenv("MOTION_WORKERS", "1"))
+STICKY_SESSIONS = os.getenv("MOTION_STICKY_SESSIONS", "0") == "1"
+
+SECTIONS = ("subjective", "objective", "assessment", "plan")
+
+# Bounds on what is kept in memory per worker
+_MAX_DICTATIONS = 512
+_MAX_DRAFTS = 256
+
+_DRAFTS = REGISTRY.counter(
+    "motion_dictation_drafts_total", "Speculative drafts by outcome", ("outcome",)
+)
+
+
+def _pattern(*alternatives: str) -> "re.Pattern[str]":
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+# (section, weight, pattern). Each cue counts once per sentence.
+_SECTION_CUES: List[Tuple[str, int, "re.Pattern[str]"]] = [
+    ("subjective", 10, re.compile(r"^\s*(?:subjective|history)\s*[:,-]", re.IGNORECASE)),
+    ("objective", 10, re.compile(r"^\s*(?:objective|examination|on examination|o/e)\s*[:,-]", re.IGNORECASE)),
+    ("assessment", 10, re.compile(r"^\s*(?:assessment|impression|diagnosis)\s*[:,-]", re.IGNORECASE)),
+    ("plan", 10, re.compile(r"^\s*(?:plan|treatment)\s*[:,-]", re.IGNORECASE)),
+    ("subjective", 3, re.compile(r"\b(?:10|\d(?:\.\d)?)\s*(?:/|out of)\s*10\b", re.IGNORECASE)),
+    ("subjective", 2, _pattern(
+        r"reports?", r"reported", r"complain(?:ed|s|ing)?", r"c/o", r"states?", r"says?", r"feels?",
+        r"describes?", r"since", r"started", r"began", r"worse(?:ns|ning)?", r"eases?", r"aggravat\w*",
+        r"reliev\w*", r"sleep\w*", r"history of", r"hx", r"\d{1,3}\s*(?:yo|y/o|years? old|year-old)",
+    )),
+    ("subjective", 1, _pattern(r"pain(?:ful)?", r"ache|aching", r"stiff(?:ness)?", r"numbness", r"tingling")),
+    ("objective", 3, re.compile(r"\b[0-5][+-]?\s*/\s*5\b|\b\d{1,3}\s*(?:°|deg\b|degrees\b)", re.IGNORECASE)),
+    ("objective", 2, _pattern(
+        r"slr", r"straight leg raise", r"rom", r"range of (?:motion|movement)", r"flexion", r"extension",
+        r"abduction", r"adduction", r"rotation", r"palpation", r"tender(?:ness)?", r"observed",
+        r"(?:positive|negative|\+ve|-ve) \w+(?: \w+)? test", r"special tests?", r"gait", r"posture",
+        r"reflexes", r"swelling", r"effusion", r"strength", r"measured", r"limited",
+    )),
+    ("assessment", 3, _pattern(
+        r"consistent with", r"suggestive of", r"likely", r"impression", r"diagnos\w*", r"secondary to",
+        r"prognosis",
+    )),
+    ("assessment", 2, _pattern(
+        r"strain", r"sprain", r"tendinopathy", r"tendinitis", r"dysfunction", r"impingement",
+        r"syndrome", r"involvement", r"irritation",
+    )),
+    ("plan", 3, _pattern(
+        r"home exercises?(?: program(?:me)?)?", r"hep", r"review in", r"follow[- ]up", r"next session",
+        r"exercises?", r"reps?", r"repetitions", r"sets?", r"times (?:a|per) day", r"times daily",
+    )),
+    ("plan", 2, _pattern(
+        r"treated", r"treatment", r"manual therapy", r"mobili[sz]ations?", r"taping", r"dry needling",
+        r"advised", r"educat\w*", r"refer(?:red|ral)?", r"continue", r"will", r"gave (?:him|her|them)",
+    )),
+]
+
+# Ends at . ! ? followed by whitespace, or a line break; "4.5/10" and "L4.5" stay whole
+_SENTENCE = re.compile(r"(?:[^.!?\n]|[.!?](?=\S))+(?:[.!?]+|\n|$)")
+
+# "Exercises: a, b and c", "exercises include ...", "gave her a, b and c"
+_EXERCISE_LIST = re.compile(
+    r"\b(?:exercises?\s*(?:[:-]|include|including|are|were|such as|like)|"
+    r"gave (?:him|her|them)(?: some)?(?: home exercises?)?[:,]?)\s*(?P<items>.+)",
+    re.IGNORECASE,
+)
+_LIST_SEPARATOR = re.compile(r"\s*(?:,|;|\band\b|\bthen\b)\s*", re.IGNORECASE)
+# Dosage trailing an exercise name: "bridges 3 sets of 10", "clams x10 daily"
+_DOSAGE = re.compile(
+    r"\s+(?:\d+|x\s*\d+|for\s+\d+|once|twice|three times|daily|each|per|every)\b.*$", re.IGNORECASE
+)
+_MAX_EXERCISE_WORDS = 8
+
+
+def split_sentences(text: str, offset: int = 0) -> List[Tuple[int, int, str]]:
+    """Split text into ``(start, end, sentence)`` spans, offsets relative to ``offset``."""
+    spans = []
+    for match in _SENTENCE.finditer(text):
+        sentence = match.group().strip()
+        if sentence:
+            spans.append((offset + match.start(), offset + match.end(), sentence))
+    return spans
+
+
+def classify_sentence(sentence: str, previous: Optional[str] = None) -> str:
+    """
+    Pick the S/O/A/P section a dictated sentence belongs to.
+
+    Sentences without any cue continue the previous section, since clinicians
+    tend to dictate one section at a time.
+
+    Args:
+        sentence: One sentence of the transcript.
+        previous: Section of the sentence before it, if any.
+
+    Returns:
+        One of SECTIONS.
+    """
+    scores: Dict[str, int] = {}
+    for section, weight, pattern in _SECTION_CUES:
+        if pattern.search(sentence):
+            scores[section] = scores.get(section, 0) + weight
+    if not scores:
+        return previous or "subjective"
+    # Ties go to the section already being dictated, then to SOAP order
+    return max(SECTIONS, key=lambda section: (scores.get(section, 0), section == previous))
+
+
+def extract_exercise_names(sentence: str, section: Optional[str] = None) -> List[str]:
+    """
+    Extract exercise names from one sentence.
+
+    Finds names listed after cues such as "exercises:" or "gave her" and, in
+    plan sentences, any exercise from the offline catalog mentioned by name or
+    alias (elsewhere "SLR" is a test, not an exercise).
+
+    Args:
+        sentence: One sentence of the transcript.
+        section: Section the sentence was assigned to, if known.
+
+    Returns:
+        Names in order of mention, as spoken (lists) or canonical (catalog).
+    """
+    catalog = get_exercise_catalog()
+    names: List[str] = []
+    covered: Set[str] = set()
+    listed = _EXERCISE_LIST.search(sentence)
+    if listed:
+        for item in _LIST_SEPARATOR.split(listed.group("items")):
+            name = _DOSAGE.sub("", item.strip(" \t\"'[]().!?:"))
+            name = name.strip(" \t\"'[]().!?:")
+            words = name.split()
+            if words and len(words) <= _MAX_EXERCISE_WORDS and re.search(r"[a-zA-Z]{3}", name):
+                names.append(name)
+                covered.update(catalog.find_mentions(name))
+
+    if section in (None, "plan"):
+        for name in catalog.find_mentions(sentence):
+            if name not in covered:
+                names.append(name)
+    return names
+
+
+def normalize_transcript(text: str) -> str:
+    """Whitespace-insensitive form of a transcript, for matching drafts to turns."""
+    return " ".join(text.split())
+
+
+def transcript_digest(text: str) -> str:
+    """Key of the speculative draft for a transcript."""
+    return hashlib.sha256(normalize_transcript(text).encode("utf-8")).hexdigest()
+
+
+class _Sentence:
+    __slots__ = ("start", "end", "text", "section", "exercises", "complete")
+
+    def __init__(self, start: int, end: int, text: str, section: str, exercises: List[str], complete: bool):
+        self.start = start
+        self.end = end
+        self.text = text
+        self.section = section
+        self.exercises = exercises
+        self.complete = complete
+
+
+class Dictation:
+    """Running state of one session's dictation."""
+
+    def __init__(self, user_id: Optional[str] = None):
+        self.user_id = user_id
+        self.transcript = ""
+        self.seq = -1
+        self.updated_at = time.monotonic()
+        self.sentences: List[_Sentence] = []
+        self.prefetched: Set[str] = set()
+        self.draft_digest: Optional[str] = None
+        self._draft_timer: Optional[asyncio.TimerHandle] = None
+
+    def update(self, transcript: str) -> None:
+        """
+        Fold in the transcript so far, re-segmenting only what changed.
+
+        Args:
+            transcript: Full transcript as currently recognized.
+        """
+        changed_at = len(os.path.commonprefix([self.transcript, transcript]))
+        keep = 0
+        for sentence in self.sentences:
+            if not sentence.complete or sentence.end > changed_at:
+                break
+            keep += 1
+        self.sentences = self.sentences[:keep]
+        start = self.sentences[-1].end if self.sentences else 0
+        previous = self.sentences[-1].section if self.sentences else None
+
+        for sentence_start, sentence_end, text in split_sentences(transcript[start:], start):
+            section = classify_sentence(text, previous)
+            complete = sentence_end < len(transcript) or transcript.rstrip()[-1:] in (".", "!", "?")
+            self.sentences.append(
+                _Sentence(sentence_start, sentence_end, text, section, extract_exercise_names(text, section), complete)
+            )
+            previous = section
+
+        self.transcript = transcript
+        self.updated_at = time.monotonic()
+        for sentence in self.sentences:
+            # The last name of an unfinished sentence may still be half spoken
+            for name in sentence.exercises if sentence.complete else sentence.exercises[:-1]:
+                prefetch_exercise(name, self.prefetched)
+
+    def exercises(self) -> List[str]:
+        """Exercise names mentioned so far, in order, without repeats."""
+        names: Dict[str, str] = {}
+        for sentence in self.sentences:
+            for name in sentence.exercises:
+                names.setdefault(normalize_exercise_name(name), name)
+        return list(names.values())
+
+    def sections(self) -> Dict[str, str]:
+        """Transcript text grouped by S/O/A/P section."""
+        grouped: Dict[str, List[str]] = {section: [] for section in SECTIONS}
+        for sentence in self.sentences:
+            grouped[sentence.section].append(sentence.text)
+        return {section: " ".join(texts) for section, texts in grouped.items()}
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Running draft returned to the client after each update."""
+        draft = _drafts.get(self.draft_digest) if self.draft_digest else None
+        if draft is None:
+            draft_status = "pending" if self.draft_pending() else None
+        elif not draft.done():
+            draft_status = "generating"
+        else:
+            draft_status = "ready" if not draft.cancelled() and not draft.exception() and draft.result() else "failed"
+        return {
+            "seq": self.seq,
+            "transcript_chars": len(self.transcript),
+            "sections": self.sections(),
+            "exercises": self.exercises(),
+            "draft": draft_status,
+        }
+
+    def draft_pending(self) -> bool:
+        """Whether a speculative draft is waiting for the pause timer."""
+        return self._draft_timer is not None
+
+    def close(self) -> None:
+        """Stop any scheduled or running speculative draft."""
+        if self._draft_timer is not None:
+            self._draft_timer.cancel()
+            self._draft_timer = None
+        if self.draft_digest is not None:
+            task = _drafts.pop(self.draft_digest, None)
+            if task is not None and not task.done():
+                task.cancel()
+                _DRAFTS.inc("superseded")
+            self.draft_digest = None
+
+    def schedule_draft(self) -> None:
+        """
+        Restart the pause timer after which a speculative draft is generated.
+
+        Called whenever the transcript changes, so any earlier draft no longer
+        matches what is being said and is dropped.
+        """
+        self.close()
+        if not SPECULATIVE_DRAFT_ENABLED or len(normalize_transcript(self.transcript)) < DRAFT_MIN_CHARS:
+            return
+        self._draft_timer = asyncio.get_running_loop().call_later(DRAFT_DELAY, self._start_draft)
+
+    def _start_draft(self) -> None:
+        self._draft_timer = None
+        if route_message(self.transcript).mode != Mode.SOAP:
+            return
+        digest = transcript_digest(self.transcript)
+        self.draft_digest = digest
+        task = _drafts.get(digest)
+        if task is None:
+            task = _drafts[digest] = asyncio.ensure_future(generate_draft(self.transcript, self.user_id))
+            task.add_done_callback(_retrieve_failure)
+            _DRAFTS.inc("started")
+            while len(_drafts) > _MAX_DRAFTS:
+                _, evicted = _drafts.popitem(last=False)
+                evicted.cancel()
+
+
+# Speculative drafts by transcript digest; each task resolves to canonical
+# soap_draft JSON, or None if the model did not produce a draft
+_drafts: "OrderedDict[str, asyncio.Future[Optional[str]]]" = OrderedDict()
+
+# Digests of drafts admitted by the scheduler and calling the model
+_running_drafts: Set[str] = set()
+
+_dictations: "OrderedDict[Tuple[str, str, str], Dictation]" = OrderedDict()
+
+
+def _retrieve_failure(task: "asyncio.Future[Optional[str]]") -> None:
+    if not task.cancelled() and task.exception() is not None:
+        _DRAFTS.inc("failed")
+        logger.warning("Speculative draft failed: %s", task.exception())
+
+
+def _expire_dictations() -> None:
+    now = time.monotonic()
+    while _dictations:
+        key, dictation = next(iter(_dictations.items()))
+        if len(_dictations) <= _MAX_DICTATIONS and now - dictation.updated_at < DICTATION_TTL:
+            break
+        _dictations.pop(key).close()
+
+
+def dictation_available() -> bool:
+    """Whether every update of a session reaches this worker: one worker, or sticky routing."""
+    return SERVER_WORKERS <= 1 or STICKY_SESSIONS
+
+
+def update_dictation(
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    transcript: Optional[str] = None,
+    delta: Optional[str] = None,
+    seq: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Apply one transcript update to a session's dictation.
+
+    Must be called from the event loop that serves agent turns.
+
+    Args:
+        app_name, user_id, session_id: Session the dictation belongs to.
+        transcript: Full transcript so far; replaces the previous one.
+        delta: Text appended to the transcript; ignored when ``transcript`` is given.
+        seq: Increasing update number; stale (lower or equal) updates are ignored.
+
+    Returns:
+        The running draft: sections, exercises and speculative draft status.
+    """
+    _expire_dictations()
+    key = (app_name, user_id, session_id)
+    dictation = _dictations.pop(key, None) or Dictation(user_id)
+    _dictations[key] = dictation
+
+    if seq is not None:
+        if seq <= dictation.seq:
+            return dictation.to_dict()
+        dictation.seq = seq
+    text = transcript if transcript is not None else dictation.transcript + (delta or "")
+    if text != dictation.transcript:
+        with span("dictation.update", chars=len(text)):
+            dictation.update(text)
+            dictation.schedule_draft()
+    return dictation.to_dict()
+
+
+def discard_dictation(app_name: str, user_id: str, session_id: str) -> bool:
+    """Forget a session's dictation; returns True if there was one."""
+    dictation = _dictations.pop((app_name, user_id, session_id), None)
+    if dictation is None:
+        return False
+    dictation.close()
+    return True
+
+
+async def generate_draft(transcript: str, user_id: Optional[str] = None) -> Optional[str]:
+    """
+    Generate a soap_draft for a transcript with the agent's SOAP prompt and model.
+
+    The model call is scheduled as background work, so it never delays live turns.
+
+    Args:
+        transcript: Dictated transcript.
+        user_id: User dictating, for the scheduler's per-user limit.
+
+    Returns:
+        Canonical soap_draft JSON, or None if the model replied with anything
+        else or the scheduler shed the draft.
+    """
+    from google.adk.models.llm_request import LlmRequest
+    from google.adk.models.registry import LLMRegistry
+    from google.genai import types
+
+    from motion.agents.soap_agents.agent import get_root_agent
+    from motion.agents.soap_agents.output_parser import parse_agent_reply
+    from motion.agents.soap_agents.prompts import SOAP_INSTRUCTION
+    from motion.agents.soap_agents.router import SOAP_MODEL
+    from motion.serialization import dumps
+
+    model = LLMRegistry.new_llm(SOAP_MODEL) if SOAP_MODEL else get_root_agent().canonical_model
+    request = LlmRequest(
+        model=model.model,
+        contents=[types.Content(role="user", parts=[types.Part(text=transcript)])],
+        config=types.GenerateContentConfig(system_instruction=SOAP_INSTRUCTION),
+    )
+    estimated_tokens = (len(SOAP_INSTRUCTION) + len(transcript)) // 4 + 2000
+    digest = transcript_digest(transcript)
+    with span("dictation.draft", chars=len(transcript)) as traced:
+        text = ""
+        try:
+            async with scheduled(user_id, Priority.BACKGROUND, estimated_tokens) as ticket:
+                _running_drafts.add(digest)
+                try:
+                    async for response in model.generate_content_async(request, stream=False):
+                        if response.content and response.content.parts:
+                            text = "".join(
+                                part.text for part in response.content.parts if part.text and not part.thought
+                            )
+                        if response.usage_metadata is not None:
+                            ticket.record_usage(response.usage_metadata.total_token_count or 0)
+                finally:
+                    _running_drafts.discard(digest)
+        except SchedulerRejected as e:
+            traced.set_error(str(e))
+            _DRAFTS.inc("shed")
+            return None
+        message = parse_agent_reply(text)
+        if message.get("type") != MessageType.SOAP_DRAFT.value:
+            traced.set_error(f"model replied with {message.get('type')}")
+            _DRAFTS.inc("failed")
+            return None
+    # Look up the drafted exercises while the clinician finishes dictating
+    prefetched: Set[str] = set()
+    for exercise in message["soap_report"].get("exercises") or []:
+        prefetch_exercise(exercise.get("name"), prefetched)
+    return dumps(message)
+
+
+async def answer_dictated_draft(callback_context: Any) -> Optional[Any]:
+    """
+    ADK before-agent callback that answers a dictated transcript with its speculative draft.
+
+    Returns:
+        Model content holding the draft, or None to run the agent as usual (no
+        draft was started for this exact transcript, or it failed).
+    """
+    if not _dictations:
+        return None
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return None
+    text = "".join(part.text for part in user_content.parts if part.text)
+    digest = transcript_digest(text)
+    task = _drafts.pop(digest, None)
+    if task is not None and not task.done() and digest not in _running_drafts:
+        # Still queued behind other work; the live turn must not wait for it
+        task.cancel()
+        task = None
+    if task is None:
+        # This turn generates the draft itself; one waiting for the pause timer would be wasted
+        for dictation in _dictations.values():
+            if dictation.draft_pending() and transcript_digest(dictation.transcript) == digest:
+                dictation.close()
+        return None
+    try:
+        # Shielded: a disconnecting client must not look like a superseded draft
+        draft = await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if task.cancelled():
+            return None
+        raise
+    except Exception:
+        return None
+    if draft is None:
+        return None
+    _DRAFTS.inc("used")
+
+    from google.genai import types
+
+    soap_report = json.loads(draft).get("soap_report") or {}
+    # What remember_structured_reply and route_turn record for a drafted turn
+    callback_context.state[MODE_KEY] = Mode.SOAP.value
+    callback_context.state[LAST_SOAP_DRAFT_KEY] = soap_report
+    callback_context.state[LAST_EXERCISE_SELECTION_KEY] = None
+    return types.Content(role="model", parts=[types.Part(text=draft)])
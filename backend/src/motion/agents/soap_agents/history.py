@@ -0,0 +1,189 @@
+"""
+Compaction of the conversation history sent to the model.
+
+Clinicians keep one session open for patient after patient, so without
+compaction every turn re-sends every earlier draft, image list and tool
+result. Before each model call the request contents are rewritten:
+
+- A structured message that a later one supersedes (an older draft, a
+  selection or final report followed by a newer draft) collapses into a
+  one-line summary. The current patient's messages stay intact.
+- Tool calls and results that an exercise_selection or final report has
+  already consumed are dropped.
+- The oldest turns are dropped until the history fits the token budget.
+
+Only the request is rewritten; the session keeps the full history.
+
+Environment:
+    MOTION_HISTORY_COMPACTION: set to ``0`` to send the full history.
+    MOTION_HISTORY_TOKEN_BUDGET: estimated token budget for the history,
+        excluding the system prompt and tool declarations (default 6000).
+"""
+
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from google.genai import types
+
+from motion.agents.soap_agents.message_types import MessageType
+
+
+logger = logging.getLogger(__name__)
+
+COMPACTION_ENABLED = os.getenv("MOTION_HISTORY_COMPACTION", "1") != "0"
+TOKEN_BUDGET = int(os.getenv("MOTION_HISTORY_TOKEN_BUDGET", "6000"))
+
+# Rough token estimate; good enough to keep the budget flat without a tokenizer
+CHARS_PER_TOKEN = 4
+
+_DRAFT = MessageType.SOAP_DRAFT.value
+_SELECTION = MessageType.EXERCISE_SELECTION.value
+_FINAL = MessageType.FINAL_REPORT.value
+
+# Message types that, when they appear later, supersede an earlier message
+_SUPERSEDED_BY = {
+    _DRAFT: {_DRAFT, _FINAL},
+    _SELECTION: {_DRAFT, _SELECTION, _FINAL},
+    _FINAL: {_DRAFT, _FINAL},
+}
+
+
+def _content_chars(content: Any) -> int:
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        elif part.function_call:
+            chars += len(part.function_call.name or "") + len(json.dumps(part.function_call.args or {}, default=str))
+        elif part.function_response:
+            chars += len(json.dumps(part.function_response.response or {}, default=str))
+    return chars
+
+
+def estimate_tokens(contents: List[Any]) -> int:
+    """
+    Estimate the number of tokens in request contents.
+
+    Args:
+        contents: ``types.Content`` objects of an LLM request.
+
+    Returns:
+        Approximate token count (characters / CHARS_PER_TOKEN).
+    """
+    return sum(_content_chars(content) for content in contents) // CHARS_PER_TOKEN
+
+
+def _structured_message(content: Any) -> Optional[Dict[str, Any]]:
+    if content.role != "model" or not content.parts:
+        return None
+    text = "".join(part.text for part in content.parts if part.text and not part.thought)
+    if not text.startswith("{"):
+        return None
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or message.get("type") not in _SUPERSEDED_BY:
+        return None
+    return message
+
+
+def _exercise_names(exercises: Any) -> str:
+    names = [exercise.get("name", "") for exercise in exercises or [] if isinstance(exercise, dict)]
+    return ", ".join(name for name in names if name) or "none"
+
+
+def summarize_message(message: Dict[str, Any]) -> str:
+    """
+    Collapse a structured message into a one-line summary.
+
+    Args:
+        message: Decoded soap_draft, exercise_selection or final_report message.
+
+    Returns:
+        Bracketed plain-text summary naming the patient, condition and exercises.
+    """
+    if message["type"] == _SELECTION:
+        return f"[Earlier exercise_selection offered images for: {_exercise_names(message.get('exercises'))}]"
+
+    report = message.get("soap_report") or {}
+    patient = ", ".join(
+        str(value) for value in (report.get("patient_name"), report.get("patient_age")) if value
+    ) or "unnamed"
+    label = "final_report completed" if message["type"] == _FINAL else "soap_draft"
+    return (
+        f"[Earlier {label} for {report.get('condition') or 'unspecified condition'} "
+        f"(patient: {patient}); exercises: {_exercise_names(report.get('exercises'))}]"
+    )
+
+
+def _is_tool_traffic(part: Any) -> bool:
+    return bool(part.function_call or part.function_response)
+
+
+def _starts_turn(content: Any) -> bool:
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def compact_contents(contents: List[Any], token_budget: int = TOKEN_BUDGET) -> List[Any]:
+    """
+    Compact request contents in place.
+
+    Args:
+        contents: ``types.Content`` objects of an LLM request, oldest first.
+            They are copies of the session events and may be modified.
+        token_budget: Estimated token budget for the returned history.
+
+    Returns:
+        The same list, compacted.
+    """
+    messages = [_structured_message(content) for content in contents]
+
+    # Index of the last message of each type, to find superseded ones
+    last_seen: Dict[str, int] = {}
+    for index, message in enumerate(messages):
+        if message is not None:
+            last_seen[message["type"]] = index
+
+    consumed_before = max(last_seen.get(_SELECTION, -1), last_seen.get(_FINAL, -1))
+
+    compacted = []
+    for index, (content, message) in enumerate(zip(contents, messages)):
+        if index < consumed_before and any(_is_tool_traffic(part) for part in content.parts or []):
+            content.parts = [part for part in content.parts if not _is_tool_traffic(part)]
+            if not content.parts:
+                continue
+        if message is not None and any(
+            last_seen.get(later, -1) > index for later in _SUPERSEDED_BY[message["type"]]
+        ):
+            content.parts = [types.Part(text=summarize_message(message))]
+        compacted.append(content)
+
+    # Drop whole turns from the front until the history fits the budget. The
+    # latest turn is always kept.
+    sizes = [_content_chars(content) // CHARS_PER_TOKEN for content in compacted]
+    remaining = sum(sizes)
+    start = 0
+    for index, content in enumerate(compacted):
+        if remaining <= token_budget:
+            break
+        if index > start and _starts_turn(content):
+            remaining -= sum(sizes[start:index])
+            start = index
+    if start:
+        logger.info("Dropped %d history contents to fit the %d token budget", start, token_budget)
+
+    contents[:] = compacted[start:]
+    return contents
+
+
+def compact_history(callback_context: Any, llm_request: Any) -> Optional[Any]:
+    """ADK before-model callback that compacts the request history."""
+    if not COMPACTION_ENABLED or not llm_request.contents:
+        return None
+    before = estimate_tokens(llm_request.contents)
+    compact_contents(llm_request.contents)
+    logger.debug("Compacted history from ~%d to ~%d tokens", before, estimate_tokens(llm_request.contents))
+    return None
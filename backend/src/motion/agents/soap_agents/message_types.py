@@ -5,7 +5,9 @@ Message type definitions for structured frontend communication.
 from enum import Enum
 from typing import List, Dict, Any, Optional
 from datetime import datetime
-import json
+
+from motion.serialization import PRETTY_JSON, dumps, dumps_bytes
+from motion.telemetry import timed
 
 
 class MessageType(str, Enum):
@@ -16,28 +18,43 @@ class MessageType(str, Enum):
     FINAL_REPORT = "final_report"
     CLARIFICATION = "clarification_needed"
     ERROR = "error"
+    PARTIAL = "partial"
 
 
 class StructuredMessage:
     """Base class for structured messages to frontend."""
     
-    def __init__(self, message_type: MessageType, **kwargs):
+    __slots__ = ("type", "timestamp", "data")
+    
+    def __init__(self, message_type: MessageType, **kwargs: Any):
         self.type = message_type
         self.timestamp = datetime.now().isoformat()
         self.data = kwargs
     
-    def to_json(self) -> str:
-        """Convert message to JSON string for transmission."""
-        return json.dumps({
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert message to a JSON-serializable dictionary."""
+        return {
             "type": self.type,
             "timestamp": self.timestamp,
             **self.data
-        }, indent=2)
+        }
+    
+    def to_json(self, pretty: bool = PRETTY_JSON) -> str:
+        """Convert message to JSON string for transmission (compact unless pretty)."""
+        with timed(f"message.{self.type.value}"):
+            return dumps(self.to_dict(), pretty)
+    
+    def to_bytes(self) -> bytes:
+        """Convert message to compact UTF-8 JSON bytes, ready to write to a response."""
+        with timed(f"message.{self.type.value}"):
+            return dumps_bytes(self.to_dict(), pretty=False)
 
 
 class ChatMessage(StructuredMessage):
     """Message containing general chat response."""
     
+    __slots__ = ()
+    
     def __init__(self, content: str):
         super().__init__(
             MessageType.CHAT_MESSAGE,
@@ -48,6 +65,8 @@ class ChatMessage(StructuredMessage):
 class SoapDraftMessage(StructuredMessage):
     """Message containing initial SOAP report draft in structured format."""
     
+    __slots__ = ()
+    
     def __init__(self, soap_report: Dict[str, Any]):
         super().__init__(
             MessageType.SOAP_DRAFT,
@@ -58,6 +77,8 @@ class SoapDraftMessage(StructuredMessage):
 class ExerciseSelectionMessage(StructuredMessage):
     """Message prompting user to select exercise images for multiple exercises."""
     
+    __slots__ = ()
+    
     def __init__(self, exercises: List[Dict[str, Any]]):
         super().__init__(
             MessageType.EXERCISE_SELECTION,
@@ -69,6 +90,8 @@ class ExerciseSelectionMessage(StructuredMessage):
 class FinalReportMessage(StructuredMessage):
     """Message containing final SOAP report with selected images."""
     
+    __slots__ = ()
+    
     def __init__(self, soap_report: Dict[str, Any], selected_images: List[str]):
         super().__init__(
             MessageType.FINAL_REPORT,
@@ -81,6 +104,8 @@ class FinalReportMessage(StructuredMessage):
 class ClarificationMessage(StructuredMessage):
     """Message requesting clarification from user."""
     
+    __slots__ = ()
+    
     def __init__(self, questions: List[str], original_content: str):
         super().__init__(
             MessageType.CLARIFICATION,
@@ -92,6 +117,8 @@ class ClarificationMessage(StructuredMessage):
 class ErrorMessage(StructuredMessage):
     """Message indicating an error occurred."""
     
+    __slots__ = ()
+    
     def __init__(self, error: str, details: Optional[str] = None):
         super().__init__(
             MessageType.ERROR,
@@ -100,6 +127,21 @@ class ErrorMessage(StructuredMessage):
         )
 
 
+class PartialMessage(StructuredMessage):
+    """Message carrying one completed field of a structured message still being generated."""
+    
+    __slots__ = ()
+    
+    def __init__(self, parent_type: str, field: str, value: Any, index: Optional[int] = None):
+        super().__init__(
+            MessageType.PARTIAL,
+            parent_type=parent_type,
+            field=field,
+            index=index,
+            value=value
+        )
+
+
 def create_chat_message(content: str) -> str:
     """Helper function to create chat message JSON."""
     return ChatMessage(content).to_json()
@@ -130,6 +172,11 @@ def create_error_message(error: str, details: Optional[str] = None) -> str:
     return ErrorMessage(error, details).to_json()
 
 
+def create_partial_message(parent_type: str, field: str, value: Any, index: Optional[int] = None) -> str:
+    """Helper function to create partial message JSON."""
+    return PartialMessage(parent_type, field, value, index).to_json()
+
+
 # Helper functions for creating structured SOAP data
 
 def create_soap_item(item_type: str, content: str, emphasis: Optional[str] = None, sub_items: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
@@ -179,6 +226,7 @@ def create_exercise_with_images(exercise_id: str, name: str, description: str,
         processed_images.append({
             "id": f"img_{exercise_id}_{i}",
             "url": img.get("url", ""),
+            "thumbnail_url": img.get("thumbnail_url"),
             "name": img.get("name", f"{name} illustration {i+1}"),
             "selected": False
         })
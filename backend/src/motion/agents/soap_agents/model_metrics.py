@@ -0,0 +1,87 @@
+"""
+Latency and token metrics for model calls.
+
+A before-model callback notes when each request is sent; an after-model
+callback records time to first streamed chunk, total latency, outcome and the
+prompt/completion token counts reported by the model. Both are cheap no-ops
+when metrics are disabled (MOTION_METRICS=0).
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from motion.telemetry import METRICS_ENABLED, REGISTRY, TOKEN_BUCKETS
+
+
+LLM_SECONDS = REGISTRY.histogram(
+    "motion_llm_seconds", "Model call latency until the final response", ("model", "outcome")
+)
+LLM_FIRST_CHUNK_SECONDS = REGISTRY.histogram(
+    "motion_llm_first_chunk_seconds", "Model call latency until the first streamed chunk", ("model",)
+)
+LLM_TOKENS = REGISTRY.counter(
+    "motion_llm_tokens_total", "Tokens reported by the model", ("model", "kind")
+)
+LLM_PROMPT_TOKENS = REGISTRY.histogram(
+    "motion_llm_prompt_tokens", "Prompt tokens per model call", ("model",), buckets=TOKEN_BUCKETS
+)
+
+# In-flight model calls, by invocation (calls within one invocation are
+# sequential); bounded in case a call never produces a final response
+_MAX_TRACKED_CALLS = 1024
+
+
+class _ModelCall:
+    __slots__ = ("model", "started", "first_chunk")
+
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.perf_counter()
+        self.first_chunk = False
+
+
+_calls: "OrderedDict[str, _ModelCall]" = OrderedDict()
+
+
+def start_model_timer(callback_context: Any, llm_request: Any) -> Optional[Any]:
+    """
+    ADK before-model callback that notes when the request is sent.
+
+    Registered last, so the model chosen by earlier callbacks is the one recorded.
+    """
+    if not METRICS_ENABLED:
+        return None
+    _calls[callback_context.invocation_id] = _ModelCall(llm_request.model or "unknown")
+    while len(_calls) > _MAX_TRACKED_CALLS:
+        _calls.popitem(last=False)
+    return None
+
+
+def record_model_response(callback_context: Any, llm_response: Any) -> Optional[Any]:
+    """ADK after-model callback recording latency and token usage. Never changes the response."""
+    if not METRICS_ENABLED:
+        return None
+    invocation_id = callback_context.invocation_id
+    if llm_response.partial:
+        call = _calls.get(invocation_id)
+        if call is not None and not call.first_chunk:
+            call.first_chunk = True
+            LLM_FIRST_CHUNK_SECONDS.observe(time.perf_counter() - call.started, call.model)
+        return None
+
+    call = _calls.pop(invocation_id, None)
+    if call is None:
+        return None
+    outcome = "error" if llm_response.error_code else "ok"
+    LLM_SECONDS.observe(time.perf_counter() - call.started, call.model, outcome)
+    usage = llm_response.usage_metadata
+    if usage is not None:
+        if usage.prompt_token_count:
+            LLM_TOKENS.inc(call.model, "prompt", amount=usage.prompt_token_count)
+            LLM_PROMPT_TOKENS.observe(usage.prompt_token_count, call.model)
+        if usage.candidates_token_count:
+            LLM_TOKENS.inc(call.model, "completion", amount=usage.candidates_token_count)
+        if usage.cached_content_token_count:
+            LLM_TOKENS.inc(call.model, "cached", amount=usage.cached_content_token_count)
+    return None
@@ -0,0 +1,315 @@
+"""
+Extraction, repair and validation of the agent's structured replies.
+
+The prompt asks the model for one JSON message per reply, but replies still
+arrive wrapped in code fences, followed by commentary, with trailing commas or
+without a timestamp. This module pulls the JSON object out of the reply text,
+repairs those defects, validates it against the schema for its message type
+and returns one canonical payload, so clients need a single plain parse.
+
+The schemas are compiled into validator functions once, at import time.
+"""
+
+import json
+import logging
+import re
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, cast
+
+from motion.agents.soap_agents.message_types import MessageType
+from motion.serialization import dumps
+
+
+logger = logging.getLogger(__name__)
+
+Validator = Callable[[Any, str, List[str]], Any]
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_MISSING = object()
+
+
+class MessageValidationError(ValueError):
+    """Raised when a message cannot be repaired into a valid structured message."""
+
+
+# Schema building blocks. Each returns a validator that takes (value, path,
+# repairs), returns the canonical value, appends a note to ``repairs`` for
+# every fix it applies, and raises MessageValidationError when it cannot fix.
+
+def _string(nullable: bool = False, default: Any = _MISSING) -> Validator:
+    def validate(value: Any, path: str, repairs: List[str]) -> Any:
+        if value is _MISSING or (value is None and not nullable):
+            if default is _MISSING:
+                raise MessageValidationError(f"{path} is required")
+            repairs.append(f"defaulted {path}")
+            return default
+        if value is None or isinstance(value, str):
+            return value
+        if isinstance(value, (int, float, bool)):
+            repairs.append(f"coerced {path} to string")
+            return str(value)
+        raise MessageValidationError(f"{path} must be a string")
+    return validate
+
+
+def _boolean(default: bool) -> Validator:
+    def validate(value: Any, path: str, repairs: List[str]) -> Any:
+        if value is _MISSING or value is None:
+            return default
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            repairs.append(f"coerced {path} to boolean")
+            return value.lower() == "true"
+        raise MessageValidationError(f"{path} must be a boolean")
+    return validate
+
+
+def _array(item: Validator, required: bool = False) -> Validator:
+    def validate(value: Any, path: str, repairs: List[str]) -> Any:
+        if value is _MISSING or value is None:
+            if required:
+                raise MessageValidationError(f"{path} is required")
+            return []
+        if not isinstance(value, list):
+            raise MessageValidationError(f"{path} must be an array")
+        return [item(element, f"{path}[{i}]", repairs) for i, element in enumerate(value)]
+    return validate
+
+
+def _object(fields: Dict[str, Validator]) -> Validator:
+    def validate(value: Any, path: str, repairs: List[str]) -> Any:
+        if value is _MISSING or value is None:
+            raise MessageValidationError(f"{path} is required")
+        if not isinstance(value, dict):
+            raise MessageValidationError(f"{path} must be an object")
+        extra = set(value) - set(fields)
+        if extra:
+            repairs.append(f"dropped {', '.join(sorted(f'{path}.{key}' for key in extra))}")
+        return {
+            name: check(value.get(name, _MISSING), f"{path}.{name}", repairs)
+            for name, check in fields.items()
+        }
+    return validate
+
+
+_EXERCISE = _object({
+    "name": _string(),
+    "description": _string(default=""),
+})
+
+_FINAL_EXERCISE = _object({
+    "name": _string(),
+    "description": _string(default=""),
+    "selected_image": _string(nullable=True, default=None),
+})
+
+
+def _soap_report(exercise: Validator) -> Validator:
+    return _object({
+        "patient_name": _string(nullable=True, default=None),
+        "patient_age": _string(nullable=True, default=None),
+        "condition": _string(nullable=True, default=None),
+        "session_date": _string(nullable=True, default=None),
+        "subjective": _string(default=""),
+        "objective": _string(default=""),
+        "assessment": _string(default=""),
+        "plan": _string(default=""),
+        "exercises": _array(exercise),
+    })
+
+
+_IMAGE = _object({
+    "id": _string(),
+    "url": _string(),
+    "name": _string(default=""),
+    "thumbnail_url": _string(nullable=True, default=None),
+    "selected": _boolean(False),
+})
+
+# Validators for the body of each message type (everything but type/timestamp)
+_MESSAGE_SCHEMAS: Dict[str, Dict[str, Validator]] = {
+    MessageType.CHAT_MESSAGE.value: {
+        "content": _string(),
+    },
+    MessageType.SOAP_DRAFT.value: {
+        "soap_report": _soap_report(_EXERCISE),
+    },
+    MessageType.EXERCISE_SELECTION.value: {
+        "exercises": _array(_object({
+            "id": _string(),
+            "name": _string(),
+            "description": _string(default=""),
+            "images": _array(_IMAGE),
+        }), required=True),
+        "requires_selection": _boolean(True),
+    },
+    MessageType.FINAL_REPORT.value: {
+        "soap_report": _soap_report(_FINAL_EXERCISE),
+        "selected_images": _array(_string()),
+        "ready_for_pdf": _boolean(True),
+    },
+    MessageType.CLARIFICATION.value: {
+        "questions": _array(_string(), required=True),
+        "original_content": _string(default=""),
+    },
+    MessageType.ERROR.value: {
+        "error": _string(),
+        "details": _string(nullable=True, default=None),
+    },
+}
+
+_VALIDATORS: Dict[str, Validator] = {
+    message_type: _object(fields) for message_type, fields in _MESSAGE_SCHEMAS.items()
+}
+
+# Top-level keys that identify a message whose "type" the model forgot
+_TYPE_HINTS = [
+    ("selected_images", MessageType.FINAL_REPORT.value),
+    ("soap_report", MessageType.SOAP_DRAFT.value),
+    ("exercises", MessageType.EXERCISE_SELECTION.value),
+    ("questions", MessageType.CLARIFICATION.value),
+    ("content", MessageType.CHAT_MESSAGE.value),
+]
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Pull the first JSON object out of free text.
+
+    Handles code fences, prose before or after the object and trailing commas.
+
+    Args:
+        text: Raw model reply.
+
+    Returns:
+        The decoded object, or None if the text contains no parseable object.
+    """
+    candidates = [match.group(1) for match in _FENCE.finditer(text)] + [text]
+    decoder = json.JSONDecoder()
+    for candidate in candidates:
+        for source in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            start = source.find("{")
+            while start != -1:
+                # Decoding from a "{" can only produce an object
+                try:
+                    value, _ = decoder.raw_decode(source, start)
+                    return cast(Dict[str, Any], value)
+                except ValueError:
+                    pass
+                start = source.find("{", start + 1)
+    return None
+
+
+def validate_message(message: Dict[str, Any], repairs: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Validate a decoded message and return its canonical form.
+
+    Missing types are inferred from the payload, missing timestamps are filled
+    in, scalar types are coerced, defaults are applied and unknown keys dropped.
+
+    Args:
+        message: Decoded JSON object produced by the model.
+        repairs: Optional list that receives a note for every repair applied.
+
+    Returns:
+        A new dictionary with ``type`` and ``timestamp`` first.
+
+    Raises:
+        MessageValidationError: If the message type is unknown or a required
+            field is missing or of the wrong type.
+    """
+    repairs = repairs if repairs is not None else []
+    message_type = message.get("type")
+    if message_type is None:
+        message_type = next((t for key, t in _TYPE_HINTS if key in message), None)
+        if message_type is None:
+            raise MessageValidationError("message has no type")
+        repairs.append(f"inferred type {message_type}")
+
+    validator = _VALIDATORS.get(message_type)
+    if validator is None:
+        raise MessageValidationError(f"unknown message type {message_type!r}")
+
+    timestamp = message.get("timestamp")
+    if not isinstance(timestamp, str) or not timestamp:
+        timestamp = datetime.now().isoformat()
+        repairs.append("added timestamp")
+
+    body = {key: value for key, value in message.items() if key not in ("type", "timestamp")}
+    return {"type": message_type, "timestamp": timestamp, **validator(body, message_type, repairs)}
+
+
+def _chat_message(text: str) -> Dict[str, Any]:
+    return {
+        "type": MessageType.CHAT_MESSAGE.value,
+        "timestamp": datetime.now().isoformat(),
+        "content": text.strip(),
+    }
+
+
+def parse_agent_reply(text: str) -> Dict[str, Any]:
+    """
+    Turn a raw agent reply into a canonical structured message.
+
+    Replies without any JSON object become a chat_message carrying the text;
+    JSON that cannot be repaired into a valid message becomes an error message.
+
+    Args:
+        text: Raw model reply.
+
+    Returns:
+        Canonical message payload.
+    """
+    message = extract_json_object(text)
+    if message is None:
+        return _chat_message(text)
+    try:
+        return validate_message(message)
+    except MessageValidationError as e:
+        return {
+            "type": MessageType.ERROR.value,
+            "timestamp": datetime.now().isoformat(),
+            "error": "The assistant reply could not be read",
+            "details": str(e),
+        }
+
+
+def canonicalize_model_response(callback_context: Any, llm_response: Any) -> None:
+    """
+    ADK after-model callback that rewrites final text replies into canonical JSON.
+
+    Plain-text replies are wrapped as a chat_message. Streaming chunks, tool
+    calls and JSON replies that cannot be validated are left unchanged.
+
+    The response is rewritten in place and None is returned, because ADK stops
+    running later after-model callbacks once one returns a response.
+    """
+    if llm_response.partial or not llm_response.content or not llm_response.content.parts:
+        return None
+    text_parts = [part for part in llm_response.content.parts if part.text and not part.thought]
+    if not text_parts or any(part.function_call for part in llm_response.content.parts):
+        return None
+
+    text = "".join(part.text for part in text_parts)
+    message = extract_json_object(text)
+    repairs: List[str] = []
+    if message is None:
+        canonical = _chat_message(text)
+        repairs.append("wrapped plain text as chat_message")
+    else:
+        try:
+            canonical = validate_message(message, repairs)
+        except MessageValidationError as e:
+            logger.warning("Agent reply failed validation: %s", e)
+            return None
+
+    if repairs:
+        logger.info("Repaired agent reply: %s", "; ".join(repairs))
+    text_parts[0].text = dumps(canonical)
+    llm_response.content.parts = [
+        part for part in llm_response.content.parts
+        if not any(part is extra for extra in text_parts[1:])
+    ]
+    return None
@@ -0,0 +1,135 @@
+"""
+Speculative illustration prefetch.
+
+The exercise names of a soap_draft are known as soon as the model writes its
+``exercises`` array, but the illustration search only runs in a later agent
+step. This after-model callback watches the draft as it is generated - chunk
+by chunk when streaming, or whole when not - and starts a background search
+for each exercise name the moment it completes. When the agent then calls the
+search tools, results are already cached or joined in flight through the
+tool's single-flight, so search latency overlaps with generation and the
+clinician's review of the draft.
+
+Environment:
+    MOTION_ILLUSTRATION_PREFETCH: set to ``0`` to disable prefetching.
+    MOTION_ILLUSTRATION_PREFETCH_MAX: most exercises prefetched per draft (default 12).
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import Any, Optional, Set, Tuple
+
+from motion.agents.soap_agents.message_types import MessageType
+from motion.agents.soap_agents.streaming import IncrementalJSONParser
+from motion.tools.illustration_cache import normalize_exercise_name
+
+
+logger = logging.getLogger(__name__)
+
+PREFETCH_ENABLED = os.getenv("MOTION_ILLUSTRATION_PREFETCH", "1") != "0"
+PREFETCH_MAX = int(os.getenv("MOTION_ILLUSTRATION_PREFETCH_MAX", "12"))
+
+# Parsers of responses still being streamed, by invocation; bounded in case a
+# stream is abandoned before its final response
+_MAX_TRACKED_STREAMS = 256
+
+
+class _DraftWatcher:
+    """Follows one model response and remembers which exercises were prefetched."""
+
+    __slots__ = ("parser", "message_type", "prefetched")
+
+    def __init__(self) -> None:
+        self.parser = IncrementalJSONParser()
+        self.message_type: Optional[str] = None
+        self.prefetched: Set[str] = set()
+
+
+_watchers: "OrderedDict[str, _DraftWatcher]" = OrderedDict()
+
+# Strong references to running prefetches; the loop only keeps weak ones
+_tasks: Set["asyncio.Task[Any]"] = set()
+
+
+def _is_exercise_name(path: Tuple[Any, ...]) -> bool:
+    return (
+        len(path) == 4
+        and path[:2] == ("soap_report", "exercises")
+        and isinstance(path[2], int)
+        and path[3] == "name"
+    )
+
+
+def prefetch_exercise(exercise_name: Any, prefetched: Set[str], limit: int = PREFETCH_MAX) -> bool:
+    """
+    Start a background illustration lookup for one exercise.
+
+    Args:
+        exercise_name: Exercise name; anything but a non-blank string is ignored.
+        prefetched: Normalized names already prefetched by this caller; updated.
+        limit: Most lookups started for one ``prefetched`` set.
+
+    Returns:
+        True if a lookup was started.
+    """
+    if not PREFETCH_ENABLED or not isinstance(exercise_name, str) or not exercise_name.strip():
+        return False
+    key = normalize_exercise_name(exercise_name)
+    if key in prefetched or len(prefetched) >= limit:
+        return False
+    prefetched.add(key)
+
+    from motion.tools.exercise_illustration_tool import search_exercise_illustrations
+
+    task = asyncio.ensure_future(search_exercise_illustrations(exercise_name))
+    _tasks.add(task)
+    task.add_done_callback(_finish_prefetch)
+    logger.debug("Prefetching illustrations for %r", exercise_name)
+    return True
+
+
+def _finish_prefetch(task: "asyncio.Task[Any]") -> None:
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug("Illustration prefetch failed: %s", task.exception())
+
+
+def _feed(watcher: _DraftWatcher, text: str) -> None:
+    for path, value in watcher.parser.feed(text):
+        if path == ("type",):
+            watcher.message_type = value
+        elif _is_exercise_name(path) and watcher.message_type in (None, MessageType.SOAP_DRAFT.value):
+            prefetch_exercise(value, watcher.prefetched)
+
+
+def prefetch_illustrations(callback_context: Any, llm_response: Any) -> None:
+    """
+    ADK after-model callback that prefetches illustrations for draft exercises.
+
+    Streaming chunks are parsed incrementally; the final response is parsed
+    once more in full, which covers non-streaming runs and anything a chunk
+    boundary hid. Never changes the response.
+    """
+    if not PREFETCH_ENABLED or not llm_response.content or not llm_response.content.parts:
+        return None
+    text = "".join(part.text for part in llm_response.content.parts if part.text and not part.thought)
+    if not text:
+        return None
+
+    invocation_id = callback_context.invocation_id
+    if llm_response.partial:
+        watcher = _watchers.get(invocation_id)
+        if watcher is None:
+            watcher = _watchers[invocation_id] = _DraftWatcher()
+            while len(_watchers) > _MAX_TRACKED_STREAMS:
+                _watchers.popitem(last=False)
+        _feed(watcher, text)
+        return None
+
+    watcher = _watchers.pop(invocation_id, None) or _DraftWatcher()
+    final = _DraftWatcher()
+    final.prefetched = watcher.prefetched
+    _feed(final, text)
+    return None
@@ -0,0 +1,156 @@
+"""
+Deterministic assembly of the final SOAP report.
+
+The last ``soap_draft`` and ``exercise_selection`` messages of a session are
+kept in session state. When the client submits its image selection, the final
+report is built directly from them - no model turn, so the clinical text is
+exactly what the clinician reviewed.
+"""
+
+import json
+from typing import Any, Dict, List, Optional
+
+from motion.agents.soap_agents.message_types import MessageType, create_final_report_message
+from motion.tools.illustration_cache import normalize_exercise_name
+
+
+# Session state keys holding the latest structured messages
+LAST_SOAP_DRAFT_KEY = "last_soap_draft"
+LAST_EXERCISE_SELECTION_KEY = "last_exercise_selection"
+
+IMAGE_SELECTION_MESSAGE_TYPE = "image_selection"
+
+
+def parse_image_selection(text: str) -> Optional[List[str]]:
+    """
+    Recognize an image selection submission from the client.
+
+    Args:
+        text: User message text, e.g.
+            ``{"selected_image_ids": ["img_cat_cow_0"], "message_type": "image_selection"}``.
+
+    Returns:
+        The selected image IDs, or None if the text is not a selection.
+    """
+    text = text.strip()
+    if not text.startswith("{"):
+        return None
+    try:
+        payload = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(payload, dict) or payload.get("message_type") != IMAGE_SELECTION_MESSAGE_TYPE:
+        return None
+    selected = payload.get("selected_image_ids")
+    if not isinstance(selected, list):
+        return None
+    return [str(image_id) for image_id in selected]
+
+
+def assemble_final_report(
+    soap_report: Dict[str, Any],
+    selection_exercises: List[Dict[str, Any]],
+    selected_image_ids: List[str],
+) -> str:
+    """
+    Build the final report message from a draft and the user's image choices.
+
+    Each draft exercise is matched to its exercise_selection entry by name (or
+    position, if the names differ) and gets the URL of the first selected
+    image for that exercise as ``selected_image``.
+
+    Args:
+        soap_report: ``soap_report`` of the last soap_draft message.
+        selection_exercises: ``exercises`` of the last exercise_selection message.
+        selected_image_ids: Image IDs chosen by the user.
+
+    Returns:
+        Final report message JSON.
+    """
+    selected = set(selected_image_ids)
+    chosen_by_name: Dict[str, str] = {}
+    chosen_by_index: Dict[int, str] = {}
+    for index, exercise in enumerate(selection_exercises):
+        url = next(
+            (image.get("url") for image in exercise.get("images", []) if image.get("id") in selected),
+            None,
+        )
+        if url:
+            chosen_by_name.setdefault(normalize_exercise_name(exercise.get("name", "")), url)
+            chosen_by_index[index] = url
+
+    exercises = []
+    for index, exercise in enumerate(soap_report.get("exercises") or []):
+        url = chosen_by_name.get(normalize_exercise_name(exercise.get("name", "")))
+        if url is None:
+            url = chosen_by_index.get(index)
+        exercises.append({
+            "name": exercise.get("name", ""),
+            "description": exercise.get("description", ""),
+            "selected_image": url,
+        })
+
+    final_report = {**soap_report, "exercises": exercises}
+    return create_final_report_message(final_report, selected_image_ids)
+
+
+def remember_structured_reply(callback_context: Any, llm_response: Any) -> None:
+    """
+    ADK after-model callback that keeps the latest draft and selection in session state.
+
+    Runs after canonicalize_model_response, so replies are canonical JSON. A new
+    draft invalidates any earlier selection; a final report closes the draft.
+    """
+    if llm_response.partial or not llm_response.content or not llm_response.content.parts:
+        return None
+    text = "".join(part.text for part in llm_response.content.parts if part.text and not part.thought)
+    if not text.startswith("{"):
+        return None
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+
+    message_type = message.get("type")
+    if message_type == MessageType.SOAP_DRAFT.value:
+        callback_context.state[LAST_SOAP_DRAFT_KEY] = message.get("soap_report")
+        callback_context.state[LAST_EXERCISE_SELECTION_KEY] = None
+    elif message_type == MessageType.EXERCISE_SELECTION.value:
+        callback_context.state[LAST_EXERCISE_SELECTION_KEY] = message.get("exercises")
+    elif message_type == MessageType.FINAL_REPORT.value:
+        close_draft(callback_context.state)
+    return None
+
+
+def close_draft(state: Any) -> None:
+    """Forget the draft and selection once the final report is out, so later turns are not edits."""
+    state[LAST_SOAP_DRAFT_KEY] = None
+    state[LAST_EXERCISE_SELECTION_KEY] = None
+
+
+def answer_image_selection(callback_context: Any) -> Optional[Any]:
+    """
+    ADK before-agent callback that answers image selections without the model.
+
+    Returns:
+        Model content holding the final report, or None to run the agent as usual
+        (the message is not a selection, or no draft/selection is on record).
+    """
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return None
+    text = "".join(part.text for part in user_content.parts if part.text)
+    selected_image_ids = parse_image_selection(text)
+    if selected_image_ids is None:
+        return None
+
+    soap_report = callback_context.state.get(LAST_SOAP_DRAFT_KEY)
+    selection_exercises = callback_context.state.get(LAST_EXERCISE_SELECTION_KEY)
+    if not soap_report or not selection_exercises:
+        return None
+
+    from google.genai import types
+
+    report = assemble_final_report(soap_report, selection_exercises, selected_image_ids)
+    close_draft(callback_context.state)
+    return types.Content(role="model", parts=[types.Part(text=report)])
@@ -0,0 +1,209 @@
+"""
+Local pre-router that picks the communication mode for each turn.
+
+The "Detection Criteria for SOAP Mode" of the prompt are scored with regular
+expressions before the model is called: pain scales, clinical examination
+findings, patient presentation, treatment details and documentation intent.
+Turns that score high enough run in SOAP mode; everything else runs in chat
+mode, with a much smaller prompt, no tool declarations and, optionally, a
+faster model.
+
+Decisions are logged (scores and matched signals only, never the message
+text) on the ``motion.agents.soap_agents.router`` logger for tuning.
+
+Environment:
+    MOTION_ROUTER: set to ``0`` to disable routing and always send INSTRUCTION.
+    MOTION_ROUTER_SOAP_THRESHOLD: minimum score for SOAP mode (default 3).
+    MOTION_CHAT_MODEL: model used for chat turns (default: the agent's model).
+    MOTION_SOAP_MODEL: model used for SOAP turns (default: the agent's model).
+"""
+
+import logging
+import os
+import re
+from enum import Enum
+from typing import Any, Dict, List, Optional, Tuple
+
+from motion.agents.soap_agents.prompts import CHAT_INSTRUCTION, INSTRUCTION, SOAP_INSTRUCTION
+from motion.agents.soap_agents.report_assembly import LAST_SOAP_DRAFT_KEY
+
+
+logger = logging.getLogger(__name__)
+
+ROUTER_ENABLED = os.getenv("MOTION_ROUTER", "1") != "0"
+SOAP_THRESHOLD = int(os.getenv("MOTION_ROUTER_SOAP_THRESHOLD", "3"))
+CHAT_MODEL = os.getenv("MOTION_CHAT_MODEL")
+SOAP_MODEL = os.getenv("MOTION_SOAP_MODEL")
+
+# Session state key holding the mode of the current turn
+MODE_KEY = "motion_mode"
+
+
+class Mode(str, Enum):
+    """Communication mode of a turn."""
+    CHAT = "chat"
+    SOAP = "soap"
+
+
+def _pattern(*alternatives: str) -> "re.Pattern[str]":
+    return re.compile(r"\b(?:" + "|".join(alternatives) + r")\b", re.IGNORECASE)
+
+
+# (signal name, weight, pattern). Each signal counts once per message.
+_SIGNALS: List[Tuple[str, int, "re.Pattern[str]"]] = [
+    ("pain_scale", 3, re.compile(r"\b(?:10|\d(?:\.\d)?)\s*(?:/|out of)\s*10\b", re.IGNORECASE)),
+    ("strength_grade", 2, re.compile(r"\b[0-5][+-]?\s*/\s*5\b")),
+    ("range_in_degrees", 2, re.compile(r"\b\d{1,3}\s*(?:°|deg\b|degrees\b)", re.IGNORECASE)),
+    ("clinical_finding", 2, _pattern(
+        r"slr", r"straight leg raise", r"rom", r"range of (?:motion|movement)", r"flexion",
+        r"extension", r"abduction", r"adduction", r"rotation", r"palpation", r"tender(?:ness)?",
+        r"(?:positive|negative|\+ve|-ve) \w+(?: \w+)? test", r"special tests?", r"mmt",
+        r"lachman'?s?", r"mcmurray'?s?", r"phalen'?s?", r"hawkins(?:-kennedy)?", r"neer'?s?",
+        r"faber", r"thomas test", r"effusion", r"reflexes", r"dermatomes?", r"myotomes?",
+    )),
+    ("patient_presentation", 2, _pattern(
+        r"patient", r"pt", r"client", r"\d{1,3}\s*(?:yo|y/o|years? old|year-old)", r"aged \d{1,3}",
+        r"presented", r"presents", r"complain(?:ed|s|ing)? of", r"c/o", r"history of", r"hx",
+    )),
+    ("treatment_given", 2, _pattern(
+        r"treated", r"i did", r"we did", r"manual therapy", r"mobili[sz]ations?", r"manipulation",
+        r"dry needling", r"taping", r"soft tissue", r"gave (?:him|her|them)", r"hep",
+        r"home exercise(?: program(?:me)?)?", r"review in", r"follow[- ]up", r"session",
+    )),
+    ("documentation_intent", 3, _pattern(
+        r"soap", r"write (?:this|it) up", r"write-?up", r"document(?: this)?", r"notes? for",
+        r"report for",
+    )),
+    ("symptom", 1, _pattern(
+        r"pain(?:ful)?", r"ache|aching", r"stiff(?:ness)?", r"swelling", r"numbness", r"tingling",
+        r"weakness", r"instability", r"spasms?",
+    )),
+]
+
+# Follow-ups that edit an existing draft stay in SOAP mode. Questions only
+# count when they name an edit, e.g. "Can you add a calf stretch?".
+_EDIT_VERBS = (
+    r"change", r"add", r"remove", r"replace", r"update", r"edit", r"modify", r"correct",
+    r"fix", r"instead", r"redo", r"regenerate",
+)
+_DRAFT_EDIT = _pattern(*_EDIT_VERBS)
+_DRAFT_FOLLOW_UP = _pattern(
+    *_EDIT_VERBS, r"exercises?", r"images?", r"illustrations?",
+    r"draft", r"report", r"subjective", r"objective", r"assessment", r"plan",
+)
+_DRAFT_FOLLOW_UP_WEIGHT = 3
+
+# General questions rarely document a session
+_QUESTION = re.compile(r"^\s*(?:what|which|how|why|when|is|are|can|could|should|do|does)\b.*\?\s*$",
+                       re.IGNORECASE | re.DOTALL)
+_QUESTION_WEIGHT = -1
+
+
+class RouteDecision:
+    """Result of routing one turn."""
+
+    __slots__ = ("mode", "score", "signals")
+
+    def __init__(self, mode: Mode, score: int, signals: List[str]):
+        self.mode = mode
+        self.score = score
+        self.signals = signals
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the decision to a loggable dictionary."""
+        return {"mode": self.mode.value, "score": self.score, "signals": self.signals}
+
+
+def route_message(text: str, has_draft: bool = False, threshold: int = SOAP_THRESHOLD) -> RouteDecision:
+    """
+    Decide whether a user message should be handled in chat or SOAP mode.
+
+    Args:
+        text: User message text.
+        has_draft: Whether the session has an open SOAP draft, in which case
+            messages that refer to it (exercises, images, edits) stay in SOAP mode.
+            General questions only do so if they ask for an edit.
+        threshold: Minimum score for SOAP mode.
+
+    Returns:
+        The routing decision with its score and the signals that matched.
+    """
+    score = 0
+    signals: List[str] = []
+    for name, weight, pattern in _SIGNALS:
+        if pattern.search(text):
+            score += weight
+            signals.append(name)
+    question = bool(_QUESTION.match(text))
+    if has_draft and _DRAFT_FOLLOW_UP.search(text) and (not question or _DRAFT_EDIT.search(text)):
+        score += _DRAFT_FOLLOW_UP_WEIGHT
+        signals.append("draft_follow_up")
+    elif question:
+        score += _QUESTION_WEIGHT
+        signals.append("question")
+
+    mode = Mode.SOAP if score >= threshold else Mode.CHAT
+    return RouteDecision(mode, score, signals)
+
+
+def route_turn(callback_context: Any) -> None:
+    """
+    ADK before-agent callback that routes the turn and records its mode in state.
+
+    Runs after answer_image_selection, so image selections answered by the
+    server never reach the router.
+    """
+    if not ROUTER_ENABLED:
+        return None
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return None
+    text = "".join(part.text for part in user_content.parts if part.text)
+    decision = route_message(text, has_draft=bool(callback_context.state.get(LAST_SOAP_DRAFT_KEY)))
+    callback_context.state[MODE_KEY] = decision.mode.value
+    logger.info(
+        "Routed turn to %s mode (score=%d, signals=%s, chars=%d)",
+        decision.mode.value, decision.score, ",".join(decision.signals) or "-", len(text),
+    )
+    return None
+
+
+def mode_instruction(context: Any) -> str:
+    """ADK instruction provider returning the prompt for the turn's mode."""
+    mode = context.state.get(MODE_KEY) if ROUTER_ENABLED else None
+    if mode == Mode.CHAT.value:
+        return CHAT_INSTRUCTION
+    if mode == Mode.SOAP.value:
+        return SOAP_INSTRUCTION
+    return INSTRUCTION
+
+
+def _has_function_parts(contents: List[Any]) -> bool:
+    return any(
+        part.function_call or part.function_response
+        for content in contents
+        for part in (content.parts or [])
+    )
+
+
+def apply_mode(callback_context: Any, llm_request: Any) -> Optional[Any]:
+    """
+    ADK before-model callback that tailors the request to the turn's mode.
+
+    Chat turns drop the tool declarations (unless the history already holds
+    tool calls, which the model needs the declarations to interpret) and use
+    MOTION_CHAT_MODEL when set; SOAP turns use MOTION_SOAP_MODEL when set. The
+    model override only switches between models served by the same backend.
+    """
+    if not ROUTER_ENABLED:
+        return None
+    mode = callback_context.state.get(MODE_KEY)
+    if mode == Mode.CHAT.value:
+        if llm_request.config.tools and not _has_function_parts(llm_request.contents):
+            llm_request.config.tools = None
+            llm_request.tools_dict.clear()
+        if CHAT_MODEL:
+            llm_request.model = CHAT_MODEL
+    elif mode == Mode.SOAP.value and SOAP_MODEL:
+        llm_request.model = SOAP_MODEL
+    return None
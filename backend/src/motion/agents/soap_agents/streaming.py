@@ -0,0 +1,200 @@
+"""
+Incremental parsing of the agent's streamed JSON replies.
+
+The model writes each structured message as one JSON object, token by token.
+IncrementalJSONParser consumes those chunks and reports every value the moment
+its closing character arrives; StructuredStreamParser turns the completed
+values into partial messages ("soap_draft.subjective ready", "exercise 2
+ready", ...) so clients can render a report while it is still being generated.
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from motion.agents.soap_agents.message_types import PartialMessage
+
+
+Path = Tuple[Union[str, int], ...]
+
+_WHITESPACE = " \t\r\n"
+_SCALAR_END = ",}]" + _WHITESPACE
+
+
+class IncrementalJSONParser:
+    """
+    Streaming parser for a single JSON object or array.
+
+    Text before the first ``{`` or ``[`` (prose, a ```json fence) is skipped and
+    text after the root value closes is ignored. The parser is tolerant rather
+    than validating: it never raises on malformed input, it just stops
+    reporting values it cannot place.
+    """
+
+    def __init__(self) -> None:
+        self.done = False
+        self.root: Any = None
+        self._stack: List[Union[Dict[str, Any], List[Any]]] = []
+        self._path: List[Union[str, int]] = []
+        self._expect_key = False
+        self._pending_key: Optional[str] = None
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._scalar: List[str] = []
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """
+        Consume a chunk of model output.
+
+        Args:
+            chunk: Next piece of text, of any length.
+
+        Returns:
+            ``(path, value)`` for every value completed by this chunk, innermost
+            first; ``()`` is the path of the root value.
+        """
+        completed: List[Tuple[Path, Any]] = []
+        for char in chunk:
+            if self.done:
+                break
+            self._consume(char, completed)
+        return completed
+
+    def _consume(self, char: str, completed: List[Tuple[Path, Any]]) -> None:
+        if self._in_string:
+            if self._escape:
+                self._string.append(char)
+                self._escape = False
+            elif char == "\\":
+                self._string.append(char)
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                try:
+                    text = json.loads('"' + "".join(self._string) + '"')
+                except ValueError:
+                    text = "".join(self._string)
+                self._string = []
+                if self._expect_key:
+                    self._pending_key = text
+                    self._expect_key = False
+                else:
+                    self._complete(text, completed)
+            else:
+                self._string.append(char)
+            return
+
+        if self._scalar:
+            if char not in _SCALAR_END:
+                self._scalar.append(char)
+                return
+            raw = "".join(self._scalar)
+            self._scalar = []
+            try:
+                self._complete(json.loads(raw), completed)
+            except ValueError:
+                self._complete(raw, completed)
+
+        if not self._stack and self.root is None and char not in "{[":
+            return  # preamble before the root value
+
+        if char in _WHITESPACE or char == ":":
+            return
+        if char == '"':
+            self._in_string = True
+        elif char in "{[":
+            container: Union[Dict[str, Any], List[Any]] = {} if char == "{" else []
+            if self._stack:
+                self._path.append(self._slot())
+                self._pending_key = None
+            self._stack.append(container)
+            self._expect_key = char == "{"
+        elif char in "}]":
+            # Never empty here: a stray closer before the root is preamble
+            container = self._stack.pop()
+            self._complete(container, completed, slot=self._path.pop() if self._stack else None)
+        elif char == ",":
+            if self._stack and isinstance(self._stack[-1], dict):
+                self._expect_key = True
+        else:
+            self._scalar.append(char)
+
+    def _slot(self) -> Union[str, int]:
+        """Path element for the value about to be placed in the current container."""
+        parent = self._stack[-1]
+        if isinstance(parent, dict):
+            return self._pending_key if self._pending_key is not None else ""
+        return len(parent)
+
+    def _complete(
+        self,
+        value: Any,
+        completed: List[Tuple[Path, Any]],
+        slot: Optional[Union[str, int]] = None,
+    ) -> None:
+        if not self._stack:
+            self.root = value
+            self.done = True
+            completed.append(((), value))
+            return
+        parent = self._stack[-1]
+        if slot is None:
+            slot = self._slot()
+        completed.append((tuple(self._path) + (slot,), value))
+        if isinstance(parent, dict):
+            parent[str(slot)] = value
+            self._pending_key = None
+        else:
+            parent.append(value)
+
+
+class StructuredStreamParser:
+    """
+    Turns a streamed structured message into partial-message payloads.
+
+    A partial is emitted for every completed top-level field, every completed
+    field of a nested object such as ``soap_report``, and every completed item
+    of a list such as ``exercises``. Once the whole object has arrived,
+    ``message`` holds it.
+    """
+
+    def __init__(self) -> None:
+        self._json = IncrementalJSONParser()
+        self.message_type: Optional[str] = None
+
+    @property
+    def message(self) -> Optional[Dict[str, Any]]:
+        """The complete message object, once its closing brace has been seen."""
+        root = self._json.root
+        return root if isinstance(root, dict) else None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        Consume a chunk of model output.
+
+        Returns:
+            Partial message payloads completed by this chunk, in order.
+        """
+        partials = []
+        for path, value in self._json.feed(chunk):
+            if path == ("type",):
+                self.message_type = value
+                continue
+            partial = self._partial_for(path, value)
+            if partial is not None:
+                partials.append(partial)
+        return partials
+
+    def _partial_for(self, path: Path, value: Any) -> Optional[Dict[str, Any]]:
+        if not path or path[-1] == "timestamp" or self.message_type is None:
+            return None
+        if isinstance(path[-1], int):
+            if len(path) > 3:
+                return None
+            field = ".".join(str(p) for p in path[:-1])
+            return PartialMessage(self.message_type, field, value, index=path[-1]).to_dict()
+        if len(path) > 2 or isinstance(value, list) or (len(path) == 1 and isinstance(value, dict)):
+            # Lists and objects were already reported item by item / field by field
+            return None
+        field = ".".join(str(p) for p in path)
+        return PartialMessage(self.message_type, field, value).to_dict()
@@ -0,0 +1,111 @@
+"""
+FastAPI application serving the SOAP agent.
+
+Exposes the ADK API server routes the iOS client relies on (session CRUD,
+``/run`` and ``/run_sse``) around a Runner built directly on ``root_agent``,
+so the session service and lifecycle hooks are under our control. The routes
+live in feature routers under ``motion.api.routes``.
+"""
+
+import logging
+import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService, InMemorySessionService
+
+from motion.api.dependencies import APP_NAME, InFlightTracker
+from motion.api.routes import dictation, ops, reports, run, sessions
+from motion.reports.pdf_service import close_pdf_service
+from motion.tools.linkup_client import close_linkup_client
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_session_service() -> BaseSessionService:
+    """
+    Build the session service from the environment.
+
+    ``MOTION_SESSION_STORE`` selects the durable event-log store (see
+    session_store.py), e.g. ``sqlite:///sessions.db`` or ``redis://host:6379/0``,
+    so any worker or node can serve any session. ``MOTION_SESSION_DB_URL`` uses
+    ADK's DatabaseSessionService instead. Without either, sessions are kept in
+    memory and only the process that created them can serve them.
+    """
+    store_url = os.getenv("MOTION_SESSION_STORE")
+    if store_url:
+        from motion.api.session_store import EventLogSessionService, create_session_store
+
+        return EventLogSessionService(
+            create_session_store(store_url),
+            snapshot_interval=int(os.getenv("MOTION_SESSION_SNAPSHOT_INTERVAL", "20")),
+        )
+    db_url = os.getenv("MOTION_SESSION_DB_URL")
+    if db_url:
+        # Pulls in SQLAlchemy; only pay for it when configured
+        from google.adk.sessions import DatabaseSessionService
+
+        return DatabaseSessionService(db_url=db_url)
+    return InMemorySessionService()
+
+
+def create_app(session_service: Optional[BaseSessionService] = None) -> FastAPI:
+    """
+    Build the FastAPI application around ``root_agent``.
+
+    Args:
+        session_service: Session service to use; defaults to create_session_service().
+
+    Returns:
+        The configured FastAPI application.
+    """
+    from motion.agents.soap_agents.agent import get_root_agent
+
+    session_service = session_service or create_session_service()
+    runner = Runner(
+        app_name=APP_NAME,
+        agent=get_root_agent(),
+        artifact_service=InMemoryArtifactService(),
+        session_service=session_service,
+    )
+    tracker = InFlightTracker()
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+        yield
+        # The server has already drained connections (up to its graceful
+        # shutdown timeout) by the time the lifespan exits
+        if tracker.requests or tracker.streams:
+            logger.warning(
+                "Shutting down with %s requests and %s streams still in flight",
+                tracker.requests, tracker.streams,
+            )
+        close_linkup_client()
+        close_pdf_service()
+        close_sessions = getattr(session_service, "close", None)
+        if close_sessions:
+            close_sessions()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.runner = runner
+    app.state.session_service = session_service
+    app.state.in_flight = tracker
+
+    allow_origins = [origin for origin in os.getenv("MOTION_ALLOW_ORIGINS", "").split(",") if origin]
+    if allow_origins:
+        app.add_middleware(
+            CORSMiddleware,
+            allow_origins=allow_origins,
+            allow_credentials=True,
+            allow_methods=["*"],
+            allow_headers=["*"],
+        )
+
+    for router in (ops.router, reports.router, sessions.router, dictation.router, run.router):
+        app.include_router(router)
+    return app
@@ -0,0 +1,79 @@
+"""
+Shared request dependencies for the API routers.
+
+create_app() stores the runner, the session service and the in-flight tracker
+on ``app.state``; routers reach them through these functions so they can be
+declared with ``Depends`` instead of being closed over.
+"""
+
+from fastapi import Depends, HTTPException, Request
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService, Session
+
+
+# App name the iOS client uses in session and run URLs
+APP_NAME = "soap_agents"
+
+
+class InFlightTracker:
+    """Counts requests and SSE streams that are still being served."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.streams = 0
+
+    def enter(self, stream: bool = False) -> None:
+        if stream:
+            self.streams += 1
+        else:
+            self.requests += 1
+
+    def leave(self, stream: bool = False) -> None:
+        if stream:
+            self.streams -= 1
+        else:
+            self.requests -= 1
+
+
+def get_runner(request: Request) -> Runner:
+    runner: Runner = request.app.state.runner
+    return runner
+
+
+def get_session_service(request: Request) -> BaseSessionService:
+    session_service: BaseSessionService = request.app.state.session_service
+    return session_service
+
+
+def get_in_flight(request: Request) -> InFlightTracker:
+    tracker: InFlightTracker = request.app.state.in_flight
+    return tracker
+
+
+def require_app(app_name: str) -> None:
+    """Answer 404 for any app but the one the runner serves."""
+    if app_name != APP_NAME:
+        raise HTTPException(status_code=404, detail=f"App not found: {app_name}")
+
+
+async def load_session(
+    session_service: BaseSessionService, app_name: str, user_id: str, session_id: str
+) -> Session:
+    """Fetch a session of the served app, answering 404 if it does not exist."""
+    require_app(app_name)
+    session = await session_service.get_session(
+        app_name=app_name, user_id=user_id, session_id=session_id
+    )
+    if not session:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+
+async def require_session(
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    session_service: BaseSessionService = Depends(get_session_service),
+) -> Session:
+    """Dependency for session-scoped routes: the session named by the path, or 404."""
+    return await load_session(session_service, app_name, user_id, session_id)
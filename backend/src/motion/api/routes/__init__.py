@@ -0,0 +1 @@
+"""HTTP routes of the agent server, grouped by feature; create_app() mounts them."""
@@ -0,0 +1,59 @@
+"""Incremental dictation: ingest the transcript while the clinician is still speaking."""
+
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+
+from motion.api.dependencies import require_session
+
+
+router = APIRouter()
+
+DICTATION_PATH = "/apps/{app_name}/users/{user_id}/sessions/{session_id}/dictation"
+
+
+def require_dictation_routing() -> None:
+    """Refuse dictation updates that could reach a worker not holding the session's dictation."""
+    from motion.agents.soap_agents.dictation import dictation_available
+
+    if not dictation_available():
+        raise HTTPException(
+            status_code=501,
+            detail="Incremental dictation needs sticky session routing when serving with several workers; "
+            "submit the final transcript to /run instead",
+        )
+
+
+class DictationUpdate(BaseModel):
+    """Body of the dictation endpoint: the transcript so far, or the text added to it."""
+
+    transcript: Optional[str] = None
+    delta: Optional[str] = None
+    seq: Optional[int] = None
+
+
+@router.post(DICTATION_PATH, dependencies=[Depends(require_dictation_routing), Depends(require_session)])
+async def update_dictation(app_name: str, user_id: str, session_id: str, update: DictationUpdate) -> Dict[str, Any]:
+    """
+    Ingest the transcript while the clinician is still dictating.
+
+    Send the full transcript recognized so far (``transcript``) or the text
+    added since the last update (``delta``), with an increasing ``seq``.
+    Returns the running draft; submit the final transcript to ``/run`` or
+    ``/run_sse`` as usual once dictation ends. Answers 501 when the server
+    runs several workers without sticky session routing.
+    """
+    from motion.agents.soap_agents.dictation import update_dictation
+
+    return update_dictation(
+        app_name, user_id, session_id,
+        transcript=update.transcript, delta=update.delta, seq=update.seq,
+    )
+
+
+@router.delete(DICTATION_PATH, dependencies=[Depends(require_session)])
+async def discard_dictation(app_name: str, user_id: str, session_id: str) -> None:
+    from motion.agents.soap_agents.dictation import discard_dictation
+
+    discard_dictation(app_name, user_id, session_id)
@@ -0,0 +1,56 @@
+"""Operational routes: health, Prometheus metrics and proxied illustration images."""
+
+import asyncio
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+
+from motion.api.dependencies import InFlightTracker, get_in_flight
+from motion.telemetry import METRICS_ENABLED, render_metrics
+
+
+router = APIRouter()
+
+
+@router.get("/healthz")
+async def healthz(tracker: InFlightTracker = Depends(get_in_flight)) -> Dict[str, Any]:
+    return {
+        "status": "ok",
+        "requests_in_flight": tracker.requests,
+        "streams_in_flight": tracker.streams,
+    }
+
+
+@router.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def _sniff_file(path: Path) -> Optional[str]:
+    from motion.tools.image_proxy import sniff_image_type
+
+    with open(path, "rb") as f:
+        return sniff_image_type(f.read(12))
+
+
+@router.get("/images/{digest}/{variant}")
+async def get_image(digest: str, variant: str) -> FileResponse:
+    from motion.tools.image_proxy import VARIANTS, get_image_proxy, is_valid_digest
+
+    if variant not in VARIANTS or not is_valid_digest(digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    path = get_image_proxy().path_for(digest, variant)
+    try:
+        media_type = await asyncio.to_thread(_sniff_file, path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Image not found") from None
+    # Content-addressed, so a URL always refers to the same bytes
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers={"Cache-Control": "public, max-age=31536000, immutable", "ETag": f'"{digest}.{variant}"'},
+    )
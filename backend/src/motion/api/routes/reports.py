@@ -0,0 +1,155 @@
+"""Rendering final reports to PDF, one at a time or as a streamed ZIP archive."""
+
+import io
+import logging
+import math
+import os
+import weakref
+import zipfile
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from motion.agents.soap_agents.message_types import MessageType
+from motion.agents.soap_agents.output_parser import MessageValidationError, validate_message
+from motion.reports.layout import TEMPLATES, UnsupportedText, unsupported_fields
+from motion.reports.pdf_service import RenderBusy, get_pdf_service
+from motion.serialization import dumps_bytes
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Largest number of reports one batch PDF request may carry
+MAX_PDF_BATCH = int(os.getenv("MOTION_PDF_MAX_BATCH", "500"))
+
+
+class PdfBatchRequest(BaseModel):
+    """Body of the batch PDF endpoint: final_report messages to render."""
+
+    reports: List[Dict[str, Any]]
+
+
+class _ZipStream(io.RawIOBase):
+    """Write-only, unseekable sink that ZipFile writes a streamed archive into."""
+
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: Any) -> int:
+        self.buffer += data
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def final_report_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validate a final_report message for PDF rendering.
+
+    Answers 422 if it is not one, or if its text has characters the PDF fonts
+    cannot show (the detail names the fields).
+    """
+    try:
+        message = validate_message(message)
+    except MessageValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e)) from None
+    if message["type"] != MessageType.FINAL_REPORT.value:
+        raise HTTPException(status_code=422, detail=f"Expected a final_report message, got {message['type']}")
+    unsupported = unsupported_fields(message.get("soap_report") or {})
+    if unsupported:
+        raise HTTPException(status_code=422, detail=str(UnsupportedText(unsupported)))
+    return message
+
+
+def require_template(template: str) -> None:
+    if template not in TEMPLATES:
+        raise HTTPException(
+            status_code=422, detail=f"Unknown template {template!r}; expected one of {', '.join(TEMPLATES)}"
+        )
+
+
+@router.post("/reports/pdf")
+async def render_report_pdf(message: Dict[str, Any] = Body(...), template: str = "soap") -> StreamingResponse:
+    """Render a final_report message to PDF, streamed as it is read from the spool file."""
+    require_template(template)
+    final_report = final_report_message(message)
+    try:
+        document = await get_pdf_service().render(final_report, template)
+    except RenderBusy as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+        ) from None
+    except Exception as e:
+        logger.exception("Rendering a report PDF failed")
+        raise HTTPException(status_code=500, detail=f"Could not render the report: {e}") from None
+
+    chunks = document.chunks()
+    # A response cancelled before its first chunk never runs the cleanup in chunks()
+    weakref.finalize(chunks, document.discard)
+    return StreamingResponse(
+        chunks,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="{document.filename}"',
+            "Content-Length": str(document.size),
+        },
+    )
+
+
+@router.post("/reports/pdf/batch")
+async def render_report_pdfs(req: PdfBatchRequest, template: str = "soap") -> StreamingResponse:
+    """
+    Render many final_report messages into a ZIP archive streamed as reports finish.
+
+    Entries are named ``{position:03d}-{file name}.pdf`` and appear in
+    completion order. Reports that fail to render are listed in an
+    ``errors.json`` entry at the end instead of failing the whole batch.
+    """
+    require_template(template)
+    if not req.reports:
+        raise HTTPException(status_code=422, detail="No reports to render")
+    if len(req.reports) > MAX_PDF_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_PDF_BATCH} reports per batch")
+    messages = []
+    for index, message in enumerate(req.reports):
+        try:
+            messages.append(final_report_message(message))
+        except HTTPException as e:
+            raise HTTPException(status_code=422, detail=f"reports[{index}]: {e.detail}") from None
+
+    async def archive_stream() -> AsyncIterator[bytes]:
+        sink = _ZipStream()
+        errors = []
+        # PDF content is already compressed, so entries are stored as-is
+        with zipfile.ZipFile(sink, "w", zipfile.ZIP_STORED) as archive:
+            async with aclosing(get_pdf_service().render_many(messages, template)) as documents:
+                async for index, document in documents:
+                    if isinstance(document, Exception):
+                        logger.warning("Rendering report %s of a batch failed: %s", index, document)
+                        errors.append({"index": index, "error": str(document) or type(document).__name__})
+                        continue
+                    with archive.open(f"{index + 1:03d}-{document.filename}", "w") as entry:
+                        async with aclosing(document.chunks()) as chunks:
+                            async for chunk in chunks:
+                                entry.write(chunk)
+                                yield sink.drain()
+            if errors:
+                archive.writestr("errors.json", dumps_bytes(errors))
+        yield sink.drain()
+
+    return StreamingResponse(
+        archive_stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="soap-reports.zip"'},
+    )
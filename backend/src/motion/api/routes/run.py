@@ -0,0 +1,230 @@
+"""Agent turns: ``/run``, ``/run_sse`` and ``/run_sse_structured``."""
+
+import logging
+import math
+import weakref
+from typing import AsyncIterator, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.events import Event
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService, Session
+from google.genai import types
+from pydantic import BaseModel
+
+from motion.agents.soap_agents.message_types import ErrorMessage
+from motion.agents.soap_agents.output_parser import parse_agent_reply
+from motion.agents.soap_agents.prompts import CHAT_INSTRUCTION, SOAP_INSTRUCTION
+from motion.agents.soap_agents.report_assembly import LAST_SOAP_DRAFT_KEY
+from motion.agents.soap_agents.router import Mode, route_message
+from motion.agents.soap_agents.streaming import StructuredStreamParser
+from motion.api.dependencies import (
+    InFlightTracker,
+    get_in_flight,
+    get_runner,
+    get_session_service,
+    load_session,
+)
+from motion.scheduler import SCHEDULER_ENABLED, Priority, SchedulerRejected, Ticket, get_scheduler
+from motion.serialization import sse_event
+from motion.telemetry import span
+
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# Header bulk clients set to run their turns as background work
+PRIORITY_HEADER = "X-Motion-Priority"
+
+# Completion tokens charged to the token budget until the model reports usage
+_COMPLETION_TOKENS = {Priority.SOAP: 2000, Priority.CHAT: 400, Priority.BACKGROUND: 2000}
+
+_CHARS_PER_TOKEN = 4
+
+
+class AgentRunRequest(BaseModel):
+    """Body of ``/run`` and ``/run_sse``, matching the ADK API server."""
+
+    app_name: str
+    user_id: str
+    session_id: str
+    new_message: types.Content
+    streaming: bool = False
+
+
+def event_text(event: Event) -> str:
+    """Concatenate the visible text parts of an event's content."""
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text and not part.thought)
+
+
+def turn_priority(text: str, session: Session, requested: Optional[str] = None) -> Priority:
+    """
+    Priority class of a turn: background if the client asked for it, else by the turn's mode.
+
+    Args:
+        text: User message text.
+        session: Session the turn runs in.
+        requested: Value of the ``X-Motion-Priority`` header, if any.
+    """
+    if requested and requested.lower() == Priority.BACKGROUND.label:
+        return Priority.BACKGROUND
+    decision = route_message(text, has_draft=bool(session.state.get(LAST_SOAP_DRAFT_KEY)))
+    return Priority.SOAP if decision.mode == Mode.SOAP else Priority.CHAT
+
+
+def estimate_turn_tokens(text: str, session: Session, priority: Priority) -> int:
+    """Rough token cost of a turn: prompt, history and message, plus an allowance for the reply."""
+    instruction = CHAT_INSTRUCTION if priority == Priority.CHAT else SOAP_INSTRUCTION
+    history = sum(len(event_text(event)) for event in session.events)
+    return (len(instruction) + history + len(text)) // _CHARS_PER_TOKEN + _COMPLETION_TOKENS[priority]
+
+
+def release_after(chunks: AsyncIterator[bytes], ticket: Ticket) -> AsyncIterator[bytes]:
+    """Wrap a response stream so its scheduler slot is released when the stream ends."""
+    async def stream() -> AsyncIterator[bytes]:
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            ticket.release()
+
+    wrapped = stream()
+    # A response cancelled before its first chunk never runs the finally block
+    weakref.finalize(wrapped, ticket.release)
+    return wrapped
+
+
+async def admit(req: AgentRunRequest, session: Session, requested_priority: Optional[str]) -> Ticket:
+    """Wait for a scheduler slot for the turn, or answer 429/503 if there is none."""
+    text = "".join(part.text for part in req.new_message.parts or [] if part.text)
+    priority = turn_priority(text, session, requested_priority)
+    estimated_tokens = estimate_turn_tokens(text, session, priority)
+    if not SCHEDULER_ENABLED:
+        return Ticket(None, req.user_id, priority, estimated_tokens)
+    try:
+        return await get_scheduler().acquire(req.user_id, priority, estimated_tokens)
+    except SchedulerRejected as e:
+        raise HTTPException(
+            status_code=e.status_code, detail=str(e), headers={"Retry-After": str(math.ceil(e.retry_after))}
+        ) from None
+
+
+async def run_agent(
+    runner: Runner, req: AgentRunRequest, endpoint: str, ticket: Ticket, run_config: Optional[RunConfig] = None
+) -> AsyncIterator[Event]:
+    """Run one admitted agent turn inside an ``agent.run`` span, reporting its token usage."""
+    tokens = 0
+    with span("agent.run", endpoint=endpoint, session_id=req.session_id, priority=ticket.priority.label) as traced:
+        async for event in runner.run_async(
+            user_id=req.user_id,
+            session_id=req.session_id,
+            new_message=req.new_message,
+            run_config=run_config or RunConfig(),
+        ):
+            if event.error_code:
+                traced.set_error(event.error_message or event.error_code)
+            if event.usage_metadata is not None and not event.partial:
+                tokens += event.usage_metadata.total_token_count or 0
+            yield event
+    ticket.record_usage(tokens)
+
+
+@router.post("/run", response_model_exclude_none=True)
+async def agent_run(
+    req: AgentRunRequest,
+    priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+    runner: Runner = Depends(get_runner),
+    session_service: BaseSessionService = Depends(get_session_service),
+    tracker: InFlightTracker = Depends(get_in_flight),
+) -> List[Event]:
+    session = await load_session(session_service, req.app_name, req.user_id, req.session_id)
+    ticket = await admit(req, session, priority)
+    tracker.enter()
+    try:
+        return [event async for event in run_agent(runner, req, "/run", ticket)]
+    finally:
+        tracker.leave()
+        ticket.release()
+
+
+@router.post("/run_sse")
+async def agent_run_sse(
+    req: AgentRunRequest,
+    priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+    runner: Runner = Depends(get_runner),
+    session_service: BaseSessionService = Depends(get_session_service),
+    tracker: InFlightTracker = Depends(get_in_flight),
+) -> StreamingResponse:
+    session = await load_session(session_service, req.app_name, req.user_id, req.session_id)
+    ticket = await admit(req, session, priority)
+
+    async def event_generator() -> AsyncIterator[bytes]:
+        tracker.enter(stream=True)
+        try:
+            stream_mode = StreamingMode.SSE if req.streaming else StreamingMode.NONE
+            async for event in run_agent(runner, req, "/run_sse", ticket, RunConfig(streaming_mode=stream_mode)):
+                yield b"data: " + event.model_dump_json(exclude_none=True, by_alias=True).encode() + b"\n\n"
+        except Exception as e:
+            logger.exception("Error in run_sse stream: %s", e)
+            yield sse_event({"error": str(e)})
+        finally:
+            tracker.leave(stream=True)
+
+    return StreamingResponse(release_after(event_generator(), ticket), media_type="text/event-stream")
+
+
+@router.post("/run_sse_structured")
+async def agent_run_sse_structured(
+    req: AgentRunRequest,
+    priority: Optional[str] = Header(None, alias=PRIORITY_HEADER),
+    runner: Runner = Depends(get_runner),
+    session_service: BaseSessionService = Depends(get_session_service),
+    tracker: InFlightTracker = Depends(get_in_flight),
+) -> StreamingResponse:
+    """
+    Stream structured messages instead of raw ADK events.
+
+    While the model is still writing a message, a ``partial`` message is sent
+    for each field as soon as it is complete (``soap_report.subjective``,
+    each entry of ``soap_report.exercises``, ...). The complete, validated
+    message follows once the model finishes.
+    """
+    session = await load_session(session_service, req.app_name, req.user_id, req.session_id)
+    ticket = await admit(req, session, priority)
+
+    async def message_generator() -> AsyncIterator[bytes]:
+        tracker.enter(stream=True)
+        parser = StructuredStreamParser()
+        streamed = False
+        try:
+            async for event in run_agent(
+                runner, req, "/run_sse_structured", ticket, RunConfig(streaming_mode=StreamingMode.SSE)
+            ):
+                text = event_text(event)
+                if not text:
+                    continue
+                if event.partial:
+                    streamed = True
+                    for partial in parser.feed(text):
+                        yield sse_event(partial)
+                    continue
+
+                # Final, aggregated text of this model response
+                if not streamed:
+                    for partial in parser.feed(text):
+                        yield sse_event(partial)
+                yield sse_event(parse_agent_reply(text))
+                parser = StructuredStreamParser()
+                streamed = False
+        except Exception as e:
+            logger.exception("Error in run_sse_structured stream: %s", e)
+            yield sse_event(ErrorMessage("Agent run failed", str(e)).to_dict())
+        finally:
+            tracker.leave(stream=True)
+
+    return StreamingResponse(release_after(message_generator(), ticket), media_type="text/event-stream")
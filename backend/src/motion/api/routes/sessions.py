@@ -0,0 +1,88 @@
+"""Session CRUD routes, matching the ADK API server."""
+
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from google.adk.sessions import BaseSessionService, Session
+
+from motion.api.dependencies import APP_NAME, get_session_service, require_app, require_session
+
+
+router = APIRouter()
+
+
+@router.get("/list-apps")
+async def list_apps() -> List[str]:
+    return [APP_NAME]
+
+
+@router.get(
+    "/apps/{app_name}/users/{user_id}/sessions/{session_id}",
+    response_model_exclude_none=True,
+)
+async def get_session(session: Session = Depends(require_session)) -> Session:
+    return session
+
+
+@router.get(
+    "/apps/{app_name}/users/{user_id}/sessions",
+    response_model_exclude_none=True,
+    dependencies=[Depends(require_app)],
+)
+async def list_sessions(
+    app_name: str,
+    user_id: str,
+    session_service: BaseSessionService = Depends(get_session_service),
+) -> List[Session]:
+    response = await session_service.list_sessions(app_name=app_name, user_id=user_id)
+    return response.sessions
+
+
+@router.post(
+    "/apps/{app_name}/users/{user_id}/sessions/{session_id}",
+    response_model_exclude_none=True,
+    dependencies=[Depends(require_app)],
+)
+async def create_session_with_id(
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    state: Optional[Dict[str, Any]] = None,
+    session_service: BaseSessionService = Depends(get_session_service),
+) -> Session:
+    existing = await session_service.get_session(
+        app_name=app_name, user_id=user_id, session_id=session_id
+    )
+    if existing is not None:
+        raise HTTPException(status_code=400, detail=f"Session already exists: {session_id}")
+    return await session_service.create_session(
+        app_name=app_name, user_id=user_id, state=state, session_id=session_id
+    )
+
+
+@router.post(
+    "/apps/{app_name}/users/{user_id}/sessions",
+    response_model_exclude_none=True,
+    dependencies=[Depends(require_app)],
+)
+async def create_session(
+    app_name: str,
+    user_id: str,
+    state: Optional[Dict[str, Any]] = None,
+    session_service: BaseSessionService = Depends(get_session_service),
+) -> Session:
+    return await session_service.create_session(
+        app_name=app_name, user_id=user_id, state=state
+    )
+
+
+@router.delete("/apps/{app_name}/users/{user_id}/sessions/{session_id}", dependencies=[Depends(require_app)])
+async def delete_session(
+    app_name: str,
+    user_id: str,
+    session_id: str,
+    session_service: BaseSessionService = Depends(get_session_service),
+) -> None:
+    await session_service.delete_session(
+        app_name=app_name, user_id=user_id, session_id=session_id
+    )
@@ -0,0 +1,595 @@
+"""
+Durable session storage shared by every worker and node.
+
+EventLogSessionService implements ADK's session service on top of a small
+storage interface with two implementations:
+
+- SqliteSessionStore: one SQLite file, shared by the workers of a node (or by
+  nodes on a shared volume).
+- KeyValueSessionStore: any client with the Redis list/hash commands used
+  below - a ``redis.Redis`` instance for production, or InMemoryKeyValue as a
+  local stand-in.
+
+Every event is appended to the session's log and never rewritten. Every
+``snapshot_interval`` events the session (state and events up to that point)
+is written as a snapshot, so loading a session reads one snapshot and the
+short tail of the log after it rather than replaying the whole log.
+
+``app:`` and ``user:`` state is kept outside the session and merged in on
+load, as ADK's own services do; ``temp:`` state is never stored.
+
+Stores are selected with ``MOTION_SESSION_STORE``: ``sqlite:///path/to.db``,
+``redis://host:6379/0`` (needs the ``redis`` package) or ``memory://``.
+"""
+
+import abc
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import quote
+
+from google.adk.events import Event
+from google.adk.sessions import BaseSessionService, Session
+from google.adk.sessions.base_session_service import GetSessionConfig, ListSessionsResponse
+from google.adk.sessions.state import State
+
+
+DEFAULT_SNAPSHOT_INTERVAL = 20
+
+# (snapshot sequence number, snapshot payload, payloads of the events after it)
+LoadedSession = Tuple[int, str, List[str]]
+
+
+class SessionStore(abc.ABC):
+    """
+    Storage primitives behind EventLogSessionService.
+
+    Payloads are opaque JSON strings. Event sequence numbers start at 1 and are
+    assigned by the store, so concurrent writers never reuse one.
+    """
+
+    @abc.abstractmethod
+    def create_session(self, app_name: str, user_id: str, session_id: str, snapshot: str, update_time: float) -> bool:
+        """Store a new session with its initial snapshot (sequence 0); False if it already exists."""
+
+    @abc.abstractmethod
+    def append_event(self, app_name: str, user_id: str, session_id: str, event: str, update_time: float) -> int:
+        """Append an event to the session's log and return its sequence number."""
+
+    @abc.abstractmethod
+    def load(self, app_name: str, user_id: str, session_id: str) -> Optional[LoadedSession]:
+        """Return the latest snapshot and the events logged after it, or None."""
+
+    @abc.abstractmethod
+    def write_snapshot(self, app_name: str, user_id: str, session_id: str, seq: int, snapshot: str) -> None:
+        """Replace the session's snapshot with one covering events up to ``seq``."""
+
+    @abc.abstractmethod
+    def list_sessions(self, app_name: str, user_id: str) -> List[Tuple[str, float]]:
+        """Return ``(session_id, last_update_time)`` for each of a user's sessions."""
+
+    @abc.abstractmethod
+    def delete_session(self, app_name: str, user_id: str, session_id: str) -> None:
+        """Delete a session, its snapshot and its event log."""
+
+    @abc.abstractmethod
+    def get_scoped_state(self, scope: str) -> Dict[str, Any]:
+        """Return the app- or user-scoped state stored under ``scope``."""
+
+    @abc.abstractmethod
+    def update_scoped_state(self, scope: str, delta: Dict[str, Any]) -> None:
+        """Merge ``delta`` into the state stored under ``scope``."""
+
+    def close(self) -> None:
+        """Release connections held by the store."""
+
+
+class SqliteSessionStore(SessionStore):
+    """Session store in a single SQLite file (WAL mode, safe across processes)."""
+
+    def __init__(self, db_path: Path) -> None:
+        db_path = Path(db_path).expanduser()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+                last_seq INTEGER NOT NULL, update_time REAL NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS session_events (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL, payload TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id, seq)
+            );
+            CREATE TABLE IF NOT EXISTS session_snapshots (
+                app_name TEXT NOT NULL, user_id TEXT NOT NULL, session_id TEXT NOT NULL,
+                seq INTEGER NOT NULL, payload TEXT NOT NULL,
+                PRIMARY KEY (app_name, user_id, session_id)
+            );
+            CREATE TABLE IF NOT EXISTS scoped_state (
+                scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+                PRIMARY KEY (scope, key)
+            );
+            """
+        )
+
+    def create_session(self, app_name: str, user_id: str, session_id: str, snapshot: str, update_time: float) -> bool:
+        ids = (app_name, user_id, session_id)
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO sessions VALUES (?, ?, ?, 0, ?)", (*ids, update_time)
+                )
+                if cursor.rowcount:
+                    self._db.execute("INSERT OR REPLACE INTO session_snapshots VALUES (?, ?, ?, 0, ?)", (*ids, snapshot))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return bool(cursor.rowcount)
+
+    def append_event(self, app_name: str, user_id: str, session_id: str, event: str, update_time: float) -> int:
+        ids = (app_name, user_id, session_id)
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so the sequence number
+            # read below cannot be taken by another process
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT last_seq FROM sessions WHERE app_name = ? AND user_id = ? AND session_id = ?", ids
+                ).fetchone()
+                if row is None:
+                    raise KeyError(f"Session not found: {session_id}")
+                seq: int = row[0] + 1
+                self._db.execute("INSERT INTO session_events VALUES (?, ?, ?, ?, ?)", (*ids, seq, event))
+                self._db.execute(
+                    "UPDATE sessions SET last_seq = ?, update_time = ? "
+                    "WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    (seq, update_time, *ids),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return seq
+
+    def load(self, app_name: str, user_id: str, session_id: str) -> Optional[LoadedSession]:
+        ids = (app_name, user_id, session_id)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT seq, payload FROM session_snapshots WHERE app_name = ? AND user_id = ? AND session_id = ?", ids
+            ).fetchone()
+            if row is None:
+                return None
+            tail = self._db.execute(
+                "SELECT payload FROM session_events "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq > ? ORDER BY seq",
+                (*ids, row[0]),
+            ).fetchall()
+        return row[0], row[1], [payload for (payload,) in tail]
+
+    def write_snapshot(self, app_name: str, user_id: str, session_id: str, seq: int, snapshot: str) -> None:
+        with self._lock:
+            # Never replace a newer snapshot written concurrently by another worker
+            self._db.execute(
+                "UPDATE session_snapshots SET seq = ?, payload = ? "
+                "WHERE app_name = ? AND user_id = ? AND session_id = ? AND seq < ?",
+                (seq, snapshot, app_name, user_id, session_id, seq),
+            )
+
+    def list_sessions(self, app_name: str, user_id: str) -> List[Tuple[str, float]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id, update_time FROM sessions WHERE app_name = ? AND user_id = ?",
+                (app_name, user_id),
+            ).fetchall()
+        return [(session_id, update_time) for session_id, update_time in rows]
+
+    def delete_session(self, app_name: str, user_id: str, session_id: str) -> None:
+        ids = (app_name, user_id, session_id)
+        where = "WHERE app_name = ? AND user_id = ? AND session_id = ?"
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("sessions", "session_events", "session_snapshots"):
+                    self._db.execute(f"DELETE FROM {table} {where}", ids)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get_scoped_state(self, scope: str) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute("SELECT key, value FROM scoped_state WHERE scope = ?", (scope,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def update_scoped_state(self, scope: str, delta: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO scoped_state VALUES (?, ?, ?)",
+                [(scope, key, json.dumps(value)) for key, value in delta.items()],
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class InMemoryKeyValue:
+    """
+    Process-local stand-in for the subset of the Redis client API used by
+    KeyValueSessionStore, for tests and single-process development.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._values: Dict[str, Any] = {}
+        # Write count per key, for WATCH
+        self._versions: Dict[str, int] = {}
+
+    def _touch(self, *keys: str) -> None:
+        for key in keys:
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def exists(self, *keys: str) -> int:
+        with self._lock:
+            return sum(key in self._values for key in keys)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._values.get(key)
+
+    def set(self, key: str, value: str, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and key in self._values:
+                return None
+            self._values[key] = value.encode("utf-8")
+            self._touch(key)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            self._touch(*keys)
+            return sum(self._values.pop(key, None) is not None for key in keys)
+
+    def rpush(self, key: str, *values: str) -> int:
+        with self._lock:
+            items = self._values.setdefault(key, [])
+            items.extend(value.encode("utf-8") for value in values)
+            self._touch(key)
+            return len(items)
+
+    def lrange(self, key: str, start: int, end: int) -> List[bytes]:
+        with self._lock:
+            items = self._values.get(key, [])
+            return list(items[start:] if end == -1 else items[start:end + 1])
+
+    def hset(self, key: str, field: Optional[str] = None, value: Optional[str] = None,
+             mapping: Optional[Dict[str, str]] = None) -> int:
+        items: Dict[str, Optional[str]] = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        with self._lock:
+            fields = self._values.setdefault(key, {})
+            added = len(set(items) - set(fields))
+            fields.update({name: str(item).encode("utf-8") for name, item in items.items()})
+            self._touch(key)
+            return added
+
+    def hdel(self, key: str, *fields: str) -> int:
+        with self._lock:
+            stored = self._values.get(key, {})
+            self._touch(key)
+            return sum(stored.pop(field, None) is not None for field in fields)
+
+    def hgetall(self, key: str) -> Dict[bytes, bytes]:
+        with self._lock:
+            return {field.encode("utf-8"): value for field, value in self._values.get(key, {}).items()}
+
+    def transaction(self, func: Callable[[Any], None], *watches: str) -> List[Any]:
+        """
+        Run ``func`` with a pipeline and execute what it queued, like redis-py's
+        WATCH/MULTI/EXEC helper: if a watched key is written before the queued
+        commands run, ``func`` is called again.
+        """
+        while True:
+            with self._lock:
+                versions = [self._versions.get(key, 0) for key in watches]
+            pipe = _InMemoryPipeline(self)
+            func(pipe)
+            with self._lock:
+                if [self._versions.get(key, 0) for key in watches] == versions:
+                    return pipe.execute()
+
+    def close(self) -> None:
+        pass
+
+
+class _InMemoryPipeline:
+    """Transaction pipeline of InMemoryKeyValue: commands run at once until multi(), then queue."""
+
+    def __init__(self, client: InMemoryKeyValue) -> None:
+        self._client = client
+        self._queued: Optional[List[Tuple[str, Tuple[Any, ...], Dict[str, Any]]]] = None
+
+    def multi(self) -> None:
+        self._queued = []
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        command: Callable[..., Any] = getattr(self._client, name)
+        queued = self._queued
+        if queued is None:
+            return command
+
+        def queue(*args: Any, **kwargs: Any) -> "_InMemoryPipeline":
+            queued.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self) -> List[Any]:
+        return [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._queued or []]
+
+
+def _text(value: Any) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class KeyValueSessionStore(SessionStore):
+    """
+    Session store on a Redis-compatible key-value server.
+
+    Keys per session: ``{prefix}:events:{app}:{user}:{id}`` (list, the event
+    log; RPUSH returns the new length, which is the event's sequence number)
+    and ``{prefix}:snapshot:{app}:{user}:{id}``. Each user has an index hash
+    ``{prefix}:index:{app}:{user}`` mapping session IDs to update times, and
+    scoped state lives in ``{prefix}:state:{scope}`` hashes.
+
+    A session exists once its snapshot key does: creation claims it with a
+    single ``SET NX`` and only then adds the index entry, so a concurrent or
+    interrupted create never leaves an index entry without a snapshot. Appends
+    WATCH the snapshot key and push inside MULTI/EXEC, so an append racing a
+    delete fails instead of recreating the log of a deleted session.
+    """
+
+    def __init__(self, client: Any, prefix: str = "motion") -> None:
+        self._client = client
+        self._prefix = prefix
+
+    def _key(self, kind: str, *ids: str) -> str:
+        return ":".join([self._prefix, kind, *(quote(part, safe="") for part in ids)])
+
+    def create_session(self, app_name: str, user_id: str, session_id: str, snapshot: str, update_time: float) -> bool:
+        ids = (app_name, user_id, session_id)
+        if not self._client.set(self._key("snapshot", *ids), json.dumps({"seq": 0, "session": snapshot}), nx=True):
+            return False
+        self._client.hset(self._key("index", app_name, user_id), session_id, repr(update_time))
+        return True
+
+    def append_event(self, app_name: str, user_id: str, session_id: str, event: str, update_time: float) -> int:
+        ids = (app_name, user_id, session_id)
+        snapshot_key = self._key("snapshot", *ids)
+
+        def append(pipe: Any) -> None:
+            if not pipe.exists(snapshot_key):
+                raise KeyError(f"Session not found: {session_id}")
+            pipe.multi()
+            pipe.rpush(self._key("events", *ids), event)
+            pipe.hset(self._key("index", app_name, user_id), session_id, repr(update_time))
+
+        seq: int = self._client.transaction(append, snapshot_key)[0]
+        return seq
+
+    def load(self, app_name: str, user_id: str, session_id: str) -> Optional[LoadedSession]:
+        ids = (app_name, user_id, session_id)
+        raw = self._client.get(self._key("snapshot", *ids))
+        if raw is None:
+            return None
+        snapshot = json.loads(raw)
+        tail = self._client.lrange(self._key("events", *ids), snapshot["seq"], -1)
+        return snapshot["seq"], snapshot["session"], [_text(event) for event in tail]
+
+    def write_snapshot(self, app_name: str, user_id: str, session_id: str, seq: int, snapshot: str) -> None:
+        # Snapshots are derived from the log, so a lost race only costs a
+        # slightly longer replay
+        self._client.set(
+            self._key("snapshot", app_name, user_id, session_id), json.dumps({"seq": seq, "session": snapshot})
+        )
+
+    def list_sessions(self, app_name: str, user_id: str) -> List[Tuple[str, float]]:
+        index = self._client.hgetall(self._key("index", app_name, user_id))
+        return [(_text(session_id), float(_text(update_time))) for session_id, update_time in index.items()]
+
+    def delete_session(self, app_name: str, user_id: str, session_id: str) -> None:
+        ids = (app_name, user_id, session_id)
+        self._client.delete(self._key("events", *ids), self._key("snapshot", *ids))
+        self._client.hdel(self._key("index", app_name, user_id), session_id)
+
+    def get_scoped_state(self, scope: str) -> Dict[str, Any]:
+        stored = self._client.hgetall(self._key("state", scope))
+        return {_text(key): json.loads(value) for key, value in stored.items()}
+
+    def update_scoped_state(self, scope: str, delta: Dict[str, Any]) -> None:
+        if delta:
+            self._client.hset(
+                self._key("state", scope), mapping={key: json.dumps(value) for key, value in delta.items()}
+            )
+
+    def close(self) -> None:
+        self._client.close()
+
+
+def create_session_store(url: str) -> SessionStore:
+    """
+    Build a session store from a URL.
+
+    Args:
+        url: ``sqlite:///path/to.db``, ``redis://...`` / ``rediss://...`` or ``memory://``.
+
+    Returns:
+        The session store.
+    """
+    if url.startswith("sqlite:///"):
+        return SqliteSessionStore(Path(url[len("sqlite:///"):]))
+    if url.startswith(("redis://", "rediss://")):
+        import redis
+
+        return KeyValueSessionStore(redis.Redis.from_url(url))
+    if url.startswith("memory://"):
+        return KeyValueSessionStore(InMemoryKeyValue())
+    raise ValueError(f"Unsupported session store URL: {url}")
+
+
+def _apply_event(session: Session, event: Event) -> None:
+    if event.actions and event.actions.state_delta:
+        for key, value in event.actions.state_delta.items():
+            if not key.startswith(State.TEMP_PREFIX):
+                session.state[key] = value
+    session.events.append(event)
+    session.last_update_time = event.timestamp
+
+
+def _scoped_delta(event: Event, prefix: str) -> Dict[str, Any]:
+    if not event.actions or not event.actions.state_delta:
+        return {}
+    return {
+        key[len(prefix):]: value
+        for key, value in event.actions.state_delta.items()
+        if key.startswith(prefix)
+    }
+
+
+class EventLogSessionService(BaseSessionService):
+    """ADK session service persisting sessions as event logs plus snapshots in a SessionStore."""
+
+    def __init__(self, store: SessionStore, snapshot_interval: int = DEFAULT_SNAPSHOT_INTERVAL):
+        self.store = store
+        self.snapshot_interval = snapshot_interval
+
+    async def create_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        state: Optional[Dict[str, Any]] = None,
+        session_id: Optional[str] = None,
+    ) -> Session:
+        session_id = (session_id or "").strip() or str(uuid.uuid4())
+        session = Session(
+            app_name=app_name,
+            user_id=user_id,
+            id=session_id,
+            state=state or {},
+            last_update_time=time.time(),
+        )
+        created = await asyncio.to_thread(
+            self.store.create_session, app_name, user_id, session_id,
+            session.model_dump_json(), session.last_update_time,
+        )
+        if not created:
+            raise ValueError(f"Session already exists: {session_id}")
+        return await self._merge_scoped_state(session)
+
+    async def get_session(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        config: Optional[GetSessionConfig] = None,
+    ) -> Optional[Session]:
+        loaded = await asyncio.to_thread(self.store.load, app_name, user_id, session_id)
+        if loaded is None:
+            return None
+        _, snapshot, tail = loaded
+        session = Session.model_validate_json(snapshot)
+        for payload in tail:
+            _apply_event(session, Event.model_validate_json(payload))
+
+        if config:
+            if config.num_recent_events:
+                session.events = session.events[-config.num_recent_events:]
+            if config.after_timestamp:
+                session.events = [event for event in session.events if event.timestamp >= config.after_timestamp]
+        return await self._merge_scoped_state(session)
+
+    async def list_sessions(self, *, app_name: str, user_id: str) -> ListSessionsResponse:
+        stored = await asyncio.to_thread(self.store.list_sessions, app_name, user_id)
+        return ListSessionsResponse(sessions=[
+            Session(app_name=app_name, user_id=user_id, id=session_id, state={}, last_update_time=update_time)
+            for session_id, update_time in stored
+        ])
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await asyncio.to_thread(self.store.delete_session, app_name, user_id, session_id)
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        if event.partial:
+            return event
+        await super().append_event(session=session, event=event)
+        session.last_update_time = event.timestamp
+
+        seq = await asyncio.to_thread(
+            self.store.append_event, session.app_name, session.user_id, session.id,
+            event.model_dump_json(exclude_none=True), event.timestamp,
+        )
+        app_delta = _scoped_delta(event, State.APP_PREFIX)
+        if app_delta:
+            await asyncio.to_thread(self.store.update_scoped_state, self._app_scope(session.app_name), app_delta)
+        user_delta = _scoped_delta(event, State.USER_PREFIX)
+        if user_delta:
+            await asyncio.to_thread(
+                self.store.update_scoped_state, self._user_scope(session.app_name, session.user_id), user_delta
+            )
+
+        if self.snapshot_interval and seq % self.snapshot_interval == 0:
+            await asyncio.to_thread(self._snapshot, session.app_name, session.user_id, session.id)
+        return event
+
+    def _snapshot(self, app_name: str, user_id: str, session_id: str) -> None:
+        # Rebuilt from the store rather than the caller's session object, which
+        # may be missing events appended by other workers
+        loaded = self.store.load(app_name, user_id, session_id)
+        if loaded is None or not loaded[2]:
+            return
+        seq, snapshot, tail = loaded
+        session = Session.model_validate_json(snapshot)
+        for payload in tail:
+            _apply_event(session, Event.model_validate_json(payload))
+        self.store.write_snapshot(app_name, user_id, session_id, seq + len(tail), session.model_dump_json())
+
+    @staticmethod
+    def _app_scope(app_name: str) -> str:
+        return f"app:{quote(app_name, safe='')}"
+
+    @staticmethod
+    def _user_scope(app_name: str, user_id: str) -> str:
+        return f"user:{quote(app_name, safe='')}:{quote(user_id, safe='')}"
+
+    async def _merge_scoped_state(self, session: Session) -> Session:
+        app_state, user_state = await asyncio.to_thread(
+            lambda: (
+                self.store.get_scoped_state(self._app_scope(session.app_name)),
+                self.store.get_scoped_state(self._user_scope(session.app_name, session.user_id)),
+            )
+        )
+        for key, value in app_state.items():
+            session.state[State.APP_PREFIX + key] = value
+        for key, value in user_state.items():
+            session.state[State.USER_PREFIX + key] = value
+        return session
+
+    def close(self) -> None:
+        """Close the underlying store."""
+        self.store.close()
@@ -0,0 +1,423 @@
+"""
+Offline batch conversion of archived session transcripts into SOAP drafts.
+
+Reads transcripts from a directory (one ``.txt`` file per session; the file's
+relative path is its ID) or a JSONL file (``{"id": ..., "transcript": ...}``
+per line), runs each one through ``root_agent`` as a fresh session, and
+appends one JSON line per transcript to the output file as soon as it is
+drafted:
+
+    {"id": ..., "status": "ok", "message": {"type": "soap_draft", ...}}
+
+``status`` is ``not_a_draft`` when the agent answered with anything other than
+a draft, and ``error`` (with an ``error`` field) when the run failed. The
+illustrations of a draft follow in a separate line once they are looked up:
+
+    {"id": ..., "illustrations": [{"exercise_name": ..., "results": [...]}, ...]}
+
+Transcripts are drafted by ``--workers`` processes, each keeping up to
+``--concurrency`` sessions in flight, so a batch never competes with the
+interactive server for its event loop. Workers take transcripts from a shared
+queue and stream each record back the moment it is done, so one slow
+transcript never holds back the others. Illustration lookups happen in the
+parent process, once per distinct exercise across the whole batch; the shared
+illustration cache also carries them over between runs.
+
+The output file is the checkpoint: every record is flushed to it as soon as
+it is done, and a rerun with the same output skips the IDs already drafted
+(``--retry-failed`` also redoes failed ones) and only looks up illustrations
+for drafts that have none yet, so an interrupted batch resumes where it
+stopped:
+
+    python -m motion.batch transcripts/ --output drafts.jsonl --workers 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+
+# Add the src directory to the path so imports work
+src_path = Path(__file__).parent.parent
+sys.path.insert(0, str(src_path))
+
+from dotenv import load_dotenv
+
+
+BATCH_USER_ID = "batch"
+
+TRANSCRIPT_SUFFIXES = (".txt", ".md")
+
+# Per-process state of a worker, set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+def read_transcripts(path: Path) -> Iterator[Tuple[str, str]]:
+    """
+    Yield ``(id, transcript)`` pairs from a directory or JSONL file.
+
+    Raises:
+        ValueError: For a JSONL line that is not an object with a transcript.
+    """
+    if path.is_dir():
+        for file in sorted(path.rglob("*")):
+            if file.is_file() and file.suffix.lower() in TRANSCRIPT_SUFFIXES:
+                yield str(file.relative_to(path)), file.read_text(encoding="utf-8")
+        return
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            transcript = record.get("transcript") if isinstance(record, dict) else None
+            if not isinstance(transcript, str):
+                raise ValueError(f"{path}:{line_number}: expected an object with a \"transcript\" string")
+            yield str(record.get("id", line_number)), transcript
+
+
+class Checkpoint:
+    """What an earlier run already wrote to the output file."""
+
+    __slots__ = ("done", "unillustrated")
+
+    def __init__(self) -> None:
+        # IDs already drafted
+        self.done: Set[str] = set()
+        # soap_draft messages, by ID, whose illustrations line was never written
+        self.unillustrated: Dict[str, Dict[str, Any]] = {}
+
+
+def load_checkpoint(output: Path, retry_failed: bool = False) -> Checkpoint:
+    """
+    Read what ``output`` already holds.
+
+    A line cut short by an interrupted run is removed, so appending resumes
+    on a clean line boundary. Lines that are not JSON objects with an ``id``
+    are ignored.
+
+    Args:
+        output: Output JSONL file; may not exist yet.
+        retry_failed: Leave out IDs whose status is ``error`` so they are redone.
+    """
+    checkpoint = Checkpoint()
+    if not output.exists():
+        return checkpoint
+    with open(output, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+            data = data[:data.rfind(b"\n") + 1]
+    for line in data.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(record, dict) or "id" not in record:
+            continue
+        item_id = str(record["id"])
+        if "illustrations" in record and "status" not in record:
+            checkpoint.unillustrated.pop(item_id, None)
+            continue
+        if retry_failed and record.get("status") == "error":
+            continue
+        checkpoint.done.add(item_id)
+        if record.get("status") == "ok" and isinstance(record.get("message"), dict):
+            checkpoint.unillustrated[item_id] = record["message"]
+    return checkpoint
+
+
+def _init_worker(inbox: Any, outbox: Any) -> None:
+    load_dotenv()
+    # Illustrations are looked up once per batch by the parent, not per draft
+    os.environ["MOTION_ILLUSTRATION_PREFETCH"] = "0"
+
+    from google.adk.artifacts import InMemoryArtifactService
+    from google.adk.runners import Runner
+    from google.adk.sessions import InMemorySessionService
+
+    from motion.agents.soap_agents.agent import get_root_agent
+    from motion.api.dependencies import APP_NAME
+
+    _worker["runner"] = Runner(
+        app_name=APP_NAME,
+        agent=get_root_agent(),
+        artifact_service=InMemoryArtifactService(),
+        session_service=InMemorySessionService(),
+    )
+    _worker["loop"] = asyncio.new_event_loop()
+    _worker["inbox"] = inbox
+    _worker["outbox"] = outbox
+
+
+async def _draft_one(item_id: str, transcript: str, timeout: float) -> Dict[str, Any]:
+    from google.genai import types
+
+    from motion.agents.soap_agents.message_types import MessageType
+    from motion.agents.soap_agents.output_parser import parse_agent_reply
+    from motion.api.dependencies import APP_NAME
+    from motion.api.routes.run import event_text
+
+    runner = _worker["runner"]
+    started = time.perf_counter()
+    session = await runner.session_service.create_session(app_name=APP_NAME, user_id=BATCH_USER_ID)
+
+    async def run() -> str:
+        reply = ""
+        async for event in runner.run_async(
+            user_id=BATCH_USER_ID,
+            session_id=session.id,
+            new_message=types.Content(role="user", parts=[types.Part(text=transcript)]),
+        ):
+            text = event_text(event)
+            if text and not event.partial:
+                reply = text
+        return reply
+
+    record: Dict[str, Any]
+    try:
+        reply = await asyncio.wait_for(run(), timeout=timeout)
+        message = parse_agent_reply(reply)
+        status = "ok" if message.get("type") == MessageType.SOAP_DRAFT.value else "not_a_draft"
+        record = {"id": item_id, "status": status, "message": message}
+    except asyncio.TimeoutError:
+        record = {"id": item_id, "status": "error", "error": f"Timed out after {timeout:g}s"}
+    except Exception as e:
+        record = {"id": item_id, "status": "error", "error": str(e)}
+    finally:
+        await runner.session_service.delete_session(
+            app_name=APP_NAME, user_id=BATCH_USER_ID, session_id=session.id
+        )
+    record["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+async def drain(inbox: Any, outbox: Any, timeout: float, concurrency: int) -> int:
+    """
+    Draft transcripts from ``inbox`` until end markers, ``concurrency`` at a time.
+
+    Each record is put on ``outbox`` as soon as its transcript is done.
+
+    Args:
+        inbox: Queue of ``(id, transcript)`` pairs; every slot stops at a None.
+        outbox: Queue the records are put on.
+        timeout: Seconds one transcript may take.
+        concurrency: Transcripts in flight; each slot consumes one end marker.
+
+    Returns:
+        The number of transcripts drafted.
+    """
+    loop = asyncio.get_running_loop()
+    drafted = 0
+
+    async def slot() -> None:
+        nonlocal drafted
+        while True:
+            item = await loop.run_in_executor(None, inbox.get)
+            if item is None:
+                return
+            outbox.put(await _draft_one(item[0], item[1], timeout))
+            drafted += 1
+
+    await asyncio.gather(*(slot() for _ in range(max(1, concurrency))))
+    return drafted
+
+
+def _drain_inbox(timeout: float, concurrency: int) -> int:
+    """Worker task: draft from the shared inbox on the worker's loop."""
+    drafted: int = _worker["loop"].run_until_complete(
+        drain(_worker["inbox"], _worker["outbox"], timeout, concurrency)
+    )
+    return drafted
+
+
+async def _drafted_records(pending: List[Tuple[str, str]], args: argparse.Namespace) -> AsyncIterator[Dict[str, Any]]:
+    """Draft ``pending`` on worker processes, yielding records in the order they finish."""
+    context = get_context("spawn")
+    inbox, outbox = context.Queue(), context.Queue()
+    workers = max(1, args.workers)
+    concurrency = max(1, args.concurrency)
+    for item in pending:
+        inbox.put(item)
+    for _ in range(workers * concurrency):
+        inbox.put(None)
+
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(inbox, outbox)
+    ) as pool:
+        drains = [
+            asyncio.wrap_future(pool.submit(_drain_inbox, args.timeout, concurrency), loop=loop)
+            for _ in range(workers)
+        ]
+        received = 0
+        while received < len(pending):
+            try:
+                record = await loop.run_in_executor(None, outbox.get, True, 0.5)
+            except queue.Empty:
+                if all(drain.done() for drain in drains):
+                    # Raises if a worker died; otherwise every record has arrived
+                    await asyncio.gather(*drains)
+                    break
+                continue
+            received += 1
+            yield record
+
+
+class IllustrationLookups:
+    """Looks up each distinct exercise of the batch once, however many drafts name it."""
+
+    def __init__(self, concurrency: int) -> None:
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._lookups: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self.requested = 0
+
+    async def _lookup(self, exercise_name: str) -> Dict[str, Any]:
+        from motion.tools.exercise_illustration_tool import search_exercise_illustrations
+
+        async with self._semaphore:
+            return await search_exercise_illustrations(exercise_name)
+
+    async def for_draft(self, message: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Illustration results for every exercise of a soap_draft, in order."""
+        from motion.tools.illustration_cache import normalize_exercise_name
+
+        names = [
+            exercise.get("name") for exercise in (message.get("soap_report") or {}).get("exercises") or []
+            if isinstance(exercise.get("name"), str) and exercise.get("name").strip()
+        ]
+        tasks = []
+        for name in names:
+            self.requested += 1
+            key = normalize_exercise_name(name)
+            if key not in self._lookups:
+                self._lookups[key] = asyncio.ensure_future(self._lookup(name))
+            tasks.append(self._lookups[key])
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        illustrations = []
+        for name, result in zip(names, results, strict=True):
+            if isinstance(result, BaseException):
+                result = {"error": str(result), "results": []}
+            illustrations.append({**result, "exercise_name": name})
+        return illustrations
+
+    @property
+    def distinct(self) -> int:
+        return len(self._lookups)
+
+
+async def run_batch(args: argparse.Namespace) -> Dict[str, Any]:
+    """Draft every pending transcript and append the results to ``args.output``."""
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    checkpoint = load_checkpoint(output, retry_failed=args.retry_failed)
+    done = checkpoint.done
+
+    pending: List[Tuple[str, str]] = []
+    seen: Set[str] = set()
+    for item_id, transcript in read_transcripts(Path(args.input)):
+        if item_id in seen:
+            print(f"Skipping duplicate ID {item_id}", file=sys.stderr)
+            continue
+        seen.add(item_id)
+        if item_id not in done and transcript.strip():
+            pending.append((item_id, transcript))
+    if args.limit:
+        pending = pending[:args.limit]
+
+    counts = {"ok": 0, "not_a_draft": 0, "error": 0}
+    started = time.perf_counter()
+    # Drafted by an earlier run that stopped before their illustrations were written
+    resumed = {} if args.no_illustrations else checkpoint.unillustrated
+    print(
+        f"{len(pending)} transcripts to draft ({len(done)} already done, "
+        f"{len(resumed)} awaiting illustrations)",
+        file=sys.stderr,
+    )
+    if not pending and not resumed:
+        return {"pending": 0, **counts}
+
+    lookups = IllustrationLookups(args.lookup_concurrency)
+    illustrated = 0
+
+    with open(output, "a", encoding="utf-8") as out:
+        def write(record: Dict[str, Any]) -> None:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+
+        async def illustrate(item_id: str, message: Dict[str, Any]) -> None:
+            nonlocal illustrated
+            write({"id": item_id, "illustrations": await lookups.for_draft(message)})
+            illustrated += 1
+
+        illustrating = [asyncio.ensure_future(illustrate(item_id, message)) for item_id, message in resumed.items()]
+        if pending:
+            async for record in _drafted_records(pending, args):
+                # The draft is checkpointed before its illustrations are looked up
+                write(record)
+                if record["status"] == "ok" and not args.no_illustrations:
+                    illustrating.append(asyncio.ensure_future(illustrate(record["id"], record["message"])))
+                counts[record["status"]] += 1
+                finished = sum(counts.values())
+                if finished % args.progress_every == 0 or finished == len(pending):
+                    print(f"{finished}/{len(pending)} drafted ({counts['error']} errors)", file=sys.stderr)
+        await asyncio.gather(*illustrating)
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "pending": len(pending),
+        **counts,
+        "illustrated": illustrated,
+        "elapsed_seconds": round(elapsed, 1),
+        "transcripts_per_minute": round(len(pending) / elapsed * 60, 1) if elapsed else None,
+        "exercises": lookups.requested,
+        "distinct_illustration_lookups": lookups.distinct,
+    }
+    return summary
+
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Command line options; defaults can also be set through MOTION_BATCH_* variables."""
+    parser = argparse.ArgumentParser(description="Draft SOAP reports for archived transcripts.")
+    parser.add_argument("input", help="Directory of .txt transcripts, or a JSONL file of {id, transcript}")
+    parser.add_argument("--output", "-o", required=True, help="JSONL file the drafts are appended to")
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("MOTION_BATCH_WORKERS", min(4, os.cpu_count() or 1))),
+        help="Worker processes drafting transcripts",
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=int(os.getenv("MOTION_BATCH_CONCURRENCY", "4")),
+        help="Transcripts each worker drafts at the same time",
+    )
+    parser.add_argument(
+        "--lookup-concurrency", type=int, default=int(os.getenv("MOTION_BATCH_LOOKUP_CONCURRENCY", "6")),
+        help="Concurrent illustration lookups",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=float(os.getenv("MOTION_BATCH_TIMEOUT", "300")),
+        help="Seconds one transcript may take before it is recorded as failed",
+    )
+    parser.add_argument("--no-illustrations", action="store_true", help="Only draft, skip illustration lookups")
+    parser.add_argument("--retry-failed", action="store_true", help="Redo transcripts recorded as errors")
+    parser.add_argument("--limit", type=int, help="Draft at most this many pending transcripts")
+    parser.add_argument("--progress-every", type=int, default=10, help="Report progress every N transcripts")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Run a batch; returns a non-zero exit code if any transcript failed."""
+    load_dotenv()
+    args = build_arg_parser().parse_args(argv)
+    summary = asyncio.run(run_batch(args))
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if summary.get("error") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,40 +3,112 @@ Main entry point for the Motion by Aiselu backend.
 Runs the Google ADK agent server.
 """
 
+import argparse
 import os
 import sys
 from pathlib import Path
+from typing import List, Optional
 
 # Add the src directory to the path so imports work
 src_path = Path(__file__).parent.parent
 sys.path.insert(0, str(src_path))
 
-from motion.agents.soap_agents.agent import root_agent
+from dotenv import load_dotenv
 
 
-def main():
+def build_arg_parser() -> argparse.ArgumentParser:
+    """Command line options; every option can also be set through its MOTION_* variable."""
+    parser = argparse.ArgumentParser(description="Run the Motion by Aiselu SOAP agent server.")
+    parser.add_argument("--host", default=os.getenv("MOTION_HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("MOTION_PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.environ["MOTION_WORKERS"]) if os.getenv("MOTION_WORKERS") else None,
+        help="Number of worker processes (default: one per CPU core with a shared session store, else 1)",
+    )
+    parser.add_argument(
+        "--keep-alive", type=int, default=int(os.getenv("MOTION_KEEP_ALIVE", "30")),
+        help="Seconds to keep idle HTTP connections open",
+    )
+    parser.add_argument(
+        "--limit-concurrency", type=int,
+        default=int(os.environ["MOTION_LIMIT_CONCURRENCY"]) if os.getenv("MOTION_LIMIT_CONCURRENCY") else None,
+        help="Maximum concurrent connections per worker before responding 503",
+    )
+    parser.add_argument(
+        "--backlog", type=int, default=int(os.getenv("MOTION_BACKLOG", "2048")),
+        help="Maximum number of pending connections in the listen queue",
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=int, default=int(os.getenv("MOTION_GRACEFUL_TIMEOUT", "120")),
+        help="Seconds to let in-flight requests and /run_sse streams finish on SIGTERM",
+    )
+    parser.add_argument("--log-level", default=os.getenv("MOTION_LOG_LEVEL", "info"))
+    parser.add_argument(
+        "--profile-startup", action="store_true",
+        help="Report cold-start import and build times instead of serving; "
+        "further options (--budget-ms, --top, --no-app, --json) go to the profiler",
+    )
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> Optional[int]:
     """Start the ADK agent server."""
+    load_dotenv()
+    parser = build_arg_parser()
+    args, profiler_args = parser.parse_known_args(argv)
+
+    if args.profile_startup:
+        from motion.startup_profile import main as profile_main
+
+        return profile_main(profiler_args)
+    if profiler_args:
+        parser.error(f"unrecognized arguments: {' '.join(profiler_args)}")
+
+    # In-memory sessions are per process; workers must share a session store
+    shared_sessions = bool(os.getenv("MOTION_SESSION_STORE") or os.getenv("MOTION_SESSION_DB_URL"))
+    if args.workers is None:
+        args.workers = (os.cpu_count() or 1) if shared_sessions else 1
+    elif args.workers > 1 and not shared_sessions:
+        parser.error(
+            f"--workers {args.workers} needs a session store shared by the workers; "
+            "set MOTION_SESSION_STORE (e.g. sqlite:///path/to/sessions.db or redis://host:6379/0) "
+            "or run a single worker"
+        )
+
+    # Lets workers tell whether per-process state (dictations) is safe to use
+    os.environ["MOTION_WORKERS"] = str(args.workers)
+
     print("Starting Motion by Aiselu SOAP Agent Server...")
-    print(f"Agent: {root_agent.name}")
     print(f"Model: {os.environ.get('MODEL_GEMINI_2_0_FLASH', 'Not set')}")
-    print("Server will be available on http://localhost:8000")
+    print(f"Workers: {args.workers}")
+    sessions = os.environ.get("MOTION_SESSION_STORE") or os.environ.get("MOTION_SESSION_DB_URL") or "in-memory"
+    print(f"Sessions: {sessions}")
+    print(f"Server will be available on http://{args.host}:{args.port}")
     print("Available endpoints:")
     print("  POST /run - Run agent with message")
     print("  POST /run_sse - Run agent with streaming")
     print("  POST /apps/{app_name}/users/{user_id}/sessions/{session_id} - Create session")
     print()
-    
-    # The ADK agent automatically starts a server when the module is loaded
-    # and the agent is defined. The server runs on localhost:8000 by default.
-    try:
-        # Keep the server running
-        print("Press Ctrl+C to stop the server")
-        import time
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        print("\nShutting down server...")
+
+    import uvicorn
+
+    # Workers import the app themselves; SIGTERM stops accepting connections and
+    # waits up to --graceful-timeout for in-flight requests before exiting
+    uvicorn.run(
+        "motion.api.app:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        timeout_keep_alive=args.keep_alive,
+        limit_concurrency=args.limit_concurrency,
+        backlog=args.backlog,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+        app_dir=str(src_path),
+    )
+    return None
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
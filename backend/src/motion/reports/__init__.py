@@ -0,0 +1 @@
+"""Server-side rendering of final SOAP reports."""
@@ -0,0 +1,518 @@
+"""
+PDF layout of final SOAP reports.
+
+Reports are laid out with fpdf2 in DejaVu Sans, a Unicode TrueType font
+shipped in ``fonts/`` that covers Latin, Greek, Cyrillic and Vietnamese
+among others; only the glyphs a report uses are embedded. Characters it
+lacks, such as Chinese, Japanese and Korean text, are drawn from the fonts
+listed in ``MOTION_PDF_FALLBACK_FONTS``. ``unsupported_fields`` lists any
+character no configured font has, and such a report is refused rather than
+printed with empty boxes in its place.
+
+A ``ReportTemplate`` describes the page. ``compile_template`` turns it, once
+per process, into everything that does not depend on the report: an empty
+document with the fonts parsed and their glyph widths read (the slow part of
+starting a document), the characters they cover and the page geometry. A
+render copies that document and only lays out text and images.
+
+Exercise images are embedded from local files only; JPEGs are copied into
+the document without being decoded.
+
+``render_to_file`` is the entry point run by the render workers.
+
+Environment:
+    MOTION_PDF_TITLE: title printed at the top of every report.
+    MOTION_PDF_PAGE_SIZE: ``a4`` (default) or ``letter``.
+    MOTION_PDF_FALLBACK_FONTS: font files (TTF, OTF or the first face of a
+        TTC) separated by ``os.pathsep``, tried in order for characters
+        DejaVu Sans lacks, e.g. ``/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc``.
+"""
+
+import copy
+import os
+import threading
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, FrozenSet, Iterator, List, Optional, Tuple, cast
+
+from fontTools.ttLib import TTFont
+from fpdf import FPDF
+from fpdf.enums import MethodReturnValue, ResourceAccessPolicy
+from fpdf.fonts import TTFFont
+from fpdf.image_parsing import preload_image
+
+
+PAGE_SIZES = {"a4": (595.28, 841.89), "letter": (612.0, 792.0)}
+
+REPORT_TITLE = os.getenv("MOTION_PDF_TITLE", "Physiotherapy Session Report")
+PAGE_SIZE = os.getenv("MOTION_PDF_PAGE_SIZE", "a4").lower()
+FALLBACK_FONTS = [path for path in os.getenv("MOTION_PDF_FALLBACK_FONTS", "").split(os.pathsep) if path]
+
+FONT_DIR = Path(__file__).parent / "fonts"
+
+SOAP_SECTIONS = (
+    ("subjective", "Subjective"),
+    ("objective", "Objective"),
+    ("assessment", "Assessment"),
+    ("plan", "Plan"),
+)
+
+PATIENT_FIELDS = (
+    ("patient_name", "Patient"),
+    ("patient_age", "Age"),
+    ("condition", "Condition"),
+    ("session_date", "Session date"),
+)
+
+# Shown for fields the report leaves empty
+EMPTY_VALUE = "\u2014"
+
+# Font family of DejaVu Sans; fallback fonts are added as fallback1, fallback2, ...
+_FONT = "dejavu"
+
+# Text colours (grey levels)
+_BODY, _MUTED = 0, 102
+
+_CONTROL_CHARACTERS = {code: None for code in range(32) if code not in (9, 10)}
+
+
+class ReportTemplate:
+    """
+    Page layout of a report.
+
+    Args:
+        name: Template name clients select it by.
+        page_size: Page width and height in points.
+        margin: Page margin in points.
+        body_size: Font size of body text.
+        heading_size: Font size of section headings.
+        title_size: Font size of the report title.
+        image_variant: Image proxy variant embedded (``display`` or ``thumb``).
+        image_max_width: Largest width of an exercise image, in points.
+        image_max_height: Largest height of an exercise image, in points.
+    """
+
+    __slots__ = (
+        "name", "page_size", "margin", "body_size", "heading_size", "title_size",
+        "image_variant", "image_max_width", "image_max_height",
+    )
+
+    def __init__(
+        self,
+        name: str,
+        page_size: Tuple[float, float] = PAGE_SIZES["a4"],
+        margin: float = 50.0,
+        body_size: float = 10.5,
+        heading_size: float = 12.5,
+        title_size: float = 17.0,
+        image_variant: str = "display",
+        image_max_width: float = 240.0,
+        image_max_height: float = 180.0,
+    ) -> None:
+        self.name = name
+        self.page_size = page_size
+        self.margin = margin
+        self.body_size = body_size
+        self.heading_size = heading_size
+        self.title_size = title_size
+        self.image_variant = image_variant
+        self.image_max_width = image_max_width
+        self.image_max_height = image_max_height
+
+
+TEMPLATES: Dict[str, ReportTemplate] = {
+    # Full report with display-size exercise images
+    "soap": ReportTemplate("soap", page_size=PAGE_SIZES.get(PAGE_SIZE, PAGE_SIZES["a4"])),
+    # Denser report with thumbnails, for printing many at once
+    "compact": ReportTemplate(
+        "compact",
+        page_size=PAGE_SIZES.get(PAGE_SIZE, PAGE_SIZES["a4"]),
+        margin=40.0,
+        body_size=9.0,
+        heading_size=10.5,
+        title_size=14.0,
+        image_variant="thumb",
+        image_max_width=110.0,
+        image_max_height=85.0,
+    ),
+}
+
+
+class UnsupportedText(ValueError):
+    """
+    Raised when report text has characters none of the PDF fonts can show.
+
+    Attributes:
+        fields: The characters that cannot be shown, by report field
+            (``plan``, ``exercises[0].name``).
+    """
+
+    def __init__(self, fields: Dict[str, str]) -> None:
+        super().__init__(
+            "Characters the PDF fonts cannot show: "
+            + "; ".join(f"{field} ({' '.join(characters)})" for field, characters in fields.items())
+        )
+        self.fields = fields
+
+
+class _ReportPdf(FPDF):
+    """A report document; fpdf2 calls header() and footer() on every page."""
+
+    compiled: "CompiledTemplate"
+    generated = ""
+
+    def header(self) -> None:
+        # The title again on continuation pages
+        if self.page_no() > 1:
+            compiled = self.compiled
+            self.set_font(_FONT, "B", compiled.small_size)
+            self.set_text_color(_MUTED)
+            self.set_xy(compiled.template.margin, compiled.template.margin * 0.6 - compiled.small_size)
+            self.cell(text=REPORT_TITLE)
+
+    def footer(self) -> None:
+        """A rule, then the generation time left and the page number right."""
+        compiled = self.compiled
+        margin = compiled.template.margin
+        self.set_draw_color(204)
+        self.set_line_width(0.5)
+        self.line(margin, compiled.footer_y - 4, compiled.width - margin, compiled.footer_y - 4)
+        self.set_font(_FONT, "", compiled.small_size)
+        self.set_text_color(_MUTED)
+        self.set_xy(margin, compiled.footer_y)
+        self.cell(text=self.generated)
+        self.set_xy(margin, compiled.footer_y)
+        # fpdf2 replaces {nb} with the page count when the document is written
+        self.cell(compiled.text_width, text=f"Page {self.page_no()} of {{nb}}", align="R")
+
+
+def _truetype_fonts(pdf: FPDF) -> List[TTFFont]:
+    # Only TrueType fonts are ever added; fpdf2 types the table for its core fonts too
+    return cast(List[TTFFont], list(pdf.fonts.values()))
+
+
+_fonts: Optional[Tuple[_ReportPdf, FrozenSet[int]]] = None
+_fonts_lock = threading.Lock()
+
+
+def _load_fonts() -> Tuple[_ReportPdf, FrozenSet[int]]:
+    """An empty document with the report fonts added, and the characters they cover; loaded once per process."""
+    global _fonts
+    with _fonts_lock:
+        if _fonts is None:
+            pdf = _ReportPdf(unit="pt")
+            pdf.add_font(_FONT, "", FONT_DIR / "DejaVuSans.ttf")
+            pdf.add_font(_FONT, "B", FONT_DIR / "DejaVuSans-Bold.ttf")
+            families = [_FONT]
+            for index, path in enumerate(FALLBACK_FONTS, start=1):
+                families.append(f"fallback{index}")
+                pdf.add_font(families[-1], "", path)
+            # Listing DejaVu Sans itself lets bold text use its regular face
+            # for the few characters the bold face lacks
+            pdf.set_fallback_fonts(families, exact_match=False)
+            pdf.set_auto_page_break(False)
+            pdf.set_producer("Motion by Aiselu")
+            pdf.c_margin = 0
+            coverage = frozenset(code for font in _truetype_fonts(pdf) for code in font.cmap)
+            _fonts = (pdf, coverage)
+        return _fonts
+
+
+def _plain_text(text: str) -> str:
+    """Text as it is drawn: composed (NFC), with ``\\n`` line breaks, tabs as spaces and no control characters."""
+    return unicodedata.normalize("NFC", text.replace("\r\n", "\n").replace("\t", "    ")).translate(_CONTROL_CHARACTERS)
+
+
+def unsupported_characters(text: str) -> str:
+    """Characters of ``text`` that no PDF font has, each once, in order of appearance."""
+    coverage = _load_fonts()[1]
+    return "".join(dict.fromkeys(
+        character for character in _plain_text(text) if character != "\n" and ord(character) not in coverage
+    ))
+
+
+def report_text(report: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """The text fields of a SOAP report that its PDF shows, as ``(field, text)`` pairs."""
+    for key, _ in PATIENT_FIELDS + SOAP_SECTIONS:
+        value = report.get(key)
+        if isinstance(value, str):
+            yield key, value
+    for index, exercise in enumerate(report.get("exercises") or []):
+        if isinstance(exercise, dict):
+            for key in ("name", "description"):
+                value = exercise.get(key)
+                if isinstance(value, str):
+                    yield f"exercises[{index}].{key}", value
+
+
+def unsupported_fields(report: Dict[str, Any]) -> Dict[str, str]:
+    """Characters the PDF fonts cannot show, by field of the report; empty if it can be rendered."""
+    fields = {}
+    for field, text in report_text(report):
+        characters = unsupported_characters(text)
+        if characters:
+            fields[field] = characters
+    return fields
+
+
+class CompiledTemplate:
+    """Everything about a template that is the same for every report it renders."""
+
+    def __init__(self, template: ReportTemplate, fonts: _ReportPdf) -> None:
+        self.template = template
+        self.fonts = fonts
+        self.width, self.height = template.page_size
+        self.text_width = self.width - 2 * template.margin
+        self.body_leading = template.body_size * 1.38
+        self.small_size = max(7.0, template.body_size - 2)
+        # Top of the footer text, and the lowest point body text reaches
+        self.footer_y = self.height - template.margin * 0.5 - self.small_size
+        self.top = template.margin
+        self.bottom = self.footer_y - 14
+
+    def document(self, generated: str) -> _ReportPdf:
+        """An empty document with the template's fonts, for one report."""
+        pdf = copy.deepcopy(self.fonts)
+        for font in _truetype_fonts(pdf):
+            # Copies share the parsed glyph widths, but fpdf2 subsets each
+            # font's fontTools object in place when it writes a document, so
+            # every document reads its own (lazily: only the tables it needs)
+            font.ttfont = TTFont(font.ttffile, recalcTimestamp=False, fontNumber=font.collection_font_number, lazy=True)
+        pdf.compiled = self
+        pdf.generated = generated
+        pdf.set_creation_date(datetime.now())
+        return pdf
+
+
+_compiled: Dict[str, CompiledTemplate] = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_template(name: str) -> CompiledTemplate:
+    """
+    Return the compiled form of a template, compiling it on first use.
+
+    Raises:
+        KeyError: If there is no template called ``name``.
+    """
+    with _compiled_lock:
+        compiled = _compiled.get(name)
+        if compiled is None:
+            compiled = _compiled[name] = CompiledTemplate(TEMPLATES[name], _load_fonts()[0])
+        return compiled
+
+
+def warm_templates() -> None:
+    """Compile every template; run when a render worker starts."""
+    for name in TEMPLATES:
+        compile_template(name)
+
+
+class _Layout:
+    """Flows a report onto pages, top to bottom."""
+
+    def __init__(self, compiled: CompiledTemplate, pdf: _ReportPdf) -> None:
+        self.compiled = compiled
+        self.template = compiled.template
+        self.pdf = pdf
+        self.images_embedded = 0
+        self.images_missing = 0
+        self.new_page()
+
+    def new_page(self) -> None:
+        self.pdf.add_page(format=self.template.page_size)
+        self.y = self.compiled.top
+
+    def ensure(self, height: float) -> None:
+        """Start a new page unless ``height`` points still fit on this one."""
+        if self.y + height > self.compiled.bottom and self.y > self.compiled.top:
+            self.new_page()
+
+    def draw(self, style: str, size: float, x: float, y: float, text: str, grey: int = _BODY) -> None:
+        """One line of text whose top is at ``y``."""
+        if not text:
+            # A blank line between paragraphs
+            return
+        self.pdf.set_font(_FONT, style, size)
+        self.pdf.set_text_color(grey)
+        self.pdf.set_xy(x, y)
+        self.pdf.cell(h=size * 1.38, text=text)
+
+    def wrap(self, text: str, style: str, size: float, width: float) -> List[str]:
+        """Break text into lines no wider than ``width``; newlines start a new line."""
+        self.pdf.set_font(_FONT, style, size)
+        return cast(List[str], self.pdf.multi_cell(width, text=text, dry_run=True, output=MethodReturnValue.LINES))
+
+    def line(self, style: str, size: float, text: str, x: Optional[float] = None, grey: int = _BODY) -> None:
+        self.ensure(size * 1.38)
+        self.draw(style, size, self.template.margin if x is None else x, self.y, text, grey)
+        self.y += size * 1.38
+
+    def paragraph(self, text: str, size: Optional[float] = None, indent: float = 0.0) -> None:
+        size = size or self.template.body_size
+        x = self.template.margin + indent
+        for line in self.wrap(_plain_text(text.strip()) or EMPTY_VALUE, "", size, self.compiled.text_width - indent):
+            self.line("", size, line, x)
+
+    def space(self, points: float) -> None:
+        self.y += points
+
+    def heading(self, text: str, keep: Optional[float] = None) -> None:
+        """A section heading, kept on a page with the next ``keep`` points (two lines by default)."""
+        size = self.template.heading_size
+        room = self.compiled.bottom - self.compiled.top
+        keep = self.compiled.body_leading * 2 if keep is None or keep > room else keep
+        self.ensure(size * 1.8 + keep)
+        self.space(size * 0.5)
+        self.line("B", size, text)
+        self.space(size * 0.2)
+
+    def patient_details(self, report: Dict[str, Any]) -> None:
+        """Patient fields in two columns: a small label over each value."""
+        compiled, template = self.compiled, self.template
+        column = compiled.text_width / 2
+        label_size = max(7.0, template.body_size - 2.5)
+        for row in range(0, len(PATIENT_FIELDS), 2):
+            cells = []
+            for index, (key, label) in enumerate(PATIENT_FIELDS[row:row + 2]):
+                value = report.get(key)
+                text = _plain_text(value.strip()) if isinstance(value, str) and value.strip() else EMPTY_VALUE
+                cells.append((template.margin + index * column, label.upper(), self.wrap(text, "", template.body_size, column - 12)))
+            height = label_size * 1.6 + max(len(lines) for _, _, lines in cells) * compiled.body_leading
+            self.ensure(height)
+            for x, label, lines in cells:
+                self.draw("B", label_size, x, self.y, label, _MUTED)
+                line_y = self.y + label_size * 1.6
+                for line in lines:
+                    self.draw("", template.body_size, x, line_y, line)
+                    line_y += compiled.body_leading
+            self.y += height + label_size * 0.8
+
+    def image(self, path: Optional[str]) -> Optional[Tuple[Path, float, float]]:
+        """A local image file and the size it is drawn at, or None if it cannot be embedded."""
+        if path is None:
+            return None
+        try:
+            _, _, info = preload_image(
+                self.pdf.image_cache, Path(path), resource_access_policy=ResourceAccessPolicy.LOCAL_FILES
+            )
+        except Exception:
+            # Missing, unreadable or not an image
+            return None
+        scale = min(self.template.image_max_width / info.width, self.template.image_max_height / info.height, 1.0)
+        return Path(path), info.width * scale, info.height * scale
+
+    def exercise_block(self, exercise: Dict[str, Any], image_path: Optional[str]) -> Tuple[Any, ...]:
+        """Measure an exercise: its name, description lines, image (if any) and total height."""
+        compiled, template = self.compiled, self.template
+        name = _plain_text((exercise.get("name") or "").strip()) or EMPTY_VALUE
+        description = _plain_text((exercise.get("description") or "").strip())
+        wanted = bool(exercise.get("selected_image"))
+        image = self.image(image_path) if wanted else None
+        if wanted:
+            if image is None:
+                self.images_missing += 1
+            else:
+                self.images_embedded += 1
+        lines = self.wrap(description, "", template.body_size, compiled.text_width - 12) if description else []
+        image_height = image[2] + 8 if image else (compiled.body_leading if wanted else 0)
+        height = template.body_size * 1.9 + len(lines) * compiled.body_leading + image_height
+        return name, lines, image, wanted, height
+
+    def exercise(self, block: Tuple[Any, ...]) -> None:
+        compiled, template = self.compiled, self.template
+        name, lines, image, wanted, height = block
+        # Keep an exercise on one page unless it is longer than a page
+        if height <= compiled.bottom - compiled.top:
+            self.ensure(height)
+        self.space(template.body_size * 0.4)
+        self.line("B", template.body_size + 0.5, name)
+        for line in lines:
+            self.line("", template.body_size, line, template.margin + 12)
+        if image:
+            path, width, image_height = image
+            self.ensure(image_height + 8)
+            self.pdf.image(
+                path, template.margin + 12, self.y + 4, width, image_height,
+                resource_access_policy=ResourceAccessPolicy.LOCAL_FILES,
+            )
+            self.y += image_height + 8
+        elif wanted:
+            self.line("", template.body_size - 1, "Image not available", template.margin + 12, _MUTED)
+
+    def report(self, report: Dict[str, Any], images: Dict[str, str]) -> None:
+        template = self.template
+        self.line("B", template.title_size, REPORT_TITLE)
+        self.space(template.title_size * 0.6)
+        self.patient_details(report)
+        for key, label in SOAP_SECTIONS:
+            self.heading(label)
+            value = report.get(key)
+            self.paragraph(value if isinstance(value, str) else "")
+        exercises = [exercise for exercise in report.get("exercises") or [] if isinstance(exercise, dict)]
+        blocks = []
+        for exercise in exercises:
+            url = exercise.get("selected_image")
+            blocks.append(self.exercise_block(exercise, images.get(url) if isinstance(url, str) else None))
+        if blocks:
+            self.heading("Exercises", keep=blocks[0][4])
+            for block in blocks:
+                self.exercise(block)
+
+
+def render_report(
+    report: Dict[str, Any],
+    images: Dict[str, str],
+    out: BinaryIO,
+    template: str = "soap",
+    generated_at: Optional[str] = None,
+) -> Dict[str, int]:
+    """
+    Write a SOAP report as a PDF document.
+
+    Args:
+        report: The ``soap_report`` of a final_report message.
+        images: Local files of the exercises' selected images, by the URL in
+            ``selected_image``; images not in it are shown as not available.
+        out: Binary stream the document is written to.
+        template: Name of the template in TEMPLATES.
+        generated_at: Time printed in the footer; defaults to now.
+
+    Returns:
+        Page, embedded and missing image counts and the document size in bytes.
+
+    Raises:
+        UnsupportedText: If report text has characters the fonts cannot show.
+    """
+    unsupported = unsupported_fields(report)
+    if unsupported:
+        raise UnsupportedText(unsupported)
+    compiled = compile_template(template)
+    pdf = compiled.document(f"Generated {generated_at or datetime.now().strftime('%Y-%m-%d %H:%M')}")
+    pdf.set_title(" - ".join(
+        value.strip() for value in (report.get("patient_name"), report.get("session_date"))
+        if isinstance(value, str) and value.strip()
+    ) or REPORT_TITLE)
+    layout = _Layout(compiled, pdf)
+    layout.report(report, images)
+    data = pdf.output()
+    out.write(data)
+    return {
+        "pages": pdf.page_no(),
+        "images_embedded": layout.images_embedded,
+        "images_missing": layout.images_missing,
+        "bytes": len(data),
+    }
+
+
+def render_to_file(
+    report: Dict[str, Any],
+    images: Dict[str, str],
+    path: str,
+    template: str = "soap",
+    generated_at: Optional[str] = None,
+) -> Dict[str, int]:
+    """Render a report into ``path``; the function render workers run. See render_report."""
+    with open(path, "wb") as out:
+        return render_report(report, images, out, template, generated_at)
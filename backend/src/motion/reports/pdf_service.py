@@ -0,0 +1,351 @@
+"""
+PDF rendering service for final reports.
+
+Renders ``final_report`` messages to PDF on the backend, so the phone no
+longer downloads every selected image again to build the document itself,
+and web or EHR integrations can fetch one directly.
+
+- Selected images are taken from the image proxy's local cache (the copies
+  served at ``/images/...``, cached when search results were proxied). An
+  image that is not cached is shown as not available: URLs in a report come
+  from the client, so the service never fetches them.
+- Drawing runs in a bounded pool of worker processes, each of which compiles
+  the layout templates once at start-up (``motion.reports.layout``), so a
+  batch of end-of-day reports neither blocks the event loop nor competes with
+  it for the GIL.
+- A worker writes the document to a spool file and hands back only its path.
+  The API streams the file to the client in chunks and deletes it afterwards.
+- At most ``queue_size`` renders are queued or running. More are refused with
+  RenderBusy (HTTP 503) instead of piling up behind the pool. A batch waits for
+  capacity rather than being refused, but never holds more than
+  ``batch_concurrency`` renders at once (across all batches), so single
+  reports still get through.
+
+Render times are recorded in ``motion_pdf_render_seconds`` by outcome.
+
+Environment:
+    MOTION_PDF_WORKERS: worker processes (default min(4, CPUs)); 0 renders on a
+        thread of the API process instead.
+    MOTION_PDF_QUEUE_SIZE: renders queued or running at once (default 4 per worker).
+    MOTION_PDF_SPOOL_DIR: where rendered files wait until they are streamed
+        (default ``motion-pdf`` in the system temporary directory).
+    MOTION_PDF_TITLE / MOTION_PDF_PAGE_SIZE / MOTION_PDF_FALLBACK_FONTS: see
+        ``motion.reports.layout``.
+"""
+
+import asyncio
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set, Tuple, Union
+
+from motion.reports.layout import TEMPLATES, render_to_file, warm_templates
+from motion.telemetry import REGISTRY
+
+
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEFAULT_QUEUE_PER_WORKER = 4
+
+CHUNK_BYTES = 64 * 1024
+
+# Spool files older than this are left over from a crashed process
+STALE_SPOOL_SECONDS = 3600
+
+_RENDER_SECONDS = REGISTRY.histogram(
+    "motion_pdf_render_seconds", "Time to render a report to PDF, including image lookups", ("outcome",)
+)
+_RENDERS = REGISTRY.counter("motion_pdf_renders_total", "PDF renders by outcome", ("outcome",))
+_IMAGES = REGISTRY.counter("motion_pdf_images_total", "Selected images of rendered reports", ("outcome",))
+
+
+class RenderBusy(Exception):
+    """
+    Raised when the render queue is full.
+
+    Attributes:
+        retry_after: Suggested seconds before retrying.
+    """
+
+    def __init__(self, message: str, retry_after: float) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RenderedPdf:
+    """A rendered report waiting in the spool directory to be streamed."""
+
+    __slots__ = ("path", "filename", "size", "pages")
+
+    def __init__(self, path: Path, filename: str, size: int, pages: int) -> None:
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.pages = pages
+
+    async def chunks(self) -> AsyncGenerator[bytes, None]:
+        """Yield the document in chunks, deleting the file once done (or abandoned)."""
+        try:
+            with open(self.path, "rb") as f:
+                while True:
+                    chunk = await asyncio.to_thread(f.read, CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    yield chunk
+        finally:
+            self.discard()
+
+    def discard(self) -> None:
+        """Delete the spool file."""
+        self.path.unlink(missing_ok=True)
+
+
+def report_filename(report: Dict[str, Any]) -> str:
+    """File name for a report's PDF, from the patient name and session date."""
+    parts = ["soap-report"]
+    for key in ("patient_name", "session_date"):
+        value = report.get(key)
+        if isinstance(value, str):
+            ascii_value = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode()
+            slug = re.sub(r"[^a-z0-9]+", "-", ascii_value.lower()).strip("-")[:40]
+            if slug:
+                parts.append(slug)
+    return "-".join(parts) + ".pdf"
+
+
+def _clean_spool(spool_dir: Path) -> None:
+    cutoff = time.time() - STALE_SPOOL_SECONDS
+    for path in spool_dir.glob("*.pdf"):
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError:
+            continue
+
+
+class PdfRenderService:
+    """
+    Renders final reports in a bounded pool of worker processes.
+
+    Args:
+        workers: Worker processes; 0 renders on a thread of this process.
+        queue_size: Renders queued or running at once before RenderBusy.
+        spool_dir: Directory rendered files wait in until they are streamed.
+
+    Calls to ``render`` and ``render_many`` must come from one event loop.
+    """
+
+    def __init__(self, workers: int, queue_size: int, spool_dir: Path) -> None:
+        self.workers = max(0, workers)
+        self.queue_size = max(1, queue_size)
+        self.batch_concurrency = max(1, min(self.queue_size // 2, max(1, self.workers) * 2))
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        _clean_spool(self.spool_dir)
+
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._pending = 0
+        # Shared by every batch, so batches together stay within their share
+        self._batch_slots = asyncio.Semaphore(self.batch_concurrency)
+        self._durations: List[float] = []
+
+        self.rendered = 0
+        self.failed = 0
+        self.busy = 0
+        self.pages = 0
+
+    async def render(self, message: Dict[str, Any], template: str = "soap") -> RenderedPdf:
+        """
+        Render one final_report message.
+
+        Args:
+            message: A validated final_report message.
+            template: Name of the layout template.
+
+        Returns:
+            The rendered document; stream it with ``chunks()`` or ``discard()`` it.
+
+        Raises:
+            RenderBusy: If the render queue is full.
+        """
+        if self._pending >= self.queue_size:
+            self.busy += 1
+            _RENDERS.inc("busy")
+            raise RenderBusy("Too many reports are being rendered; try again shortly", self._retry_after())
+        return await self._render_counted(message, template)
+
+    async def render_many(
+        self, messages: List[Dict[str, Any]], template: str = "soap"
+    ) -> AsyncGenerator[Tuple[int, Union[RenderedPdf, Exception]], None]:
+        """
+        Render a batch of final_report messages, yielding each as soon as it is done.
+
+        Waits for queue capacity instead of raising RenderBusy. Documents that
+        were rendered but not yet yielded when the iteration is abandoned are
+        deleted.
+
+        Yields:
+            ``(index, document)`` pairs in completion order, where the
+            document is the exception that render raised if it failed.
+        """
+        async def render_one(index: int, message: Dict[str, Any]) -> Tuple[int, Union[RenderedPdf, Exception]]:
+            async with self._batch_slots:
+                try:
+                    return index, await self._render_counted(message, template)
+                except Exception as e:
+                    return index, e
+
+        tasks = [asyncio.ensure_future(render_one(index, message)) for index, message in enumerate(messages)]
+        yielded = set()
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, result = await next_done
+                yielded.add(index)
+                yield index, result
+        finally:
+            for task in tasks:
+                # Renders still running are stopped; finished ones nobody received are deleted
+                if not task.cancel():
+                    index, result = task.result()
+                    if index not in yielded and isinstance(result, RenderedPdf):
+                        result.discard()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return render counters, queue occupancy and recent render times."""
+        durations = sorted(self._durations)
+        return {
+            "workers": self.workers,
+            "queue_size": self.queue_size,
+            "pending": self._pending,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "busy": self.busy,
+            "pages": self.pages,
+            "median_render_seconds": durations[len(durations) // 2] if durations else 0.0,
+        }
+
+    def close(self) -> None:
+        """Stop the worker processes; renders still queued are cancelled."""
+        self._reset_pool()
+
+    async def _render_counted(self, message: Dict[str, Any], template: str) -> RenderedPdf:
+        self._pending += 1
+        started = time.perf_counter()
+        try:
+            document = await self._render(message, template)
+        except Exception:
+            self.failed += 1
+            _RENDERS.inc("error")
+            _RENDER_SECONDS.observe(time.perf_counter() - started, "error")
+            raise
+        finally:
+            self._pending -= 1
+        elapsed = time.perf_counter() - started
+        self._durations = self._durations[-99:] + [elapsed]
+        self.rendered += 1
+        _RENDERS.inc("ok")
+        _RENDER_SECONDS.observe(elapsed, "ok")
+        return document
+
+    async def _render(self, message: Dict[str, Any], template: str) -> RenderedPdf:
+        report = message.get("soap_report") or {}
+        # Cache lookups stat files, so they run off the event loop
+        images = await asyncio.to_thread(self._resolve_images, report, TEMPLATES[template].image_variant)
+        path = self.spool_dir / f"{uuid.uuid4().hex}.pdf"
+        arguments = (report, images, str(path), template, datetime.now().strftime("%Y-%m-%d %H:%M"))
+        try:
+            if self.workers:
+                future = self._get_pool().submit(render_to_file, *arguments)
+                try:
+                    result = await asyncio.wrap_future(future)
+                except asyncio.CancelledError:
+                    # A render that already started still writes its file
+                    future.add_done_callback(lambda _: path.unlink(missing_ok=True))
+                    raise
+            else:
+                result = await asyncio.to_thread(render_to_file, *arguments)
+        except BrokenProcessPool:
+            # A worker died (killed, out of memory); start a fresh pool next time
+            self._reset_pool()
+            path.unlink(missing_ok=True)
+            raise
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        self.pages += result["pages"]
+        _IMAGES.inc("embedded", amount=result["images_embedded"])
+        _IMAGES.inc("missing", amount=result["images_missing"])
+        return RenderedPdf(path, report_filename(report), result["bytes"], result["pages"])
+
+    def _resolve_images(self, report: Dict[str, Any], variant: str) -> Dict[str, str]:
+        """Local files of the report's selected images that are in the image proxy's cache."""
+        from motion.tools.image_proxy import get_image_proxy
+
+        urls: Set[str] = set()
+        for exercise in report.get("exercises") or []:
+            url = exercise.get("selected_image") if isinstance(exercise, dict) else None
+            if isinstance(url, str) and url.startswith(("http://", "https://", "/images/")):
+                urls.add(url)
+        if not urls:
+            return {}
+        proxy = get_image_proxy()
+        paths = {url: proxy.cached_path(url, variant) for url in urls}
+        return {url: str(path) for url, path in paths.items() if path is not None}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=get_context("spawn"), initializer=warm_templates
+                )
+            return self._pool
+
+    def _reset_pool(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _retry_after(self) -> float:
+        durations = sorted(self._durations)
+        typical = durations[len(durations) // 2] if durations else 1.0
+        return max(1.0, typical * self._pending / max(1, self.workers))
+
+
+_service: Optional[PdfRenderService] = None
+_service_lock = threading.Lock()
+
+
+def get_pdf_service() -> PdfRenderService:
+    """
+    Return the process-wide render service, creating it on first use.
+
+    Configured through the ``MOTION_PDF_*`` variables.
+    """
+    global _service
+    with _service_lock:
+        if _service is None:
+            workers = int(os.getenv("MOTION_PDF_WORKERS", DEFAULT_WORKERS))
+            _service = PdfRenderService(
+                workers=workers,
+                queue_size=int(os.getenv("MOTION_PDF_QUEUE_SIZE", max(1, workers) * DEFAULT_QUEUE_PER_WORKER)),
+                spool_dir=Path(os.getenv("MOTION_PDF_SPOOL_DIR") or Path(tempfile.gettempdir()) / "motion-pdf"),
+            )
+            REGISTRY.register_stats("motion_pdf", _service.stats)
+        return _service
+
+
+def close_pdf_service() -> None:
+    """Stop the render workers, if the service was started."""
+    with _service_lock:
+        if _service is not None:
+            _service.close()
@@ -0,0 +1,387 @@
+"""
+Admission control and priority scheduling of agent turns.
+
+Every agent turn (and every speculative dictation draft) asks the scheduler
+for a slot before it calls the model, so bursts of background work or retry
+storms queue up behind live sessions instead of pushing them into the model
+provider's rate limits:
+
+- Priority classes: interactive SOAP turns, then chat turns, then background
+  work (bulk uploads sent with ``X-Motion-Priority: background`` and
+  speculative drafts). A free slot always goes to the highest class waiting;
+  background work may only use part of the slots, so live sessions keep
+  headroom.
+- In-flight limits: globally, and per user, so one clinic cannot hold every
+  slot. Within a class, a user at their limit does not block the users
+  queued behind them.
+- Token budget: a token bucket refilled at ``tokens_per_minute``. Turns are
+  admitted against an estimate and settled with the usage the model reports.
+- Bounded queues: a full class queue, or too many queued turns from one user,
+  rejects at once (HTTP 429). A queued turn that has not started by its
+  class's deadline is shed (HTTP 503) rather than served after the client has
+  given up.
+
+Queue times are recorded in ``motion_scheduler_queue_seconds`` by class and
+outcome; admissions, rejections and sheds in ``motion_scheduler_requests_total``.
+
+The scheduler belongs to one event loop; every call must come from it.
+
+Environment:
+    MOTION_SCHEDULER: set to ``0`` to admit every turn immediately.
+    MOTION_SCHEDULER_MAX_IN_FLIGHT: turns running at once (default 16).
+    MOTION_SCHEDULER_MAX_PER_USER: turns running at once per user (default 2).
+    MOTION_SCHEDULER_BACKGROUND_MAX_IN_FLIGHT: background turns running at once
+        (default half of MOTION_SCHEDULER_MAX_IN_FLIGHT).
+    MOTION_SCHEDULER_TOKENS_PER_MINUTE: model token budget (default 0, unlimited).
+    MOTION_SCHEDULER_QUEUE_SIZE: queued turns per class (default 64).
+    MOTION_SCHEDULER_MAX_QUEUED_PER_USER: queued turns per user (default 8).
+    MOTION_SCHEDULER_MAX_WAIT_SOAP / _CHAT / _BACKGROUND: seconds a turn of
+        each class may wait for a slot (defaults 10, 5 and 60).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+from motion.telemetry import REGISTRY
+
+
+SCHEDULER_ENABLED = os.getenv("MOTION_SCHEDULER", "1") != "0"
+
+DEFAULT_MAX_IN_FLIGHT = 16
+DEFAULT_MAX_PER_USER = 2
+DEFAULT_QUEUE_SIZE = 64
+DEFAULT_MAX_QUEUED_PER_USER = 8
+
+QUEUE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_QUEUE_SECONDS = REGISTRY.histogram(
+    "motion_scheduler_queue_seconds", "Time agent turns waited for a slot", ("priority", "outcome"),
+    buckets=QUEUE_BUCKETS,
+)
+_REQUESTS = REGISTRY.counter(
+    "motion_scheduler_requests_total", "Agent turns by scheduling outcome", ("priority", "outcome")
+)
+
+
+class Priority(IntEnum):
+    """Priority class of a turn; lower values are served first."""
+    SOAP = 0
+    CHAT = 1
+    BACKGROUND = 2
+
+    @property
+    def label(self) -> str:
+        return self.name.lower()
+
+
+DEFAULT_MAX_WAIT = {Priority.SOAP: 10.0, Priority.CHAT: 5.0, Priority.BACKGROUND: 60.0}
+
+
+class SchedulerRejected(Exception):
+    """
+    Raised when a turn is not admitted.
+
+    Attributes:
+        status_code: 429 when rejected on arrival, 503 when shed after queueing.
+        retry_after: Suggested seconds before retrying.
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: float):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted turn; release() returns its slot and settles its token estimate."""
+
+    __slots__ = ("scheduler", "user_id", "priority", "estimated_tokens", "used_tokens", "released")
+
+    def __init__(
+        self, scheduler: Optional["RequestScheduler"], user_id: Optional[str], priority: Priority, estimated_tokens: int
+    ):
+        self.scheduler = scheduler
+        self.user_id = user_id
+        self.priority = priority
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens: Optional[int] = None
+        self.released = False
+
+    def record_usage(self, tokens: int) -> None:
+        """Add model-reported tokens; they replace the estimate when the ticket is released."""
+        self.used_tokens = (self.used_tokens or 0) + tokens
+
+    def release(self) -> None:
+        """Free the slot. Safe to call more than once."""
+        if not self.released:
+            self.released = True
+            if self.scheduler is not None:
+                self.scheduler._release(self)
+
+
+class _Waiter:
+    __slots__ = ("user_id", "priority", "estimated_tokens", "enqueued_at", "deadline", "future")
+
+    def __init__(self, user_id: Optional[str], priority: Priority, estimated_tokens: int, max_wait: float):
+        self.user_id = user_id
+        self.priority = priority
+        self.estimated_tokens = estimated_tokens
+        self.enqueued_at = time.monotonic()
+        self.deadline = self.enqueued_at + max_wait
+        self.future: "asyncio.Future[Ticket]" = asyncio.get_running_loop().create_future()
+
+
+class RequestScheduler:
+    """Priority queues with global, per-user and token-rate admission limits."""
+
+    def __init__(
+        self,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        max_per_user: int = DEFAULT_MAX_PER_USER,
+        background_max_in_flight: Optional[int] = None,
+        tokens_per_minute: int = 0,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        max_queued_per_user: int = DEFAULT_MAX_QUEUED_PER_USER,
+        max_wait: Optional[Dict[Priority, float]] = None,
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_per_user = max(1, max_per_user)
+        self.background_max_in_flight = max(
+            1, background_max_in_flight if background_max_in_flight is not None else self.max_in_flight // 2
+        )
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_size = queue_size
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = {**DEFAULT_MAX_WAIT, **(max_wait or {})}
+
+        self._queues: Dict[Priority, Deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._in_flight = 0
+        self._in_flight_by_class: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self._in_flight_by_user: Dict[str, int] = {}
+        self._queued_by_user: Dict[str, int] = {}
+        self._tokens = float(tokens_per_minute)
+        self._tokens_at = time.monotonic()
+        self._refill_timer: Optional[asyncio.TimerHandle] = None
+
+    def acquire_nowait(self, user_id: Optional[str], priority: Priority, estimated_tokens: int = 0) -> Optional[Ticket]:
+        """Admit a turn if a slot is free right now and nothing of its class or higher is queued."""
+        if any(self._queues[p] for p in Priority if p <= priority) or not self._can_start(
+            user_id, priority, estimated_tokens
+        ):
+            return None
+        return self._start(user_id, priority, estimated_tokens)
+
+    async def acquire(self, user_id: Optional[str], priority: Priority, estimated_tokens: int = 0) -> Ticket:
+        """
+        Wait for a slot.
+
+        Args:
+            user_id: User the turn is for; None exempts it from per-user limits.
+            priority: Priority class of the turn.
+            estimated_tokens: Expected model tokens, charged to the token budget.
+
+        Returns:
+            The admitted turn's ticket; release it when the turn is done.
+
+        Raises:
+            SchedulerRejected: If the queue is full (429) or the class's deadline
+                passed before a slot was free (503).
+        """
+        ticket = self.acquire_nowait(user_id, priority, estimated_tokens)
+        if ticket is not None:
+            _QUEUE_SECONDS.observe(0.0, priority.label, "admitted")
+            _REQUESTS.inc(priority.label, "admitted")
+            return ticket
+
+        queue = self._queues[priority]
+        if len(queue) >= self.queue_size or (
+            user_id is not None and self._queued_by_user.get(user_id, 0) >= self.max_queued_per_user
+        ):
+            _REQUESTS.inc(priority.label, "rejected")
+            raise SchedulerRejected("Too many requests are queued", 429, self._retry_after(priority))
+
+        waiter = _Waiter(user_id, priority, estimated_tokens, self.max_wait[priority])
+        queue.append(waiter)
+        if user_id is not None:
+            self._queued_by_user[user_id] = self._queued_by_user.get(user_id, 0) + 1
+        # Turns queued ahead may be waiting on their user's limit, not on a slot
+        self._dispatch()
+        try:
+            # Not wait_for(): on 3.11 it swallows a cancellation that races the admission
+            async with asyncio.timeout(max(0.0, waiter.deadline - time.monotonic())):
+                ticket = await asyncio.shield(waiter.future)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the wait ended; give the slot back
+                waiter.future.result().release()
+            else:
+                waiter.future.cancel()
+                self._dequeue(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            _QUEUE_SECONDS.observe(time.monotonic() - waiter.enqueued_at, priority.label, "shed")
+            _REQUESTS.inc(priority.label, "shed")
+            raise SchedulerRejected(
+                f"No capacity within {self.max_wait[priority]:g}s", 503, self._retry_after(priority)
+            ) from None
+        _QUEUE_SECONDS.observe(time.monotonic() - waiter.enqueued_at, priority.label, "admitted")
+        _REQUESTS.inc(priority.label, "admitted")
+        return ticket
+
+    def stats(self) -> Dict[str, Any]:
+        """Return in-flight and queued turns by class, and the token budget left."""
+        stats: Dict[str, Any] = {
+            "in_flight": self._in_flight,
+            "in_flight_by_priority": {p.label: self._in_flight_by_class[p] for p in Priority},
+            "queued": {p.label: len(self._queues[p]) for p in Priority},
+        }
+        if self.tokens_per_minute:
+            self._refill()
+            stats["tokens_available"] = self._tokens
+        return stats
+
+    def _refill(self) -> None:
+        # Only called with a token budget configured
+        now = time.monotonic()
+        self._tokens = min(
+            float(self.tokens_per_minute), self._tokens + (now - self._tokens_at) * self.tokens_per_minute / 60
+        )
+        self._tokens_at = now
+
+    def _can_start(self, user_id: Optional[str], priority: Priority, estimated_tokens: int) -> bool:
+        if self._in_flight >= self.max_in_flight:
+            return False
+        if priority == Priority.BACKGROUND and self._in_flight_by_class[priority] >= self.background_max_in_flight:
+            return False
+        if user_id is not None and self._in_flight_by_user.get(user_id, 0) >= self.max_per_user:
+            return False
+        if self.tokens_per_minute:
+            self._refill()
+            # A turn may overdraw the bucket, so a large one cannot wait forever
+            if self._tokens <= 0 or (estimated_tokens > self._tokens and self._in_flight):
+                return False
+        return True
+
+    def _start(self, user_id: Optional[str], priority: Priority, estimated_tokens: int) -> Ticket:
+        self._in_flight += 1
+        self._in_flight_by_class[priority] += 1
+        if user_id is not None:
+            self._in_flight_by_user[user_id] = self._in_flight_by_user.get(user_id, 0) + 1
+        if self.tokens_per_minute:
+            self._tokens -= estimated_tokens
+        return Ticket(self, user_id, priority, estimated_tokens)
+
+    def _release(self, ticket: Ticket) -> None:
+        self._in_flight -= 1
+        self._in_flight_by_class[ticket.priority] -= 1
+        if ticket.user_id is not None:
+            remaining = self._in_flight_by_user.get(ticket.user_id, 1) - 1
+            if remaining:
+                self._in_flight_by_user[ticket.user_id] = remaining
+            else:
+                self._in_flight_by_user.pop(ticket.user_id, None)
+        if self.tokens_per_minute and ticket.used_tokens is not None:
+            self._tokens += ticket.estimated_tokens - ticket.used_tokens
+        self._dispatch()
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        # A waiter is queued until its future is resolved, and that always dequeues it
+        self._queues[waiter.priority].remove(waiter)
+        if waiter.user_id is not None:
+            remaining = self._queued_by_user.get(waiter.user_id, 1) - 1
+            if remaining:
+                self._queued_by_user[waiter.user_id] = remaining
+            else:
+                self._queued_by_user.pop(waiter.user_id, None)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiting turns, highest class first."""
+        now = time.monotonic()
+        for priority in Priority:
+            for waiter in list(self._queues[priority]):
+                if self._in_flight >= self.max_in_flight:
+                    return
+                if waiter.deadline <= now:
+                    # Its acquire() is about to time out and shed it
+                    continue
+                if self._can_start(waiter.user_id, priority, waiter.estimated_tokens):
+                    self._dequeue(waiter)
+                    waiter.future.set_result(self._start(waiter.user_id, priority, waiter.estimated_tokens))
+        self._schedule_refill()
+
+    def _schedule_refill(self) -> None:
+        """Run _dispatch() again once the token bucket has refilled, if turns wait only for tokens."""
+        if not self.tokens_per_minute or self._refill_timer is not None or not any(self._queues.values()):
+            return
+        needed = max(1.0, -self._tokens + 1)
+        delay = needed * 60 / self.tokens_per_minute
+
+        def refill() -> None:
+            self._refill_timer = None
+            self._dispatch()
+
+        self._refill_timer = asyncio.get_running_loop().call_later(min(delay, 1.0), refill)
+
+    def _retry_after(self, priority: Priority) -> float:
+        return min(self.max_wait[priority], 5.0)
+
+
+_scheduler: Optional[RequestScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Return the process-wide scheduler, creating it on first use.
+
+    Configured through the ``MOTION_SCHEDULER_*`` variables.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            background = os.getenv("MOTION_SCHEDULER_BACKGROUND_MAX_IN_FLIGHT")
+            _scheduler = RequestScheduler(
+                max_in_flight=int(os.getenv("MOTION_SCHEDULER_MAX_IN_FLIGHT", DEFAULT_MAX_IN_FLIGHT)),
+                max_per_user=int(os.getenv("MOTION_SCHEDULER_MAX_PER_USER", DEFAULT_MAX_PER_USER)),
+                background_max_in_flight=int(background) if background else None,
+                tokens_per_minute=int(os.getenv("MOTION_SCHEDULER_TOKENS_PER_MINUTE", "0")),
+                queue_size=int(os.getenv("MOTION_SCHEDULER_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+                max_queued_per_user=int(os.getenv("MOTION_SCHEDULER_MAX_QUEUED_PER_USER", DEFAULT_MAX_QUEUED_PER_USER)),
+                max_wait={
+                    priority: float(os.getenv(f"MOTION_SCHEDULER_MAX_WAIT_{priority.name}", default))
+                    for priority, default in DEFAULT_MAX_WAIT.items()
+                },
+            )
+            REGISTRY.register_stats("motion_scheduler", _scheduler.stats)
+        return _scheduler
+
+
+@asynccontextmanager
+async def scheduled(
+    user_id: Optional[str], priority: Priority, estimated_tokens: int = 0
+) -> AsyncIterator[Ticket]:
+    """
+    Hold a slot for the duration of an ``async with`` block.
+
+    Usage::
+
+        async with scheduled(user_id, Priority.BACKGROUND, 4000) as ticket:
+            ...
+
+    Yields a ticket whose record_usage() reports actual tokens. With the
+    scheduler disabled the block runs at once.
+    """
+    if not SCHEDULER_ENABLED:
+        yield Ticket(None, user_id, priority, estimated_tokens)
+        return
+    ticket = await get_scheduler().acquire(user_id, priority, estimated_tokens)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
@@ -0,0 +1,47 @@
+"""
+JSON encoding for payloads sent to clients.
+
+Uses orjson when it is installed (``pip install .[fast]``) and the standard
+library otherwise. Output is compact by default; set ``MOTION_JSON_PRETTY=1``
+to indent payloads while debugging.
+"""
+
+import json
+import os
+from types import ModuleType
+from typing import Any, Optional
+
+try:
+    import orjson as _orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    _orjson = None  # type: ignore[assignment]
+
+orjson: Optional[ModuleType] = _orjson
+
+
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+PRETTY_JSON = os.getenv("MOTION_JSON_PRETTY") == "1"
+
+
+def dumps_bytes(payload: Any, pretty: bool = PRETTY_JSON) -> bytes:
+    """Encode ``payload`` as UTF-8 JSON bytes."""
+    if orjson is not None:
+        encoded: bytes = orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else 0)
+        return encoded
+    return dumps(payload, pretty).encode("utf-8")
+
+
+def dumps(payload: Any, pretty: bool = PRETTY_JSON) -> str:
+    """Encode ``payload`` as a JSON string."""
+    if orjson is not None:
+        return dumps_bytes(payload, pretty).decode("utf-8")
+    # Non-ASCII text is written as-is in both modes, as orjson does
+    if pretty:
+        return json.dumps(payload, indent=2, ensure_ascii=False)
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def sse_event(payload: Any) -> bytes:
+    """Encode ``payload`` as one server-sent event, ready to write to the response."""
+    return b"data: " + dumps_bytes(payload, pretty=False) + b"\n\n"
@@ -0,0 +1,156 @@
+"""
+Cold-start profiler for the agent server.
+
+Runs the startup path in a fresh interpreter with ``-X importtime`` and reports
+how long each phase took and which modules dominate import time, so cold start
+can be kept under a budget:
+
+    python -m motion.startup_profile --budget-ms 3000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+SRC_PATH = Path(__file__).parent.parent
+
+# Startup phases timed inside the child interpreter, in order
+_PHASES_SCRIPT = """
+import json, sys, time
+phases = {}
+t = time.perf_counter()
+import motion.agents.soap_agents.message_types
+phases["import_message_types"] = time.perf_counter() - t
+t = time.perf_counter()
+import motion.agents.soap_agents.agent as agent
+phases["import_agent_module"] = time.perf_counter() - t
+t = time.perf_counter()
+agent.get_root_agent()
+phases["build_root_agent"] = time.perf_counter() - t
+if %(include_app)r:
+    t = time.perf_counter()
+    from motion.api.app import create_app
+    create_app()
+    phases["create_app"] = time.perf_counter() - t
+sys.stdout.write(json.dumps(phases))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """
+    Parse ``-X importtime`` output.
+
+    Returns:
+        One dict per imported module with ``module``, ``self_us`` and ``cumulative_us``.
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+            modules.append({
+                "module": name.strip(),
+                "self_us": int(self_us),
+                "cumulative_us": int(cumulative_us),
+            })
+        except ValueError:
+            continue
+    return modules
+
+
+def profile_startup(include_app: bool = True, top: int = 15) -> Dict[str, Any]:
+    """
+    Profile a cold start in a subprocess.
+
+    Args:
+        include_app: Also time building the FastAPI application.
+        top: Number of modules and packages to include in the report.
+
+    Returns:
+        Report with per-phase timings, total, and the heaviest modules and
+        top-level packages by self import time.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(SRC_PATH), env.get("PYTHONPATH")]))
+    env.setdefault("MODEL_GEMINI_2_0_FLASH", "gemini-2.0-flash")
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PHASES_SCRIPT % {"include_app": include_app}],
+        capture_output=True,
+        text=True,
+        env=env,
+        check=False,
+    )
+    if completed.returncode != 0:
+        tail = "\n".join(completed.stderr.splitlines()[-20:])
+        raise RuntimeError(f"Startup failed while profiling:\n{tail}")
+
+    phases_ms = {name: seconds * 1000 for name, seconds in json.loads(completed.stdout).items()}
+    modules = parse_importtime(completed.stderr)
+
+    packages: Dict[str, int] = defaultdict(int)
+    for module in modules:
+        packages[module["module"].split(".")[0]] += module["self_us"]
+
+    return {
+        "phases_ms": phases_ms,
+        "total_ms": sum(phases_ms.values()),
+        "modules_imported": len(modules),
+        "top_modules": [
+            {"module": m["module"], "self_ms": m["self_us"] / 1000, "cumulative_ms": m["cumulative_us"] / 1000}
+            for m in sorted(modules, key=lambda m: m["self_us"], reverse=True)[:top]
+        ],
+        "top_packages": [
+            {"package": name, "self_ms": us / 1000}
+            for name, us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+        ],
+    }
+
+
+def format_report(report: Dict[str, Any], budget_ms: Optional[float] = None) -> str:
+    """Render a profile report as plain text."""
+    lines = ["Startup phases:"]
+    for name, ms in report["phases_ms"].items():
+        lines.append(f"  {name:<24} {ms:9.1f} ms")
+    total = f"  {'total':<24} {report['total_ms']:9.1f} ms"
+    if budget_ms is not None:
+        total += f"  (budget {budget_ms:.0f} ms)"
+    lines.append(total)
+    lines.append("")
+    lines.append(f"Top packages by import time ({report['modules_imported']} modules imported):")
+    for package in report["top_packages"]:
+        lines.append(f"  {package['package']:<40} {package['self_ms']:9.1f} ms")
+    lines.append("")
+    lines.append("Top modules by self import time:")
+    for module in report["top_modules"]:
+        lines.append(
+            f"  {module['module']:<56} {module['self_ms']:9.1f} ms (cumulative {module['cumulative_ms']:.1f} ms)"
+        )
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile agent server cold start.")
+    parser.add_argument("--budget-ms", type=float, default=None, help="Exit non-zero if startup exceeds this")
+    parser.add_argument("--top", type=int, default=15, help="Number of modules/packages to list")
+    parser.add_argument("--no-app", action="store_true", help="Skip building the FastAPI application")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = profile_startup(include_app=not args.no_app, top=args.top)
+    print(json.dumps(report, indent=2) if args.json else format_report(report, args.budget_ms))
+
+    if args.budget_ms is not None and report["total_ms"] > args.budget_ms:
+        print(f"Startup took {report['total_ms']:.0f} ms, over the {args.budget_ms:.0f} ms budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,345 @@
+"""
+Tracing spans and Prometheus metrics for the agent's hot paths.
+
+``span()`` times a block of code. It opens an OpenTelemetry span (nested under
+ADK's own agent and model spans, exported wherever the process's tracer
+provider sends them) and records the duration in the ``motion_span_seconds``
+histogram, labelled by span name and outcome; ``timed()`` records only the
+histogram, for small operations on hot paths. Counters and histograms for
+model latency, token counts, lookup sources and the like live in the
+module-level ``REGISTRY``. ``render_metrics()`` formats them, together with
+registered stats such as cache hit rates, in the Prometheus text format served
+on ``/metrics``.
+
+Metrics are kept per process: with several uvicorn workers each scrape is
+answered by one of them, labelled with its ``pid``.
+
+Environment:
+    MOTION_METRICS: set to ``0`` to disable metrics (and ``/metrics``).
+    MOTION_TRACING: set to ``0`` to stop opening spans. With both disabled
+        ``span()`` and ``timed()`` return a shared no-op.
+"""
+
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+
+METRICS_ENABLED = os.getenv("MOTION_METRICS", "1") != "0"
+
+TRACING_ENABLED = os.getenv("MOTION_TRACING", "1") != "0"
+
+# Seconds; spans range from sub-millisecond serialization to minute-long turns
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        """Add ``amount`` to the series for ``labels`` (one value per label name)."""
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(label) for label in labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, *labels: Any) -> float:
+        """Current value of the series for ``labels``."""
+        with self._lock:
+            return self._values.get(tuple(str(label) for label in labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # Per series: [count per bucket (last is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+
+    def observe(self, value: float, *labels: Any) -> None:
+        """Record one observation in the series for ``labels``."""
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(label) for label in labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, *labels: Any) -> int:
+        """Number of observations in the series for ``labels``."""
+        with self._lock:
+            series = self._series.get(tuple(str(label) for label in labels))
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = sorted((key, list(series[0]), series[1]) for key, series in self._series.items())
+        for key, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="%s"' % _format_value(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named counters and histograms plus stats providers rendered as gauges."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+        self._stats: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def _get_or_create(self, cls: type, name: str, *args: Any, **kwargs: Any) -> Any:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} is already registered as a {type(metric).__name__}")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Return the counter ``name``, creating it on first use."""
+        counter: Counter = self._get_or_create(Counter, name, documentation, labelnames)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        """Return the histogram ``name``, creating it on first use."""
+        histogram: Histogram = self._get_or_create(Histogram, name, documentation, labelnames, buckets)
+        return histogram
+
+    def register_stats(self, prefix: str, provider: Callable[[], Dict[str, Any]]) -> None:
+        """
+        Expose a ``stats()``-style provider as gauges at scrape time.
+
+        Numeric values of the (possibly nested) dict it returns become gauges
+        named ``<prefix>_<key>[_<key>...]``; other values are skipped.
+
+        Args:
+            prefix: Metric name prefix, e.g. ``motion_illustration``.
+            provider: Zero-argument callable returning the stats dict.
+        """
+        with self._lock:
+            self._stats[prefix] = provider
+
+    def render(self) -> str:
+        """Format every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            stats = list(self._stats.items())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for prefix, provider in stats:
+            try:
+                values = provider()
+            except Exception as e:
+                lines.append(f"# {prefix} unavailable: {e}")
+                continue
+            for name, value in _flatten(prefix, values):
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+        lines.append("# TYPE motion_process_info gauge")
+        lines.append(f'motion_process_info{{pid="{os.getpid()}"}} 1')
+        return "\n".join(lines) + "\n"
+
+
+def _flatten(prefix: str, values: Any) -> List[Tuple[str, float]]:
+    if isinstance(values, bool):
+        return [(prefix, float(values))]
+    if isinstance(values, (int, float)):
+        return [(prefix, values)]
+    if isinstance(values, dict):
+        flat = []
+        for key, value in values.items():
+            flat.extend(_flatten(f"{prefix}_{key}", value))
+        return flat
+    return []
+
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "motion_span_seconds", "Duration of traced operations", ("span", "outcome")
+)
+
+
+class _NoopSpan:
+    """Shared stand-in returned by span() when metrics and tracing are both off."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        return None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        return None
+
+    def set_error(self, message: str) -> None:
+        return None
+
+
+_NOOP_SPAN = _NoopSpan()
+
+_tracer = None
+
+
+def _get_tracer() -> Any:
+    global _tracer
+    if _tracer is None:
+        # opentelemetry-api is a dependency of google-adk; imported lazily so
+        # modules such as message_types stay cheap to import
+        from opentelemetry import trace
+
+        _tracer = trace.get_tracer("motion")
+    return _tracer
+
+
+class Span:
+    """Times a block and mirrors it as an OpenTelemetry span."""
+
+    __slots__ = ("name", "attributes", "outcome", "trace", "_started", "_otel", "_otel_cm")
+
+    def __init__(self, name: str, attributes: Dict[str, Any], trace: bool = True):
+        self.name = name
+        self.attributes = attributes
+        self.outcome = "ok"
+        self.trace = trace and TRACING_ENABLED
+        self._otel: Any = None
+        self._otel_cm: Any = None
+
+    def __enter__(self) -> "Span":
+        if self.trace:
+            self._otel_cm = _get_tracer().start_as_current_span(self.name, attributes=self.attributes or None)
+            self._otel = self._otel_cm.__enter__()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type: Any, exc: Any, tb: Any) -> None:
+        elapsed = time.perf_counter() - self._started
+        if exc_type is not None and self.outcome == "ok":
+            # Abandoned streams and cancelled tasks are not failures of the operation
+            self.outcome = "error" if issubclass(exc_type, Exception) else "cancelled"
+        SPAN_SECONDS.observe(elapsed, self.name, self.outcome)
+        if self._otel_cm is not None:
+            self._otel_cm.__exit__(exc_type, exc, tb)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute to the trace span."""
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+    def set_error(self, message: str) -> None:
+        """Mark the operation failed without raising, e.g. for error results."""
+        self.outcome = "error"
+        if self._otel is not None:
+            from opentelemetry.trace import Status, StatusCode
+
+            self._otel.set_status(Status(StatusCode.ERROR, message))
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    Trace and time a block of code.
+
+    Usage::
+
+        with span("tool.search_exercise_illustrations", exercise=name) as s:
+            result = ...
+            if "error" in result:
+                s.set_error(result["error"])
+
+    Args:
+        name: Span name, also the ``span`` label of ``motion_span_seconds``.
+        **attributes: Attributes attached to the trace span (not to metrics).
+
+    Returns:
+        A context manager yielding an object with ``set_attribute`` and ``set_error``.
+    """
+    if not METRICS_ENABLED and not TRACING_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, attributes)
+
+
+def timed(name: str) -> Any:
+    """
+    Time a block of code in ``motion_span_seconds`` without opening a trace span.
+
+    For operations too small and frequent to be worth a span each, such as
+    serializing one streamed message.
+    """
+    if not METRICS_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, {}, trace=False)
+
+
+def render_metrics() -> str:
+    """Return all metrics in the Prometheus text exposition format."""
+    return REGISTRY.render()
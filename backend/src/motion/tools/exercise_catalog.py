@@ -0,0 +1,335 @@
+"""
+Offline exercise catalog with a fuzzy-match index.
+
+The catalog is a curated JSON file of well-known exercises, their common
+aliases and vetted illustration URLs. Lookups normalize synonyms and the side
+being treated ("L", "left", ...) and score candidates by character-trigram
+similarity, so "Seated Banded L Ankle Dorsiflexion" and "seated band ankle
+dorsi flexion" resolve to the same entry without a network round trip.
+Qualifiers that change the movement ("side", "single", "band", ...) must agree,
+so "Side bridge" never answers for "Bridge".
+
+Entries without images are kept for their aliases but never answer a lookup.
+
+Answering illustration searches from the catalog is opt-in. The bundled
+catalog has names and aliases only (used to recognise and normalize exercise
+names), so out of the box every illustration search goes to Linkup. To serve
+known exercises offline, point ``MOTION_EXERCISE_CATALOG`` at a catalog whose
+entries list vetted images::
+
+    {"exercises": [{"name": "Bridge", "aliases": ["glute bridge"],
+                    "images": [{"name": "Bridge", "url": "https://..."}]}]}
+"""
+
+import json
+import os
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+
+DEFAULT_CATALOG_PATH = Path(__file__).parent / "data" / "exercise_catalog.json"
+
+# Minimum similarity (0-1) for a catalog entry to answer a search
+DEFAULT_MIN_CONFIDENCE = 0.8
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+# Words that carry no information about which exercise is meant
+_STOPWORDS = {"a", "an", "the", "and", "with", "of", "for", "on", "in", "exercise", "exercises", "ex"}
+
+# Side markers; illustrations are the same for either side
+_LATERALITY = {"l", "r", "lt", "rt", "left", "right"}
+
+# Words (after synonym rewrites) naming a variant of a movement rather than the
+# movement itself; a catalog entry only matches a name with the same qualifiers
+_QUALIFIERS = {
+    "side", "lateral", "single", "one", "double", "bilateral", "bilat", "unilateral",
+    "band", "reverse", "half", "wall", "ball", "weighted", "assisted", "eccentric",
+    "isometric", "standing", "sitting", "lying", "front", "kneeling", "quadruped",
+    "internal", "external", "inner", "outer",
+}
+
+# Multi-word phrases rewritten after single-word synonyms
+_PHRASE_SYNONYMS = {
+    "cat camel": "cat cow",
+    "dorsi flexion": "dorsiflexion",
+    "plantar flexion": "plantarflexion",
+    "resistance band": "band",
+    "thera band": "band",
+    "straight leg raise": "slr",
+    "hip bridge": "bridge",
+    "glute bridge": "bridge",
+    "gluteal bridge": "bridge",
+    "heel raise": "calf raise",
+    "knee to chest": "knee chest",
+}
+
+# Single-word rewrites applied first
+_WORD_SYNONYMS = {
+    "banded": "band",
+    "theraband": "band",
+    "df": "dorsiflexion",
+    "pf": "plantarflexion",
+    "ext": "extension",
+    "flex": "flexion",
+    "rot": "rotation",
+    "abd": "abduction",
+    "add": "adduction",
+    "er": "external rotation",
+    "ir": "internal rotation",
+    "stretches": "stretch",
+    "stretching": "stretch",
+    "bridges": "bridge",
+    "bridging": "bridge",
+    "squats": "squat",
+    "lunges": "lunge",
+    "raises": "raise",
+    "curls": "curl",
+    "rows": "row",
+    "planks": "plank",
+    "slides": "slide",
+    "sets": "set",
+    "clams": "clam",
+    "clamshell": "clam",
+    "clamshells": "clam",
+    "seated": "sitting",
+    "supine": "lying",
+    "prone": "lying front",
+}
+
+
+def normalize_catalog_name(name: str) -> str:
+    """
+    Normalize an exercise name for catalog matching.
+
+    Lowercases, drops stopwords and laterality markers, and applies synonym
+    rewrites, e.g. "Seated Banded L Ankle Dorsiflexion" -> "sitting band ankle dorsiflexion".
+    """
+    words = []
+    for word in _NON_ALNUM.sub(" ", name.lower()).split():
+        if word in _STOPWORDS or word in _LATERALITY:
+            continue
+        words.append(_WORD_SYNONYMS.get(word, word))
+    text = " " + " ".join(words) + " "
+    for phrase, replacement in _PHRASE_SYNONYMS.items():
+        text = text.replace(f" {phrase} ", f" {replacement} ")
+    return " ".join(text.split())
+
+
+def _qualifiers(key: str) -> FrozenSet[str]:
+    return frozenset(word for word in key.split() if word in _QUALIFIERS)
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def name_coverage(exercise_name: str, text: str) -> float:
+    """
+    Fraction (0-1) of an exercise name found in a longer text, such as an image caption.
+
+    Both are normalized like catalog names and compared by character trigrams,
+    so extra words in ``text`` do not lower the score.
+    """
+    key = normalize_catalog_name(exercise_name)
+    if not key:
+        return 0.0
+    name_grams = _trigrams(key)
+    return len(name_grams & _trigrams(normalize_catalog_name(text))) / len(name_grams)
+
+
+class ExerciseCatalog:
+    """
+    In-memory exercise catalog with an inverted character-trigram index.
+
+    Each entry is indexed under its canonical name and every alias. A lookup
+    gathers candidates sharing at least one trigram with the query and the
+    same qualifier words, and ranks them by Dice similarity of the trigram sets.
+    """
+
+    def __init__(self, entries: List[Dict[str, Any]], min_confidence: float = DEFAULT_MIN_CONFIDENCE):
+        self.entries = entries
+        self.min_confidence = min_confidence
+
+        self._keys: List[str] = []
+        self._key_entry: List[int] = []
+        self._key_grams: List[Set[str]] = []
+        self._key_qualifiers: List[FrozenSet[str]] = []
+        self._exact: Dict[str, int] = {}
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        # Every name and alias, with or without images, for spotting mentions in free text
+        self._mentions: Dict[str, int] = {}
+        self._mention_max_words = 0
+
+        for entry_index, entry in enumerate(entries):
+            for raw in [entry["name"], *entry.get("aliases", [])]:
+                key = normalize_catalog_name(raw)
+                if key:
+                    self._mentions.setdefault(key, entry_index)
+                    self._mention_max_words = max(self._mention_max_words, len(key.split()))
+            if not entry.get("images"):
+                continue
+            for raw in [entry["name"], *entry.get("aliases", [])]:
+                key = normalize_catalog_name(raw)
+                if not key or key in self._exact:
+                    continue
+                key_index = len(self._keys)
+                grams = _trigrams(key)
+                self._keys.append(key)
+                self._key_entry.append(entry_index)
+                self._key_grams.append(grams)
+                self._key_qualifiers.append(_qualifiers(key))
+                self._exact[key] = key_index
+                for gram in grams:
+                    self._postings[gram].append(key_index)
+
+    @classmethod
+    def load(cls, path: Path, min_confidence: float = DEFAULT_MIN_CONFIDENCE) -> "ExerciseCatalog":
+        """Load a catalog file of the form ``{"exercises": [{"name", "aliases", "images"}]}``."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data.get("exercises", []), min_confidence=min_confidence)
+
+    def __len__(self) -> int:
+        return sum(1 for entry in self.entries if entry.get("images"))
+
+    def match(self, exercise_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Find the best catalog entry for an exercise name.
+
+        Args:
+            exercise_name: Exercise name as written in the SOAP plan.
+
+        Returns:
+            ``{"entry": ..., "score": ...}`` for the best candidate, or None if no
+            entry with the same qualifiers shares any trigram with the name.
+        """
+        key = normalize_catalog_name(exercise_name)
+        if not key:
+            return None
+
+        exact = self._exact.get(key)
+        if exact is not None:
+            return {"entry": self.entries[self._key_entry[exact]], "score": 1.0}
+
+        query_grams = _trigrams(key)
+        query_qualifiers = _qualifiers(key)
+        overlap: Dict[int, int] = defaultdict(int)
+        for gram in query_grams:
+            for key_index in self._postings.get(gram, ()):
+                overlap[key_index] += 1
+        if not overlap:
+            return None
+
+        # In catalog order, so ties go to the earlier entry whatever the hash seed
+        best_index, best_score = -1, 0.0
+        for key_index, shared in sorted(overlap.items()):
+            if self._key_qualifiers[key_index] != query_qualifiers:
+                continue
+            score = 2 * shared / (len(query_grams) + len(self._key_grams[key_index]))
+            if score > best_score:
+                best_index, best_score = key_index, score
+        if best_index < 0:
+            return None
+        return {"entry": self.entries[self._key_entry[best_index]], "score": best_score}
+
+    def find_mentions(self, text: str) -> List[str]:
+        """
+        Find catalog exercises mentioned by name or alias in free text.
+
+        Scans the normalized words of ``text`` left to right, preferring the
+        longest exact name match at each position.
+
+        Args:
+            text: Free text, e.g. one sentence of a dictated transcript.
+
+        Returns:
+            Canonical names of the mentioned exercises, in order of first mention.
+        """
+        words = normalize_catalog_name(text).split()
+        found: List[str] = []
+        i = 0
+        while i < len(words):
+            for length in range(min(self._mention_max_words, len(words) - i), 0, -1):
+                entry_index = self._mentions.get(" ".join(words[i:i + length]))
+                if entry_index is not None:
+                    name = self.entries[entry_index]["name"]
+                    if name not in found:
+                        found.append(name)
+                    i += length
+                    break
+            else:
+                i += 1
+        return found
+
+    def lookup(self, exercise_name: str, min_confidence: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Answer an illustration search from the catalog when confidence is high.
+
+        Args:
+            exercise_name: Exercise name as written in the SOAP plan.
+            min_confidence: Overrides the catalog's threshold, e.g. a lower one
+                when the catalog is the only source available.
+
+        Returns:
+            A result dictionary shaped like search_exercise_illustrations output,
+            or None if no entry reaches the threshold.
+        """
+        found = self.match(exercise_name)
+        threshold = self.min_confidence if min_confidence is None else min_confidence
+        if found is None or found["score"] < threshold:
+            return None
+        entry = found["entry"]
+        return {
+            "exercise_name": exercise_name,
+            "source": "catalog",
+            "matched_exercise": entry["name"],
+            "results": [
+                {"type": "image", "name": image.get("name", entry["name"]), "url": image["url"]}
+                for image in entry["images"]
+            ]
+        }
+
+
+_catalog: Optional[ExerciseCatalog] = None
+_catalog_lock = threading.Lock()
+
+
+def get_exercise_catalog() -> ExerciseCatalog:
+    """
+    Return the process-wide catalog, loading it on first use.
+
+    The file is read from ``MOTION_EXERCISE_CATALOG`` (defaults to the bundled
+    ``data/exercise_catalog.json``) and the match threshold from
+    ``MOTION_EXERCISE_CATALOG_MIN_CONFIDENCE``.
+    """
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            path = Path(os.getenv("MOTION_EXERCISE_CATALOG", str(DEFAULT_CATALOG_PATH)))
+            min_confidence = float(
+                os.getenv("MOTION_EXERCISE_CATALOG_MIN_CONFIDENCE", DEFAULT_MIN_CONFIDENCE)
+            )
+            if path.exists():
+                _catalog = ExerciseCatalog.load(path, min_confidence=min_confidence)
+            else:
+                _catalog = ExerciseCatalog([], min_confidence=min_confidence)
+        return _catalog
+
+
+def get_illustration_catalog() -> Optional[ExerciseCatalog]:
+    """
+    Return the catalog for answering illustration searches, if one is configured.
+
+    Opt-in: only an operator-supplied ``MOTION_EXERCISE_CATALOG`` with at least
+    one illustrated entry qualifies. The bundled catalog carries no image URLs,
+    so without one this returns None and searches go to Linkup.
+    """
+    if not os.getenv("MOTION_EXERCISE_CATALOG"):
+        return None
+    catalog = get_exercise_catalog()
+    return catalog if len(catalog) else None
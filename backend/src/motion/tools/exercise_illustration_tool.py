@@ -4,9 +4,42 @@ Exercise illustration search tool using Linkup AI Search API.
 
 import os
 import json
-from typing import Dict, Any
+import asyncio
+from typing import Dict, Any, List, Optional
 
-from linkup import LinkupClient
+from motion.telemetry import REGISTRY, span
+from motion.tools.exercise_catalog import get_illustration_catalog
+from motion.tools.illustration_cache import get_illustration_cache, normalize_exercise_name
+from motion.tools.image_proxy import IMAGE_PROXY_ENABLED, get_image_proxy
+from motion.tools.linkup_client import CircuitOpenError, get_linkup_client
+from motion.tools.result_ranking import rank_results, ranking_stats
+from motion.tools.single_flight import SingleFlight
+
+
+# Upper bound on concurrent Linkup searches issued by one batch call
+BATCH_MAX_CONCURRENCY = int(os.getenv("MOTION_ILLUSTRATION_BATCH_CONCURRENCY", "6"))
+
+# Results kept per exercise after ranking
+TOP_K = int(os.getenv("MOTION_ILLUSTRATION_TOP_K", "4"))
+
+# Seconds a single exercise search may take inside a batch before it is reported as failed
+BATCH_ITEM_TIMEOUT = float(os.getenv("MOTION_ILLUSTRATION_ITEM_TIMEOUT", "20"))
+
+# Identical concurrent upstream searches are coalesced by normalized exercise name
+_search_flights = SingleFlight()
+
+# Identical concurrent lookups (search plus image processing) are coalesced the
+# same way, so a prefetch and the agent's own call share one execution
+_illustration_flights = SingleFlight()
+
+# Catalog similarity accepted when Linkup is failing and nothing is cached
+FALLBACK_MIN_CONFIDENCE = float(os.getenv("MOTION_ILLUSTRATION_FALLBACK_CONFIDENCE", "0.7"))
+
+# Where each lookup was answered from: catalog, cache, linkup, unconfigured,
+# or, when Linkup failed, stale_cache or catalog_fallback
+_LOOKUPS = REGISTRY.counter(
+    "motion_illustration_source_total", "Illustration lookups by the source that answered them", ("source",)
+)
 
 
 # Structured output schema for image search results
@@ -42,37 +75,155 @@ LINKUP_IMAGE_SEARCH_SCHEMA = {
     "additionalProperties": False
 }
 
-def search_exercise_illustrations(exercise_name: str) -> Dict[str, Any]:
+async def search_exercise_illustrations(exercise_name: str) -> Dict[str, Any]:
     """
     Search for illustration images of a specific physiotherapy exercise using Linkup AI Search.
     
+    Well-known exercises are answered from the offline exercise catalog, when one
+    with vetted images is configured and it matches with high confidence. Otherwise results are served from the
+    illustration cache when possible, keyed by the normalized exercise name. Upstream errors are cached briefly as negative
+    entries; configuration errors are never cached. When Linkup fails or its
+    circuit breaker is open, an expired cache entry or a looser catalog match
+    is returned instead, marked ``"degraded": True`` and never cached. Concurrent searches for the
+    same exercise (including speculative prefetches) wait on a single upstream
+    request. Searches share one pooled Linkup connection per process and never
+    block the caller's event loop.
+    Results are ranked by how well they match the exercise name, with tracking,
+    non-image and duplicate links removed, and trimmed to the best TOP_K.
+    Candidate images go through the image proxy, which drops dead links and
+    duplicates and, when configured, points results at backend-served copies.
+    
     Args:
         exercise_name: The name of the exercise to search for (e.g., "Seated Banded L Ankle Dorsiflexion")
         
     Returns:
         Dictionary containing search results with exercise illustration images
     """
-    # Initialize Linkup client
+    async def find_and_process() -> Dict[str, Any]:
+        result = await _find_illustrations(exercise_name)
+        if "error" in result or not result.get("results"):
+            return result
+        if IMAGE_PROXY_ENABLED:
+            # Rank a few spares, in case some links turn out to be dead
+            candidates = rank_results(exercise_name, result["results"], 2 * TOP_K)
+            result["results"] = (await get_image_proxy().process(candidates))[:TOP_K]
+        else:
+            result["results"] = rank_results(exercise_name, result["results"], TOP_K)
+        return result
+    
+    with span("tool.search_exercise_illustrations", exercise=exercise_name) as traced:
+        result = await _illustration_flights.do_async(normalize_exercise_name(exercise_name), find_and_process)
+        if "error" in result:
+            traced.set_error(result["error"])
+    return {**result, "exercise_name": exercise_name}
+
+
+def search_exercise_illustrations_sync(exercise_name: str) -> Dict[str, Any]:
+    """
+    Search for illustration images of a specific physiotherapy exercise using Linkup AI Search.
+    
+    Blocking wrapper around search_exercise_illustrations for callers that
+    are not running an event loop.
+    
+    Args:
+        exercise_name: The name of the exercise to search for (e.g., "Seated Banded L Ankle Dorsiflexion")
+        
+    Returns:
+        Dictionary containing search results with exercise illustration images
+    """
+    return get_linkup_client().run_sync(search_exercise_illustrations(exercise_name))
+
+
+async def _find_illustrations(exercise_name: str) -> Dict[str, Any]:
+    """Look up illustration candidates in the catalog, the cache or Linkup."""
+    catalog = get_illustration_catalog()
+    catalog_result = catalog.lookup(exercise_name) if catalog is not None else None
+    if catalog_result is not None:
+        _LOOKUPS.inc("catalog")
+        return catalog_result
+    
     api_key = os.getenv("LINKUP_API_KEY")
     if not api_key:
+        _LOOKUPS.inc("unconfigured")
         return {
             "error": "LINKUP_API_KEY environment variable is not set",
             "exercise_name": exercise_name,
             "results": []
         }
     
-    client = LinkupClient(api_key=api_key)
+    cache = get_illustration_cache()
+    cached = cache.get(exercise_name)
+    if cached is not None:
+        _LOOKUPS.inc("cache")
+        cached["exercise_name"] = exercise_name
+        return cached
+    
+    async def search_and_cache() -> Dict[str, Any]:
+        _LOOKUPS.inc("linkup")
+        result = await _search_linkup(api_key, exercise_name)
+        if "error" in result:
+            fallback = _degraded_result(exercise_name)
+            if fallback is not None:
+                return fallback
+            if result.get("unavailable"):
+                # The breaker already keeps load off Linkup; don't pin the outage in the cache
+                return result
+        cache.put(exercise_name, result)
+        return result
+    
+    result = await _search_flights.do_async(normalize_exercise_name(exercise_name), search_and_cache)
+    return {**result, "exercise_name": exercise_name}
+
+
+def _degraded_result(exercise_name: str) -> Optional[Dict[str, Any]]:
+    """Best answer available without Linkup: an expired cache entry, else a looser catalog match."""
+    stale = get_illustration_cache().get_stale(exercise_name)
+    if stale is not None and stale.get("results"):
+        _LOOKUPS.inc("stale_cache")
+        return {**stale, "exercise_name": exercise_name, "degraded": True}
     
+    catalog = get_illustration_catalog()
+    loose = (
+        catalog.lookup(exercise_name, min_confidence=FALLBACK_MIN_CONFIDENCE)
+        if catalog is not None
+        else None
+    )
+    if loose is not None:
+        _LOOKUPS.inc("catalog_fallback")
+        return {**loose, "degraded": True}
+    return None
+
+
+def get_illustration_search_stats() -> Dict[str, Any]:
+    """Return cache, request-coalescing and Linkup client counters for illustration searches."""
+    client = get_linkup_client()
+    return {
+        "cache": get_illustration_cache().stats(),
+        "single_flight": _search_flights.stats(),
+        "lookups": _illustration_flights.stats(),
+        "images": get_image_proxy().stats() if IMAGE_PROXY_ENABLED else None,
+        "ranking": ranking_stats(),
+        "linkup": client.stats() if client.started else None
+    }
+
+
+REGISTRY.register_stats("motion_illustration", get_illustration_search_stats)
+
+
+async def _search_linkup(api_key: str, exercise_name: str) -> Dict[str, Any]:
+    """Run one uncached Linkup search and wrap the response as a tool result."""
     try:
         query = f"Return me actual illustration images for the following physiotherapy exercise - {exercise_name}"
         
-        response = client.search(
-            query=query,
-            depth="standard",
-            output_type="structured",
-            structured_output_schema=json.dumps(LINKUP_IMAGE_SEARCH_SCHEMA),
-            include_images=True
-        )
+        with span("linkup.search", exercise=exercise_name):
+            response = await get_linkup_client().search(
+                api_key,
+                q=query,
+                depth="standard",
+                outputType="structured",
+                structuredOutputSchema=json.dumps(LINKUP_IMAGE_SEARCH_SCHEMA),
+                includeImages=True
+            )
         
         return {
             "exercise_name": exercise_name,
@@ -80,9 +231,81 @@ def search_exercise_illustrations(exercise_name: str) -> Dict[str, Any]:
             "results": response.get("results", []) if response else []
         }
         
+    except CircuitOpenError:
+        return {
+            "error": f"Illustration search is temporarily unavailable; no illustrations found for {exercise_name}",
+            "exercise_name": exercise_name,
+            "unavailable": True,
+            "results": []
+        }
     except Exception as e:
         return {
             "error": f"Error searching for {exercise_name}: {str(e)}",
             "exercise_name": exercise_name,
             "results": []
-        }
\ No newline at end of file
+        }
+
+
+async def search_exercise_illustrations_batch(exercise_names: List[str]) -> Dict[str, Any]:
+    """
+    Search for illustration images of several physiotherapy exercises at once.
+    
+    The searches run concurrently (at most BATCH_MAX_CONCURRENCY at a time) and
+    each one is bounded by BATCH_ITEM_TIMEOUT seconds, so a whole treatment plan
+    costs one tool call and roughly one search round trip.
+    
+    Args:
+        exercise_names: Names of all exercises in the plan (e.g., ["Cat-cow exercises", "Bridge exercises"])
+        
+    Returns:
+        Dictionary with one entry per requested exercise under "exercises", in the
+        order given, each shaped like a search_exercise_illustrations result, plus
+        the names of any exercises whose search failed under "failed".
+    """
+    # Identical names (after normalization) are searched only once
+    unique: Dict[str, str] = {}
+    for name in exercise_names:
+        unique.setdefault(normalize_exercise_name(name), name)
+    
+    semaphore = asyncio.Semaphore(max(1, BATCH_MAX_CONCURRENCY))
+    
+    async def run_one(name: str) -> Dict[str, Any]:
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    search_exercise_illustrations(name),
+                    timeout=BATCH_ITEM_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                return {
+                    "error": f"Timed out searching for {name} after {BATCH_ITEM_TIMEOUT:g}s",
+                    "exercise_name": name,
+                    "results": []
+                }
+            except Exception as e:
+                return {
+                    "error": f"Error searching for {name}: {str(e)}",
+                    "exercise_name": name,
+                    "results": []
+                }
+    
+    keys = list(unique)
+    with span("tool.search_exercise_illustrations_batch", exercises=len(keys)) as traced:
+        outcomes = await asyncio.gather(*(run_one(unique[key]) for key in keys))
+        if any("error" in outcome for outcome in outcomes):
+            traced.set_error("One or more exercise searches failed")
+    by_key = dict(zip(keys, outcomes))
+    
+    exercises = []
+    failed = []
+    for name in exercise_names:
+        result = dict(by_key[normalize_exercise_name(name)])
+        result["exercise_name"] = name
+        if "error" in result:
+            failed.append(name)
+        exercises.append(result)
+    
+    return {
+        "exercises": exercises,
+        "failed": failed
+    }
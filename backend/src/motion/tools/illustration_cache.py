@@ -0,0 +1,316 @@
+"""
+Two-tier result cache for exercise illustration searches.
+
+The first tier is an in-process LRU; the second is a SQLite file that survives
+restarts and is shared by every worker process on the node. Both tiers apply a
+TTL, with a much shorter TTL for negative (error) entries so a transient
+upstream failure is not replayed for long. Expired positive entries stay on
+disk (until evicted for space) so they can still be served, marked stale,
+while the upstream is unavailable.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "motion"
+
+DEFAULT_MEMORY_ENTRIES = 512
+DEFAULT_DISK_ENTRIES = 20000
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL_SECONDS = 300
+
+_NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+
+def get_cache_dir() -> Path:
+    """Return the directory used for on-disk caches (``MOTION_CACHE_DIR``)."""
+    return Path(os.getenv("MOTION_CACHE_DIR", str(DEFAULT_CACHE_DIR))).expanduser()
+
+
+def normalize_exercise_name(exercise_name: str) -> str:
+    """
+    Normalize an exercise name into a cache key.
+
+    Case, punctuation and repeated whitespace are ignored, so "Cat-Cow  exercises"
+    and "cat cow exercises" share one entry.
+    """
+    return _NON_ALNUM.sub(" ", exercise_name.lower()).strip()
+
+
+class IllustrationCache:
+    """
+    LRU + SQLite cache of ``search_exercise_illustrations`` results.
+
+    Values are the tool's result dictionaries. A value containing an ``"error"``
+    key is stored as a negative entry and expires after ``negative_ttl_seconds``.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[Path] = None,
+        max_memory_entries: int = DEFAULT_MEMORY_ENTRIES,
+        max_disk_entries: int = DEFAULT_DISK_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+    ):
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "negative_writes": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "stale_hits": 0,
+        }
+
+        self._db: Optional[sqlite3.Connection] = None
+        if db_path is not None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(db_path), check_same_thread=False, timeout=5.0)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS illustrations (
+                    key TEXT PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS illustrations_accessed ON illustrations (accessed_at)"
+            )
+            self._db.commit()
+
+    def get(self, exercise_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached result.
+
+        Args:
+            exercise_name: Raw exercise name; it is normalized before lookup.
+
+        Returns:
+            A copy of the cached result dictionary, or None on a miss.
+        """
+        key = normalize_exercise_name(exercise_name)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._count_hit("memory_hits", value)
+                    return dict(value)
+                del self._memory[key]
+                self._counters["expirations"] += 1
+
+            stored = self._disk_get(key, now)
+            if stored is None:
+                self._counters["misses"] += 1
+                return None
+
+            self._count_hit("disk_hits", stored)
+            return dict(stored)
+
+    def put(self, exercise_name: str, value: Dict[str, Any]) -> None:
+        """
+        Store a result, as a negative entry if it carries an ``"error"`` key.
+
+        Args:
+            exercise_name: Raw exercise name; it is normalized before storing.
+            value: Result dictionary as returned by the search tool.
+        """
+        key = normalize_exercise_name(exercise_name)
+        negative = "error" in value
+        ttl = self.negative_ttl_seconds if negative else self.ttl_seconds
+        now = time.time()
+        expires_at = now + ttl
+
+        with self._lock:
+            self._counters["negative_writes" if negative else "writes"] += 1
+            self._memory_put(key, expires_at, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO illustrations (key, payload, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value), expires_at, now),
+                )
+                self._disk_evict(self._db)
+                self._db.commit()
+
+    def get_stale(self, exercise_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a result even if it has expired, as a fallback when the upstream is down.
+
+        Negative entries are never returned.
+
+        Args:
+            exercise_name: Raw exercise name; it is normalized before lookup.
+
+        Returns:
+            A copy of the cached result dictionary with ``"stale": True`` if it
+            has expired, or None if nothing usable is cached.
+        """
+        key = normalize_exercise_name(exercise_name)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and "error" not in entry[1]:
+                expires_at, value = entry
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT payload, expires_at FROM illustrations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                expires_at, value = row[1], json.loads(row[0])
+                if "error" in value:
+                    return None
+            else:
+                return None
+            self._counters["stale_hits"] += 1
+        value = dict(value)
+        if expires_at <= now:
+            value["stale"] = True
+        return value
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM illustrations")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters and current tier sizes."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            if self._db is not None:
+                stats["disk_entries"] = self._db.execute(
+                    "SELECT COUNT(*) FROM illustrations"
+                ).fetchone()[0]
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        )
+        return stats
+
+    def close(self) -> None:
+        """Close the SQLite connection, if any."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # Internal helpers; callers must hold self._lock.
+
+    def _count_hit(self, counter: str, value: Dict[str, Any]) -> None:
+        self._counters[counter] += 1
+        if "error" in value:
+            self._counters["negative_hits"] += 1
+
+    def _memory_put(self, key: str, expires_at: float, value: Dict[str, Any]) -> None:
+        self._memory[key] = (expires_at, dict(value))
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _disk_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT payload, expires_at FROM illustrations WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        payload, expires_at = row
+        if expires_at <= now:
+            # Expired results stay as a fallback for get_stale(); errors have no further use
+            if "error" in json.loads(payload):
+                self._db.execute("DELETE FROM illustrations WHERE key = ?", (key,))
+                self._db.commit()
+            self._counters["expirations"] += 1
+            return None
+
+        self._db.execute(
+            "UPDATE illustrations SET accessed_at = ? WHERE key = ?", (now, key)
+        )
+        self._db.commit()
+        value: Dict[str, Any] = json.loads(payload)
+        self._memory_put(key, expires_at, value)
+        return value
+
+    def _disk_evict(self, db: sqlite3.Connection) -> None:
+        count = db.execute("SELECT COUNT(*) FROM illustrations").fetchone()[0]
+        excess = count - self.max_disk_entries
+        if excess <= 0:
+            return
+        db.execute(
+            "DELETE FROM illustrations WHERE key IN ("
+            "SELECT key FROM illustrations ORDER BY expires_at <= ? DESC, accessed_at ASC LIMIT ?)",
+            (time.time(), excess),
+        )
+        self._counters["evictions"] += excess
+
+
+_cache: Optional[IllustrationCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_illustration_cache() -> IllustrationCache:
+    """
+    Return the process-wide cache, creating it on first use.
+
+    Configured through ``MOTION_ILLUSTRATION_CACHE_TTL``,
+    ``MOTION_ILLUSTRATION_CACHE_NEGATIVE_TTL``, ``MOTION_ILLUSTRATION_CACHE_MEMORY_ENTRIES``,
+    ``MOTION_ILLUSTRATION_CACHE_DISK_ENTRIES`` and ``MOTION_CACHE_DIR``. Setting
+    ``MOTION_ILLUSTRATION_CACHE_DISK=0`` keeps the cache in memory only.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            db_path = None
+            if os.getenv("MOTION_ILLUSTRATION_CACHE_DISK", "1") != "0":
+                db_path = get_cache_dir() / "illustrations.sqlite3"
+            _cache = IllustrationCache(
+                db_path=db_path,
+                max_memory_entries=int(
+                    os.getenv("MOTION_ILLUSTRATION_CACHE_MEMORY_ENTRIES", DEFAULT_MEMORY_ENTRIES)
+                ),
+                max_disk_entries=int(
+                    os.getenv("MOTION_ILLUSTRATION_CACHE_DISK_ENTRIES", DEFAULT_DISK_ENTRIES)
+                ),
+                ttl_seconds=float(
+                    os.getenv("MOTION_ILLUSTRATION_CACHE_TTL", DEFAULT_TTL_SECONDS)
+                ),
+                negative_ttl_seconds=float(
+                    os.getenv(
+                        "MOTION_ILLUSTRATION_CACHE_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL_SECONDS
+                    )
+                ),
+            )
+        return _cache
@@ -0,0 +1,503 @@
+"""
+Image pipeline for illustration search results.
+
+Search results point at arbitrary third-party images: some links are dead,
+some are not images at all, several are the same picture on different hosts
+and many are far larger than a phone needs. Before results reach the agent,
+every candidate URL is fetched (concurrently, size- and time-bounded) and
+
+- dead links and non-image responses are dropped,
+- exact and near-identical images (same content hash or perceptual hash) are
+  collapsed into one,
+- a thumbnail and a display-size JPEG are written to a content-addressed disk
+  cache (``{cache_dir}/images/ab/abcdef...thumb``) served by the backend at
+  ``/images/{digest}/{variant}``.
+
+Results are rewritten to point at the backend copies when
+``MOTION_PUBLIC_BASE_URL`` (the URL clients reach the backend at) is set;
+otherwise they keep their source URLs and are only validated and de-duplicated.
+Thumbnails and perceptual de-duplication need Pillow (``pip install .[images]``);
+without it the original bytes are served as-is and only exact duplicates are
+removed.
+
+Source URLs come from the open web, so the proxy only connects to public
+addresses: before every request, including each redirect hop, the host is
+resolved and the fetch is refused if any address is loopback, link-local,
+private (RFC 1918 / unique-local), multicast or otherwise not globally
+routable. The request then connects to the address that was checked (the
+host goes in the ``Host`` header and the TLS server name), so a second DNS
+answer cannot point it elsewhere. Redirects are followed by hand, at most
+``MAX_REDIRECTS`` deep.
+Hosts listed in ``MOTION_IMAGE_ALLOWED_HOSTS`` (comma-separated, e.g. a local
+image server in development) are exempt.
+
+What each source URL resolved to is recorded in a SQLite index next to the
+images, so repeated searches do not fetch anything; dead URLs are remembered
+for ``negative_ttl_seconds``.
+"""
+
+import asyncio
+import hashlib
+import io
+import ipaddress
+import os
+import re
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+from motion.tools.illustration_cache import get_cache_dir
+
+try:
+    from PIL import Image as _Image
+except ImportError:  # pragma: no cover - depends on the environment
+    _Image = None  # type: ignore[assignment]
+
+Image: Optional[ModuleType] = _Image
+
+
+IMAGE_PROXY_ENABLED = os.getenv("MOTION_IMAGE_PROXY", "1") != "0"
+PUBLIC_BASE_URL = os.getenv("MOTION_PUBLIC_BASE_URL", "").rstrip("/")
+ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("MOTION_IMAGE_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+DEFAULT_FETCH_CONCURRENCY = 8
+DEFAULT_FETCH_TIMEOUT = 5.0
+DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_THUMBNAIL_SIZE = 320
+DEFAULT_DISPLAY_SIZE = 1024
+DEFAULT_NEGATIVE_TTL_SECONDS = 3600
+
+MAX_REDIRECTS = 5
+_REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+# Perceptual hashes this many bits apart (out of 64) are the same picture
+NEAR_DUPLICATE_DISTANCE = 6
+
+VARIANTS = ("thumb", "display")
+
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+# Path of a backend copy, as written into results by ImageProxy.url_for
+_ASSET_PATH = re.compile(r"^/images/([0-9a-f]{64})/(thumb|display)$")
+
+# Magic numbers of the formats clients can render
+_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+
+def sniff_image_type(data: bytes) -> Optional[str]:
+    """
+    Identify an image from its leading bytes.
+
+    Args:
+        data: Response body, or at least its first 12 bytes.
+
+    Returns:
+        The MIME type of a JPEG, PNG, GIF or WebP image, or None.
+    """
+    for signature, content_type in _SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def is_valid_digest(digest: str) -> bool:
+    """Whether ``digest`` is a well-formed asset digest (lowercase SHA-256 hex)."""
+    return bool(_DIGEST.match(digest))
+
+
+def is_public_address(address: str) -> bool:
+    """
+    Whether an IP address is globally routable.
+
+    Args:
+        address: IPv4 or IPv6 address, as returned by getaddrinfo.
+
+    Returns:
+        False for loopback, link-local, private, shared, multicast, reserved and
+        unspecified addresses (IPv4-mapped IPv6 addresses are judged by their
+        IPv4 address), True otherwise.
+    """
+    try:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+    except ValueError:
+        return False
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not (ip.is_multicast or ip.is_reserved or ip.is_unspecified)
+
+
+async def resolve_host(host: str, port: int) -> List[str]:
+    """Resolve a host name to its IP addresses with the running loop's resolver."""
+    infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    return [str(info[4][0]) for info in infos]
+
+
+def _difference_hash(image: Any) -> int:
+    """64-bit difference hash of a Pillow image."""
+    pixels = image.convert("L").resize((9, 8)).tobytes()
+    bits = 0
+    for row in range(8):
+        for column in range(8):
+            left = pixels[row * 9 + column]
+            bits = (bits << 1) | (left > pixels[row * 9 + column + 1])
+    return bits
+
+
+class ImageAsset:
+    """A validated image stored in the content-addressed cache."""
+
+    __slots__ = ("digest", "content_type", "perceptual_hash")
+
+    def __init__(self, digest: str, content_type: str, perceptual_hash: Optional[int]) -> None:
+        self.digest = digest
+        self.content_type = content_type
+        self.perceptual_hash = perceptual_hash
+
+
+class ImageProxy:
+    """
+    Fetches, validates, de-duplicates and thumbnails illustration images.
+
+    Args:
+        cache_dir: Directory holding the images and their source index.
+        public_base_url: Base URL clients reach the backend at; empty to keep
+            source URLs in results.
+        fetch_concurrency: Maximum concurrent image downloads per ``process`` call.
+        fetch_timeout: Seconds allowed per download.
+        max_bytes: Larger images are dropped.
+        thumbnail_size: Bounding box (pixels) of thumbnails.
+        display_size: Bounding box (pixels) of display-size copies.
+        negative_ttl_seconds: How long a dead URL is remembered.
+        transport: Custom httpx transport (e.g. ``httpx.MockTransport``)
+            replacing the network connection pool.
+        resolver: Coroutine function mapping ``(host, port)`` to IP addresses,
+            used to vet every host before it is fetched; defaults to
+            resolve_host().
+        allowed_hosts: Host names fetched even if they resolve to non-public
+            addresses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        public_base_url: str = PUBLIC_BASE_URL,
+        fetch_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+        fetch_timeout: float = DEFAULT_FETCH_TIMEOUT,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE,
+        display_size: int = DEFAULT_DISPLAY_SIZE,
+        negative_ttl_seconds: float = DEFAULT_NEGATIVE_TTL_SECONDS,
+        transport: Optional[Any] = None,
+        resolver: Optional[Callable[[str, int], Awaitable[List[str]]]] = None,
+        allowed_hosts: FrozenSet[str] = ALLOWED_HOSTS,
+    ) -> None:
+        self.cache_dir = Path(cache_dir)
+        self.public_base_url = public_base_url.rstrip("/")
+        self.fetch_concurrency = fetch_concurrency
+        self.fetch_timeout = fetch_timeout
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self.display_size = display_size
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.transport = transport
+        self.resolver = resolver or resolve_host
+        self.allowed_hosts = frozenset(host.lower() for host in allowed_hosts)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.cache_dir / "index.sqlite3"), check_same_thread=False, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS image_sources ("
+            " url TEXT PRIMARY KEY, digest TEXT, content_type TEXT,"
+            " perceptual_hash TEXT, checked_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+        self.fetches = 0
+        self.index_hits = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.blocked = 0
+
+    def path_for(self, digest: str, variant: str) -> Path:
+        """Path of an asset variant in the cache."""
+        return self.cache_dir / digest[:2] / f"{digest}.{variant}"
+
+    def url_for(self, digest: str, variant: str) -> str:
+        """Public URL of an asset variant."""
+        return f"{self.public_base_url}/images/{digest}/{variant}"
+
+    def cached_path(self, url: str, variant: str = "display") -> Optional[Path]:
+        """
+        Local file of an image that is already in the cache.
+
+        Args:
+            url: A backend ``/images/{digest}/{variant}`` URL (absolute or
+                relative; the host is not checked, so links written under an
+                earlier base URL still resolve) or a source URL fetched before.
+            variant: Variant to return.
+
+        Returns:
+            The path of the cached variant, or None if the image was never
+            fetched, its source is dead or the file is gone.
+        """
+        match = _ASSET_PATH.match(urlsplit(url).path)
+        if match:
+            digest = match.group(1)
+        else:
+            _, asset = self._lookup(url)
+            if asset is None:
+                return None
+            digest = asset.digest
+        path = self.path_for(digest, variant)
+        return path if path.exists() else None
+
+    async def process(self, results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Validate and de-duplicate search results, rewriting them to cached copies.
+
+        Args:
+            results: Search result items with a ``url`` key.
+
+        Returns:
+            The results whose image could be fetched, in their original order,
+            without duplicates. When a public base URL is configured, ``url``
+            points at the display-size copy, ``thumbnail_url`` at the thumbnail
+            and ``source_url`` keeps the original.
+        """
+        import httpx
+
+        semaphore = asyncio.Semaphore(max(1, self.fetch_concurrency))
+        async with httpx.AsyncClient(
+            timeout=self.fetch_timeout, follow_redirects=False, transport=self.transport
+        ) as client:
+            async def resolve(item: Dict[str, Any]) -> Optional[ImageAsset]:
+                url = item.get("url")
+                if not isinstance(url, str) or not url.startswith(("http://", "https://")):
+                    return None
+                async with semaphore:
+                    return await self._asset_for(client, url)
+
+            assets = await asyncio.gather(*(resolve(item) for item in results))
+
+        processed: List[Dict[str, Any]] = []
+        kept: List[ImageAsset] = []
+        for item, asset in zip(results, assets, strict=True):
+            if asset is None:
+                self.dropped += 1
+                continue
+            if any(self._same_image(asset, other) for other in kept):
+                self.duplicates += 1
+                continue
+            kept.append(asset)
+            if self.public_base_url:
+                item = {
+                    **item,
+                    "url": self.url_for(asset.digest, "display"),
+                    "thumbnail_url": self.url_for(asset.digest, "thumb"),
+                    "source_url": item["url"],
+                }
+            processed.append(item)
+        return processed
+
+    def stats(self) -> Dict[str, int]:
+        """Return counters for fetched, reused, dropped, duplicate and blocked images."""
+        return {
+            "fetches": self.fetches,
+            "index_hits": self.index_hits,
+            "dropped": self.dropped,
+            "duplicates": self.duplicates,
+            "blocked": self.blocked,
+        }
+
+    def close(self) -> None:
+        """Close the source index."""
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _same_image(asset: ImageAsset, other: ImageAsset) -> bool:
+        if asset.digest == other.digest:
+            return True
+        if asset.perceptual_hash is None or other.perceptual_hash is None:
+            return False
+        return bin(asset.perceptual_hash ^ other.perceptual_hash).count("1") <= NEAR_DUPLICATE_DISTANCE
+
+    async def _asset_for(self, client: Any, url: str) -> Optional[ImageAsset]:
+        known, asset = self._lookup(url)
+        if known and (asset is None or all(self.path_for(asset.digest, v).exists() for v in VARIANTS)):
+            self.index_hits += 1
+            return asset
+
+        self.fetches += 1
+        data = await self._download(client, url)
+        asset = await asyncio.to_thread(self._store, data) if data is not None else None
+        self._remember(url, asset)
+        return asset
+
+    async def _pin(self, url: str) -> Optional[Tuple[str, Dict[str, str], Dict[str, Any]]]:
+        """
+        Vet a URL's host and pin the request to the address that was checked.
+
+        Returns:
+            ``(url, headers, extensions)`` to request: the URL with its host
+            replaced by a vetted IP address, the original host in the ``Host``
+            header and, for HTTPS, as the TLS server name. Allowed hosts are
+            requested as they are. None if the host is not public.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return None
+        if parts.hostname in self.allowed_hosts:
+            return url, {}, {}
+        try:
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            addresses = await self.resolver(parts.hostname, port)
+        except (OSError, ValueError):
+            return None
+        # Every address must be public: the host may answer with any of them
+        if not addresses or not all(is_public_address(address) for address in addresses):
+            return None
+        host = f"[{addresses[0]}]" if ":" in addresses[0] else addresses[0]
+        netloc = f"{host}:{parts.port}" if parts.port else host
+        headers = {"Host": parts.netloc.rsplit("@", 1)[-1]}
+        extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+        return urlunsplit(parts._replace(netloc=netloc)), headers, extensions
+
+    async def _download(self, client: Any, url: str) -> Optional[bytes]:
+        try:
+            for _ in range(MAX_REDIRECTS + 1):
+                pinned = await self._pin(url)
+                if pinned is None:
+                    self.blocked += 1
+                    return None
+                target, headers, extensions = pinned
+                async with client.stream("GET", target, headers=headers, extensions=extensions) as response:
+                    location = response.headers.get("location")
+                    if response.status_code in _REDIRECT_STATUSES and location:
+                        url = urljoin(url, location)
+                        continue
+                    return await self._read_image(response)
+        except Exception:
+            return None
+        # Too many redirects
+        return None
+
+    async def _read_image(self, response: Any) -> Optional[bytes]:
+        if response.status_code != 200:
+            return None
+        declared = response.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > self.max_bytes:
+            return None
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                return None
+            chunks.append(chunk)
+        data = b"".join(chunks)
+        return data if sniff_image_type(data) else None
+
+    def _store(self, data: bytes) -> Optional[ImageAsset]:
+        digest = hashlib.sha256(data).hexdigest()
+        if Image is None:
+            # Only sniffed images are stored
+            content_type = sniff_image_type(data) or "application/octet-stream"
+            for variant in VARIANTS:
+                self._write(self.path_for(digest, variant), data)
+            return ImageAsset(digest, content_type, None)
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                # Lets JPEG decode straight at a reduced scale
+                image.draft("RGB", (self.display_size, self.display_size))
+                image.load()
+                perceptual_hash = _difference_hash(image)
+                if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+                    # Flatten transparent illustrations onto white, not black
+                    rgba = image.convert("RGBA")
+                    rgb = Image.new("RGB", rgba.size, "white")
+                    rgb.paste(rgba, mask=rgba.getchannel("A"))
+                else:
+                    rgb = image.convert("RGB")
+        except Exception:
+            # Passed the signature check but does not decode
+            return None
+        for variant, size in (("thumb", self.thumbnail_size), ("display", self.display_size)):
+            copy = rgb.copy()
+            copy.thumbnail((size, size))
+            buffer = io.BytesIO()
+            copy.save(buffer, format="JPEG", quality=82, optimize=True, progressive=True)
+            self._write(self.path_for(digest, variant), buffer.getvalue())
+        return ImageAsset(digest, "image/jpeg", perceptual_hash)
+
+    @staticmethod
+    def _write(path: Path, data: bytes) -> None:
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporary.write_bytes(data)
+        os.replace(temporary, path)
+
+    def _lookup(self, url: str) -> Tuple[bool, Optional[ImageAsset]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, content_type, perceptual_hash, checked_at FROM image_sources WHERE url = ?", (url,)
+            ).fetchone()
+        if row is None:
+            return False, None
+        digest, content_type, perceptual_hash, checked_at = row
+        if digest is None:
+            return time.time() - checked_at < self.negative_ttl_seconds, None
+        return True, ImageAsset(digest, content_type, int(perceptual_hash, 16) if perceptual_hash else None)
+
+    def _remember(self, url: str, asset: Optional[ImageAsset]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO image_sources VALUES (?, ?, ?, ?, ?)",
+                (
+                    url,
+                    asset.digest if asset else None,
+                    asset.content_type if asset else None,
+                    format(asset.perceptual_hash, "016x") if asset and asset.perceptual_hash is not None else None,
+                    time.time(),
+                ),
+            )
+            self._db.commit()
+
+
+_image_proxy: Optional[ImageProxy] = None
+_image_proxy_lock = threading.Lock()
+
+
+def get_image_proxy() -> ImageProxy:
+    """Return the process-wide image proxy, configured from the environment."""
+    global _image_proxy
+    with _image_proxy_lock:
+        if _image_proxy is None:
+            _image_proxy = ImageProxy(
+                cache_dir=get_cache_dir() / "images",
+                fetch_concurrency=int(os.getenv("MOTION_IMAGE_FETCH_CONCURRENCY", str(DEFAULT_FETCH_CONCURRENCY))),
+                fetch_timeout=float(os.getenv("MOTION_IMAGE_FETCH_TIMEOUT", str(DEFAULT_FETCH_TIMEOUT))),
+                max_bytes=int(os.getenv("MOTION_IMAGE_MAX_BYTES", str(DEFAULT_MAX_BYTES))),
+                thumbnail_size=int(os.getenv("MOTION_IMAGE_THUMBNAIL_SIZE", str(DEFAULT_THUMBNAIL_SIZE))),
+                display_size=int(os.getenv("MOTION_IMAGE_DISPLAY_SIZE", str(DEFAULT_DISPLAY_SIZE))),
+            )
+        return _image_proxy
@@ -0,0 +1,443 @@
+"""
+Process-wide async client for the Linkup search API.
+
+A single pooled ``httpx.AsyncClient`` is created lazily and owned by a dedicated
+background event loop, so every caller - asyncio code on any loop as well as
+plain threads - reuses the same keep-alive connections instead of paying a new
+TLS handshake per search.
+
+Searches are guarded against a slow or failing upstream:
+
+- Each search has an overall deadline (``LINKUP_DEADLINE``), however many
+  attempts it takes.
+- A request still running after the recent p95 latency is hedged with a
+  duplicate request; the first response wins. Hedges are capped at
+  ``LINKUP_HEDGE_MAX_RATIO`` of requests, since every search is billed.
+- Transient failures (transport errors, 429 and 5xx responses) are retried
+  with full-jitter exponential backoff, within the deadline.
+- After ``LINKUP_BREAKER_FAILURES`` consecutive failed searches the circuit
+  opens and searches fail fast with CircuitOpenError for
+  ``LINKUP_BREAKER_RESET`` seconds; then a single probe decides whether it
+  closes again.
+
+Counters, the p95 estimate and the breaker state are reported by stats().
+"""
+
+import asyncio
+import atexit
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, Coroutine, Deque, Dict, List, Optional, TypeVar
+
+
+if TYPE_CHECKING:
+    import httpx
+
+
+LINKUP_BASE_URL = os.getenv("LINKUP_BASE_URL", "https://api.linkup.so/v1")
+
+# Seconds allowed for a single Linkup HTTP request
+LINKUP_TIMEOUT = float(os.getenv("LINKUP_TIMEOUT", "30"))
+
+# Connection pool limits shared by every search in this process
+LINKUP_MAX_CONNECTIONS = int(os.getenv("LINKUP_MAX_CONNECTIONS", "20"))
+LINKUP_MAX_KEEPALIVE = int(os.getenv("LINKUP_MAX_KEEPALIVE", "10"))
+
+# Seconds a search may take in total, across hedges and retries
+LINKUP_DEADLINE = float(os.getenv("LINKUP_DEADLINE", "15"))
+
+# Hedging: delay before the duplicate request until enough latencies are known
+LINKUP_HEDGE_ENABLED = os.getenv("LINKUP_HEDGE", "1") != "0"
+LINKUP_HEDGE_DELAY = float(os.getenv("LINKUP_HEDGE_DELAY", "3"))
+LINKUP_HEDGE_MIN_DELAY = float(os.getenv("LINKUP_HEDGE_MIN_DELAY", "0.25"))
+LINKUP_HEDGE_MAX_RATIO = float(os.getenv("LINKUP_HEDGE_MAX_RATIO", "0.1"))
+
+# Retries of transient failures, with full-jitter exponential backoff
+LINKUP_RETRIES = int(os.getenv("LINKUP_RETRIES", "2"))
+LINKUP_BACKOFF_BASE = float(os.getenv("LINKUP_BACKOFF_BASE", "0.2"))
+LINKUP_BACKOFF_MAX = float(os.getenv("LINKUP_BACKOFF_MAX", "2"))
+
+# Circuit breaker
+LINKUP_BREAKER_FAILURES = int(os.getenv("LINKUP_BREAKER_FAILURES", "5"))
+LINKUP_BREAKER_RESET = float(os.getenv("LINKUP_BREAKER_RESET", "30"))
+
+# Latencies needed before the hedge delay follows the observed p95
+_MIN_LATENCY_SAMPLES = 20
+
+T = TypeVar("T")
+
+
+class LinkupSearchError(Exception):
+    """Raised when the Linkup API rejects a search or returns an unusable response."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    @property
+    def transient(self) -> bool:
+        """Whether retrying the same request may succeed."""
+        return self.status_code is None or self.status_code == 429 or self.status_code >= 500
+
+
+class LinkupTimeoutError(LinkupSearchError):
+    """Raised when a search does not complete within its deadline."""
+
+
+class CircuitOpenError(LinkupSearchError):
+    """Raised without contacting Linkup while the circuit breaker is open."""
+
+
+def _is_transient(error: BaseException) -> bool:
+    if isinstance(error, LinkupSearchError):
+        return error.transient
+    import httpx
+
+    return isinstance(error, httpx.TransportError)
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Closed: requests pass. After ``failure_threshold`` consecutive failures it
+    opens and rejects requests for ``reset_timeout`` seconds, then lets a
+    single probe through (half-open); the probe's outcome closes or reopens it.
+    Used from one event loop, so it needs no locking.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = LINKUP_BREAKER_FAILURES, reset_timeout: float = LINKUP_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._probe_started: Optional[float] = None
+
+    def allow(self) -> bool:
+        """Whether a request may go upstream now."""
+        now = time.monotonic()
+        if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            # A probe whose caller went away never reports back; allow another
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False
+            self._probe_started = now
+        return self.state != self.OPEN
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_started = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opens += 1
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Sliding window of recent successful request latencies."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile, or None until enough samples were seen."""
+        if len(self._samples) < _MIN_LATENCY_SAMPLES:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+
+class SharedLinkupClient:
+    """
+    Long-lived Linkup client backed by one HTTP connection pool.
+
+    The pool lives on a private event loop running in a daemon thread. Coroutines
+    submitted from other loops are bridged onto it, which keeps the pool usable
+    from any thread without binding it to whichever loop happened to call first.
+    A custom ``transport`` (e.g. ``httpx.MockTransport``) replaces the network
+    connection pool.
+    """
+
+    def __init__(
+        self,
+        base_url: str = LINKUP_BASE_URL,
+        timeout: float = LINKUP_TIMEOUT,
+        max_connections: int = LINKUP_MAX_CONNECTIONS,
+        max_keepalive: int = LINKUP_MAX_KEEPALIVE,
+        transport: Optional["httpx.AsyncBaseTransport"] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.transport = transport
+
+        self.deadline = LINKUP_DEADLINE
+        self.hedge_enabled = LINKUP_HEDGE_ENABLED
+        self.retries = LINKUP_RETRIES
+
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional["httpx.AsyncClient"] = None
+
+        # Touched only on the client loop
+        self.breaker = CircuitBreaker()
+        self.latencies = LatencyTracker()
+        self._counters = {
+            "searches": 0,
+            "requests": 0,
+            "failures": 0,
+            "retries": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "timeouts": 0,
+            "short_circuited": 0,
+        }
+
+    @property
+    def started(self) -> bool:
+        """Whether the background loop and connection pool have been created."""
+        return self._loop is not None
+
+    async def search(self, api_key: str, **params: Any) -> Dict[str, Any]:
+        """
+        Run a Linkup search from any event loop.
+
+        The search is hedged, retried and bounded by the client's deadline as
+        described in the module docstring.
+
+        Args:
+            api_key: Linkup API key sent as a bearer token.
+            **params: Search parameters in Linkup's wire format (``q``, ``depth``, ...).
+
+        Returns:
+            The decoded JSON response body.
+
+        Raises:
+            CircuitOpenError: If the circuit breaker is open.
+            LinkupTimeoutError: If the deadline passed first.
+            LinkupSearchError: If the API responds with an error status or invalid JSON.
+            httpx.HTTPError: On transport failures such as refused connections.
+        """
+        return await self.run_async(self._search(api_key, params))
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, hedge and retry counters, the p95 latency and the breaker state."""
+        stats: Dict[str, Any] = dict(self._counters)
+        p95 = self.latencies.percentile(95)
+        stats["p95_seconds"] = p95 if p95 is not None else 0.0
+        stats["hedge_delay_seconds"] = self._hedge_delay()
+        stats["breaker_state"] = self.breaker.state
+        stats["breaker_open"] = 1 if self.breaker.state == CircuitBreaker.OPEN else 0
+        stats["breaker_opens"] = self.breaker.opens
+        stats["consecutive_failures"] = self.breaker.failures
+        return stats
+
+    async def run_async(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Await ``coro`` on the client loop from any other event loop."""
+        loop = self._ensure_started()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run_sync(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """
+        Block the calling thread until ``coro`` completes on the client loop.
+
+        Must not be called from the client loop itself.
+        """
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout)
+
+    def close(self) -> None:
+        """Close the connection pool and stop the background loop."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None or thread is None:
+            return
+        if self._http is not None:
+            asyncio.run_coroutine_threadsafe(self._http.aclose(), loop).result(5)
+            self._http = None
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run() -> None:
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                thread = threading.Thread(target=run, name="linkup-client", daemon=True)
+                thread.start()
+                ready.wait()
+                self._loop = loop
+                self._thread = thread
+            return self._loop
+
+    def _hedge_delay(self) -> float:
+        p95 = self.latencies.percentile(95)
+        return max(LINKUP_HEDGE_MIN_DELAY, p95) if p95 is not None else LINKUP_HEDGE_DELAY
+
+    async def _search(self, api_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._counters["searches"] += 1
+        if not self.breaker.allow():
+            self._counters["short_circuited"] += 1
+            raise CircuitOpenError("Linkup is unavailable; the circuit breaker is open")
+
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                result = await asyncio.wait_for(
+                    self._hedged_search(api_key, params), max(0.0, deadline - time.monotonic())
+                )
+            except asyncio.TimeoutError:
+                self._counters["timeouts"] += 1
+                self.breaker.record_failure()
+                raise LinkupTimeoutError(f"Linkup search did not complete within {self.deadline:g}s") from None
+            except Exception as e:
+                backoff = random.uniform(0, min(LINKUP_BACKOFF_MAX, LINKUP_BACKOFF_BASE * 2 ** attempt))
+                if _is_transient(e) and attempt < self.retries and time.monotonic() + backoff < deadline:
+                    attempt += 1
+                    self._counters["retries"] += 1
+                    await asyncio.sleep(backoff)
+                    continue
+                if _is_transient(e):
+                    self.breaker.record_failure()
+                else:
+                    # The request was rejected; Linkup itself is up
+                    self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def _hedged_search(self, api_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send the request, and a duplicate if it is still running after the hedge delay."""
+        # Counts the request about to be sent, so a fresh client may hedge its first slow search
+        may_hedge = (
+            self.hedge_enabled
+            and self._counters["hedges"] < LINKUP_HEDGE_MAX_RATIO * (self._counters["requests"] + 1)
+        )
+        primary = asyncio.ensure_future(self._timed_post(api_key, params))
+        if not may_hedge:
+            return await primary
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self._hedge_delay())
+            if done:
+                return primary.result()
+
+            self._counters["hedges"] += 1
+            hedge = asyncio.ensure_future(self._timed_post(api_key, params))
+            pending.add(hedge)
+            errors: List[BaseException] = []
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is hedge:
+                            self._counters["hedge_wins"] += 1
+                        return task.result()
+                    errors.append(error)
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed_post(self, api_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        self._counters["requests"] += 1
+        started = time.monotonic()
+        try:
+            result = await self._post_search(api_key, params)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._counters["failures"] += 1
+            raise
+        self.latencies.add(time.monotonic() - started)
+        return result
+
+    async def _post_search(self, api_key: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if self._http is None:
+            import httpx
+
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                ),
+                transport=self.transport,
+            )
+        response = await self._http.post(
+            "/search",
+            json=params,
+            headers={"Authorization": f"Bearer {api_key}"},
+        )
+        if response.status_code >= 400:
+            raise LinkupSearchError(
+                f"Linkup API returned {response.status_code}: {response.text[:200]}",
+                status_code=response.status_code,
+            )
+        try:
+            body: Dict[str, Any] = response.json()
+        except ValueError as e:
+            raise LinkupSearchError(
+                f"Linkup API returned invalid JSON: {e}", status_code=response.status_code
+            ) from e
+        return body
+
+
+_client: Optional[SharedLinkupClient] = None
+_client_lock = threading.Lock()
+
+
+def get_linkup_client() -> SharedLinkupClient:
+    """Return the process-wide Linkup client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = SharedLinkupClient()
+        return _client
+
+
+def close_linkup_client() -> None:
+    """Close the process-wide Linkup client if it was ever started."""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        client.close()
+
+
+atexit.register(close_linkup_client)
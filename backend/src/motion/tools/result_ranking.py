@@ -0,0 +1,178 @@
+"""
+Ranking and trimming of illustration search results.
+
+Everything a search returns is sent to the model as tool output and, from
+there, to the phone, so results are cleaned up first:
+
+- URLs are canonicalized: lowercase host, no default port or fragment, no
+  tracking parameters (``utm_*``, ``fbclid``, ...). Other parameters keep
+  their order and encoding, which signed CDN URLs depend on.
+- Links that are not images (web pages, videos, documents) and tracking
+  pixels or ad-server links are dropped.
+- Duplicates are collapsed, also across ``http``/``https``, ``www.`` and
+  WordPress-style size variants (``photo-300x200.jpg``).
+- The rest is scored by how well the caption and file name match the exercise
+  name, and only the best ``top_k`` are kept. Ties keep the search order.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+from motion.tools.exercise_catalog import name_coverage
+
+
+# Longest caption passed on; search engines sometimes return whole paragraphs
+MAX_NAME_CHARS = 120
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".webp"}
+
+# Extensions that are certainly not something the client can display
+NON_IMAGE_EXTENSIONS = {
+    ".html", ".htm", ".php", ".asp", ".aspx", ".jsp", ".pdf", ".doc", ".docx",
+    ".mp4", ".webm", ".mov", ".avi", ".m3u8", ".js", ".css", ".json", ".xml", ".svg",
+}
+
+# Hosts serving pages or videos rather than image files
+NON_IMAGE_HOSTS = {"youtube.com", "youtu.be", "vimeo.com", "tiktok.com", "instagram.com", "facebook.com"}
+
+TRACKING_HOSTS = {
+    "doubleclick.net", "google-analytics.com", "googletagmanager.com", "googleadservices.com",
+    "scorecardresearch.com", "quantserve.com", "bat.bing.com", "pixel.wp.com", "adservice.google.com",
+}
+
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "gclsrc", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "_ga", "_gl", "ref", "ref_src", "spm", "si", "cmpid",
+}
+
+_TRACKING_PATH = re.compile(r"(^|/)(pixel|beacon|tracking?|1x1|spacer)([./_-]|$)")
+
+# WordPress and similar CDNs publish resized copies as name-300x200.jpg
+_SIZE_SUFFIX = re.compile(r"-\d{2,4}x\d{2,4}(?=\.[a-z0-9]+$)")
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+_counters = {"ranked": 0, "dropped": 0, "duplicates": 0, "trimmed": 0}
+
+
+def _host_matches(host: str, domains: Set[str]) -> bool:
+    parts = host.split(".")
+    return any(".".join(parts[i:]) in domains for i in range(len(parts) - 1))
+
+
+def _extension(path: str) -> str:
+    last = path.rsplit("/", 1)[-1]
+    return "." + last.rsplit(".", 1)[-1].lower() if "." in last else ""
+
+
+def canonicalize_url(url: str) -> Optional[str]:
+    """
+    Return a canonical form of an http(s) URL, or None if it is not one.
+
+    Tracking query parameters, fragments and default ports are removed and
+    the scheme and host are lowercased.
+    """
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    if scheme not in _DEFAULT_PORTS or not host:
+        return None
+    netloc = host if port in (None, _DEFAULT_PORTS[scheme]) else f"{host}:{port}"
+    query = "&".join(
+        pair for pair in parts.query.split("&")
+        if pair and not _is_tracking_param(unquote(pair.split("=", 1)[0]).lower())
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def _is_tracking_param(key: str) -> bool:
+    return key in TRACKING_PARAMS or key.startswith("utm_")
+
+
+def is_displayable_image_url(url: str) -> bool:
+    """Whether a canonical URL may point at an image, rather than a page, video or tracker."""
+    parts = urlsplit(url)
+    host = parts.hostname or ""
+    path = parts.path.lower()
+    if _host_matches(host, TRACKING_HOSTS) or _TRACKING_PATH.search(path):
+        return False
+    if _host_matches(host, NON_IMAGE_HOSTS):
+        return False
+    return _extension(path) not in NON_IMAGE_EXTENSIONS
+
+
+def _dedupe_key(url: str) -> str:
+    parts = urlsplit(url)
+    host = parts.netloc[4:] if parts.netloc.startswith("www.") else parts.netloc
+    query = "&".join(sorted(parts.query.split("&"))) if parts.query else ""
+    return host + _SIZE_SUFFIX.sub("", parts.path) + ("?" + query if query else "")
+
+
+def score_result(exercise_name: str, name: str, url: str) -> float:
+    """
+    Score how likely a result illustrates the exercise (0-1.1).
+
+    Mostly the caption's match with the exercise name, partly the file name's,
+    with a small bonus for links that are evidently image files.
+    """
+    path = urlsplit(url).path
+    file_words = unquote(path.rsplit("/", 1)[-1]).rsplit(".", 1)[0]
+    score = 0.7 * name_coverage(exercise_name, name) + 0.3 * name_coverage(exercise_name, file_words)
+    if _extension(path) in IMAGE_EXTENSIONS:
+        score += 0.1
+    return score
+
+
+def rank_results(exercise_name: str, results: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Clean up, de-duplicate, score and trim search results for one exercise.
+
+    Args:
+        exercise_name: Exercise the results were searched for.
+        results: Result items with ``url`` and usually ``name`` keys.
+        top_k: Maximum number of results returned; 0 or less keeps all.
+
+    Returns:
+        The best results, best first, with canonical URLs and captions cut to
+        MAX_NAME_CHARS.
+    """
+    best: Dict[str, Tuple[float, int, Dict[str, Any]]] = {}
+    for position, item in enumerate(results):
+        url = item.get("url") if isinstance(item, dict) else None
+        canonical = canonicalize_url(url) if isinstance(url, str) else None
+        if (
+            canonical is None
+            or item.get("type", "image") != "image"
+            or not is_displayable_image_url(canonical)
+        ):
+            _counters["dropped"] += 1
+            continue
+        name: str = item["name"] if isinstance(item.get("name"), str) else ""
+        score = score_result(exercise_name, name, canonical)
+        key = _dedupe_key(canonical)
+        if key in best:
+            _counters["duplicates"] += 1
+            if best[key][0] >= score:
+                continue
+            position = best[key][1]
+        cleaned = {**item, "url": canonical}
+        if len(name) > MAX_NAME_CHARS:
+            cleaned["name"] = name[:MAX_NAME_CHARS].rsplit(" ", 1)[0]
+        best[key] = (score, position, cleaned)
+
+    ranked = [item for _, _, item in sorted(best.values(), key=lambda entry: (-entry[0], entry[1]))]
+    if top_k > 0 and len(ranked) > top_k:
+        _counters["trimmed"] += len(ranked) - top_k
+        ranked = ranked[:top_k]
+    _counters["ranked"] += 1
+    return ranked
+
+
+def ranking_stats() -> Dict[str, int]:
+    """Return counters for ranked result lists and dropped, duplicate and trimmed results."""
+    return dict(_counters)
@@ -0,0 +1,109 @@
+"""
+Request coalescing ("single-flight") for duplicate in-flight calls.
+
+While a call for a key is running, further callers asking for the same key wait
+for that call and share its result instead of starting their own. Thread-based
+and asyncio callers share one in-flight table, so a blocking caller and a
+coroutine asking for the same key still trigger a single upstream request.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, "Future[Any]"] = {}
+        self._counters = {"calls": 0, "executions": 0, "coalesced": 0}
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """
+        Run ``fn`` unless a call for ``key`` is already in flight, blocking the thread.
+
+        Args:
+            key: Coalescing key; callers with equal keys share one execution.
+            fn: Zero-argument callable producing the result.
+
+        Returns:
+            The result of the leading call for ``key``.
+        """
+        future, leader = self._join(key)
+        if not leader:
+            shared: T = future.result()
+            return shared
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, exception=e)
+            raise
+        self._finish(key, future, result=result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Await ``fn()`` unless a call for ``key`` is already in flight.
+
+        The shared call runs as its own task, so cancelling any one caller
+        (including the one that started it) does not cancel it for the others.
+
+        Args:
+            key: Coalescing key; callers with equal keys share one execution.
+            fn: Zero-argument coroutine function producing the result.
+
+        Returns:
+            The result of the leading call for ``key``.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(fn())
+
+            def settle(done: "asyncio.Future[T]") -> None:
+                if done.cancelled():
+                    self._finish(key, future, exception=asyncio.CancelledError())
+                elif done.exception() is not None:
+                    self._finish(key, future, exception=done.exception())
+                else:
+                    self._finish(key, future, result=done.result())
+
+            task.add_done_callback(settle)
+        shared = asyncio.wrap_future(future)
+        # Mark the outcome retrieved even if this caller is cancelled before
+        # reading it (e.g. a background prefetch at loop shutdown)
+        shared.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return await asyncio.shield(shared)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call, execution and coalesced counters plus the in-flight count."""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["in_flight"] = len(self._in_flight)
+        return stats
+
+    def _join(self, key: str) -> Tuple["Future[Any]", bool]:
+        with self._lock:
+            self._counters["calls"] += 1
+            running = self._in_flight.get(key)
+            if running is not None:
+                self._counters["coalesced"] += 1
+                return running, False
+            future: "Future[Any]" = Future()
+            self._in_flight[key] = future
+            self._counters["executions"] += 1
+            return future, True
+
+    def _finish(self, key: str, future: "Future[Any]", result: Any = None, exception: Optional[BaseException] = None) -> None:
+        with self._lock:
+            # Only the leader finishes a call, and the key stays reserved until it does
+            del self._in_flight[key]
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
@@ -0,0 +1,254 @@
+"""Tests for the semantic cache of general chat answers."""
+
+import json
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from motion.agents.soap_agents import answer_cache
+from motion.agents.soap_agents.answer_cache import (
+    SemanticAnswerCache,
+    answer_from_cache,
+    content_words,
+    is_general_question,
+    note_cacheable_question,
+    remember_chat_answer,
+)
+from motion.agents.soap_agents.report_assembly import LAST_SOAP_DRAFT_KEY
+from motion.agents.soap_agents.router import MODE_KEY, Mode
+
+
+QUESTION = "What are the best exercises for lower back pain?"
+ANSWER = {"type": "chat_message", "content": "Bridges, bird dogs and walking.", "timestamp": "2024-01-01T10:00:00"}
+
+
+@pytest.fixture(params=["numpy", "pure_python"])
+def cache(request, monkeypatch):
+    if request.param == "pure_python":
+        monkeypatch.setattr(answer_cache, "np", None)
+    return SemanticAnswerCache(threshold=0.6, ttl_seconds=60, max_entries=3)
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    """A fresh process-wide cache for the callback tests."""
+    fresh = SemanticAnswerCache()
+    monkeypatch.setattr(answer_cache, "_cache", fresh)
+    monkeypatch.setattr(answer_cache, "_pending", OrderedDict())
+    return fresh
+
+
+def context(text, invocation_id="inv", **state):
+    return SimpleNamespace(
+        invocation_id=invocation_id,
+        user_content=types.Content(role="user", parts=[types.Part(text=text)]),
+        state={MODE_KEY: Mode.CHAT.value, **state},
+    )
+
+
+def reply(message):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=json.dumps(message))]))
+
+
+@pytest.mark.unit
+def test_content_words_drop_stopwords_and_plurals():
+    assert content_words("What are the best exercises for lower back pains?") == ["lower", "back", "pain"]
+    assert content_words("Which therapies help injuries") == ["therapy", "help", "injury"]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("question", [
+    QUESTION,
+    "How do I progress a bridge exercise?",
+    "What is the difference between isometric and eccentric loading?",
+])
+def test_general_questions_are_cacheable(question):
+    assert is_general_question(question)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("question", [
+    "Patient reports lower back pain 7/10 for 3 days.",
+    "What exercises should I give her for her knee?",
+    "Best exercises for my patient's shoulder?",
+    "Exercises for Jane with knee pain",
+    "Call me on +44 20 7946 0958 about exercises",
+    "Exercises to do after the 12/03/2024 surgery",
+    "What about the above?",
+    "Hi",
+    "x " * 200,
+    "",
+])
+def test_questions_that_may_carry_patient_details_are_not(question):
+    assert not is_general_question(question)
+
+
+@pytest.mark.unit
+def test_paraphrases_and_typos_hit_but_different_questions_miss(cache):
+    cache.put(QUESTION, ANSWER)
+
+    assert cache.get("best exercise for lower back pain") == ANSWER
+    assert cache.get("Which exercises are best for lower back pain") == ANSWER
+    assert cache.get("What are the best exercises for upper back pain?") is None
+    assert cache.get("What are the best exercises for lower back stiffness?") is None
+    assert cache.get("Hip abduction exercises") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (2, 3, 1)
+
+
+@pytest.mark.unit
+def test_misspelled_words_still_hit(cache):
+    cache.put("How should I progress hamstring strengthening exercises?", ANSWER)
+    assert cache.get("How should I progress hamstring strengthenning exercises?") == ANSWER
+    # A truncated word is too far from the original to count as the same
+    assert cache.get("How should I progres hamstring strengthening exercises?") is None
+
+
+@pytest.mark.unit
+def test_returned_answers_are_copies(cache):
+    cache.put(QUESTION, ANSWER)
+    cache.get(QUESTION)["content"] = "changed"
+    assert cache.get(QUESTION)["content"] == ANSWER["content"]
+
+
+@pytest.mark.unit
+def test_near_duplicate_put_replaces_and_lru_evicts(cache):
+    cache.put(QUESTION, ANSWER)
+    cache.put("best exercises for lower back pain", {**ANSWER, "content": "newer"})
+    assert cache.stats()["entries"] == 1
+    assert cache.get(QUESTION)["content"] == "newer"
+
+    cache.put("How do I progress a bridge exercise?", ANSWER)
+    cache.put("Hamstring stretch technique tips", ANSWER)
+    cache.get(QUESTION)
+    cache.put("Calf raise progression options", ANSWER)
+
+    # The bridge question was least recently used
+    assert cache.get("How do I progress a bridge exercise?") is None
+    assert cache.get(QUESTION) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.unit
+def test_expired_answers_are_not_served(cache, monkeypatch):
+    cache.put(QUESTION, ANSWER)
+    now = answer_cache.time.time()
+    monkeypatch.setattr(answer_cache.time, "time", lambda: now + 61)
+    assert cache.get(QUESTION) is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.unit
+def test_clear_and_empty_questions(cache):
+    cache.put("the and of", ANSWER)
+    assert cache.stats()["writes"] == 0
+    cache.put(QUESTION, ANSWER)
+    cache.clear()
+    assert cache.get(QUESTION) is None
+
+
+@pytest.mark.unit
+def test_first_turn_answer_is_stored_then_served(shared_cache):
+    first = context(QUESTION, invocation_id="inv-1")
+    assert answer_from_cache(first) is None
+    note_cacheable_question(first, SimpleNamespace(contents=[first.user_content]))
+    remember_chat_answer(first, reply(ANSWER))
+
+    later = context("best exercises for lower back pain", invocation_id="inv-2")
+    served = answer_from_cache(later)
+    message = json.loads(served.parts[0].text)
+    assert message["content"] == ANSWER["content"]
+    assert message["timestamp"] != ANSWER["timestamp"]
+
+
+@pytest.mark.unit
+def test_answers_depending_on_context_are_not_stored(shared_cache):
+    follow_up = context(QUESTION, invocation_id="inv-1")
+    note_cacheable_question(follow_up, SimpleNamespace(contents=[follow_up.user_content] * 3))
+    remember_chat_answer(follow_up, reply(ANSWER))
+
+    soap = context(QUESTION, invocation_id="inv-2", **{MODE_KEY: Mode.SOAP.value})
+    note_cacheable_question(soap, SimpleNamespace(contents=[soap.user_content]))
+    remember_chat_answer(soap, reply(ANSWER))
+
+    personal = context(QUESTION, invocation_id="inv-3")
+    note_cacheable_question(personal, SimpleNamespace(contents=[personal.user_content]))
+    remember_chat_answer(personal, reply({**ANSWER, "content": "Email jo@example.com for a plan"}))
+
+    drafted = context(QUESTION, invocation_id="inv-4")
+    note_cacheable_question(drafted, SimpleNamespace(contents=[drafted.user_content]))
+    remember_chat_answer(drafted, reply({"type": "soap_draft", "soap_report": {}}))
+
+    assert shared_cache.stats()["writes"] == 0
+
+
+@pytest.mark.unit
+def test_cache_follows_the_routed_mode_even_with_a_draft(shared_cache):
+    shared_cache.put(QUESTION, ANSWER)
+    draft = {LAST_SOAP_DRAFT_KEY: {"plan": "x"}}
+    # A general question asked after a draft is routed to chat mode and may be served
+    assert answer_from_cache(context(QUESTION, **draft)) is not None
+    assert answer_from_cache(context(QUESTION, **draft, **{MODE_KEY: Mode.SOAP.value})) is None
+    assert answer_from_cache(context("What exercises for her knee pain?")) is None
+
+
+@pytest.mark.unit
+def test_turns_without_text_are_skipped(shared_cache):
+    empty = SimpleNamespace(invocation_id="inv", user_content=None, state={MODE_KEY: Mode.CHAT.value})
+    assert answer_from_cache(empty) is None
+
+
+@pytest.mark.unit
+def test_unusable_replies_are_not_stored(shared_cache):
+    call = LlmResponse(content=types.Content(role="model", parts=[
+        types.Part(function_call=types.FunctionCall(name="search_exercise_illustrations")),
+    ]))
+    partial = reply(ANSWER)
+    partial.partial = True
+    failed = LlmResponse(error_code="SAFETY")
+    not_json = LlmResponse(content=types.Content(role="model", parts=[types.Part(text="plain text")]))
+
+    for invocation_id, response in enumerate([partial, failed, call, not_json]):
+        turn = context(QUESTION, invocation_id=str(invocation_id))
+        note_cacheable_question(turn, SimpleNamespace(contents=[turn.user_content]))
+        remember_chat_answer(turn, response)
+
+    assert shared_cache.stats()["writes"] == 0
+    # A partial response leaves the question noted for the final one
+    assert list(answer_cache._pending) == ["0"]
+
+
+@pytest.mark.unit
+def test_noted_questions_are_bounded(shared_cache, monkeypatch):
+    monkeypatch.setattr(answer_cache, "_MAX_PENDING", 2)
+    for invocation_id in ("a", "b", "c"):
+        turn = context(QUESTION, invocation_id=invocation_id)
+        note_cacheable_question(turn, SimpleNamespace(contents=[turn.user_content]))
+    personal = context("What exercises for her knee pain?", invocation_id="d")
+    note_cacheable_question(personal, SimpleNamespace(contents=[personal.user_content]))
+
+    assert list(answer_cache._pending) == ["b", "c"]
+
+
+@pytest.mark.unit
+def test_similar_questions_with_other_words_are_kept_apart(cache):
+    cache.put(QUESTION, ANSWER)
+    cache.put("What are the best exercises for upper back pain?", {**ANSWER, "content": "upper"})
+
+    assert cache.stats()["entries"] == 2
+    assert cache.get(QUESTION) == ANSWER
+
+
+@pytest.mark.unit
+def test_process_wide_cache_is_configured_from_env(monkeypatch):
+    monkeypatch.setattr(answer_cache, "_cache", None)
+    monkeypatch.setenv("MOTION_ANSWER_CACHE_THRESHOLD", "0.9")
+    monkeypatch.setenv("MOTION_ANSWER_CACHE_ENTRIES", "7")
+    cache = answer_cache.get_answer_cache()
+    assert cache is answer_cache.get_answer_cache()
+    assert (cache.threshold, cache.max_entries) == (0.9, 7)
+    assert answer_cache.get_answer_cache_stats()["entries"] == 0
@@ -0,0 +1,149 @@
+"""Tests for the agent server routes."""
+
+import pytest
+
+from motion.api.dependencies import APP_NAME
+
+
+SESSION_URL = f"/apps/{APP_NAME}/users/u1/sessions"
+
+
+def run_body(session_id, text="Hello", **extra):
+    return {
+        "app_name": APP_NAME,
+        "user_id": "u1",
+        "session_id": session_id,
+        "new_message": {"role": "user", "parts": [{"text": text}]},
+        **extra,
+    }
+
+
+@pytest.mark.integration
+def test_health_and_app_listing(api_client):
+    health = api_client.get("/healthz").json()
+    assert health == {"status": "ok", "requests_in_flight": 0, "streams_in_flight": 0}
+    assert api_client.get("/list-apps").json() == [APP_NAME]
+
+
+@pytest.mark.integration
+def test_session_crud(api_client):
+    created = api_client.post(f"{SESSION_URL}/s1", json={"patient": "A"})
+    assert created.status_code == 200
+    assert created.json()["state"] == {"patient": "A"}
+    assert api_client.post(f"{SESSION_URL}/s1").status_code == 400
+
+    generated = api_client.post(SESSION_URL).json()
+    ids = {session["id"] for session in api_client.get(SESSION_URL).json()}
+    assert ids == {"s1", generated["id"]}
+
+    assert api_client.get(f"{SESSION_URL}/s1").json()["id"] == "s1"
+    api_client.delete(f"{SESSION_URL}/s1")
+    assert api_client.get(f"{SESSION_URL}/s1").status_code == 404
+
+
+@pytest.mark.integration
+def test_run_returns_agent_events_and_records_them(api_client):
+    api_client.post(f"{SESSION_URL}/s1")
+
+    events = api_client.post("/run", json=run_body("s1", "How long should I hold a stretch?")).json()
+
+    assert len(events) == 1
+    assert "echo: How long should I hold a stretch?" in events[0]["content"]["parts"][0]["text"]
+    session = api_client.get(f"{SESSION_URL}/s1").json()
+    assert [event["author"] for event in session["events"]] == ["user", "soap_agent"]
+
+
+@pytest.mark.integration
+def test_run_sse_streams_events(api_client):
+    api_client.post(f"{SESSION_URL}/s1")
+
+    response = api_client.post("/run_sse", json=run_body("s1"))
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    frames = [line for line in response.text.splitlines() if line.startswith("data: ")]
+    assert len(frames) == 1
+    assert "echo: Hello" in frames[0]
+
+
+@pytest.mark.integration
+def test_run_sse_reports_agent_failures_in_the_stream(api_client, scripted_agent):
+    scripted_agent.replies.append(RuntimeError("model unavailable"))
+    api_client.post(f"{SESSION_URL}/s1")
+
+    response = api_client.post("/run_sse", json=run_body("s1"))
+
+    assert response.status_code == 200
+    assert response.text == 'data: {"error":"model unavailable"}\n\n'
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("path", ["/run", "/run_sse", "/run_sse_structured"])
+def test_run_routes_need_an_existing_session(api_client, path):
+    response = api_client.post(path, json=run_body("missing"))
+    assert response.status_code == 404
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("path", ["/run", "/run_sse", "/run_sse_structured"])
+def test_run_routes_only_serve_the_soap_app(api_client, path):
+    api_client.post(f"{SESSION_URL}/s1")
+    response = api_client.post(path, json={**run_body("s1"), "app_name": "other_app"})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "App not found: other_app"
+
+
+@pytest.mark.integration
+def test_session_routes_only_serve_the_soap_app(api_client):
+    other = "/apps/other_app/users/u1/sessions"
+    assert api_client.post(other).status_code == 404
+    assert api_client.post(f"{other}/s1").status_code == 404
+    assert api_client.get(other).status_code == 404
+    assert api_client.get(f"{other}/s1").status_code == 404
+    assert api_client.delete(f"{other}/s1").status_code == 404
+    assert api_client.get(SESSION_URL).json() == []
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("method", ["post", "delete"])
+def test_dictation_routes_need_an_existing_session(api_client, method):
+    kwargs = {"json": {"transcript": "Patient reports"}} if method == "post" else {}
+    response = getattr(api_client, method)(f"{SESSION_URL}/missing/dictation", **kwargs)
+    assert response.status_code == 404
+
+
+@pytest.mark.integration
+def test_images_route_rejects_unknown_images(api_client):
+    assert api_client.get("/images/not-a-digest/display").status_code == 404
+    assert api_client.get(f"/images/{'a' * 64}/poster").status_code == 404
+    assert api_client.get(f"/images/{'a' * 64}/display").status_code == 404
+
+
+@pytest.mark.unit
+def test_session_service_uses_the_configured_database(monkeypatch, tmp_path):
+    from google.adk.sessions import DatabaseSessionService
+
+    from motion.api.app import create_session_service
+
+    monkeypatch.delenv("MOTION_SESSION_STORE", raising=False)
+    monkeypatch.setenv("MOTION_SESSION_DB_URL", f"sqlite:///{tmp_path / 'sessions.db'}")
+    assert isinstance(create_session_service(), DatabaseSessionService)
+
+
+@pytest.mark.integration
+def test_cors_origins_and_shutdown_with_work_in_flight(scripted_agent, monkeypatch, tmp_path, caplog):
+    from fastapi.testclient import TestClient
+
+    from motion.api.app import create_app
+
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setenv("MOTION_ALLOW_ORIGINS", "https://app.example")
+    monkeypatch.delenv("MOTION_SESSION_STORE", raising=False)
+    monkeypatch.delenv("MOTION_SESSION_DB_URL", raising=False)
+
+    app = create_app()
+    with TestClient(app) as client:
+        response = client.get("/healthz", headers={"Origin": "https://app.example"})
+        assert response.headers["access-control-allow-origin"] == "https://app.example"
+        app.state.in_flight.enter(stream=True)
+
+    assert "Shutting down with 0 requests and 1 streams still in flight" in caplog.text
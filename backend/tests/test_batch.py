@@ -0,0 +1,342 @@
+"""Tests for offline batch drafting of archived transcripts."""
+
+import argparse
+import asyncio
+import json
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from motion import batch
+from motion.batch import drain, load_checkpoint, read_transcripts, run_batch
+
+
+DRAFT = {"type": "soap_draft", "soap_report": {"exercises": [{"name": "Bridge"}, {"name": "Clamshell"}]}}
+
+
+def batch_args(tmp_path, **overrides):
+    args = {
+        "input": str(tmp_path / "in.jsonl"),
+        "output": str(tmp_path / "out.jsonl"),
+        "workers": 1,
+        "concurrency": 2,
+        "lookup_concurrency": 2,
+        "timeout": 5.0,
+        "no_illustrations": False,
+        "retry_failed": False,
+        "limit": None,
+        "progress_every": 1,
+    }
+    args.update(overrides)
+    return argparse.Namespace(**args)
+
+
+def write_lines(path, *records):
+    path.write_text("".join((r if isinstance(r, str) else json.dumps(r)) + "\n" for r in records))
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Illustration searches answered instantly; records the names searched."""
+    searched = []
+
+    async def search(exercise_name):
+        searched.append(exercise_name)
+        return {"exercise_name": exercise_name, "results": [{"url": f"https://img/{exercise_name}.png"}]}
+
+    monkeypatch.setattr("motion.tools.exercise_illustration_tool.search_exercise_illustrations", search)
+    return searched
+
+
+@pytest.mark.unit
+def test_read_transcripts_from_directory_and_jsonl(tmp_path):
+    folder = tmp_path / "sessions"
+    (folder / "2024").mkdir(parents=True)
+    (folder / "2024" / "a.txt").write_text("first")
+    (folder / "b.md").write_text("second")
+    (folder / "notes.pdf").write_text("ignored")
+    assert list(read_transcripts(folder)) == [("2024/a.txt", "first"), ("b.md", "second")]
+
+    jsonl = tmp_path / "in.jsonl"
+    write_lines(jsonl, {"id": "x", "transcript": "one"}, "", {"transcript": "two"})
+    assert list(read_transcripts(jsonl)) == [("x", "one"), ("3", "two")]
+
+    write_lines(jsonl, {"id": "x", "text": "wrong key"})
+    with pytest.raises(ValueError, match="in.jsonl:1"):
+        list(read_transcripts(jsonl))
+
+
+@pytest.mark.unit
+def test_load_checkpoint_truncates_torn_lines_and_skips_lines_without_id(tmp_path):
+    output = tmp_path / "out.jsonl"
+    write_lines(
+        output,
+        {"id": "a", "status": "ok", "message": DRAFT},
+        {"id": "a", "illustrations": []},
+        {"id": "b", "status": "ok", "message": DRAFT},
+        {"id": "c", "status": "error", "error": "boom"},
+        {"id": 4, "status": "not_a_draft", "message": {"type": "chat_message"}},
+        {"summary": "no id"},
+        "[1, 2]",
+        "not json",
+    )
+    with open(output, "a") as f:
+        f.write('{"id": "d", "status": "o')
+
+    checkpoint = load_checkpoint(output)
+    assert checkpoint.done == {"a", "b", "c", "4"}
+    assert list(checkpoint.unillustrated) == ["b"]
+    assert output.read_text().endswith("not json\n")
+
+    assert load_checkpoint(output, retry_failed=True).done == {"a", "b", "4"}
+    assert load_checkpoint(tmp_path / "missing.jsonl").done == set()
+
+
+@pytest.mark.asyncio
+async def test_drain_streams_records_as_each_transcript_finishes(monkeypatch):
+    release_slow = asyncio.Event()
+    outbox = queue.Queue()
+
+    async def draft_one(item_id, transcript, timeout):
+        if item_id == "slow":
+            await release_slow.wait()
+        return {"id": item_id, "status": "ok"}
+
+    monkeypatch.setattr(batch, "_draft_one", draft_one)
+    inbox = queue.Queue()
+    for item in [("slow", "t"), ("fast-1", "t"), ("fast-2", "t"), None, None]:
+        inbox.put(item)
+
+    draining = asyncio.ensure_future(drain(inbox, outbox, timeout=5, concurrency=2))
+    # Both fast transcripts come back while the slow one still holds its slot
+    first = await asyncio.get_running_loop().run_in_executor(None, outbox.get, True, 5)
+    second = await asyncio.get_running_loop().run_in_executor(None, outbox.get, True, 5)
+    assert {first["id"], second["id"]} == {"fast-1", "fast-2"}
+    release_slow.set()
+    assert await draining == 3
+    assert outbox.get_nowait()["id"] == "slow"
+
+
+@pytest.mark.asyncio
+async def test_run_batch_writes_drafts_before_illustrations(tmp_path, monkeypatch, lookups):
+    write_lines(tmp_path / "in.jsonl", *({"id": i, "transcript": f"t{i}"} for i in ("a", "b", "c")), {"id": "d", "transcript": " "})
+    output = tmp_path / "out.jsonl"
+    seen_on_disk = []
+
+    async def drafted(pending, args):
+        for item_id, _ in pending:
+            yield {"id": item_id, "status": "ok" if item_id != "c" else "error", "message": DRAFT, "error": "x"}
+
+    real_for_draft = batch.IllustrationLookups.for_draft
+
+    async def for_draft(self, message):
+        # The draft line is on disk before any lookup starts
+        seen_on_disk.append(len(output.read_text().splitlines()))
+        return await real_for_draft(self, message)
+
+    monkeypatch.setattr(batch, "_drafted_records", drafted)
+    monkeypatch.setattr(batch.IllustrationLookups, "for_draft", for_draft)
+
+    summary = await run_batch(batch_args(tmp_path))
+
+    lines = read_lines(output)
+    assert [(line["id"], "status" in line) for line in lines[:3]] == [("a", True), ("b", True), ("c", True)]
+    illustrations = {line["id"]: line["illustrations"] for line in lines[3:]}
+    assert set(illustrations) == {"a", "b"}
+    assert [entry["exercise_name"] for entry in illustrations["a"]] == ["Bridge", "Clamshell"]
+    assert min(seen_on_disk) >= 1
+    assert sorted(lookups) == ["Bridge", "Clamshell"]
+    assert summary["ok"] == 2 and summary["error"] == 1 and summary["illustrated"] == 2
+    assert summary["distinct_illustration_lookups"] == 2
+
+
+@pytest.mark.asyncio
+async def test_rerun_only_illustrates_drafts_missing_them(tmp_path, monkeypatch, lookups):
+    write_lines(tmp_path / "in.jsonl", {"id": "a", "transcript": "ta"}, {"id": "b", "transcript": "tb"})
+    output = tmp_path / "out.jsonl"
+    write_lines(
+        output,
+        {"id": "a", "status": "ok", "message": DRAFT},
+        {"id": "a", "illustrations": []},
+        {"id": "b", "status": "ok", "message": {"type": "soap_draft", "soap_report": {"exercises": [{"name": "Squat"}]}}},
+    )
+
+    async def drafted(pending, args):
+        raise AssertionError("nothing should be redrafted")
+        yield
+
+    monkeypatch.setattr(batch, "_drafted_records", drafted)
+    summary = await run_batch(batch_args(tmp_path))
+
+    assert lookups == ["Squat"]
+    assert read_lines(output)[-1] == {"id": "b", "illustrations": [
+        {"exercise_name": "Squat", "results": [{"url": "https://img/Squat.png"}]},
+    ]}
+    assert summary["pending"] == 0 and summary["illustrated"] == 1
+    assert load_checkpoint(output).unillustrated == {}
+
+    # Nothing left to do
+    assert (await run_batch(batch_args(tmp_path)))["pending"] == 0
+
+
+@pytest.mark.asyncio
+async def test_no_illustrations_skips_lookups(tmp_path, monkeypatch, lookups):
+    write_lines(tmp_path / "in.jsonl", {"id": "a", "transcript": "ta"})
+
+    async def drafted(pending, args):
+        for item_id, _ in pending:
+            yield {"id": item_id, "status": "ok", "message": DRAFT}
+
+    monkeypatch.setattr(batch, "_drafted_records", drafted)
+    await run_batch(batch_args(tmp_path, no_illustrations=True))
+    assert lookups == []
+    assert len(read_lines(tmp_path / "out.jsonl")) == 1
+
+
+@pytest.mark.integration
+def test_worker_pipeline_drafts_each_transcript(tmp_path, monkeypatch, scripted_agent, soap_draft_json, lookups):
+    """Runs the real worker code, on threads instead of spawned processes so the scripted agent applies."""
+    monkeypatch.setenv("MOTION_ILLUSTRATION_PREFETCH", "1")
+    monkeypatch.setattr(
+        batch, "ProcessPoolExecutor",
+        lambda max_workers, mp_context, initializer, initargs: ThreadPoolExecutor(
+            max_workers, initializer=initializer, initargs=initargs
+        ),
+    )
+    scripted_agent.replies = [soap_draft_json, "plain text, not a draft"]
+    write_lines(tmp_path / "in.jsonl", {"id": "a", "transcript": "Patient reports pain"}, {"id": "b", "transcript": "Hi"})
+
+    summary = asyncio.run(run_batch(batch_args(tmp_path, concurrency=1)))
+
+    lines = read_lines(tmp_path / "out.jsonl")
+    statuses = {line["id"]: line["status"] for line in lines if "status" in line}
+    assert statuses == {"a": "ok", "b": "not_a_draft"}
+    assert all(line["elapsed_seconds"] >= 0 for line in lines if "status" in line)
+    assert [line["id"] for line in lines if "illustrations" in line] == ["a"]
+    assert summary["ok"] == 1 and summary["not_a_draft"] == 1
+    assert batch.main(["--output", str(tmp_path / "out.jsonl"), str(tmp_path / "in.jsonl")]) == 0
+
+
+def thread_pool(max_workers, mp_context, initializer, initargs):
+    return ThreadPoolExecutor(max_workers)
+
+
+class StubRunner:
+    """Runner stand-in whose turns are played by ``play(transcript)``, an async event generator."""
+
+    def __init__(self, play):
+        self.session_service = InMemorySessionService()
+        self.play = play
+
+    def run_async(self, user_id, session_id, new_message):
+        return self.play(new_message.parts[0].text)
+
+
+def reply_event(text, partial=False):
+    return Event(
+        author="soap_agent",
+        partial=partial,
+        content=types.Content(role="model", parts=[types.Part(text=text)]) if text else None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_draft_one_keeps_the_final_reply_and_records_failures(monkeypatch, soap_draft_json):
+    async def play(transcript):
+        if transcript == "slow":
+            await asyncio.sleep(1)
+        if transcript == "broken":
+            raise RuntimeError("model unavailable")
+        yield reply_event('{"type": "soap')
+        yield reply_event(soap_draft_json[:20], partial=True)
+        yield reply_event("")
+        yield reply_event(soap_draft_json)
+
+    runner = StubRunner(play)
+    monkeypatch.setitem(batch._worker, "runner", runner)
+
+    drafted = await batch._draft_one("a", "ok", timeout=5)
+    assert drafted["status"] == "ok"
+    assert drafted["message"]["soap_report"]["patient_name"] == "John Doe"
+
+    timed_out = await batch._draft_one("b", "slow", timeout=0.05)
+    assert timed_out["status"] == "error" and timed_out["error"] == "Timed out after 0.05s"
+
+    failed = await batch._draft_one("c", "broken", timeout=5)
+    assert failed == {"id": "c", "status": "error", "error": "model unavailable", "elapsed_seconds": failed["elapsed_seconds"]}
+
+    # Every session is deleted once drafted
+    assert (await runner.session_service.list_sessions(app_name="soap_agents", user_id=batch.BATCH_USER_ID)).sessions == []
+
+
+@pytest.mark.asyncio
+async def test_drafted_records_stop_when_the_workers_are_done(tmp_path, monkeypatch):
+    def quiet_worker(timeout, concurrency):
+        # Outlives one poll of the outbox, then ends without drafting
+        time.sleep(0.7)
+        return 0
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", thread_pool)
+    monkeypatch.setattr(batch, "_drain_inbox", quiet_worker)
+
+    assert [record async for record in batch._drafted_records([("a", "t")], batch_args(tmp_path))] == []
+
+
+@pytest.mark.asyncio
+async def test_drafted_records_raise_when_a_worker_dies(tmp_path, monkeypatch):
+    def dying_worker(timeout, concurrency):
+        raise RuntimeError("worker died")
+
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", thread_pool)
+    monkeypatch.setattr(batch, "_drain_inbox", dying_worker)
+
+    with pytest.raises(RuntimeError, match="worker died"):
+        [record async for record in batch._drafted_records([("a", "t")], batch_args(tmp_path))]
+
+
+@pytest.mark.asyncio
+async def test_failed_lookups_are_recorded_per_exercise(monkeypatch):
+    async def search(exercise_name):
+        if exercise_name == "Clamshell":
+            raise ConnectionError("search unavailable")
+        return {"exercise_name": exercise_name, "results": []}
+
+    monkeypatch.setattr("motion.tools.exercise_illustration_tool.search_exercise_illustrations", search)
+
+    illustrations = await batch.IllustrationLookups(2).for_draft(DRAFT)
+
+    assert illustrations == [
+        {"exercise_name": "Bridge", "results": []},
+        {"exercise_name": "Clamshell", "error": "search unavailable", "results": []},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_skips_duplicates_and_honours_the_limit(tmp_path, monkeypatch, capsys):
+    write_lines(
+        tmp_path / "in.jsonl",
+        *({"id": item_id, "transcript": f"t{item_id}"} for item_id in ("a", "a", "b", "c", "d")),
+    )
+
+    async def drafted(pending, args):
+        for item_id, _ in pending:
+            yield {"id": item_id, "status": "not_a_draft", "message": {"type": "chat_message"}}
+
+    monkeypatch.setattr(batch, "_drafted_records", drafted)
+    summary = await run_batch(batch_args(tmp_path, limit=3, progress_every=2))
+
+    assert [line["id"] for line in read_lines(tmp_path / "out.jsonl")] == ["a", "b", "c"]
+    assert summary["not_a_draft"] == 3
+    err = capsys.readouterr().err
+    assert "Skipping duplicate ID a" in err
+    assert "1/3 drafted" not in err and "2/3 drafted" in err and "3/3 drafted" in err
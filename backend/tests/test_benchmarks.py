@@ -0,0 +1,114 @@
+"""Tests for the benchmark harness's report maths and deterministic fakes."""
+
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+from PIL import Image
+
+from benchmarks.bench_e2e import DICTATION, percentiles
+from fakes import ILLUSTRATION_REQUEST, ScriptedLlm, _png, create_fake_linkup_app
+
+
+@pytest.fixture
+def fast_model(monkeypatch, tmp_path):
+    monkeypatch.setenv("BENCH_LLM_FIRST_TOKEN_SECONDS", "0")
+    monkeypatch.setenv("BENCH_LLM_TOKENS_PER_SECOND", "1000000")
+    monkeypatch.setenv("BENCH_EVENTS_FILE", str(tmp_path / "events.jsonl"))
+    return ScriptedLlm(model="bench-scripted")
+
+
+def user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def model(text):
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+async def generate(llm, contents, stream=False):
+    return [response async for response in llm.generate_content_async(LlmRequest(contents=contents), stream=stream)]
+
+
+@pytest.mark.unit
+def test_percentiles_use_nearest_rank_in_milliseconds():
+    summary = percentiles([i / 1000 for i in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50_ms"] == pytest.approx(50)
+    assert summary["p95_ms"] == pytest.approx(95)
+    assert summary["p99_ms"] == pytest.approx(99)
+    assert summary["max_ms"] == pytest.approx(100)
+    assert summary["mean_ms"] == pytest.approx(50.5)
+    assert percentiles([])["p50_ms"] is None
+    assert percentiles([0.2])["p99_ms"] == pytest.approx(200)
+
+
+@pytest.mark.asyncio
+async def test_scripted_session_replays_draft_tool_call_selection_and_chat(fast_model, tmp_path):
+    dictation = user(DICTATION.format(exercises=json.dumps(["Bridge", "Bird dog"])))
+    [response] = await generate(fast_model, [dictation])
+    draft = json.loads(response.content.parts[0].text)
+    assert draft["type"] == "soap_draft"
+    assert [e["name"] for e in draft["soap_report"]["exercises"]] == ["Bridge", "Bird dog"]
+    assert response.usage_metadata.candidates_token_count > 0
+
+    history = [dictation, response.content, user(ILLUSTRATION_REQUEST)]
+    [call_response] = await generate(fast_model, history)
+    call = call_response.content.parts[0].function_call
+    assert call.name == "search_exercise_illustrations_batch"
+    assert call.args == {"exercise_names": ["Bridge", "Bird dog"]}
+
+    tool_result = {"exercises": [
+        {"exercise_name": "Bridge", "results": [{"url": "https://img/1.png", "name": "Bridge 1"}]},
+        {"exercise_name": "Bird dog", "results": []},
+    ]}
+    reply = types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+        id=call.id, name=call.name, response=tool_result,
+    ))])
+    [selection_response] = await generate(fast_model, history + [call_response.content, reply])
+    selection = json.loads(selection_response.content.parts[0].text)
+    assert selection["type"] == "exercise_selection"
+    assert selection["exercises"][0]["images"][0]["id"] == "img_exercise_1_0"
+    assert selection["exercises"][1]["images"] == []
+
+    events = [json.loads(line) for line in (tmp_path / "events.jsonl").read_text().splitlines()]
+    assert [event["kind"] for event in events] == ["tool_fanout"]
+
+    [chat] = await generate(fast_model, [user("What else helps?")])
+    assert json.loads(chat.content.parts[0].text)["type"] == "chat_message"
+
+
+@pytest.mark.asyncio
+async def test_streaming_replies_arrive_in_chunks_then_whole(fast_model):
+    responses = await generate(fast_model, [user("Hello")], stream=True)
+    *chunks, final = responses
+    assert len(chunks) > 1 and all(chunk.partial for chunk in chunks)
+    assert "".join(chunk.content.parts[0].text for chunk in chunks) == final.content.parts[0].text
+    assert final.turn_complete
+
+
+@pytest.mark.unit
+def test_fake_linkup_serves_searches_images_and_injected_faults():
+    app = create_fake_linkup_app(latency=0, jitter=0, images_per_exercise=3, base_url="http://fake")
+    with TestClient(app) as client:
+        body = client.post("/search", json={"q": "illustration - Bridge"}).json()
+        assert len(body["results"]) == 3
+        assert all(r["url"].startswith("http://fake/img/") for r in body["results"])
+
+        image = client.get(body["results"][0]["url"].replace("http://fake", ""))
+        assert image.headers["content-type"] == "image/png"
+        with Image.open(io.BytesIO(image.content)) as decoded:
+            assert decoded.size == (32, 32)
+
+        app.state.error_rate = 1.0
+        assert client.post("/search", json={"q": "Bridge"}).status_code == 503
+        assert (app.state.searches, app.state.errors) == (2, 1)
+
+
+@pytest.mark.unit
+def test_fake_images_are_distinct_per_name():
+    assert _png("a") == _png("a")
+    assert _png("a") != _png("b")
@@ -0,0 +1,443 @@
+"""Tests for incremental dictation and speculative drafts."""
+
+import asyncio
+import json
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from motion.agents.soap_agents import dictation
+from motion.agents.soap_agents.dictation import (
+    Dictation,
+    answer_dictated_draft,
+    classify_sentence,
+    discard_dictation,
+    extract_exercise_names,
+    split_sentences,
+    transcript_digest,
+    update_dictation,
+)
+from motion.agents.soap_agents.report_assembly import LAST_SOAP_DRAFT_KEY
+from motion.scheduler import SchedulerRejected
+
+
+TRANSCRIPT = (
+    "Patient reports lower back pain, 7/10, for 3 days. "
+    "Limited lumbar flexion, positive straight leg raise test on the left. "
+    "Consistent with an acute lumbar strain. "
+    "Plan: manual therapy. Exercises: bridges 3 sets of 10, clamshells and bird dog."
+)
+
+DRAFT = json.dumps({"type": "soap_draft", "soap_report": {"condition": "Low back pain", "exercises": []}})
+
+
+@pytest.fixture(autouse=True)
+def isolated(monkeypatch):
+    """Fresh dictation registries, recorded prefetches and an instant fake draft model."""
+    monkeypatch.setattr(dictation, "_dictations", OrderedDict())
+    monkeypatch.setattr(dictation, "_drafts", OrderedDict())
+    monkeypatch.setattr(dictation, "_running_drafts", set())
+    prefetched = []
+    monkeypatch.setattr(dictation, "prefetch_exercise", lambda name, seen: prefetched.append(name) or True)
+    return prefetched
+
+
+@pytest.fixture
+def drafts(monkeypatch):
+    """Speculative drafts start at once and return DRAFT; records the transcripts drafted."""
+    drafted = []
+
+    async def generate(transcript, user_id=None):
+        drafted.append(transcript)
+        return DRAFT
+
+    monkeypatch.setattr(dictation, "generate_draft", generate)
+    monkeypatch.setattr(dictation, "DRAFT_DELAY", 0)
+    monkeypatch.setattr(dictation, "DRAFT_MIN_CHARS", 20)
+    return drafted
+
+
+async def settle(rounds=5):
+    for _ in range(rounds):
+        await asyncio.sleep(0)
+
+
+def turn(text):
+    return SimpleNamespace(user_content=types.Content(role="user", parts=[types.Part(text=text)]), state={})
+
+
+@pytest.fixture
+def held_drafts(drafts, monkeypatch):
+    """Speculative drafts that call the model until ``release`` is set, then return DRAFT."""
+    release = asyncio.Event()
+
+    async def generate(transcript, user_id=None):
+        dictation._running_drafts.add(transcript_digest(transcript))
+        await release.wait()
+        return DRAFT
+
+    monkeypatch.setattr(dictation, "generate_draft", generate)
+    return release
+
+
+class DraftModel:
+    """Model stand-in answering every request with one reply."""
+
+    def __init__(self, reply):
+        self.model = "draft-model"
+        self.reply = reply
+        self.requests = []
+
+    async def generate_content_async(self, request, stream=False):
+        self.requests.append(request)
+        # Empty turn metadata first, as some backends send
+        yield LlmResponse()
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=self.reply)]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(total_token_count=42),
+        )
+
+
+@pytest.fixture
+def draft_model(monkeypatch):
+    """Install a DraftModel as the agent's model, with the scheduler out of the way."""
+    from motion import scheduler
+    from motion.agents.soap_agents import agent as agent_module
+
+    def install(reply):
+        model = DraftModel(reply if isinstance(reply, str) else json.dumps(reply))
+        monkeypatch.setattr(agent_module, "get_root_agent", lambda: SimpleNamespace(canonical_model=model))
+        return model
+
+    monkeypatch.setattr(scheduler, "SCHEDULER_ENABLED", False)
+    return install
+
+
+@pytest.mark.unit
+def test_split_sentences_keeps_scores_and_decimals_whole():
+    spans = split_sentences("Pain 4.5/10 at L4.5. Worse sitting!\nNo numbness", offset=10)
+    assert [text for _, _, text in spans] == ["Pain 4.5/10 at L4.5.", "Worse sitting!", "No numbness"]
+    assert spans[0][0] == 10
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("sentence, previous, section", [
+    ("Patient reports pain 6/10 since Monday.", None, "subjective"),
+    ("Hip abduction strength 4/5, flexion 90 degrees.", "subjective", "objective"),
+    ("Findings consistent with patellar tendinopathy.", "objective", "assessment"),
+    ("Home exercise programme, review in 2 weeks.", "assessment", "plan"),
+    ("Objective: nothing remarkable.", "subjective", "objective"),
+    ("She is a teacher.", "objective", "objective"),
+    ("She is a teacher.", None, "subjective"),
+])
+def test_classify_sentence(sentence, previous, section):
+    assert classify_sentence(sentence, previous) == section
+
+
+@pytest.mark.unit
+def test_extract_exercise_names_from_lists_and_catalog_mentions():
+    assert extract_exercise_names("Exercises: bridges 3 sets of 10, clamshells and bird dog daily.") == [
+        "bridges", "clamshells", "bird dog",
+    ]
+    assert extract_exercise_names("Continue with calf raise and wall squat.", "plan") == ["Calf raise", "Wall squat"]
+    # A straight leg raise in the examination is a test, not an exercise
+    assert extract_exercise_names("Positive straight leg raise on the left.", "objective") == []
+
+
+@pytest.mark.unit
+def test_updates_resegment_sections_and_prefetch_finished_names(isolated):
+    running = Dictation("u1")
+    running.update(TRANSCRIPT[:120])
+    running.update(TRANSCRIPT)
+
+    sections = running.sections()
+    assert sections["subjective"].startswith("Patient reports lower back pain")
+    assert "straight leg raise" in sections["objective"]
+    assert "lumbar strain" in sections["assessment"]
+    assert "Exercises:" in sections["plan"]
+    assert running.exercises() == ["bridges", "clamshells", "bird dog"]
+    assert "bird dog" in isolated
+
+    half_spoken = Dictation("u1")
+    half_spoken.update("Plan: exercises: bridges, clamsh")
+    assert half_spoken.exercises() == ["bridges", "clamsh"]
+    # The last name of an unfinished sentence may still be half spoken
+    assert "bridges" in isolated and "clamsh" not in isolated
+
+
+@pytest.mark.asyncio
+async def test_update_dictation_applies_deltas_in_sequence_order():
+    first = update_dictation("app", "u1", "s1", delta="Patient reports knee pain. ", seq=1)
+    assert first["seq"] == 1 and first["draft"] is None
+
+    update_dictation("app", "u1", "s1", delta="Worse on stairs. ", seq=2)
+    stale = update_dictation("app", "u1", "s1", delta="IGNORED ", seq=2)
+    assert stale["transcript_chars"] == len("Patient reports knee pain. Worse on stairs. ")
+    assert "IGNORED" not in stale["sections"]["subjective"]
+
+    replaced = update_dictation("app", "u1", "s1", transcript="Patient reports hip pain.", seq=3)
+    assert replaced["sections"]["subjective"] == "Patient reports hip pain."
+
+    assert discard_dictation("app", "u1", "s1")
+    assert not discard_dictation("app", "u1", "s1")
+
+
+@pytest.mark.asyncio
+async def test_pause_starts_a_speculative_draft_that_answers_the_final_turn(drafts):
+    status = update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    assert status["draft"] == "pending"
+    await settle()
+    assert drafts == [TRANSCRIPT]
+    assert update_dictation("app", "u1", "s1", seq=1)["draft"] == "ready"
+
+    context = turn("  " + TRANSCRIPT.replace(". ", ".  "))
+    content = await answer_dictated_draft(context)
+
+    assert content.parts[0].text == DRAFT
+    assert context.state[LAST_SOAP_DRAFT_KEY] == {"condition": "Low back pain", "exercises": []}
+    # The draft is used once
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+
+
+@pytest.mark.asyncio
+async def test_changed_transcript_supersedes_the_draft(drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT + " Review in one week.", seq=2)
+
+    assert transcript_digest(TRANSCRIPT) not in dictation._drafts
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+
+
+@pytest.mark.asyncio
+async def test_final_turn_before_the_pause_cancels_the_pending_draft(drafts, monkeypatch):
+    monkeypatch.setattr(dictation, "DRAFT_DELAY", 60)
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+    assert not dictation._dictations[("app", "u1", "s1")].draft_pending()
+    assert drafts == []
+
+
+@pytest.mark.asyncio
+async def test_queued_draft_is_dropped_for_the_live_turn(drafts, monkeypatch):
+    queued = asyncio.Event()
+
+    async def waiting(transcript, user_id=None):
+        await queued.wait()
+        return DRAFT
+
+    monkeypatch.setattr(dictation, "generate_draft", waiting)
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    task = dictation._drafts[transcript_digest(TRANSCRIPT)]
+
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+    await settle()
+    assert task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_chat_questions_are_not_drafted(drafts):
+    update_dictation("app", "u1", "s1", transcript="What are good exercises for a frozen shoulder patient?", seq=1)
+    await settle()
+    assert drafts == []
+
+
+@pytest.mark.integration
+def test_dictation_endpoint_returns_the_running_draft(api_client, monkeypatch):
+    monkeypatch.setattr(dictation, "SPECULATIVE_DRAFT_ENABLED", False)
+    url = "/apps/soap_agents/users/u1/sessions/s1"
+    api_client.post(url, json={})
+
+    body = api_client.post(f"{url}/dictation", json={"transcript": TRANSCRIPT, "seq": 1}).json()
+    assert body["exercises"] == ["bridges", "clamshells", "bird dog"]
+    assert api_client.delete(f"{url}/dictation").status_code == 200
+
+
+@pytest.mark.integration
+def test_dictation_needs_sticky_routing_with_several_workers(api_client, monkeypatch):
+    url = "/apps/soap_agents/users/u1/sessions/s1"
+    api_client.post(url, json={})
+    monkeypatch.setattr(dictation, "SERVER_WORKERS", 4)
+
+    refused = api_client.post(f"{url}/dictation", json={"delta": "Patient reports pain.", "seq": 1})
+    assert refused.status_code == 501
+    assert "sticky" in refused.json()["detail"]
+
+    monkeypatch.setattr(dictation, "STICKY_SESSIONS", True)
+    assert api_client.post(f"{url}/dictation", json={"delta": "Patient reports pain.", "seq": 1}).status_code == 200
+
+
+@pytest.mark.unit
+def test_list_items_without_a_name_are_skipped():
+    assert extract_exercise_names("Exercises: 3, and bridges.", "plan") == ["bridges"]
+
+
+@pytest.mark.asyncio
+async def test_draft_status_follows_the_generation(held_drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    assert update_dictation("app", "u1", "s1", seq=1)["draft"] == "generating"
+
+    held_drafts.set()
+    await settle()
+    assert update_dictation("app", "u1", "s1", seq=1)["draft"] == "ready"
+
+
+@pytest.mark.asyncio
+async def test_changed_transcript_cancels_a_running_draft(held_drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    task = dictation._drafts[transcript_digest(TRANSCRIPT)]
+
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT + " Review in one week.", seq=2)
+    await settle()
+
+    assert task.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_sessions_dictating_the_same_transcript_share_one_draft(drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    update_dictation("app", "u1", "s2", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    assert drafts == [TRANSCRIPT]
+
+
+@pytest.mark.asyncio
+async def test_oldest_drafts_are_evicted(held_drafts, monkeypatch):
+    monkeypatch.setattr(dictation, "_MAX_DRAFTS", 1)
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    first = dictation._drafts[transcript_digest(TRANSCRIPT)]
+
+    update_dictation("app", "u1", "s2", transcript=TRANSCRIPT + " Review in one week.", seq=1)
+    await settle()
+
+    assert first.cancelled()
+    assert list(dictation._drafts) == [transcript_digest(TRANSCRIPT + " Review in one week.")]
+
+
+@pytest.mark.asyncio
+async def test_failed_drafts_are_reported_and_not_used(drafts, monkeypatch, caplog):
+    async def failing(transcript, user_id=None):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(dictation, "generate_draft", failing)
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+
+    assert update_dictation("app", "u1", "s1", seq=1)["draft"] == "failed"
+    assert "model unavailable" in caplog.text
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+
+
+@pytest.mark.asyncio
+async def test_empty_drafts_are_not_used(drafts, monkeypatch):
+    async def empty(transcript, user_id=None):
+        return None
+
+    monkeypatch.setattr(dictation, "generate_draft", empty)
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+
+
+@pytest.mark.asyncio
+async def test_cancelled_draft_lets_the_turn_run(held_drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    task = dictation._drafts[transcript_digest(TRANSCRIPT)]
+
+    answer = asyncio.ensure_future(answer_dictated_draft(turn(TRANSCRIPT)))
+    await settle()
+    task.cancel()
+
+    assert await answer is None
+
+
+@pytest.mark.asyncio
+async def test_disconnecting_turn_does_not_cancel_the_draft(held_drafts):
+    update_dictation("app", "u1", "s1", transcript=TRANSCRIPT, seq=1)
+    await settle()
+    task = dictation._drafts[transcript_digest(TRANSCRIPT)]
+
+    answer = asyncio.ensure_future(answer_dictated_draft(turn(TRANSCRIPT)))
+    await settle()
+    answer.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await answer
+    assert not task.cancelled()
+    held_drafts.set()
+    assert await task == DRAFT
+
+
+@pytest.mark.asyncio
+async def test_turns_without_dictations_or_text_are_not_answered():
+    assert await answer_dictated_draft(turn(TRANSCRIPT)) is None
+
+    update_dictation("app", "u1", "s1", transcript="Patient reports knee pain.")
+    assert await answer_dictated_draft(SimpleNamespace(user_content=None, state={})) is None
+
+
+@pytest.mark.asyncio
+async def test_idle_dictations_expire(monkeypatch):
+    update_dictation("app", "u1", "s1", transcript="Patient reports knee pain.")
+    monkeypatch.setattr(dictation, "DICTATION_TTL", 0)
+
+    update_dictation("app", "u1", "s2", transcript="Patient reports hip pain.")
+
+    assert list(dictation._dictations) == [("app", "u1", "s2")]
+
+
+@pytest.mark.asyncio
+async def test_unchanged_transcript_is_not_resegmented():
+    first = update_dictation("app", "u1", "s1", transcript="Patient reports knee pain.")
+    assert update_dictation("app", "u1", "s1", transcript="Patient reports knee pain.") == first
+
+
+@pytest.mark.asyncio
+async def test_generate_draft_calls_the_soap_model_and_prefetches(draft_model, isolated):
+    from motion.agents.soap_agents.prompts import SOAP_INSTRUCTION
+
+    model = draft_model({
+        "type": "soap_draft",
+        "soap_report": {"condition": "Low back pain", "exercises": [{"name": "Bridge"}, {"name": "Bird dog"}]},
+    })
+
+    draft = await dictation.generate_draft(TRANSCRIPT, "u1")
+
+    assert json.loads(draft)["soap_report"]["condition"] == "Low back pain"
+    assert model.requests[0].config.system_instruction == SOAP_INSTRUCTION
+    assert model.requests[0].contents[0].parts[0].text == TRANSCRIPT
+    assert isolated == ["Bridge", "Bird dog"]
+    assert not dictation._running_drafts
+
+
+@pytest.mark.asyncio
+async def test_generate_draft_ignores_replies_that_are_not_drafts(draft_model):
+    draft_model({"type": "chat_message", "content": "Could you tell me more?"})
+    assert await dictation.generate_draft(TRANSCRIPT) is None
+
+
+@pytest.mark.asyncio
+async def test_generate_draft_gives_way_when_the_scheduler_sheds_it(draft_model, monkeypatch):
+    model = draft_model({"type": "soap_draft", "soap_report": {}})
+
+    @asynccontextmanager
+    async def shed(user_id, priority, estimated_tokens=0):
+        raise SchedulerRejected("busy", 503, 1.0)
+        yield
+
+    monkeypatch.setattr(dictation, "scheduled", shed)
+
+    assert await dictation.generate_draft(TRANSCRIPT, "u1") is None
+    assert model.requests == []
@@ -0,0 +1,160 @@
+"""Tests for the offline exercise catalog."""
+
+import json
+
+import pytest
+
+from motion.tools import exercise_catalog
+from motion.tools.exercise_catalog import (
+    DEFAULT_CATALOG_PATH,
+    ExerciseCatalog,
+    get_illustration_catalog,
+    name_coverage,
+    normalize_catalog_name,
+)
+
+
+def image(name):
+    return [{"name": f"{name} illustration", "url": f"https://images.example.com/{name.replace(' ', '-')}.png"}]
+
+
+ENTRIES = [
+    {"name": "Bridge", "aliases": ["glute bridge", "supine bridge"], "images": image("bridge")},
+    {"name": "Side plank", "aliases": ["lateral plank"], "images": image("side plank")},
+    {"name": "Single leg bridge", "aliases": [], "images": image("single leg bridge")},
+    {"name": "Seated banded ankle dorsiflexion", "aliases": [], "images": image("ankle")},
+    {"name": "Hamstring stretch", "aliases": [], "images": image("hamstring")},
+    {"name": "Bird dog", "aliases": ["quadruped arm and leg raise"], "images": []},
+]
+
+
+@pytest.fixture
+def catalog():
+    return ExerciseCatalog(ENTRIES)
+
+
+@pytest.fixture
+def fresh_catalog(monkeypatch):
+    monkeypatch.setattr(exercise_catalog, "_catalog", None)
+    monkeypatch.delenv("MOTION_EXERCISE_CATALOG", raising=False)
+    monkeypatch.delenv("MOTION_EXERCISE_CATALOG_MIN_CONFIDENCE", raising=False)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ("Seated Banded L Ankle Dorsiflexion", "sitting band ankle dorsiflexion"),
+        ("seated band ankle dorsi flexion", "sitting band ankle dorsiflexion"),
+        ("Glute bridges (R)", "bridge"),
+        ("Cat camel exercises", "cat cow"),
+        ("Bilateral heel raises", "bilateral calf raise"),
+    ],
+)
+def test_normalize_catalog_name(raw, expected):
+    assert normalize_catalog_name(raw) == expected
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("Bridge exercises", "Bridge"),
+        ("Hip bridge, left", "Bridge"),
+        ("Seated Banded L Ankle Dorsiflexion", "Seated banded ankle dorsiflexion"),
+        ("Single-leg bridge R", "Single leg bridge"),
+        ("lateral plank", "Side plank"),
+        ("hamstring stretches", "Hamstring stretch"),
+    ],
+)
+def test_lookup_answers_confident_matches(catalog, query, expected):
+    result = catalog.lookup(query)
+    assert result["matched_exercise"] == expected
+    assert result["source"] == "catalog"
+    assert result["exercise_name"] == query
+    assert result["results"][0]["type"] == "image"
+    assert result["results"][0]["url"].startswith("https://images.example.com/")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "query",
+    ["Side bridge", "Bridge with band", "Single leg hamstring stretch", "Standing hamstring stretch", "Reverse bridge"],
+)
+def test_qualifiers_must_agree(catalog, query):
+    found = catalog.match(query)
+    assert found is None or found["entry"]["name"] not in {"Bridge", "Hamstring stretch"}
+    assert catalog.lookup(query, min_confidence=0.5) is None
+
+
+@pytest.mark.unit
+def test_lookup_threshold_and_override(catalog):
+    found = catalog.match("hamstrng strech")
+    assert found["entry"]["name"] == "Hamstring stretch"
+    assert 0.5 < found["score"] < 0.8
+    assert catalog.lookup("hamstrng strech") is None
+    assert catalog.lookup("hamstrng strech", min_confidence=0.5)["matched_exercise"] == "Hamstring stretch"
+
+
+@pytest.mark.unit
+def test_entries_without_images_never_answer(catalog):
+    assert len(catalog) == 5
+    assert catalog.match("Bird dog")["score"] < 0.5
+    assert catalog.lookup("bird dog") is None
+    assert catalog.match("") is None
+    assert catalog.match("zzzz") is None
+
+
+@pytest.mark.unit
+def test_ties_go_to_the_earlier_entry_and_empty_names_are_skipped():
+    catalog = ExerciseCatalog([
+        {"name": "Wall lift", "aliases": ["(L)"], "images": image("wall lift")},
+        {"name": "Wall gift", "images": image("wall gift")},
+    ])
+    # Equally close to both names
+    assert catalog.match("wall ift")["entry"]["name"] == "Wall lift"
+    assert catalog.find_mentions("left") == []
+
+
+@pytest.mark.unit
+def test_find_mentions_uses_every_name_and_alias(catalog):
+    text = "Then a quadruped arm and leg raise, some glute bridges and a single leg bridge on the left."
+    assert catalog.find_mentions(text) == ["Bird dog", "Bridge", "Single leg bridge"]
+    assert catalog.find_mentions("Bridge, then another bridge") == ["Bridge"]
+
+
+@pytest.mark.unit
+def test_name_coverage_ignores_extra_words():
+    assert name_coverage("Glute bridge", "Bridge pose (glute bridge) on a mat") == 1.0
+    assert name_coverage("Bridge", "Side plank") < 0.5
+    assert name_coverage("", "anything") == 0.0
+
+
+@pytest.mark.unit
+def test_bundled_catalog_has_no_illustrations(fresh_catalog):
+    bundled = ExerciseCatalog.load(DEFAULT_CATALOG_PATH)
+    assert bundled.entries
+    assert len(bundled) == 0
+    assert bundled.find_mentions("two sets of clamshells") == ["Clamshell"]
+    assert exercise_catalog.get_exercise_catalog().entries == bundled.entries
+    assert get_illustration_catalog() is None
+
+
+@pytest.mark.unit
+def test_operator_catalog_answers_illustration_searches(fresh_catalog, monkeypatch, tmp_path):
+    path = tmp_path / "catalog.json"
+    path.write_text(json.dumps({"version": 1, "exercises": ENTRIES}))
+    monkeypatch.setenv("MOTION_EXERCISE_CATALOG", str(path))
+    monkeypatch.setenv("MOTION_EXERCISE_CATALOG_MIN_CONFIDENCE", "0.9")
+
+    catalog = get_illustration_catalog()
+    assert catalog is exercise_catalog.get_exercise_catalog()
+    assert catalog.min_confidence == 0.9
+    assert catalog.lookup("glute bridge")["matched_exercise"] == "Bridge"
+
+
+@pytest.mark.unit
+def test_missing_operator_catalog_is_empty(fresh_catalog, monkeypatch, tmp_path):
+    monkeypatch.setenv("MOTION_EXERCISE_CATALOG", str(tmp_path / "missing.json"))
+    assert len(exercise_catalog.get_exercise_catalog().entries) == 0
+    assert get_illustration_catalog() is None
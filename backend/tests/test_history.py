@@ -0,0 +1,148 @@
+"""Tests for compaction of the model request history."""
+
+import json
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from motion.agents.soap_agents import history
+from motion.agents.soap_agents.history import compact_contents, compact_history, estimate_tokens, summarize_message
+
+
+def user(text):
+    return types.Content(role="user", parts=[types.Part(text=text)])
+
+
+def model(message):
+    text = message if isinstance(message, str) else json.dumps(message)
+    return types.Content(role="model", parts=[types.Part(text=text)])
+
+
+def draft(patient, condition, *exercises):
+    return {
+        "type": "soap_draft",
+        "soap_report": {
+            "patient_name": patient,
+            "patient_age": "40",
+            "condition": condition,
+            "subjective": "Long subjective text. " * 40,
+            "exercises": [{"name": name} for name in exercises],
+        },
+    }
+
+
+def selection(*exercises):
+    return {"type": "exercise_selection", "exercises": [{"name": name, "images": [{"url": "u" * 200}]} for name in exercises]}
+
+
+def final(patient):
+    return {"type": "final_report", "soap_report": {"patient_name": patient, "condition": "Neck pain", "exercises": []}}
+
+
+def tool_call():
+    return types.Content(role="model", parts=[
+        types.Part(function_call=types.FunctionCall(name="search_exercise_illustrations_batch", args={"exercise_names": ["Bridge"]}))
+    ])
+
+
+def tool_result():
+    return types.Content(role="user", parts=[
+        types.Part(function_response=types.FunctionResponse(name="search_exercise_illustrations_batch", response={"exercises": ["x" * 500]}))
+    ])
+
+
+def texts(contents):
+    return [part.text for content in contents for part in content.parts if part.text]
+
+
+@pytest.mark.unit
+def test_summaries_name_patient_condition_and_exercises():
+    assert summarize_message(draft("Ann", "Low back pain", "Bridge", "Plank")) == (
+        "[Earlier soap_draft for Low back pain (patient: Ann, 40); exercises: Bridge, Plank]"
+    )
+    assert summarize_message(final(None)) == (
+        "[Earlier final_report completed for Neck pain (patient: unnamed); exercises: none]"
+    )
+    assert summarize_message(selection("Bridge")) == "[Earlier exercise_selection offered images for: Bridge]"
+
+
+@pytest.mark.unit
+def test_superseded_messages_and_consumed_tool_traffic_are_compacted():
+    contents = [
+        user("Dictation for Ann"), model(draft("Ann", "Low back pain", "Bridge")),
+        user("Find illustrations"), tool_call(), tool_result(), model(selection("Bridge")),
+        user('{"message_type": "image_selection"}'), model(final("Ann")),
+        user("Dictation for Bob"), model(draft("Bob", "Shoulder pain", "Pendulum")),
+    ]
+    before = estimate_tokens(contents)
+
+    compact_contents(contents, token_budget=100_000)
+
+    assert len(contents) == 8
+    assert not any(part.function_call or part.function_response for c in contents for part in c.parts)
+    summaries = [text for text in texts(contents) if text.startswith("[Earlier")]
+    assert len(summaries) == 3
+    assert "Ann" in summaries[0]
+    # The current patient's draft stays intact
+    assert json.loads(texts(contents)[-1])["soap_report"]["patient_name"] == "Bob"
+    assert estimate_tokens(contents) < before
+
+
+@pytest.mark.unit
+def test_unstructured_model_text_is_kept_and_mixed_tool_turns_keep_their_text():
+    narrated_call = tool_call()
+    narrated_call.parts.insert(0, types.Part(text="Looking up illustrations"))
+    contents = [
+        model("{not json"), model('{"type": "chat_message", "message": "Hi"}'),
+        types.Content(role="model", parts=[types.Part(thought_signature=b"sig")]),
+        user("Find illustrations"), narrated_call, tool_result(), model(selection("Bridge")),
+    ]
+
+    compact_contents(contents, token_budget=100_000)
+
+    assert texts(contents) == [
+        "{not json", '{"type": "chat_message", "message": "Hi"}', "Find illustrations",
+        "Looking up illustrations", json.dumps(selection("Bridge")),
+    ]
+
+
+@pytest.mark.unit
+def test_pending_tool_traffic_is_kept():
+    contents = [user("Find illustrations"), tool_call(), tool_result()]
+    compact_contents(contents, token_budget=100_000)
+    assert len(contents) == 3
+
+
+@pytest.mark.unit
+def test_oldest_turns_are_dropped_to_fit_the_budget():
+    contents = []
+    for i in range(10):
+        contents += [user(f"Question {i}: " + "words " * 50), model(f"Answer {i}: " + "more words " * 50)]
+
+    compact_contents(contents, token_budget=300)
+
+    assert estimate_tokens(contents) <= 300
+    assert texts(contents)[0].startswith("Question")
+    assert texts(contents)[-1].startswith("Answer 9")
+
+
+@pytest.mark.unit
+def test_latest_turn_is_kept_even_over_budget():
+    contents = [user("old"), model("old answer"), user("x" * 4000)]
+    compact_contents(contents, token_budget=10)
+    assert texts(contents) == ["x" * 4000]
+
+
+@pytest.mark.unit
+def test_compact_history_callback(monkeypatch):
+    request = LlmRequest(contents=[
+        user("a"), model(draft("Ann", "Knee pain")), user("b"), model(draft("Bob", "Hip pain")),
+    ])
+    compact_history(None, request)
+    assert texts(request.contents)[1].startswith("[Earlier soap_draft")
+
+    monkeypatch.setattr(history, "COMPACTION_ENABLED", False)
+    request = LlmRequest(contents=[model(draft("Ann", "Knee pain")), model(draft("Bob", "Hip pain"))])
+    compact_history(None, request)
+    assert texts(request.contents)[0].startswith("{")
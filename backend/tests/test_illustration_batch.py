@@ -0,0 +1,84 @@
+"""Tests for the concurrent batch illustration search tool."""
+
+import asyncio
+
+import pytest
+
+from motion.tools import exercise_illustration_tool as tool
+
+
+@pytest.fixture
+def fake_search(monkeypatch):
+    """Replace the single-exercise search with a recording fake."""
+    calls = []
+    state = {"active": 0, "peak": 0, "delay": 0.01, "behaviour": {}}
+
+    async def search(name):
+        calls.append(name)
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            behaviour = state["behaviour"].get(name)
+            if behaviour == "hang":
+                await asyncio.sleep(10)
+            if behaviour == "raise":
+                raise RuntimeError("boom")
+            await asyncio.sleep(state["delay"])
+            if behaviour == "error":
+                return {"error": "upstream failed", "exercise_name": name, "results": []}
+            return {"exercise_name": name, "results": [{"type": "image", "name": name, "url": f"https://example.com/{len(calls)}.jpg"}]}
+        finally:
+            state["active"] -= 1
+
+    monkeypatch.setattr(tool, "search_exercise_illustrations", search)
+    state["calls"] = calls
+    return state
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_batch_keeps_order_and_searches_duplicates_once(fake_search):
+    names = ["Bridge", "Cat-cow", "bridge!", "Plank"]
+    result = await tool.search_exercise_illustrations_batch(names)
+
+    assert [item["exercise_name"] for item in result["exercises"]] == names
+    assert result["failed"] == []
+    assert fake_search["calls"] == ["Bridge", "Cat-cow", "Plank"]
+    assert result["exercises"][0]["results"] == result["exercises"][2]["results"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_batch_bounds_concurrency(fake_search, monkeypatch):
+    monkeypatch.setattr(tool, "BATCH_MAX_CONCURRENCY", 2)
+    await tool.search_exercise_illustrations_batch([f"exercise {i}" for i in range(7)])
+
+    assert len(fake_search["calls"]) == 7
+    assert fake_search["peak"] == 2
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_batch_reports_failures_without_failing_the_rest(fake_search, monkeypatch):
+    monkeypatch.setattr(tool, "BATCH_ITEM_TIMEOUT", 0.05)
+    fake_search["behaviour"] = {"Slow": "hang", "Broken": "raise", "Failing": "error"}
+
+    result = await tool.search_exercise_illustrations_batch(["Slow", "Bridge", "Broken", "Failing"])
+
+    by_name = {item["exercise_name"]: item for item in result["exercises"]}
+    assert result["failed"] == ["Slow", "Broken", "Failing"]
+    assert "Timed out" in by_name["Slow"]["error"]
+    assert "boom" in by_name["Broken"]["error"]
+    assert by_name["Failing"]["error"] == "upstream failed"
+    assert by_name["Bridge"]["results"]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_batch_runs_searches_concurrently(fake_search):
+    fake_search["delay"] = 0.1
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await tool.search_exercise_illustrations_batch(["a", "b", "c", "d"])
+
+    assert loop.time() - started < 0.3
@@ -0,0 +1,208 @@
+"""Tests for the two-tier illustration search cache."""
+
+import pytest
+
+from motion.tools import illustration_cache
+from motion.tools.illustration_cache import (
+    IllustrationCache,
+    get_cache_dir,
+    normalize_exercise_name,
+)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module inside illustration_cache."""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(illustration_cache, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / "cache" / "illustrations.sqlite3"
+
+
+RESULT = {"exercise_name": "Bridge", "results": [{"type": "image", "url": "https://example.com/b.jpg"}]}
+ERROR = {"exercise_name": "Bridge", "error": "upstream unavailable"}
+
+
+@pytest.mark.unit
+def test_normalize_exercise_name_ignores_case_and_punctuation():
+    assert normalize_exercise_name("Cat-Cow  exercises!") == "cat cow exercises"
+    assert normalize_exercise_name("  BRIDGE ") == "bridge"
+
+
+@pytest.mark.unit
+def test_get_cache_dir_reads_env(monkeypatch, tmp_path):
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path))
+    assert get_cache_dir() == tmp_path
+
+
+@pytest.mark.unit
+def test_memory_hit_returns_copy(clock):
+    cache = IllustrationCache()
+    assert cache.get("bridge") is None
+    cache.put("Bridge", RESULT)
+
+    value = cache.get("bridge!")
+    assert value == RESULT
+    value["results"] = []
+    assert cache.get("bridge") == RESULT
+
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["misses"] == 1
+    assert stats["writes"] == 1
+    assert stats["hit_rate"] == pytest.approx(2 / 3)
+    assert "disk_entries" not in stats
+
+
+@pytest.mark.unit
+def test_positive_entry_expires_after_ttl(clock):
+    cache = IllustrationCache(ttl_seconds=60)
+    cache.put("bridge", RESULT)
+    clock.now += 59
+    assert cache.get("bridge") == RESULT
+    clock.now += 2
+    assert cache.get("bridge") is None
+    assert cache.stats()["expirations"] == 1
+
+
+@pytest.mark.unit
+def test_negative_entry_uses_short_ttl(clock):
+    cache = IllustrationCache(ttl_seconds=3600, negative_ttl_seconds=10)
+    cache.put("bridge", ERROR)
+    assert cache.get("bridge") == ERROR
+    assert cache.stats()["negative_hits"] == 1
+    assert cache.stats()["negative_writes"] == 1
+    clock.now += 11
+    assert cache.get("bridge") is None
+
+
+@pytest.mark.unit
+def test_memory_tier_evicts_least_recently_used(clock):
+    cache = IllustrationCache(max_memory_entries=2)
+    cache.put("a", RESULT)
+    cache.put("b", RESULT)
+    cache.get("a")
+    cache.put("c", RESULT)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.unit
+def test_disk_tier_survives_restart(clock, db_path):
+    first = IllustrationCache(db_path=db_path)
+    first.put("Bridge", RESULT)
+    first.close()
+
+    second = IllustrationCache(db_path=db_path)
+    assert second.get("bridge") == RESULT
+    assert second.get("bridge") == RESULT
+    stats = second.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["disk_entries"] == 1
+    second.close()
+
+
+@pytest.mark.unit
+def test_disk_tier_drops_expired_errors_but_keeps_expired_results(clock, db_path):
+    writer = IllustrationCache(db_path=db_path, ttl_seconds=60, negative_ttl_seconds=10)
+    writer.put("bridge", RESULT)
+    writer.put("plank", ERROR)
+    writer.close()
+
+    # Errors are never served stale, even before they expire
+    early = IllustrationCache(db_path=db_path)
+    assert early.get_stale("plank") is None
+    early.close()
+    clock.now += 120
+    reader = IllustrationCache(db_path=db_path)
+    assert reader.get("bridge") is None
+    assert reader.get("plank") is None
+    assert reader.stats()["disk_entries"] == 1
+    assert reader.get_stale("bridge") == {**RESULT, "stale": True}
+    assert reader.get_stale("plank") is None
+    reader.close()
+
+
+@pytest.mark.unit
+def test_disk_tier_evicts_expired_then_oldest(clock, db_path):
+    cache = IllustrationCache(
+        db_path=db_path, max_memory_entries=1, max_disk_entries=2, ttl_seconds=100
+    )
+    cache.put("old", RESULT)
+    clock.now += 150
+    cache.put("fresh", RESULT)
+    cache.put("newest", RESULT)
+
+    stats = cache.stats()
+    assert stats["disk_entries"] == 2
+    assert cache.get_stale("old") is None
+    assert cache.get_stale("fresh") == RESULT
+
+    cache.clear()
+    assert cache.get("fresh") is None
+    assert cache.stats()["disk_entries"] == 0
+    cache.close()
+
+
+@pytest.mark.unit
+def test_get_stale_prefers_memory_and_skips_errors(clock):
+    cache = IllustrationCache(ttl_seconds=60)
+    assert cache.get_stale("bridge") is None
+
+    cache.put("bridge", RESULT)
+    assert cache.get_stale("bridge") == RESULT
+    clock.now += 61
+    assert cache.get_stale("bridge") == {**RESULT, "stale": True}
+
+    cache.put("plank", ERROR)
+    assert cache.get_stale("plank") is None
+    assert cache.stats()["stale_hits"] == 2
+
+
+@pytest.mark.unit
+def test_get_illustration_cache_is_configured_from_env(monkeypatch, tmp_path):
+    monkeypatch.setattr(illustration_cache, "_cache", None)
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("MOTION_ILLUSTRATION_CACHE_TTL", "42")
+    monkeypatch.setenv("MOTION_ILLUSTRATION_CACHE_MEMORY_ENTRIES", "7")
+
+    cache = illustration_cache.get_illustration_cache()
+    try:
+        assert cache is illustration_cache.get_illustration_cache()
+        assert cache.ttl_seconds == 42
+        assert cache.max_memory_entries == 7
+        assert (tmp_path / "illustrations.sqlite3").exists()
+    finally:
+        cache.close()
+
+
+@pytest.mark.unit
+def test_get_illustration_cache_memory_only(monkeypatch, tmp_path):
+    monkeypatch.setattr(illustration_cache, "_cache", None)
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("MOTION_ILLUSTRATION_CACHE_DISK", "0")
+
+    cache = illustration_cache.get_illustration_cache()
+    assert "disk_entries" not in cache.stats()
+    assert not (tmp_path / "illustrations.sqlite3").exists()
+    cache.put("bridge", RESULT)
+    cache.clear()
+    assert cache.get("bridge") is None
+    cache.close()
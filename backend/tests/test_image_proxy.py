@@ -0,0 +1,343 @@
+"""Tests for the illustration image proxy."""
+
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from motion.tools.image_proxy import (
+    ImageProxy,
+    is_public_address,
+    is_valid_digest,
+    resolve_host,
+    sniff_image_type,
+)
+
+
+# The address the public_resolver fixture answers with
+PUBLIC = "93.184.216.34"
+
+
+def item(url):
+    return {"type": "image", "url": url}
+
+
+@pytest.mark.unit
+def test_sniff_image_type_and_digest_validation(picture):
+    assert sniff_image_type(picture(fmt="PNG")) == "image/png"
+    assert sniff_image_type(picture(fmt="JPEG")) == "image/jpeg"
+    assert sniff_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "image/webp"
+    assert sniff_image_type(b"<html>") is None
+    assert is_valid_digest("a" * 64)
+    assert not is_valid_digest("../" + "a" * 61)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("address", [
+    "127.0.0.1", "10.0.0.5", "172.16.3.4", "192.168.1.1", "169.254.169.254",
+    "::1", "fe80::1%eth0", "fd00::1", "::ffff:10.0.0.1", "0.0.0.0", "224.0.0.1", "not-an-ip",
+])
+def test_non_public_addresses_are_rejected(address):
+    assert not is_public_address(address)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("address", [PUBLIC, "8.8.8.8", "2606:4700::1111"])
+def test_public_addresses_are_allowed(address):
+    assert is_public_address(address)
+
+
+@pytest.mark.asyncio
+async def test_drops_dead_links_and_non_images(make_proxy, picture):
+    proxy, _ = make_proxy({
+        "https://a.example/ok.png": httpx.Response(200, content=picture()),
+        "https://a.example/gone.png": httpx.Response(404),
+        "https://a.example/page.png": httpx.Response(200, content=b"<html>not an image</html>"),
+        "https://a.example/broken.png": httpx.Response(200, content=b"\x89PNG\r\n\x1a\ntruncated"),
+    })
+    results = [item(f"https://a.example/{name}.png") for name in ("ok", "gone", "page", "broken")]
+    results.append(item("ftp://a.example/ok.png"))
+
+    processed = await proxy.process(results)
+
+    assert [r["url"] for r in processed] == ["https://a.example/ok.png"]
+    assert proxy.stats()["dropped"] == 4
+
+
+@pytest.mark.asyncio
+async def test_max_bytes_cuts_off_large_images(make_proxy, picture):
+    big = picture(size=(600, 600)) + b"\x00" * 4096
+
+    async def chunks():
+        yield big[:2048]
+        yield big[2048:]
+
+    def chunked(request):
+        # No content-length: the limit must be enforced while streaming
+        return httpx.Response(200, content=chunks())
+
+    proxy, _ = make_proxy({
+        "https://a.example/declared.png": httpx.Response(200, content=big),
+        "https://a.example/streamed.png": chunked,
+        "https://a.example/small.png": httpx.Response(200, content=picture(size=(20, 20))),
+    }, max_bytes=4096)
+
+    processed = await proxy.process([
+        item("https://a.example/declared.png"),
+        item("https://a.example/streamed.png"),
+        item("https://a.example/small.png"),
+    ])
+
+    assert [r["url"] for r in processed] == ["https://a.example/small.png"]
+
+
+@pytest.mark.asyncio
+async def test_collapses_exact_and_perceptual_duplicates(make_proxy, picture):
+    png = picture()
+    proxy, _ = make_proxy({
+        "https://a.example/one.png": httpx.Response(200, content=png),
+        "https://mirror.example/one.png": httpx.Response(200, content=png),
+        "https://b.example/one.jpg": httpx.Response(200, content=picture(size=(200, 150), fmt="JPEG")),
+        "https://c.example/other.png": httpx.Response(200, content=picture(shade=128)),
+    })
+
+    processed = await proxy.process([
+        item("https://a.example/one.png"),
+        item("https://mirror.example/one.png"),
+        item("https://b.example/one.jpg"),
+        item("https://c.example/other.png"),
+    ])
+
+    assert [r["url"] for r in processed] == ["https://a.example/one.png", "https://c.example/other.png"]
+    assert proxy.stats()["duplicates"] == 2
+
+
+@pytest.mark.asyncio
+async def test_writes_thumbnails_and_rewrites_urls(make_proxy, picture):
+    proxy, server = make_proxy(
+        {"https://a.example/big.png": httpx.Response(200, content=picture(size=(2000, 1000)))},
+        public_base_url="https://api.example/",
+    )
+
+    [result] = await proxy.process([item("https://a.example/big.png")])
+
+    digest = result["url"].split("/")[-2]
+    assert result["url"] == f"https://api.example/images/{digest}/display"
+    assert result["thumbnail_url"] == f"https://api.example/images/{digest}/thumb"
+    assert result["source_url"] == "https://a.example/big.png"
+    with Image.open(proxy.path_for(digest, "thumb")) as thumb:
+        assert thumb.format == "JPEG" and max(thumb.size) == 320
+    with Image.open(proxy.path_for(digest, "display")) as display:
+        assert display.size == (1024, 512)
+    assert proxy.cached_path(result["url"], "thumb") == proxy.path_for(digest, "thumb")
+    assert proxy.cached_path("https://a.example/big.png") == proxy.path_for(digest, "display")
+
+    # The source index answers repeat searches without fetching
+    await proxy.process([item("https://a.example/big.png")])
+    assert len(server.requests) == 1
+    assert proxy.stats()["index_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_flattens_transparent_images_onto_white(make_proxy):
+    transparent = Image.new("RGBA", (40, 40), (0, 0, 0, 0))
+    buffer = io.BytesIO()
+    transparent.save(buffer, format="PNG")
+    proxy, _ = make_proxy({"https://a.example/clear.png": httpx.Response(200, content=buffer.getvalue())})
+
+    await proxy.process([item("https://a.example/clear.png")])
+
+    with Image.open(proxy.cached_path("https://a.example/clear.png")) as display:
+        assert display.getpixel((20, 20)) == (255, 255, 255)
+
+
+@pytest.mark.asyncio
+async def test_without_pillow_serves_original_bytes(make_proxy, monkeypatch, picture):
+    from motion.tools import image_proxy
+
+    monkeypatch.setattr(image_proxy, "Image", None)
+    png, other = picture(), picture(shade=128)
+    proxy, _ = make_proxy({
+        "https://a.example/one.png": httpx.Response(200, content=png),
+        "https://b.example/two.png": httpx.Response(200, content=other),
+    })
+
+    processed = await proxy.process([item("https://a.example/one.png"), item("https://b.example/two.png")])
+
+    # Only exact duplicates can be detected without perceptual hashes
+    assert len(processed) == 2
+    assert proxy.cached_path("https://a.example/one.png", "thumb").read_bytes() == png
+
+
+@pytest.mark.asyncio
+async def test_connection_errors_drop_the_image(make_proxy):
+    def refused(request):
+        raise httpx.ConnectError("connection refused", request=request)
+
+    proxy, _ = make_proxy({"https://a.example/x.png": refused})
+    assert await proxy.process([item("https://a.example/x.png")]) == []
+    assert proxy.stats()["dropped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_remembers_dead_links(make_proxy):
+    proxy, server = make_proxy({})
+    await proxy.process([item("https://a.example/gone.png")])
+    await proxy.process([item("https://a.example/gone.png")])
+    assert len(server.requests) == 1
+    assert proxy.cached_path("https://a.example/gone.png") is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1/x.png",
+    "http://169.254.169.254/latest/meta-data",
+    "http://10.0.0.5/x.png",
+    "http://[::1]/x.png",
+    "http://internal.example/x.png",
+])
+async def test_refuses_non_public_hosts(make_proxy, url, picture, public_resolver):
+    resolver = public_resolver({"internal.example": ["192.168.0.10"], "127.0.0.1": ["127.0.0.1"],
+                                "169.254.169.254": ["169.254.169.254"], "10.0.0.5": ["10.0.0.5"], "::1": ["::1"]})
+    proxy, server = make_proxy({url: httpx.Response(200, content=picture())}, resolver=resolver)
+
+    assert await proxy.process([item(url)]) == []
+    assert server.requests == []
+    assert proxy.stats()["blocked"] == 1
+
+
+@pytest.mark.asyncio
+async def test_checks_every_redirect_hop(make_proxy, picture, public_resolver):
+    resolver = public_resolver({"internal.example": [PUBLIC, "10.0.0.1"]})
+    proxy, server = make_proxy({
+        "https://a.example/ok.png": httpx.Response(302, headers={"location": "/real.png"}),
+        "https://a.example/real.png": httpx.Response(200, content=picture()),
+        "https://a.example/evil.png": httpx.Response(301, headers={"location": "http://internal.example/x.png"}),
+        "http://internal.example/x.png": httpx.Response(200, content=picture(shade=100)),
+        "https://a.example/loop.png": httpx.Response(302, headers={"location": "https://a.example/loop.png"}),
+        "https://a.example/ftp.png": httpx.Response(302, headers={"location": "ftp://a.example/x.png"}),
+    }, resolver=resolver)
+
+    processed = await proxy.process([
+        item("https://a.example/ok.png"), item("https://a.example/evil.png"), item("https://a.example/loop.png"),
+        item("https://a.example/ftp.png"),
+    ])
+
+    assert [r["url"] for r in processed] == ["https://a.example/ok.png"]
+    assert "http://internal.example/x.png" not in server.requests
+    assert server.requests.count("https://a.example/loop.png") == 6
+    assert proxy.stats()["blocked"] == 2
+
+
+@pytest.mark.asyncio
+async def test_connects_to_the_address_that_was_checked(make_proxy, picture):
+    answers = iter([[PUBLIC], ["10.0.0.1"]])
+
+    async def rebinding(host, port):
+        # A second lookup would hand out a private address
+        return next(answers)
+
+    proxy, server = make_proxy({"https://a.example/x.png": httpx.Response(200, content=picture())}, resolver=rebinding)
+
+    assert len(await proxy.process([item("https://a.example/x.png")])) == 1
+    assert server.connections == [PUBLIC]
+    assert server.extensions[0]["sni_hostname"] == "a.example"
+
+
+@pytest.mark.asyncio
+async def test_pins_ipv6_addresses_and_keeps_the_port(make_proxy, picture, public_resolver):
+    proxy, server = make_proxy(
+        {"http://v6.example:8080/x.png": httpx.Response(200, content=picture())},
+        resolver=public_resolver({"v6.example": ["2606:4700::1111"]}),
+    )
+
+    assert len(await proxy.process([item("http://v6.example:8080/x.png")])) == 1
+    assert server.connections == ["2606:4700::1111"]
+    assert "sni_hostname" not in server.extensions[0]
+
+
+@pytest.mark.asyncio
+async def test_unresolvable_hosts_are_refused(make_proxy, picture):
+    async def failing(host, port):
+        raise OSError("name does not resolve")
+
+    proxy, server = make_proxy({"https://a.example/x.png": httpx.Response(200, content=picture())}, resolver=failing)
+    assert await proxy.process([item("https://a.example/x.png")]) == []
+    assert server.requests == []
+
+
+@pytest.mark.asyncio
+async def test_default_resolver_sees_loopback():
+    assert not any(is_public_address(address) for address in await resolve_host("localhost", 80))
+
+
+@pytest.mark.integration
+def test_images_route_serves_cached_variants(api_client, monkeypatch, tmp_path, picture):
+    from motion.tools import image_proxy
+
+    proxy = ImageProxy(tmp_path / "served")
+    monkeypatch.setattr(image_proxy, "_image_proxy", proxy)
+    path = proxy.path_for("a" * 64, "thumb")
+    path.parent.mkdir(parents=True)
+    path.write_bytes(picture(fmt="JPEG"))
+
+    response = api_client.get(f"/images/{'a' * 64}/thumb")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    assert api_client.get(f"/images/{'b' * 64}/thumb").status_code == 404
+    assert api_client.get(f"/images/{'a' * 64}/original").status_code == 404
+    proxy.close()
+
+
+@pytest.mark.unit
+def test_get_image_proxy_is_configured_from_the_environment(monkeypatch, tmp_path):
+    from motion.tools import image_proxy
+
+    monkeypatch.setattr(image_proxy, "_image_proxy", None)
+    monkeypatch.setenv("MOTION_CACHE_DIR", str(tmp_path))
+    monkeypatch.setenv("MOTION_IMAGE_THUMBNAIL_SIZE", "128")
+
+    proxy = image_proxy.get_image_proxy()
+
+    assert image_proxy.get_image_proxy() is proxy
+    assert proxy.cache_dir == tmp_path / "images"
+    assert proxy.thumbnail_size == 128
+    proxy.close()
+
+
+@pytest.mark.asyncio
+async def test_allowed_hosts_are_exempt(make_proxy, picture):
+    async def loopback(host, port):
+        return ["127.0.0.1"]
+
+    proxy, server = make_proxy(
+        {"http://127.0.0.1:8001/x.png": httpx.Response(200, content=picture())},
+        resolver=loopback,
+        allowed_hosts=frozenset({"127.0.0.1"}),
+    )
+    assert len(await proxy.process([item("http://127.0.0.1:8001/x.png")])) == 1
+    assert proxy.stats()["blocked"] == 0
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_illustration_search_keeps_only_live_images(make_proxy, picture, monkeypatch):
+    from motion.tools import exercise_illustration_tool as tool
+
+    proxy, _ = make_proxy({
+        "https://a.example/bridge.png": httpx.Response(200, content=picture()),
+        "https://a.example/gone.png": httpx.Response(404),
+    })
+
+    async def find_illustrations(exercise_name):
+        return {"results": [item("https://a.example/gone.png"), item("https://a.example/bridge.png")]}
+
+    monkeypatch.setattr(tool, "IMAGE_PROXY_ENABLED", True)
+    monkeypatch.setattr(tool, "get_image_proxy", lambda: proxy)
+    monkeypatch.setattr(tool, "_find_illustrations", find_illustrations)
+
+    result = await tool.search_exercise_illustrations("Bridge")
+
+    assert [r["url"] for r in result["results"]] == ["https://a.example/bridge.png"]
@@ -0,0 +1,546 @@
+"""Tests for the shared Linkup client, using httpx.MockTransport as the API."""
+
+import asyncio
+import json
+import threading
+import time
+from pathlib import Path
+
+import httpx
+import pytest
+
+from motion.tools import exercise_illustration_tool as tool
+from motion.tools import linkup_client
+from motion.tools.exercise_catalog import ExerciseCatalog
+from motion.tools.illustration_cache import IllustrationCache
+from motion.tools.linkup_client import (
+    CircuitBreaker,
+    CircuitOpenError,
+    LinkupSearchError,
+    LinkupTimeoutError,
+    SharedLinkupClient,
+)
+
+
+FIXTURES = Path(__file__).parent / "fixtures"
+
+
+class FakeLinkup:
+    """Scripted stand-in for the Linkup /search endpoint."""
+
+    def __init__(self):
+        self.requests = []
+        self.responses = []
+
+    def respond(self, *responses):
+        self.responses.extend(responses)
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.responses.pop(0) if self.responses else {"results": []}
+        if callable(response):
+            response = await response(request)
+        if isinstance(response, httpx.Response):
+            return response
+        return httpx.Response(200, json=response)
+
+
+@pytest.fixture
+def linkup():
+    return FakeLinkup()
+
+
+@pytest.fixture
+def make_client(linkup):
+    clients = []
+
+    def make(**attributes):
+        client = SharedLinkupClient(
+            base_url="https://linkup.test/v1/", transport=httpx.MockTransport(linkup.handler)
+        )
+        client.hedge_enabled = False
+        client.retries = 0
+        for name, value in attributes.items():
+            setattr(client, name, value)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_search_posts_params_with_bearer_token(make_client, linkup):
+    linkup.respond({"results": [{"type": "image", "name": "Bridge", "url": "https://example.com/b.jpg"}]})
+    client = make_client()
+
+    response = await client.search("secret", q="bridge", depth="standard")
+
+    assert response["results"][0]["name"] == "Bridge"
+    request = linkup.requests[0]
+    assert str(request.url) == "https://linkup.test/v1/search"
+    assert request.headers["Authorization"] == "Bearer secret"
+    assert json.loads(request.content) == {"q": "bridge", "depth": "standard"}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_illustration_search_matches_the_linkup_wire_format(linkup, monkeypatch):
+    # Pins what linkup-sdk 0.2.8 sent for LinkupClient.search(query=..., depth="standard",
+    # output_type="structured", structured_output_schema=<JSON string>, include_images=True)
+    # and how it handed back a structured response: the JSON body as-is
+    linkup.respond(json.loads((FIXTURES / "linkup_structured_search.json").read_text()))
+    client = SharedLinkupClient(transport=httpx.MockTransport(linkup.handler))
+    monkeypatch.setattr(tool, "get_linkup_client", lambda: client)
+    try:
+        result = await tool._search_linkup("secret", "Glute bridge")
+    finally:
+        client.close()
+
+    request = linkup.requests[0]
+    assert request.method == "POST"
+    assert str(request.url) == "https://api.linkup.so/v1/search"
+    assert request.headers["Authorization"] == "Bearer secret"
+    assert request.headers["Content-Type"] == "application/json"
+    body = json.loads(request.content)
+    assert body == {
+        "q": "Return me actual illustration images for the following physiotherapy exercise - Glute bridge",
+        "depth": "standard",
+        "outputType": "structured",
+        "structuredOutputSchema": body["structuredOutputSchema"],
+        "includeImages": True,
+    }
+    # The schema travels as a JSON string, not a nested object
+    assert json.loads(body["structuredOutputSchema"]) == tool.LINKUP_IMAGE_SEARCH_SCHEMA
+    assert [item["type"] for item in result["results"]] == ["image", "image"]
+    assert result["results"][0]["url"].endswith("300px-glute-bridge.jpg")
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_linkup_error_bodies_become_tool_errors(make_client, linkup, monkeypatch):
+    linkup.respond(httpx.Response(401, content=(FIXTURES / "linkup_error.json").read_bytes()))
+    client = make_client()
+    monkeypatch.setattr(tool, "get_linkup_client", lambda: client)
+
+    result = await tool._search_linkup("wrong", "Glute bridge")
+
+    assert result["results"] == []
+    assert "Linkup API returned 401" in result["error"]
+    assert "UNAUTHORIZED" in result["error"]
+
+
+@pytest.mark.unit
+def test_one_pool_is_shared_across_loops_and_threads(make_client, linkup):
+    client = make_client()
+    assert not client.started
+
+    asyncio.run(client.search("key", q="one"))
+    pool = client._http
+    asyncio.run(client.search("key", q="two"))
+
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(client.run_sync(client.search("key", q="three"), timeout=5))
+    )
+    thread.start()
+    thread.join(5)
+
+    assert client.started
+    assert client._http is pool
+    assert results == [{"results": []}]
+    assert len(linkup.requests) == 3
+    assert client.stats()["searches"] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_client_errors_are_raised_and_not_retried(make_client, linkup):
+    linkup.respond(httpx.Response(401, text="bad key"))
+    client = make_client(retries=3)
+
+    with pytest.raises(LinkupSearchError) as raised:
+        await client.search("wrong", q="bridge")
+
+    assert raised.value.status_code == 401
+    assert not raised.value.transient
+    assert len(linkup.requests) == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_invalid_json_is_a_search_error(make_client, linkup):
+    linkup.respond(httpx.Response(200, text="<html>"))
+    client = make_client()
+
+    with pytest.raises(LinkupSearchError, match="invalid JSON"):
+        await client.search("key", q="bridge")
+
+
+@pytest.mark.unit
+def test_close_stops_the_background_loop(make_client):
+    client = make_client()
+    client.run_sync(asyncio.sleep(0))
+    thread = client._thread
+
+    client.close()
+
+    assert not client.started
+    assert not thread.is_alive()
+    client.close()
+
+
+@pytest.mark.unit
+def test_process_wide_client_is_created_once(monkeypatch):
+    monkeypatch.setattr(linkup_client, "_client", None)
+    client = linkup_client.get_linkup_client()
+    assert linkup_client.get_linkup_client() is client
+
+    client.run_sync(asyncio.sleep(0))
+    linkup_client.close_linkup_client()
+    assert not client.started
+    assert linkup_client._client is None
+    linkup_client.close_linkup_client()
+
+
+@pytest.mark.unit
+def test_agent_tools_keep_their_published_names():
+    from google.adk.tools import FunctionTool
+
+    from motion.tools.exercise_illustration_tool import (
+        search_exercise_illustrations,
+        search_exercise_illustrations_batch,
+    )
+
+    assert FunctionTool(search_exercise_illustrations).name == "search_exercise_illustrations"
+    assert FunctionTool(search_exercise_illustrations_batch).name == "search_exercise_illustrations_batch"
+
+
+@pytest.mark.unit
+def test_sync_wrapper_runs_the_async_tool(mock_linkup_client, monkeypatch):
+    from motion.tools import exercise_illustration_tool as tool
+
+    async def search(name):
+        return {"exercise_name": name, "results": []}
+
+    monkeypatch.setattr(tool, "search_exercise_illustrations", search)
+    assert tool.search_exercise_illustrations_sync("Bridge") == {"exercise_name": "Bridge", "results": []}
+
+
+def slow(seconds, body=None):
+    async def respond(request):
+        await asyncio.sleep(seconds)
+        return body or {"results": [{"name": "slow"}]}
+
+    return respond
+
+
+async def transport_timeout(request):
+    raise httpx.ReadTimeout("read timed out", request=request)
+
+
+@pytest.fixture
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(linkup_client, "LINKUP_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(linkup_client, "LINKUP_BACKOFF_MAX", 0.001)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_after_the_delay(make_client, linkup, monkeypatch):
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_DELAY", 0.05)
+    linkup.respond(slow(2), {"results": [{"name": "hedge"}]})
+    client = make_client(hedge_enabled=True)
+
+    started = time.monotonic()
+    response = await client.search("key", q="bridge")
+
+    assert response == {"results": [{"name": "hedge"}]}
+    assert time.monotonic() - started < 1
+    assert len(linkup.requests) == 2
+    stats = client.stats()
+    assert (stats["hedges"], stats["hedge_wins"], stats["requests"]) == (1, 1, 2)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "outcomes,expected",
+    [
+        ([(0.1, {"results": [{"name": "primary"}]}), (2, {"results": []})], {"results": [{"name": "primary"}]}),
+        ([(0.1, LinkupSearchError("primary", 400)), (0, LinkupSearchError("hedge", 401))], 401),
+    ],
+    ids=["primary-wins-late", "both-fail"],
+)
+async def test_hedged_requests_return_the_first_success_or_the_first_error(
+    make_client, monkeypatch, outcomes, expected
+):
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_DELAY", 0.05)
+    client = make_client(hedge_enabled=True)
+
+    async def timed_post(api_key, params):
+        delay, outcome = outcomes.pop(0)
+        await asyncio.sleep(delay)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client, "_timed_post", timed_post)
+
+    if isinstance(expected, int):
+        with pytest.raises(LinkupSearchError) as raised:
+            await client.search("key", q="bridge")
+        assert raised.value.status_code == expected
+    else:
+        assert await client.search("key", q="bridge") == expected
+    assert (client.stats()["hedges"], client.stats()["hedge_wins"]) == (1, 0)
+
+
+@pytest.mark.unit
+def test_hedge_delay_follows_recent_latency(make_client, monkeypatch):
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_DELAY", 3.0)
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_MIN_DELAY", 0.25)
+    client = make_client()
+    assert client._hedge_delay() == 3.0
+
+    for i in range(100):
+        client.latencies.add(i / 100)
+    assert client._hedge_delay() == 0.95
+    client.latencies = linkup_client.LatencyTracker()
+    for _ in range(20):
+        client.latencies.add(0.01)
+    assert client._hedge_delay() == 0.25
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_fast_requests_are_not_hedged_and_hedges_are_capped(make_client, linkup, monkeypatch):
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_DELAY", 0.05)
+    monkeypatch.setattr(linkup_client, "LINKUP_HEDGE_MAX_RATIO", 0.1)
+    client = make_client(hedge_enabled=True)
+
+    await client.search("key", q="fast")
+    assert client.stats()["hedges"] == 0
+
+    linkup.respond(slow(0.2), {"results": []}, slow(0.2))
+    await client.search("key", q="slow")
+    # The hedge budget (10% of requests) is spent: the next slow search waits it out
+    await client.search("key", q="slow again")
+    assert client.stats()["hedges"] == 1
+    assert len(linkup.requests) == 4
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_server_errors_are_retried(make_client, linkup, fast_backoff):
+    linkup.respond(httpx.Response(503, text="busy"), httpx.Response(502), {"results": [{"name": "ok"}]})
+    client = make_client(retries=2)
+
+    assert await client.search("key", q="bridge") == {"results": [{"name": "ok"}]}
+    stats = client.stats()
+    assert (stats["retries"], stats["failures"], stats["requests"]) == (2, 2, 3)
+    assert client.breaker.failures == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_transport_timeouts_are_retried(make_client, linkup, fast_backoff):
+    linkup.respond(transport_timeout, {"results": []})
+    client = make_client(retries=1)
+
+    assert await client.search("key", q="bridge") == {"results": []}
+    assert client.stats()["retries"] == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_exhausted_retries_raise_and_count_against_the_breaker(make_client, linkup, fast_backoff):
+    linkup.respond(*[httpx.Response(500)] * 3)
+    client = make_client(retries=2)
+
+    with pytest.raises(LinkupSearchError) as raised:
+        await client.search("key", q="bridge")
+    assert raised.value.status_code == 500
+    assert len(linkup.requests) == 3
+    assert client.breaker.failures == 1
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_breaker_opens_then_half_opens_for_one_probe(make_client, linkup):
+    client = make_client(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=0.2))
+    linkup.respond(httpx.Response(503), httpx.Response(503))
+    for _ in range(2):
+        with pytest.raises(LinkupSearchError):
+            await client.search("key", q="bridge")
+    assert client.stats()["breaker_state"] == CircuitBreaker.OPEN
+
+    # Open: fails fast without reaching Linkup
+    with pytest.raises(CircuitOpenError):
+        await client.search("key", q="bridge")
+    assert len(linkup.requests) == 2
+    assert client.stats()["short_circuited"] == 1
+
+    # Half-open after the reset timeout: a failed probe reopens at once
+    await asyncio.sleep(0.25)
+    linkup.respond(httpx.Response(503))
+    with pytest.raises(LinkupSearchError):
+        await client.search("key", q="probe")
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert client.breaker.opens == 2
+
+    # The next probe succeeds and closes the circuit
+    await asyncio.sleep(0.25)
+    assert await client.search("key", q="probe") == {"results": []}
+    assert client.breaker.state == CircuitBreaker.CLOSED
+    assert await client.search("key", q="after") == {"results": []}
+
+
+@pytest.mark.unit
+def test_half_open_breaker_lets_one_probe_through_at_a_time():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    # A probe that never reports back is replaced after the reset timeout
+    time.sleep(0.06)
+    assert breaker.allow()
+
+
+@pytest.mark.unit
+def test_failures_while_open_do_not_reopen_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    # e.g. a request that was already running when the breaker opened
+    breaker.record_failure()
+    assert (breaker.state, breaker.opens, breaker.failures) == (CircuitBreaker.OPEN, 1, 2)
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_deadline_bounds_the_whole_search(make_client, linkup, fast_backoff):
+    linkup.respond(httpx.Response(503), slow(5))
+    client = make_client(deadline=0.3, retries=3)
+
+    started = time.monotonic()
+    with pytest.raises(LinkupTimeoutError):
+        await client.search("key", q="bridge")
+
+    assert time.monotonic() - started < 1
+    assert client.stats()["timeouts"] == 1
+    assert client.breaker.failures == 1
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_failing_linkup_falls_back_to_the_catalog(make_client, linkup, monkeypatch, tmp_path):
+    catalog = ExerciseCatalog([{
+        "name": "Glute bridge",
+        "aliases": ["bridge"],
+        "images": [{"name": "Glute bridge", "url": "https://catalog.example/bridge.png"}],
+    }])
+    cache = IllustrationCache(db_path=tmp_path / "illustrations.sqlite3")
+    client = make_client(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    monkeypatch.setenv("LINKUP_API_KEY", "key")
+    monkeypatch.setattr(tool, "IMAGE_PROXY_ENABLED", False)
+    monkeypatch.setattr(tool, "get_linkup_client", lambda: client)
+    monkeypatch.setattr(tool, "get_illustration_cache", lambda: cache)
+    monkeypatch.setattr(tool, "get_illustration_catalog", lambda: catalog)
+    linkup.respond(httpx.Response(503))
+
+    # Too loose a match (0.74) to answer while Linkup is up, close enough when it is down
+    assert catalog.lookup("Glute bridge hold") is None
+    degraded = await tool.search_exercise_illustrations("Glute bridge hold")
+    assert degraded["degraded"] is True
+    assert degraded["results"][0]["url"] == "https://catalog.example/bridge.png"
+    assert cache.get("Glute bridge hold") is None
+
+    # With the breaker open Linkup is skipped entirely; the catalog still answers
+    again = await tool.search_exercise_illustrations("Glute bridge hold")
+    assert again["degraded"] is True
+    assert len(linkup.requests) == 1
+
+    unknown = await tool.search_exercise_illustrations("Nordic hamstring curl")
+    assert unknown["unavailable"] is True and unknown["results"] == []
+    cache.close()
+
+
+@pytest.fixture
+def illustration_search(make_client, linkup, monkeypatch, tmp_path):
+    """Point the illustration tool at a scripted Linkup, a fresh cache and an optional catalog."""
+
+    def wire(catalog=None, **cache_options):
+        cache = IllustrationCache(db_path=tmp_path / "illustrations.sqlite3", **cache_options)
+        client = make_client()
+        monkeypatch.setenv("LINKUP_API_KEY", "key")
+        monkeypatch.setattr(tool, "IMAGE_PROXY_ENABLED", False)
+        monkeypatch.setattr(tool, "get_linkup_client", lambda: client)
+        monkeypatch.setattr(tool, "get_illustration_cache", lambda: cache)
+        monkeypatch.setattr(tool, "get_illustration_catalog", lambda: catalog)
+        return cache
+
+    return wire
+
+
+BRIDGE_IMAGES = {"results": [{"type": "image", "name": "Glute bridge", "url": "https://example.com/bridge.jpg"}]}
+
+
+@pytest.mark.integration
+@pytest.mark.asyncio
+async def test_illustration_search_answers_from_the_catalog_then_the_cache_then_linkup(
+    illustration_search, linkup, monkeypatch
+):
+    catalog = ExerciseCatalog([
+        {"name": "Side plank", "images": [{"name": "Side plank", "url": "https://catalog.example/plank.png"}]},
+    ])
+    cache = illustration_search(catalog)
+    linkup.respond(BRIDGE_IMAGES, httpx.Response(400, json={"error": {"message": "Bad query"}}))
+
+    assert (await tool.search_exercise_illustrations("Side plank"))["source"] == "catalog"
+    first = await tool.search_exercise_illustrations("Glute bridge")
+    again = await tool.search_exercise_illustrations("glute bridge")
+    assert first["results"] == again["results"] == BRIDGE_IMAGES["results"]
+    assert again["exercise_name"] == "glute bridge"
+    assert len(linkup.requests) == 1
+
+    # Errors that are not outages are cached for the short negative TTL
+    failed = await tool.search_exercise_illustrations("Nordic curl")
+    assert "Linkup API returned 400" in failed["error"]
+    assert cache.get("Nordic curl")["error"] == failed["error"]
+    assert len(linkup.requests) == 2
+
+    monkeypatch.delenv("LINKUP_API_KEY")
+    unconfigured = await tool.search_exercise_illustrations("Dead bug")
+    assert unconfigured["error"] == "LINKUP_API_KEY environment variable is not set"
+    cache.close()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_failed_searches_fall_back_and_only_outages_skip_the_cache(illustration_search, monkeypatch):
+    # Search results handed over directly: on Python 3.11 coverage loses track of
+    # a coroutine once a failed future is thrown into the chain that awaits it
+    results = {
+        "Glute bridge": {"error": "Bad gateway", "results": []},
+        "Nordic curl": {"error": "Bad query", "results": []},
+        "Dead bug": {"error": "Illustration search is temporarily unavailable", "unavailable": True, "results": []},
+    }
+
+    async def search_linkup(api_key, exercise_name):
+        return {"exercise_name": exercise_name, **results[exercise_name]}
+
+    monkeypatch.setattr(tool, "_search_linkup", search_linkup)
+    cache = illustration_search(ttl_seconds=0)
+    cache.put("Glute bridge", {"exercise_name": "Glute bridge", **BRIDGE_IMAGES})
+
+    assert (await tool.search_exercise_illustrations("Glute bridge"))["degraded"] is True
+    assert (await tool.search_exercise_illustrations("Nordic curl"))["error"] == "Bad query"
+    assert (await tool.search_exercise_illustrations("Dead bug"))["unavailable"] is True
+    assert cache.get("Nordic curl")["error"] == "Bad query"
+    assert cache.get("Dead bug") is None
+    cache.close()
@@ -0,0 +1,155 @@
+"""Tests for extraction, repair and validation of agent replies."""
+
+import json
+
+import pytest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from motion.agents.soap_agents.output_parser import (
+    MessageValidationError,
+    canonicalize_model_response,
+    extract_json_object,
+    parse_agent_reply,
+    validate_message,
+)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "text",
+    [
+        '{"type": "chat_message", "content": "hi"}',
+        'Sure! ```json\n{"type": "chat_message", "content": "hi"}\n``` Let me know.',
+        'Here you go: {"type": "chat_message", "content": "hi",} Anything else?',
+        '{not json} then {"type": "chat_message", "content": "hi"}',
+    ],
+)
+def test_extract_json_object(text):
+    assert extract_json_object(text) == {"type": "chat_message", "content": "hi"}
+
+
+@pytest.mark.unit
+def test_extract_json_object_without_object():
+    assert extract_json_object("Hold the stretch for 30 seconds.") is None
+    assert extract_json_object("[1, 2, 3]") is None
+
+
+@pytest.mark.unit
+def test_validate_message_repairs_and_canonicalizes(soap_draft_json):
+    repairs = []
+    message = json.loads(soap_draft_json)
+    del message["type"]
+    del message["timestamp"]
+    message["soap_report"]["patient_age"] = 45
+    message["soap_report"]["mood"] = "good"
+    message["soap_report"]["exercises"].append({"name": "Bridge"})
+
+    canonical = validate_message(message, repairs)
+
+    assert list(canonical)[:2] == ["type", "timestamp"]
+    assert canonical["type"] == "soap_draft"
+    report = canonical["soap_report"]
+    assert report["patient_age"] == "45"
+    assert "mood" not in report
+    assert report["exercises"][1] == {"name": "Bridge", "description": ""}
+    assert "inferred type soap_draft" in repairs
+    assert "added timestamp" in repairs
+    assert "coerced soap_draft.soap_report.patient_age to string" in repairs
+    assert "dropped soap_draft.soap_report.mood" in repairs
+    assert "defaulted soap_draft.soap_report.exercises[1].description" in repairs
+
+
+@pytest.mark.unit
+def test_validate_message_coerces_booleans(exercise_selection_json):
+    message = json.loads(exercise_selection_json)
+    message["requires_selection"] = "false"
+    message["exercises"][0]["images"][0]["selected"] = "TRUE"
+
+    canonical = validate_message(message)
+
+    assert canonical["requires_selection"] is False
+    assert canonical["exercises"][0]["images"][0]["selected"] is True
+    assert canonical["exercises"][0]["images"][0]["thumbnail_url"] is None
+
+
+@pytest.mark.unit
+def test_validate_message_keeps_valid_values_and_defaults_optional_arrays():
+    repairs = []
+    message = {"type": "final_report", "timestamp": "t", "soap_report": {}, "ready_for_pdf": False}
+
+    canonical = validate_message(message, repairs)
+
+    assert canonical["ready_for_pdf"] is False
+    assert canonical["selected_images"] == []
+    assert validate_message({"type": "exercise_selection", "exercises": []})["requires_selection"] is True
+    assert canonical["soap_report"]["exercises"] == []
+    assert not any("ready_for_pdf" in repair for repair in repairs)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "message, error",
+    [
+        ({"foo": 1}, "message has no type"),
+        ({"type": "poem"}, "unknown message type"),
+        ({"type": "chat_message"}, "chat_message.content is required"),
+        ({"type": "chat_message", "content": ["a"]}, "must be a string"),
+        ({"type": "clarification_needed", "questions": "why?"}, "must be an array"),
+        ({"type": "soap_draft", "soap_report": "text"}, "must be an object"),
+        ({"type": "exercise_selection", "exercises": [], "requires_selection": "maybe"}, "must be a boolean"),
+        ({"type": "exercise_selection"}, "exercise_selection.exercises is required"),
+    ],
+)
+def test_validate_message_rejects_unrepairable_messages(message, error):
+    with pytest.raises(MessageValidationError, match=error):
+        validate_message(message)
+
+
+@pytest.mark.unit
+def test_parse_agent_reply():
+    assert parse_agent_reply("  Plain answer.  ")["content"] == "Plain answer."
+    assert parse_agent_reply('{"type": "chat_message", "content": "hi"}')["content"] == "hi"
+    broken = parse_agent_reply('{"type": "soap_draft"}')
+    assert broken["type"] == "error"
+    assert "soap_report is required" in broken["details"]
+
+
+def response(*parts, partial=False):
+    return LlmResponse(content=types.Content(role="model", parts=list(parts)), partial=partial)
+
+
+@pytest.mark.unit
+def test_canonicalize_rewrites_final_text_in_place():
+    reply = response(types.Part(text='```json\n{"content": "Hold for'), types.Part(text=' 30 s",}\n```'))
+    assert canonicalize_model_response(None, reply) is None
+
+    assert len(reply.content.parts) == 1
+    message = json.loads(reply.content.parts[0].text)
+    assert message["type"] == "chat_message"
+    assert message["content"] == "Hold for 30 s"
+
+    canonical = '{"type":"chat_message","timestamp":"t","content":"hi"}'
+    valid = response(types.Part(text=canonical))
+    canonicalize_model_response(None, valid)
+    assert valid.content.parts[0].text == canonical
+
+    plain = response(types.Part(text="Just text"))
+    canonicalize_model_response(None, plain)
+    assert json.loads(plain.content.parts[0].text)["content"] == "Just text"
+
+
+@pytest.mark.unit
+def test_canonicalize_leaves_partials_tool_calls_and_invalid_json_alone():
+    partial = response(types.Part(text='{"type": "chat'), partial=True)
+    tool_call = response(
+        types.Part(text="Searching"),
+        types.Part(function_call=types.FunctionCall(name="search_exercise_illustrations", args={})),
+    )
+    invalid = response(types.Part(text='{"type": "soap_draft"}'))
+    empty = LlmResponse()
+
+    for llm_response in (partial, tool_call, invalid, empty):
+        before = llm_response.model_dump()
+        canonicalize_model_response(None, llm_response)
+        assert llm_response.model_dump() == before
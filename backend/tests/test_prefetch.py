@@ -0,0 +1,114 @@
+"""Tests for speculative illustration prefetch during draft generation."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmResponse
+from google.genai import types
+
+from motion.agents.soap_agents import prefetch
+from motion.agents.soap_agents.prefetch import prefetch_exercise, prefetch_illustrations
+from motion.tools import exercise_illustration_tool
+
+
+@pytest.fixture
+def searches(monkeypatch):
+    """Records the exercises the background lookups were started for."""
+    started = []
+
+    async def search(exercise_name):
+        started.append(exercise_name)
+        if exercise_name == "Explodes":
+            raise RuntimeError("upstream down")
+        return {"exercise_name": exercise_name, "results": []}
+
+    monkeypatch.setattr(exercise_illustration_tool, "search_exercise_illustrations", search)
+    monkeypatch.setattr(prefetch, "_watchers", type(prefetch._watchers)())
+    return started
+
+
+def response(text, partial=False):
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), partial=partial)
+
+
+def draft(*names, message_type="soap_draft"):
+    return json.dumps({
+        "type": message_type,
+        "soap_report": {"exercises": [{"name": name, "sets": 3} for name in names]},
+    })
+
+
+async def settle():
+    while prefetch._tasks:
+        await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_streamed_draft_prefetches_each_exercise_as_it_completes(searches):
+    context = SimpleNamespace(invocation_id="inv-1")
+    text = draft("Bridge", "Clamshell")
+    cut = text.index("Clamshell") + 4
+
+    prefetch_illustrations(context, response(text[:cut], partial=True))
+    await settle()
+    assert searches == ["Bridge"]
+
+    prefetch_illustrations(context, response(text[cut:], partial=True))
+    await settle()
+    assert searches == ["Bridge", "Clamshell"]
+
+    # The final aggregated response does not start the same lookups again
+    prefetch_illustrations(context, response(text))
+    await settle()
+    assert searches == ["Bridge", "Clamshell"]
+    assert "inv-1" not in prefetch._watchers
+
+
+@pytest.mark.asyncio
+async def test_final_response_prefetches_distinct_names(searches):
+    prefetch_illustrations(SimpleNamespace(invocation_id="inv-2"), response(draft("Bridge", "bridge!", "Squat")))
+    await settle()
+    assert searches == ["Bridge", "Squat"]
+
+
+@pytest.mark.asyncio
+async def test_other_message_types_are_ignored(searches):
+    context = SimpleNamespace(invocation_id="inv-3")
+    prefetch_illustrations(context, response(draft("Bridge", message_type="chat_message")))
+    prefetch_illustrations(context, response(""))
+    prefetch_illustrations(context, LlmResponse())
+    await settle()
+    assert searches == []
+
+
+@pytest.mark.asyncio
+async def test_prefetch_exercise_limits_and_skips_blank_names(searches):
+    prefetched = set()
+    assert prefetch_exercise("Bridge", prefetched, limit=2)
+    assert not prefetch_exercise("BRIDGE", prefetched, limit=2)
+    assert not prefetch_exercise("  ", prefetched, limit=2)
+    assert not prefetch_exercise(None, prefetched, limit=2)
+    assert prefetch_exercise("Explodes", prefetched, limit=2)
+    assert not prefetch_exercise("Squat", prefetched, limit=2)
+    await settle()
+    # A failed prefetch is swallowed; the agent's own call will retry
+    assert searches == ["Bridge", "Explodes"]
+
+
+@pytest.mark.asyncio
+async def test_disabled_prefetch_starts_nothing(searches, monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_ENABLED", False)
+    prefetch_illustrations(SimpleNamespace(invocation_id="inv-4"), response(draft("Bridge")))
+    assert not prefetch_exercise("Bridge", set())
+    await settle()
+    assert searches == []
+
+
+@pytest.mark.asyncio
+async def test_abandoned_streams_are_bounded(searches, monkeypatch):
+    monkeypatch.setattr(prefetch, "_MAX_TRACKED_STREAMS", 2)
+    for i in range(4):
+        prefetch_illustrations(SimpleNamespace(invocation_id=f"inv-{i}"), response('{"type": "soap', partial=True))
+    assert list(prefetch._watchers) == ["inv-2", "inv-3"]
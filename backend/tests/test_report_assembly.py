@@ -0,0 +1,123 @@
+"""Tests for server-side assembly of the final report."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from motion.agents.soap_agents.report_assembly import (
+    LAST_EXERCISE_SELECTION_KEY,
+    LAST_SOAP_DRAFT_KEY,
+    answer_image_selection,
+    assemble_final_report,
+    parse_image_selection,
+    remember_structured_reply,
+)
+
+
+def selection_text(*ids):
+    return json.dumps({"message_type": "image_selection", "selected_image_ids": list(ids)})
+
+
+def context(state=None, text=None):
+    user_content = types.Content(role="user", parts=[types.Part(text=text)]) if text is not None else None
+    return SimpleNamespace(state=dict(state or {}), user_content=user_content)
+
+
+def reply(message, partial=False):
+    text = message if isinstance(message, str) else json.dumps(message)
+    return LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]), partial=partial)
+
+
+@pytest.fixture
+def selection(exercise_selection_json):
+    exercises = json.loads(exercise_selection_json)["exercises"]
+    exercises.append({
+        "id": "exercise_2",
+        "name": "Glute bridge",
+        "images": [
+            {"id": "img_bridge_0", "url": "https://example.com/bridge-0.jpg"},
+            {"id": "img_bridge_1", "url": "https://example.com/bridge-1.jpg"},
+        ],
+    })
+    return exercises
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        (selection_text("a", "b"), ["a", "b"]),
+        ('  {"message_type": "image_selection", "selected_image_ids": [1]}', ["1"]),
+        ("Please pick the first image", None),
+        ("{broken", None),
+        ('{"message_type": "chat", "selected_image_ids": []}', None),
+        ('{"message_type": "image_selection", "selected_image_ids": "a"}', None),
+        ("[1]", None),
+    ],
+)
+def test_parse_image_selection(text, expected):
+    assert parse_image_selection(text) == expected
+
+
+@pytest.mark.unit
+def test_assemble_matches_exercises_by_name_then_position(sample_patient_session, selection):
+    report = dict(sample_patient_session)
+    final = json.loads(assemble_final_report(report, selection, ["img_cat_cow_0", "img_bridge_1", "img_bridge_0"]))
+
+    assert final["type"] == "final_report"
+    assert final["selected_images"] == ["img_cat_cow_0", "img_bridge_1", "img_bridge_0"]
+    exercises = final["soap_report"]["exercises"]
+    # "Cat-cow exercises" matches by name, "Bridge exercises" falls back to position
+    assert exercises[0]["selected_image"] == "https://example.com/cat-cow-1.jpg"
+    assert exercises[1]["selected_image"] == "https://example.com/bridge-0.jpg"
+    assert final["soap_report"]["subjective"] == report["subjective"]
+
+
+@pytest.mark.unit
+def test_assemble_leaves_unselected_exercises_without_image(sample_patient_session, selection):
+    final = json.loads(assemble_final_report(sample_patient_session, selection, []))
+    assert [e["selected_image"] for e in final["soap_report"]["exercises"]] == [None, None]
+
+
+@pytest.mark.unit
+def test_remember_structured_reply_tracks_latest_draft_and_selection(soap_draft_json, exercise_selection_json):
+    ctx = context({LAST_EXERCISE_SELECTION_KEY: ["stale"]})
+
+    remember_structured_reply(ctx, reply(soap_draft_json))
+    assert ctx.state[LAST_SOAP_DRAFT_KEY]["patient_name"] == "John Doe"
+    assert ctx.state[LAST_EXERCISE_SELECTION_KEY] is None
+
+    remember_structured_reply(ctx, reply(exercise_selection_json))
+    assert ctx.state[LAST_EXERCISE_SELECTION_KEY][0]["id"] == "exercise_1"
+
+    before = dict(ctx.state)
+    for ignored in (reply(soap_draft_json, partial=True), reply("plain text"), reply("{bad json"), reply({"type": "chat_message", "content": "hi"}), LlmResponse()):
+        remember_structured_reply(ctx, ignored)
+    assert ctx.state == before
+
+    remember_structured_reply(ctx, reply({"type": "final_report", "soap_report": {}}))
+    assert ctx.state == {LAST_SOAP_DRAFT_KEY: None, LAST_EXERCISE_SELECTION_KEY: None}
+
+
+@pytest.mark.unit
+def test_answer_image_selection_builds_the_report_without_the_model(sample_patient_session, selection):
+    state = {LAST_SOAP_DRAFT_KEY: sample_patient_session, LAST_EXERCISE_SELECTION_KEY: selection}
+
+    ctx = context(state, selection_text("img_cat_cow_0"))
+    content = answer_image_selection(ctx)
+
+    final = json.loads(content.parts[0].text)
+    assert content.role == "model"
+    assert final["type"] == "final_report"
+    assert final["soap_report"]["exercises"][0]["selected_image"] == "https://example.com/cat-cow-1.jpg"
+    assert ctx.state == {LAST_SOAP_DRAFT_KEY: None, LAST_EXERCISE_SELECTION_KEY: None}
+
+
+@pytest.mark.unit
+def test_answer_image_selection_defers_to_the_model(sample_patient_session):
+    assert answer_image_selection(context({}, "What does SOAP stand for?")) is None
+    assert answer_image_selection(context({LAST_SOAP_DRAFT_KEY: sample_patient_session}, selection_text("x"))) is None
+    assert answer_image_selection(context({})) is None
@@ -0,0 +1,481 @@
+"""Tests for server-side PDF rendering of final reports."""
+
+import asyncio
+import io
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import httpx
+import pytest
+from fontTools.fontBuilder import FontBuilder
+from fontTools.pens.ttGlyphPen import TTGlyphPen
+from pypdf import PdfReader
+
+from motion.api.routes import reports as routes_reports
+from motion.reports import layout, pdf_service
+from motion.reports.layout import (
+    UnsupportedText,
+    render_report,
+    unsupported_characters,
+    unsupported_fields,
+)
+from motion.reports.pdf_service import PdfRenderService
+from motion.tools import image_proxy
+
+
+CACHED = "https://images.example.com/bridge.jpg"
+UNCACHED = "http://169.254.169.254/latest/meta-data/iam.jpg"
+
+
+def report(**fields):
+    return {
+        "patient_name": "Zoë Müller",
+        "session_date": "2024-03-01",
+        "subjective": "Knee pain on stairs, 6/10 → 3/10 after rest.",
+        "objective": "Flexion ≥ 110°, extension −5°.",
+        "assessment": "Patellofemoral pain.",
+        "plan": "Progress loading over 4 weeks.",
+        "exercises": [
+            {"name": "Glute bridge", "description": "3 × 12, hold 2 s", "selected_image": CACHED},
+            {"name": "Wall sit", "description": "", "selected_image": UNCACHED},
+        ],
+        **fields,
+    }
+
+
+def final_report(**fields):
+    return {"type": "final_report", "soap_report": report(**fields), "selected_images": [], "ready_for_pdf": True}
+
+
+def pdf_text(data):
+    return "\n".join(page.extract_text() for page in PdfReader(io.BytesIO(data)).pages)
+
+
+def pdf_fonts(data):
+    """Names of the fonts a document uses."""
+    return {
+        str(font.get_object()["/BaseFont"])
+        for page in PdfReader(io.BytesIO(data)).pages
+        for font in page["/Resources"]["/Font"].values()
+    }
+
+
+def font_with(path, characters):
+    """Write a TrueType font with a square glyph for each of ``characters``."""
+    names = [".notdef"] + [f"uni{ord(character):04X}" for character in characters]
+    pen = TTGlyphPen(None)
+    pen.moveTo((100, 0))
+    pen.lineTo((100, 700))
+    pen.lineTo((900, 700))
+    pen.lineTo((900, 0))
+    pen.closePath()
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(names)
+    builder.setupCharacterMap({ord(character): name for character, name in zip(characters, names[1:], strict=True)})
+    builder.setupGlyf({name: pen.glyph() for name in names})
+    builder.setupHorizontalMetrics(dict.fromkeys(names, (1000, 100)))
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({"familyName": "Squares", "styleName": "Regular"})
+    builder.setupOS2(sTypoAscender=800, usWinAscent=800, usWinDescent=200)
+    builder.setupPost()
+    builder.save(str(path))
+    return str(path)
+
+
+@pytest.fixture
+def fallback_fonts(monkeypatch):
+    """Load the PDF fonts again with ``paths`` as fallback fonts; the fonts loaded before come back afterwards."""
+    def configure(*paths):
+        monkeypatch.setattr(layout, "FALLBACK_FONTS", list(paths))
+        monkeypatch.setattr(layout, "_fonts", None)
+        monkeypatch.setattr(layout, "_compiled", {})
+
+    return configure
+
+
+@pytest.fixture
+def proxy(make_proxy, picture, monkeypatch):
+    """An image proxy with one cached image; it records any request it makes."""
+    proxy, server = make_proxy({CACHED: httpx.Response(200, content=picture(fmt="JPEG"))})
+    monkeypatch.setattr(image_proxy, "_image_proxy", proxy)
+    return proxy, server
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    service = PdfRenderService(workers=0, queue_size=4, spool_dir=tmp_path / "spool")
+    monkeypatch.setattr(pdf_service, "_service", service)
+    return service
+
+
+@pytest.mark.unit
+def test_unsupported_characters_are_those_no_font_has():
+    assert unsupported_characters("Γειά Привет Tiếng Việt → ≥ ≠ −5° ½ ﬁ") == ""
+    assert unsupported_characters("膝 pain → 👍 膝\r\n\tx\x07") == "膝👍"
+
+
+@pytest.mark.unit
+def test_unsupported_fields_name_every_shown_field():
+    text = report(plan="Review in 2 weeks 👍", exercises=[{"name": "Ωmega stretch 🧘", "description": "ok"}])
+    text["patient_age"] = "四十"
+    assert unsupported_fields(text) == {"patient_age": "四十", "plan": "👍", "exercises[0].name": "🧘"}
+    assert unsupported_fields(report()) == {}
+    # Fields the PDF does not show are not checked
+    assert unsupported_fields({**report(), "notes": "👍", "exercises": ["👍", {"selected_image": "👍"}]}) == {}
+
+
+@pytest.mark.unit
+def test_render_refuses_text_it_cannot_show():
+    out = io.BytesIO()
+    with pytest.raises(UnsupportedText) as refused:
+        render_report(report(assessment="PFPS 🦵"), {}, out)
+    assert refused.value.fields == {"assessment": "🦵"}
+    assert "assessment (🦵)" in str(refused.value)
+    assert out.getvalue() == b""
+
+
+@pytest.mark.unit
+def test_render_writes_the_report_text():
+    out = io.BytesIO()
+    result = render_report(report(), {}, out, generated_at="2024-03-01 12:00")
+
+    text = pdf_text(out.getvalue())
+    assert "6/10 → 3/10" in text
+    assert "Flexion ≥ 110°, extension −5°." in text
+    assert "Zoë Müller" in text
+    assert "Generated 2024-03-01 12:00" in text and "Page 1 of 1" in text
+    assert result["images_missing"] == 2
+    assert result["bytes"] == len(out.getvalue())
+    assert PdfReader(io.BytesIO(out.getvalue())).metadata.title == "Zoë Müller - 2024-03-01"
+
+
+@pytest.mark.unit
+def test_greek_cyrillic_and_vietnamese_are_drawn_in_the_bundled_font():
+    out = io.BytesIO()
+    render_report(report(
+        patient_name="Ελένη Παπαδοπούλου",
+        condition="Боль в колене",
+        assessment="Đau khớp gối, cần tăng cường cơ tứ đầu.",
+        exercises=[{"name": "Приседания у стены", "description": "Ημικάθισμα, 3 × 30 s"}],
+    ), {}, out)
+
+    text = pdf_text(out.getvalue())
+    for expected in ("Ελένη Παπαδοπούλου", "Боль в колене", "Đau khớp gối, cần tăng cường cơ tứ đầu.",
+                     "Приседания у стены", "Ημικάθισμα, 3 × 30 s"):
+        assert expected in text
+    assert all("DejaVuSans" in font for font in pdf_fonts(out.getvalue()))
+
+
+@pytest.mark.unit
+def test_characters_the_bundled_font_lacks_come_from_fallback_fonts(tmp_path, fallback_fonts):
+    fallback_fonts(font_with(tmp_path / "squares.ttf", "膝痛四十"))
+    text = report(patient_age="四十", plan="膝痛 → rest")
+    assert unsupported_fields(text) == {}
+    assert unsupported_characters("膝 👍") == "👍"
+
+    out = io.BytesIO()
+    render_report(text, {}, out)
+
+    assert "膝痛 → rest" in pdf_text(out.getvalue())
+    assert any("Squares" in font for font in pdf_fonts(out.getvalue()))
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("template", ["soap", "compact"])
+def test_long_reports_continue_on_numbered_pages(tmp_path, picture, template):
+    photo, drawing, broken = tmp_path / "photo.jpg", tmp_path / "drawing.png", tmp_path / "broken.jpg"
+    photo.write_bytes(picture(size=(800, 600), fmt="JPEG"))
+    drawing.write_bytes(picture(size=(60, 40)))
+    broken.write_bytes(b"\xff\xd8 not really a JPEG")
+    images = {"https://a.example/photo.jpg": str(photo), "https://a.example/drawing.png": str(drawing),
+              "https://a.example/broken.jpg": str(broken), "https://a.example/gone.jpg": str(tmp_path / "gone.jpg")}
+    exercises = [
+        {"name": f"Exercise {index}", "description": "Slow and controlled. " * 8, "selected_image": url}
+        for index, url in enumerate([*images, "https://a.example/uncached.jpg"] * 3)
+    ]
+    exercises.append({"name": "", "description": "Hold, breathe and relax. " * 600, "selected_image": None})
+    out = io.BytesIO()
+
+    result = render_report(
+        report(plan="\n\n".join(["Progress loading over four weeks. " * 30] * 6) + " " + "x" * 400,
+               exercises=exercises),
+        images, out, template=template, generated_at="2024-03-01 12:00",
+    )
+
+    pages = PdfReader(io.BytesIO(out.getvalue())).pages
+    assert result["pages"] == len(pages) > 3
+    assert result["images_embedded"] == 6 and result["images_missing"] == 9
+    assert f"Page 2 of {len(pages)}" in pages[1].extract_text()
+    assert layout.REPORT_TITLE in pages[1].extract_text()
+    # Each file is embedded once, and JPEGs as they are
+    embedded = {
+        name: image.get_object() for page in pages for name, image in page["/Resources"].get("/XObject", {}).items()
+    }
+    assert len(embedded) == 2
+    assert photo.read_bytes() in [image._data for image in embedded.values() if image["/Filter"] == "/DCTDecode"]
+
+
+@pytest.mark.unit
+def test_reports_without_exercises_have_no_exercise_section():
+    out = io.BytesIO()
+    render_report(report(exercises=None, patient_name=None, plan=None), {}, out)
+    text = pdf_text(out.getvalue())
+    assert "Exercises" not in text
+    assert text.count(layout.EMPTY_VALUE) == 4
+    assert PdfReader(io.BytesIO(out.getvalue())).metadata.title == "2024-03-01"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_only_cached_images_are_embedded_and_nothing_is_fetched(proxy, service):
+    proxy, server = proxy
+    await proxy.process([{"url": CACHED}])
+    assert server.requests == [CACHED]
+
+    document = await service.render(final_report())
+    data = b"".join([chunk async for chunk in document.chunks()])
+
+    # The uncached image in the client's report is never requested
+    assert server.requests == [CACHED]
+    page = PdfReader(io.BytesIO(data)).pages[0]
+    assert len(page.images) == 1
+    assert "Image not available" in pdf_text(data)
+    assert not document.path.exists()
+
+
+@pytest.mark.integration
+def test_pdf_route_answers_422_naming_fields_it_cannot_show(api_client, proxy, service):
+    response = api_client.post("/reports/pdf", json=final_report(plan="Ice 🧊 twice daily"))
+    assert response.status_code == 422
+    assert response.json()["detail"] == "Characters the PDF fonts cannot show: plan (🧊)"
+
+    batch = api_client.post("/reports/pdf/batch", json={"reports": [final_report(), final_report(condition="ACL 🦵")]})
+    assert batch.status_code == 422
+    assert batch.json()["detail"] == "reports[1]: Characters the PDF fonts cannot show: condition (🦵)"
+
+    rendered = api_client.post("/reports/pdf", json=final_report())
+    assert rendered.status_code == 200
+    assert rendered.headers["content-type"] == "application/pdf"
+    assert "6/10 → 3/10" in pdf_text(rendered.content)
+
+
+@pytest.mark.unit
+def test_report_filename_is_an_ascii_slug():
+    assert pdf_service.report_filename(report()) == "soap-report-zoe-muller-2024-03-01.pdf"
+    assert pdf_service.report_filename({"patient_name": "  ", "session_date": None}) == "soap-report.pdf"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_queue_is_refused_and_batches_report_failures(service, proxy):
+    service.queue_size = 1
+    service._pending = 1
+    with pytest.raises(pdf_service.RenderBusy):
+        await service.render(final_report())
+    assert service.stats()["busy"] == 1
+    service._pending = 0
+
+    results = {
+        index: document
+        async for index, document in service.render_many([final_report(), final_report(plan="🙂")])
+    }
+    assert results[0].filename.endswith(".pdf")
+    assert isinstance(results[1], UnsupportedText)
+    results[0].discard()
+    assert service.stats()["rendered"] == 1 and service.stats()["failed"] == 1
+
+
+@pytest.mark.integration
+def test_batch_route_streams_a_zip_of_reports(api_client, proxy, service):
+    response = api_client.post(
+        "/reports/pdf/batch", json={"reports": [final_report(), final_report(patient_name="Sam Lee")]}
+    )
+    assert response.status_code == 200
+    names = sorted(zipfile.ZipFile(io.BytesIO(response.content)).namelist())
+    assert names == ["001-soap-report-zoe-muller-2024-03-01.pdf", "002-soap-report-sam-lee-2024-03-01.pdf"]
+    assert api_client.post("/reports/pdf?template=poster", json=final_report()).status_code == 422
+    assert api_client.post("/reports/pdf/batch", json={"reports": []}).status_code == 422
+
+
+@pytest.mark.integration
+def test_routes_answer_503_when_busy_and_500_when_rendering_fails(api_client, proxy, service, monkeypatch):
+    assert api_client.post("/reports/pdf", json={"type": "final_report"}).status_code == 422
+    not_final = api_client.post("/reports/pdf", json={"type": "chat_message", "content": "hi"})
+    assert not_final.status_code == 422
+    assert "Expected a final_report message" in not_final.json()["detail"]
+    monkeypatch.setattr(routes_reports, "MAX_PDF_BATCH", 1)
+    assert api_client.post("/reports/pdf/batch", json={"reports": [final_report()] * 2}).status_code == 413
+
+    service.queue_size = 1
+    service._pending = 1
+    busy = api_client.post("/reports/pdf", json=final_report())
+    assert busy.status_code == 503
+    assert busy.headers["retry-after"] == "1"
+    service._pending = 0
+
+    def broken(report, images, path, template, generated_at):
+        raise RuntimeError("disk full")
+
+    monkeypatch.setattr(pdf_service, "render_to_file", broken)
+    failed = api_client.post("/reports/pdf", json=final_report())
+    assert failed.status_code == 500
+    assert failed.json()["detail"] == "Could not render the report: disk full"
+
+
+@pytest.mark.integration
+def test_batch_lists_reports_that_failed_to_render(api_client, proxy, service, monkeypatch):
+    def render_unless_sam(report, images, path, template, generated_at):
+        if report["patient_name"] == "Sam Lee":
+            raise RuntimeError("disk full")
+        return layout.render_to_file(report, images, path, template, generated_at)
+
+    monkeypatch.setattr(pdf_service, "render_to_file", render_unless_sam)
+    response = api_client.post(
+        "/reports/pdf/batch", json={"reports": [final_report(), final_report(patient_name="Sam Lee")]}
+    )
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(archive.namelist()) == ["001-soap-report-zoe-muller-2024-03-01.pdf", "errors.json"]
+    assert json.loads(archive.read("errors.json")) == [{"index": 1, "error": "disk full"}]
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_abandoned_batches_stop_renders_and_delete_documents_nobody_received(service, proxy, monkeypatch):
+    release = threading.Event()
+
+    def render(report, images, path, template, generated_at):
+        if report["patient_name"] == "Sam Lee":
+            # Still rendering when the batch is abandoned
+            release.wait(5)
+            raise RuntimeError("abandoned")
+        return layout.render_to_file(report, images, path, template, generated_at)
+
+    monkeypatch.setattr(pdf_service, "render_to_file", render)
+    service._batch_slots = asyncio.Semaphore(3)
+    batch = service.render_many([final_report(), final_report(patient_name="Sam Lee"), final_report()])
+
+    _, received = await batch.__anext__()
+    while service.rendered < 2:
+        await asyncio.sleep(0.01)
+    await batch.aclose()
+    release.set()
+
+    assert list(service.spool_dir.glob("*.pdf")) == [received.path]
+    received.discard()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_reports_render_in_worker_processes(tmp_path):
+    service = PdfRenderService(workers=1, queue_size=2, spool_dir=tmp_path / "spool")
+    try:
+        document = await service.render(final_report(exercises=[{"name": "Squat", "selected_image": "ftp://a/x.jpg"}]))
+        data = b"".join([chunk async for chunk in document.chunks()])
+    finally:
+        service.close()
+    assert "Squat" in pdf_text(data)
+    assert service._pool is None
+    assert service.stats()["median_render_seconds"] > 0
+
+
+class _StubPool:
+    """Stands in for the process pool: every render gets the same future, already running (or failed with ``error``)."""
+
+    def __init__(self, error=None):
+        self.future = Future()
+        self.error = error
+        self.shut_down = False
+
+    def submit(self, function, *arguments):
+        self.path = Path(arguments[2])
+        self.future.set_running_or_notify_cancel()
+        if self.error is not None:
+            self.future.set_exception(self.error)
+        return self.future
+
+    def shutdown(self, wait, cancel_futures):
+        self.shut_down = True
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_a_dead_worker_is_replaced_by_a_fresh_pool(tmp_path):
+    service = PdfRenderService(workers=1, queue_size=2, spool_dir=tmp_path / "spool")
+    pool = service._pool = _StubPool(BrokenProcessPool("a worker was killed"))
+
+    with pytest.raises(BrokenProcessPool):
+        await service.render(final_report())
+    assert pool.shut_down and service._pool is None
+    # With no renders recorded, clients are told to wait a second per queued render
+    service._pending = 3
+    assert service._retry_after() == 3.0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_a_cancelled_render_deletes_the_file_its_worker_writes(tmp_path):
+    service = PdfRenderService(workers=1, queue_size=2, spool_dir=tmp_path / "spool")
+    pool = service._pool = _StubPool()
+    render = asyncio.ensure_future(service.render(final_report()))
+    while not hasattr(pool, "path"):
+        await asyncio.sleep(0.01)
+    render.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await render
+
+    # The worker finishes the file after the client went away
+    pool.path.write_bytes(b"%PDF-")
+    pool.future.set_result({"pages": 1, "images_embedded": 0, "images_missing": 0, "bytes": 5})
+    assert not pool.path.exists()
+
+
+@pytest.mark.unit
+def test_stale_spool_files_are_removed_at_start(tmp_path):
+    spool = tmp_path / "spool"
+    spool.mkdir()
+    (spool / "stale.pdf").write_bytes(b"%PDF-")
+    os.utime(spool / "stale.pdf", (0, 0))
+    (spool / "fresh.pdf").write_bytes(b"%PDF-")
+    (spool / "odd.pdf").mkdir()
+    os.utime(spool / "odd.pdf", (0, 0))
+
+    PdfRenderService(workers=0, queue_size=1, spool_dir=spool)
+
+    assert sorted(path.name for path in spool.iterdir()) == ["fresh.pdf", "odd.pdf"]
+
+
+@pytest.mark.unit
+def test_get_pdf_service_is_configured_from_the_environment(tmp_path, monkeypatch):
+    monkeypatch.setattr(pdf_service, "_service", None)
+    pdf_service.close_pdf_service()
+    monkeypatch.setenv("MOTION_PDF_WORKERS", "0")
+    monkeypatch.setenv("MOTION_PDF_SPOOL_DIR", str(tmp_path))
+
+    service = pdf_service.get_pdf_service()
+
+    assert pdf_service.get_pdf_service() is service
+    assert (service.workers, service.queue_size, service.spool_dir) == (0, 4, tmp_path)
+
+
+@pytest.mark.unit
+def test_zip_stream_hands_over_what_was_written():
+    sink = routes_reports._ZipStream()
+    assert sink.writable()
+    with zipfile.ZipFile(sink, "w") as archive:
+        archive.writestr("a.txt", "a")
+    assert zipfile.ZipFile(io.BytesIO(sink.drain())).read("a.txt") == b"a"
+    assert sink.drain() == b""
+
+
+@pytest.mark.unit
+def test_templates_compile_once_per_process():
+    layout.warm_templates()
+    assert layout.compile_template("compact") is layout.compile_template("compact")
+    with pytest.raises(KeyError):
+        layout.compile_template("poster")
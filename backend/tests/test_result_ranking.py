@@ -0,0 +1,104 @@
+"""Tests for ranking and trimming of illustration search results."""
+
+import pytest
+
+from motion.tools import result_ranking
+from motion.tools.result_ranking import (
+    MAX_NAME_CHARS,
+    canonicalize_url,
+    is_displayable_image_url,
+    rank_results,
+    ranking_stats,
+    score_result,
+)
+
+
+def image(url, name=""):
+    return {"type": "image", "name": name, "url": url}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("url, canonical", [
+    ("HTTPS://Example.COM:443/a/B.jpg#top", "https://example.com/a/B.jpg"),
+    ("http://example.com:8080/x.png", "http://example.com:8080/x.png"),
+    ("https://example.com", "https://example.com/"),
+    ("https://cdn.example/x.jpg?utm_source=a&w=300&fbclid=1&sig=a%2Bb", "https://cdn.example/x.jpg?w=300&sig=a%2Bb"),
+    ("  https://example.com./x.gif  ", "https://example.com/x.gif"),
+    ("ftp://example.com/x.jpg", None),
+    ("data:image/png;base64,AAAA", None),
+    ("https://example.com:99999/x.jpg", None),
+    ("not a url", None),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("url, displayable", [
+    ("https://example.com/bridge.jpg", True),
+    ("https://example.com/images/bridge", True),
+    ("https://example.com/bridge.html", False),
+    ("https://example.com/guide.pdf", False),
+    ("https://www.youtube.com/watch", False),
+    ("https://m.facebook.com/photo.jpg", False),
+    ("https://ad.doubleclick.net/img.gif", False),
+    ("https://example.com/pixel.gif", False),
+    ("https://example.com/t/1x1.png", False),
+])
+def test_is_displayable_image_url(url, displayable):
+    assert is_displayable_image_url(url) is displayable
+
+
+@pytest.mark.unit
+def test_score_prefers_matching_captions_and_image_files():
+    matching = score_result("Glute bridge", "Glute bridge exercise", "https://a.example/glute-bridge.jpg")
+    caption_only = score_result("Glute bridge", "Glute bridge exercise", "https://a.example/img/1234")
+    unrelated = score_result("Glute bridge", "Shoulder stretch", "https://a.example/shoulder.jpg")
+    assert matching > caption_only > unrelated
+    assert matching <= 1.1
+
+
+@pytest.mark.unit
+def test_rank_results_drops_dedupes_and_trims(monkeypatch):
+    monkeypatch.setattr(result_ranking, "_counters", {"ranked": 0, "dropped": 0, "duplicates": 0, "trimmed": 0})
+    results = [
+        image("https://b.example/shoulder.jpg", "Shoulder stretch"),
+        image("https://a.example/img/1", "Glute bridge"),
+        image("https://a.example/photo-300x200.jpg?utm_medium=x", "Side view"),
+        image("https://www.a.example/photo.jpg", "Glute bridge"),
+        image("https://b.example/page.html", "Glute bridge"),
+        {"type": "video", "name": "Glute bridge", "url": "https://b.example/v.jpg"},
+        {"name": "missing url"},
+        "not a dict",
+    ]
+
+    ranked = rank_results("Glute bridge", results, top_k=2)
+
+    # The size variant and the www. copy are one image; the better caption wins
+    assert [item["url"] for item in ranked] == ["https://www.a.example/photo.jpg", "https://a.example/img/1"]
+    assert ranking_stats() == {"ranked": 1, "dropped": 4, "duplicates": 1, "trimmed": 1}
+
+
+@pytest.mark.unit
+def test_rank_results_keeps_search_order_for_ties_and_trims_long_captions():
+    caption = "Bridge " + "word " * 60
+    ranked = rank_results("Bridge", [
+        image("https://a.example/1", "Bridge"),
+        image("https://a.example/2", "Bridge"),
+        image("https://a.example/3", caption),
+    ], top_k=0)
+
+    assert [item["url"] for item in ranked[:2]] == ["https://a.example/1", "https://a.example/2"]
+    long = ranked[2]["name"]
+    assert len(long) <= MAX_NAME_CHARS and not long.endswith(" ")
+    assert rank_results("Bridge", [], top_k=4) == []
+
+
+@pytest.mark.unit
+def test_rank_results_drops_duplicates_with_worse_captions():
+    ranked = rank_results("Bridge", [
+        image("https://a.example/bridge.jpg", "Bridge"),
+        image("https://www.a.example/bridge.jpg", "Side view"),
+    ], top_k=0)
+
+    assert [(item["url"], item["name"]) for item in ranked] == [("https://a.example/bridge.jpg", "Bridge")]
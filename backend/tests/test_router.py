@@ -0,0 +1,159 @@
+"""Tests for routing turns to chat or SOAP mode."""
+
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+from google.genai import types
+
+from motion.agents.soap_agents import router
+from motion.agents.soap_agents.prompts import CHAT_INSTRUCTION, INSTRUCTION, SOAP_INSTRUCTION
+from motion.agents.soap_agents.report_assembly import LAST_SOAP_DRAFT_KEY
+from motion.agents.soap_agents.router import MODE_KEY, Mode, apply_mode, mode_instruction, route_message, route_turn
+
+
+def context(state=None, text=None):
+    user_content = types.Content(role="user", parts=[types.Part(text=text)]) if text is not None else None
+    return SimpleNamespace(state=dict(state or {}), user_content=user_content)
+
+
+def request_with_tools(history=()):
+    request = LlmRequest(
+        model="base-model",
+        contents=list(history),
+        config=types.GenerateContentConfig(
+            tools=[types.Tool(function_declarations=[types.FunctionDeclaration(name="search_exercise_illustrations")])]
+        ),
+    )
+    request.tools_dict["search_exercise_illustrations"] = object()
+    return request
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Pt 45 y/o presents with low back pain 7/10, positive SLR at 60 degrees, treated with manual therapy.",
+        "Can you write this up as a SOAP note for today's session?",
+        "Knee flexion 110°, quads 4/5, tender over medial joint line.",
+    ],
+)
+def test_clinical_dictation_routes_to_soap(text):
+    decision = route_message(text)
+    assert decision.mode == Mode.SOAP
+    assert decision.score >= router.SOAP_THRESHOLD
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "text",
+    [
+        "Hi there!",
+        "What is the difference between a sprain and a strain?",
+        "How long should I hold a hamstring stretch?",
+        "Thanks, that's all for now.",
+    ],
+)
+def test_general_conversation_routes_to_chat(text):
+    assert route_message(text).mode == Mode.CHAT
+
+
+@pytest.mark.unit
+def test_draft_follow_ups_stay_in_soap_mode():
+    text = "Please add a calf stretch to the exercises."
+    assert route_message(text).mode == Mode.CHAT
+    decision = route_message(text, has_draft=True)
+    assert decision.mode == Mode.SOAP
+    assert "draft_follow_up" in decision.signals
+    assert decision.to_dict() == {"mode": "soap", "score": decision.score, "signals": decision.signals}
+
+
+@pytest.mark.unit
+def test_questions_lower_the_score():
+    decision = route_message("Is stiffness normal after a session?")
+    assert "question" in decision.signals
+    assert decision.mode == Mode.CHAT
+
+
+@pytest.mark.unit
+def test_route_turn_records_the_mode():
+    ctx = context({LAST_SOAP_DRAFT_KEY: {"plan": "x"}}, "Replace the bridge exercise")
+    route_turn(ctx)
+    assert ctx.state[MODE_KEY] == "soap"
+
+    ctx = context({}, "Hello!")
+    route_turn(ctx)
+    assert ctx.state[MODE_KEY] == "chat"
+
+    ctx = context({})
+    route_turn(ctx)
+    assert MODE_KEY not in ctx.state
+
+
+@pytest.mark.unit
+def test_mode_instruction_picks_the_prompt():
+    assert mode_instruction(context({MODE_KEY: "chat"})) == CHAT_INSTRUCTION
+    assert mode_instruction(context({MODE_KEY: "soap"})) == SOAP_INSTRUCTION
+    assert mode_instruction(context({})) == INSTRUCTION
+    assert len(CHAT_INSTRUCTION) < len(SOAP_INSTRUCTION)
+
+
+@pytest.mark.unit
+def test_chat_turns_drop_tools_and_switch_model(monkeypatch):
+    monkeypatch.setattr(router, "CHAT_MODEL", "fast-model")
+    request = request_with_tools()
+
+    apply_mode(context({MODE_KEY: "chat"}), request)
+
+    assert request.config.tools is None
+    assert request.tools_dict == {}
+    assert request.model == "fast-model"
+
+
+@pytest.mark.unit
+def test_chat_turns_keep_tools_when_history_has_tool_calls():
+    call = types.Content(role="model", parts=[types.Part(function_call=types.FunctionCall(name="search_exercise_illustrations"))])
+    request = request_with_tools([call])
+
+    apply_mode(context({MODE_KEY: "chat"}), request)
+
+    assert request.config.tools
+    assert request.model == "base-model"
+
+
+@pytest.mark.unit
+def test_soap_turns_use_the_soap_model(monkeypatch):
+    monkeypatch.setattr(router, "SOAP_MODEL", "big-model")
+    request = request_with_tools()
+    apply_mode(context({MODE_KEY: "soap"}), request)
+    assert request.model == "big-model"
+    assert request.config.tools
+
+    monkeypatch.setattr(router, "SOAP_MODEL", "")
+    request = request_with_tools()
+    apply_mode(context({MODE_KEY: "soap"}), request)
+    assert request.model == "base-model"
+
+
+@pytest.mark.unit
+def test_disabled_router_changes_nothing(monkeypatch):
+    monkeypatch.setattr(router, "ROUTER_ENABLED", False)
+    ctx = context({MODE_KEY: "chat"}, "Hello!")
+    request = request_with_tools()
+
+    route_turn(ctx)
+    apply_mode(ctx, request)
+
+    assert mode_instruction(ctx) == INSTRUCTION
+    assert request.config.tools
+
+
+@pytest.mark.unit
+def test_general_questions_after_a_draft_route_to_chat():
+    decision = route_message("What exercises help with knee pain?", has_draft=True)
+    assert decision.mode == Mode.CHAT
+    assert "draft_follow_up" not in decision.signals
+
+    decision = route_message("Can you add a calf stretch to the plan?", has_draft=True)
+    assert decision.mode == Mode.SOAP
+    assert "question" not in decision.signals
@@ -0,0 +1,332 @@
+"""Tests for admission control and priority scheduling of agent turns."""
+
+import asyncio
+import time
+
+import pytest
+
+from motion import scheduler as scheduler_module
+from motion.api.routes import run
+from motion.scheduler import Priority, RequestScheduler, SchedulerRejected, scheduled
+from tests.test_app import SESSION_URL, run_body
+
+
+async def settle():
+    """Let woken waiters run."""
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def waiting(scheduler, user_id, priority, estimated_tokens=0):
+    return asyncio.create_task(scheduler.acquire(user_id, priority, estimated_tokens))
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_free_slot_goes_to_the_highest_class_waiting():
+    scheduler = RequestScheduler(max_in_flight=1, max_per_user=4)
+    holder = await scheduler.acquire("u0", Priority.SOAP)
+    background = waiting(scheduler, "u1", Priority.BACKGROUND)
+    chat = waiting(scheduler, "u2", Priority.CHAT)
+    soap = waiting(scheduler, "u3", Priority.SOAP)
+    await settle()
+    assert scheduler.stats()["queued"] == {"soap": 1, "chat": 1, "background": 1}
+
+    admitted = []
+    for _ in range(3):
+        holder.release()
+        await settle()
+        (holder,) = [task.result() for task in (soap, chat, background) if task.done() and not task.result().released]
+        admitted.append(holder.priority)
+    holder.release()
+
+    assert admitted == [Priority.SOAP, Priority.CHAT, Priority.BACKGROUND]
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_user_at_their_limit_does_not_block_others():
+    scheduler = RequestScheduler(max_in_flight=4, max_per_user=1)
+    first = await scheduler.acquire("busy", Priority.CHAT)
+    second = waiting(scheduler, "busy", Priority.CHAT)
+    await settle()
+
+    # Queued behind the busy user's turn, but admitted straight away
+    other = await asyncio.wait_for(scheduler.acquire("other", Priority.CHAT), 1)
+    assert not second.done()
+    # Turns without a user are exempt from per-user limits
+    anonymous = [await scheduler.acquire(None, Priority.CHAT) for _ in range(2)]
+    assert scheduler.stats()["in_flight"] == 4
+
+    anonymous[0].release()
+    await settle()
+    assert not second.done()  # A slot is free, but the user is still at their limit
+    first.release()
+    await settle()
+    assert second.result().user_id == "busy"
+    for ticket in (second.result(), other, anonymous[1]):
+        ticket.release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_background_work_keeps_headroom_for_live_sessions():
+    scheduler = RequestScheduler(max_in_flight=3, max_per_user=4, background_max_in_flight=1)
+    bulk = await scheduler.acquire("u1", Priority.BACKGROUND)
+    more_bulk = waiting(scheduler, "u1", Priority.BACKGROUND)
+    await settle()
+
+    live = [await asyncio.wait_for(scheduler.acquire("u2", Priority.SOAP), 1) for _ in range(2)]
+    assert not more_bulk.done()
+    assert scheduler.acquire_nowait("u3", Priority.CHAT) is None
+
+    bulk.release()
+    await settle()
+    assert more_bulk.result().priority == Priority.BACKGROUND
+    assert scheduler.stats()["in_flight_by_priority"] == {"soap": 2, "chat": 0, "background": 1}
+    for ticket in (*live, more_bulk.result()):
+        ticket.release()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_token_budget_admits_against_the_estimate_and_settles_on_usage():
+    scheduler = RequestScheduler(max_in_flight=4, max_per_user=4, tokens_per_minute=6000)
+    first = await scheduler.acquire("u1", Priority.SOAP, estimated_tokens=5000)
+    assert scheduler.stats()["tokens_available"] == pytest.approx(1000, abs=10)
+
+    # Does not fit while another turn runs
+    assert scheduler.acquire_nowait("u2", Priority.SOAP, 4000) is None
+    blocked = waiting(scheduler, "u2", Priority.SOAP, estimated_tokens=4000)
+    await settle()
+    assert not blocked.done()
+
+    # The turn used far less than estimated; the difference goes back in the bucket
+    first.record_usage(600)
+    first.record_usage(400)
+    first.release()
+    await settle()
+    second = blocked.result()
+    assert scheduler.stats()["tokens_available"] == pytest.approx(1000, abs=10)
+
+    # With nothing running, a large turn may overdraw the bucket rather than wait forever
+    second.release()
+    large = scheduler.acquire_nowait("u3", Priority.SOAP, 9000)
+    assert large is not None
+    assert scheduler.stats()["tokens_available"] < 0
+    large.release()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_turns_waiting_only_for_tokens_run_once_the_bucket_refills():
+    scheduler = RequestScheduler(max_in_flight=4, tokens_per_minute=60000)
+    running = await scheduler.acquire("u1", Priority.CHAT, estimated_tokens=60000)
+    # The bucket refills at 1000 tokens a second
+    refilled = await asyncio.wait_for(scheduler.acquire("u2", Priority.CHAT, estimated_tokens=200), 2)
+    assert refilled.user_id == "u2"
+    running.release()
+    refilled.release()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_full_queues_reject_on_arrival():
+    scheduler = RequestScheduler(max_in_flight=1, max_per_user=4, queue_size=2, max_queued_per_user=1)
+    holder = await scheduler.acquire("u0", Priority.CHAT)
+    queued = [waiting(scheduler, "u1", Priority.CHAT)]
+    await settle()
+
+    with pytest.raises(SchedulerRejected) as per_user:
+        await scheduler.acquire("u1", Priority.CHAT)
+    assert per_user.value.status_code == 429
+
+    queued.append(waiting(scheduler, "u2", Priority.CHAT))
+    await settle()
+    with pytest.raises(SchedulerRejected) as full:
+        await scheduler.acquire("u3", Priority.CHAT)
+    assert (full.value.status_code, full.value.retry_after) == (429, 5.0)
+
+    # Each class has its own queue
+    other_class = waiting(scheduler, "u3", Priority.SOAP)
+    await settle()
+    assert scheduler.stats()["queued"] == {"soap": 1, "chat": 2, "background": 0}
+
+    for task in (*queued, other_class):
+        task.cancel()
+    await asyncio.gather(*queued, other_class, return_exceptions=True)
+    holder.release()
+    assert scheduler.stats()["queued"] == {"soap": 0, "chat": 0, "background": 0}
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_turns_not_started_by_their_deadline_are_shed():
+    scheduler = RequestScheduler(max_in_flight=1, max_wait={Priority.CHAT: 0.05})
+    holder = await scheduler.acquire("u0", Priority.SOAP)
+
+    with pytest.raises(SchedulerRejected) as shed:
+        await scheduler.acquire("u1", Priority.CHAT)
+    assert (shed.value.status_code, shed.value.retry_after) == (503, 0.05)
+    assert scheduler.stats()["queued"]["chat"] == 0
+
+    # A shed turn's user may queue again
+    retry = waiting(scheduler, "u1", Priority.CHAT)
+    await settle()
+    holder.release()
+    await settle()
+    retry.result().release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_slots_freed_after_a_deadline_go_to_turns_still_in_time():
+    scheduler = RequestScheduler(max_in_flight=1, max_wait={Priority.SOAP: 0.05, Priority.CHAT: 5})
+    holder = await scheduler.acquire("u0", Priority.SOAP)
+    late = waiting(scheduler, "u1", Priority.SOAP)
+    in_time = waiting(scheduler, "u2", Priority.CHAT)
+    await settle()
+
+    # Block the loop past the SOAP deadline, so the slot is freed before its wait times out
+    time.sleep(0.1)
+    holder.release()
+    await settle()
+
+    assert in_time.done()
+    with pytest.raises(SchedulerRejected):
+        await late
+    in_time.result().release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_waiter_cancelled_as_it_is_admitted_gives_the_slot_back():
+    scheduler = RequestScheduler(max_in_flight=1, max_queued_per_user=2)
+    holder = await scheduler.acquire("u0", Priority.CHAT)
+    admitted = waiting(scheduler, "u1", Priority.CHAT)
+    queued = waiting(scheduler, "u1", Priority.CHAT)
+    await settle()
+
+    holder.release()
+    admitted.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await admitted
+    await settle()
+
+    assert queued.done()
+    assert scheduler.stats()["queued"]["chat"] == 0
+    queued.result().release()
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_the_queue():
+    scheduler = RequestScheduler(max_in_flight=1, max_queued_per_user=1)
+    holder = await scheduler.acquire("u0", Priority.CHAT)
+    task = waiting(scheduler, "u1", Priority.CHAT)
+    await settle()
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    assert scheduler.stats()["queued"]["chat"] == 0
+    holder.release()
+    assert scheduler.stats()["in_flight"] == 0
+    # Its per-user queue slot was returned too
+    (await scheduler.acquire("u1", Priority.CHAT)).release()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_release_is_idempotent_and_scheduled_releases_on_error(monkeypatch):
+    scheduler = RequestScheduler(max_in_flight=2)
+    monkeypatch.setattr(scheduler_module, "_scheduler", scheduler)
+    ticket = await scheduler.acquire("u1", Priority.CHAT)
+    ticket.release()
+    ticket.release()
+    assert scheduler.stats()["in_flight"] == 0
+
+    with pytest.raises(RuntimeError):
+        async with scheduled("u1", Priority.BACKGROUND, 100) as held:
+            assert scheduler.stats()["in_flight_by_priority"]["background"] == 1
+            raise RuntimeError("turn failed")
+    assert held.released
+    assert scheduler.stats()["in_flight"] == 0
+
+    monkeypatch.setattr(scheduler_module, "SCHEDULER_ENABLED", False)
+    async with scheduled("u1", Priority.SOAP) as unscheduled:
+        assert unscheduled.scheduler is None
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+def test_process_wide_scheduler_is_configured_from_env(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "_scheduler", None)
+    monkeypatch.setenv("MOTION_SCHEDULER_MAX_IN_FLIGHT", "6")
+    monkeypatch.setenv("MOTION_SCHEDULER_MAX_WAIT_CHAT", "2.5")
+    scheduler = scheduler_module.get_scheduler()
+
+    assert scheduler is scheduler_module.get_scheduler()
+    assert (scheduler.max_in_flight, scheduler.background_max_in_flight) == (6, 3)
+    assert scheduler.max_wait[Priority.CHAT] == 2.5
+
+
+@pytest.mark.integration
+def test_run_answers_429_with_retry_after_when_queues_are_full(api_client, monkeypatch):
+    scheduler = RequestScheduler(max_in_flight=1, queue_size=0)
+    monkeypatch.setattr(run, "get_scheduler", lambda: scheduler)
+    api_client.post(f"{SESSION_URL}/s1")
+    holder = scheduler.acquire_nowait("someone", Priority.SOAP)
+
+    response = api_client.post("/run", json=run_body("s1", "How long should I hold a stretch?"))
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+    holder.release()
+    assert api_client.post("/run", json=run_body("s1", "How long should I hold a stretch?")).status_code == 200
+    assert scheduler.stats()["in_flight"] == 0
+
+
+@pytest.mark.unit
+def test_turn_priority_and_token_estimate():
+    from google.adk.sessions import Session
+
+    session = Session(id="s1", app_name="app", user_id="u1")
+    assert run.turn_priority("Patient reports knee pain 6/10", session) == Priority.SOAP
+    assert run.turn_priority("How long should I hold a stretch?", session) == Priority.CHAT
+    assert run.turn_priority("Patient reports knee pain 6/10", session, "Background") == Priority.BACKGROUND
+    # SOAP turns carry the longer prompt and reply
+    assert run.estimate_turn_tokens("hi", session, Priority.SOAP) > run.estimate_turn_tokens("hi", session, Priority.CHAT)
+    # About four characters a token
+    longer = run.estimate_turn_tokens("hi " * 400, session, Priority.CHAT)
+    assert longer - run.estimate_turn_tokens("hi", session, Priority.CHAT) == pytest.approx(300, abs=1)
+
+
+@pytest.mark.integration
+def test_turns_record_model_usage_and_run_unscheduled_when_disabled(api_client, scripted_agent, monkeypatch):
+    from google.adk.events import Event
+    from google.genai import types
+
+    scheduler = RequestScheduler(max_in_flight=1, tokens_per_minute=100_000)
+    monkeypatch.setattr(run, "get_scheduler", lambda: scheduler)
+    usage = types.GenerateContentResponseUsageMetadata(total_token_count=4000)
+    scripted_agent.replies.append([
+        Event(author="", usage_metadata=usage, content=types.Content(role="model", parts=[types.Part(text="Hold")])),
+        Event(author="", error_code="RESOURCE_EXHAUSTED", error_message="Quota exceeded"),
+    ])
+    api_client.post(f"{SESSION_URL}/s1")
+
+    events = api_client.post("/run", json=run_body("s1", "How long should I hold a stretch?")).json()
+
+    assert events[-1]["errorCode"] == "RESOURCE_EXHAUSTED"
+    assert scheduler.stats()["tokens_available"] == pytest.approx(96_000, abs=100)
+
+    monkeypatch.setattr(run, "SCHEDULER_ENABLED", False)
+    assert api_client.post("/run", json=run_body("s1", "How long should I hold a stretch?")).status_code == 200
+    assert scheduler.stats()["tokens_available"] == pytest.approx(96_000, abs=100)
@@ -0,0 +1,104 @@
+"""Tests for client payload encoding."""
+
+import json
+
+import pytest
+
+from motion import serialization
+from motion.agents.soap_agents import message_types
+from motion.agents.soap_agents.message_types import ChatMessage
+
+
+PAYLOAD = {"type": "chat_message", "content": "Ängstlich? 30° flexion", "items": [1, 2.5, None, True]}
+
+
+@pytest.mark.unit
+def test_dumps_is_compact_and_keeps_unicode():
+    text = serialization.dumps(PAYLOAD, pretty=False)
+    assert json.loads(text) == PAYLOAD
+    assert "\n" not in text
+    assert ": " not in text
+    assert "Ängstlich" in text
+
+
+@pytest.mark.unit
+def test_pretty_output_is_indented():
+    text = serialization.dumps(PAYLOAD, pretty=True)
+    assert json.loads(text) == PAYLOAD
+    assert '\n  "content"' in text
+
+
+@pytest.mark.unit
+def test_dumps_bytes_and_sse_event():
+    assert json.loads(serialization.dumps_bytes(PAYLOAD, pretty=False).decode("utf-8")) == PAYLOAD
+    event = serialization.sse_event(PAYLOAD)
+    assert event.startswith(b"data: ")
+    assert event.endswith(b"\n\n")
+    assert json.loads(event[len(b"data: "):]) == PAYLOAD
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("pretty", [False, True])
+def test_stdlib_backend_matches_orjson_when_installed(monkeypatch, pretty):
+    encoded = serialization.dumps_bytes(PAYLOAD, pretty=pretty)
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert serialization.dumps_bytes(PAYLOAD, pretty=pretty) == encoded
+    assert "Ängstlich".encode("utf-8") in encoded
+
+
+@pytest.mark.unit
+def test_messages_serialize_through_the_shared_encoder():
+    message = json.loads(ChatMessage("Hold for 30 s").to_json())
+    assert message["type"] == "chat_message"
+    assert message["content"] == "Hold for 30 s"
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("create, args, expected", [
+    (message_types.create_chat_message, ("Hi",), {"type": "chat_message", "content": "Hi"}),
+    (message_types.create_soap_draft_message, ({"condition": "Knee"},), {"type": "soap_draft", "soap_report": {"condition": "Knee"}}),
+    (message_types.create_exercise_selection_message, ([{"name": "Bridge"}],), {
+        "type": "exercise_selection", "exercises": [{"name": "Bridge"}], "requires_selection": True,
+    }),
+    (message_types.create_final_report_message, ({"condition": "Knee"}, ["u"]), {
+        "type": "final_report", "soap_report": {"condition": "Knee"}, "selected_images": ["u"], "ready_for_pdf": True,
+    }),
+    (message_types.create_clarification_message, (["Which side?"], "Knee"), {
+        "type": "clarification_needed", "questions": ["Which side?"], "original_content": "Knee",
+    }),
+    (message_types.create_error_message, ("Failed",), {"type": "error", "error": "Failed", "details": None}),
+    (message_types.create_partial_message, ("soap_draft", "exercises", {"name": "Bridge"}, 0), {
+        "type": "partial", "parent_type": "soap_draft", "field": "exercises", "index": 0, "value": {"name": "Bridge"},
+    }),
+])
+def test_message_helpers_encode_their_fields(create, args, expected):
+    message = json.loads(create(*args))
+    assert message.pop("timestamp")
+    assert message == expected
+
+
+@pytest.mark.unit
+def test_to_bytes_is_compact_json():
+    encoded = ChatMessage("Hold for 30 s").to_bytes()
+    assert b"\n" not in encoded
+    assert json.loads(encoded)["content"] == "Hold for 30 s"
+
+
+@pytest.mark.unit
+def test_soap_structure_helpers():
+    item = message_types.create_soap_item("bullet", "Pain 6/10", emphasis="high")
+    section = message_types.create_soap_section("Subjective", [item])
+    patient = message_types.create_patient_info(name="Ann", age="40")
+    report = message_types.create_soap_report(patient, section, section, section, section, "2024-01-01")
+    assert report["subjective"]["items"][0] == {"type": "bullet", "content": "Pain 6/10", "emphasis": "high", "sub_items": None}
+    assert report["patient_info"]["name"] == "Ann"
+    assert report["timestamp"] == "2024-01-01"
+
+    exercise = message_types.create_exercise_with_images("ex1", "Bridge", "Lift hips", [
+        {"url": "https://a/1.png", "name": "Side view"}, {"thumbnail_url": "https://a/t.png"},
+    ])
+    assert [image["id"] for image in exercise["images"]] == ["img_ex1_0", "img_ex1_1"]
+    assert exercise["images"][0]["name"] == "Side view"
+    assert exercise["images"][1] == {
+        "id": "img_ex1_1", "url": "", "thumbnail_url": "https://a/t.png", "name": "Bridge illustration 2", "selected": False,
+    }
@@ -0,0 +1,290 @@
+"""Tests for the durable event-log session service and its stores."""
+
+import sys
+from types import SimpleNamespace
+
+import pytest
+from google.adk.events import Event, EventActions
+from google.adk.sessions.base_session_service import GetSessionConfig
+from google.genai import types
+
+from motion.api.session_store import (
+    EventLogSessionService,
+    InMemoryKeyValue,
+    KeyValueSessionStore,
+    SqliteSessionStore,
+    create_session_store,
+)
+
+
+APP = "soap_agents"
+
+
+@pytest.fixture(params=["sqlite", "key_value"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        store = SqliteSessionStore(tmp_path / "sessions.sqlite3")
+    else:
+        store = KeyValueSessionStore(InMemoryKeyValue())
+    yield store
+    store.close()
+
+
+def event(text, author="user", state=None, timestamp=None):
+    kwargs = {"timestamp": timestamp} if timestamp is not None else {}
+    return Event(
+        author=author,
+        invocation_id="inv",
+        content=types.Content(role="user" if author == "user" else "model", parts=[types.Part(text=text)]),
+        actions=EventActions(state_delta=state or {}),
+        **kwargs,
+    )
+
+
+def texts(session):
+    return [e.content.parts[0].text for e in session.events]
+
+
+@pytest.mark.asyncio
+async def test_round_trip(store):
+    service = EventLogSessionService(store, snapshot_interval=0)
+    session = await service.create_session(app_name=APP, user_id="u1", state={"patient": "Ann"})
+
+    await service.append_event(session, event("dictation", state={"draft": 1}))
+    await service.append_event(session, event("reply", author="soap_agent"))
+
+    loaded = await service.get_session(app_name=APP, user_id="u1", session_id=session.id)
+    assert texts(loaded) == ["dictation", "reply"]
+    assert loaded.state == {"patient": "Ann", "draft": 1}
+    assert loaded.last_update_time == session.last_update_time
+    assert await service.get_session(app_name=APP, user_id="u1", session_id="missing") is None
+    assert await service.get_session(app_name=APP, user_id="u2", session_id=session.id) is None
+
+
+@pytest.mark.asyncio
+async def test_loads_from_snapshot_plus_tail(store):
+    service = EventLogSessionService(store, snapshot_interval=3)
+    session = await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+    for i in range(7):
+        await service.append_event(session, event(f"e{i}", state={"count": i}))
+
+    seq, _, tail = store.load(APP, "u1", "s1")
+    assert seq == 6
+    assert len(tail) == 1
+
+    loaded = await service.get_session(app_name=APP, user_id="u1", session_id="s1")
+    assert texts(loaded) == [f"e{i}" for i in range(7)]
+    assert loaded.state["count"] == 6
+
+
+@pytest.mark.asyncio
+async def test_scoped_state_is_shared_and_temp_state_is_dropped(store):
+    service = EventLogSessionService(store)
+    first = await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+    await service.append_event(first, event("x", state={
+        "app:template": "compact", "user:clinic": "North", "temp:scratch": 1, "draft": "a",
+    }))
+
+    same_user = await service.create_session(app_name=APP, user_id="u1", session_id="s2")
+    other_user = await service.create_session(app_name=APP, user_id="u2", session_id="s3")
+    reloaded = await service.get_session(app_name=APP, user_id="u1", session_id="s1")
+
+    assert same_user.state == {"app:template": "compact", "user:clinic": "North"}
+    assert other_user.state == {"app:template": "compact"}
+    assert reloaded.state == {"app:template": "compact", "user:clinic": "North", "draft": "a"}
+    store.update_scoped_state("scope", {"k": 1})
+    store.update_scoped_state("scope", {})
+    assert store.get_scoped_state("scope") == {"k": 1}
+
+
+@pytest.mark.unit
+def test_snapshots_skip_missing_and_caught_up_sessions(store):
+    service = EventLogSessionService(store)
+    store.create_session(APP, "u1", "s1", '{"id": "s1"}', 1.0)
+
+    service._snapshot(APP, "u1", "missing")
+    service._snapshot(APP, "u1", "s1")
+
+    assert store.load(APP, "u1", "missing") is None
+    assert store.load(APP, "u1", "s1") == (0, '{"id": "s1"}', [])
+
+
+@pytest.mark.asyncio
+async def test_two_services_share_one_store(store):
+    """Two workers: each appends to the same session and sees the other's events."""
+    worker_a = EventLogSessionService(store, snapshot_interval=2)
+    worker_b = EventLogSessionService(store, snapshot_interval=2)
+    await worker_a.create_session(app_name=APP, user_id="u1", session_id="s1")
+
+    for i in range(5):
+        worker = worker_a if i % 2 == 0 else worker_b
+        session = await worker.get_session(app_name=APP, user_id="u1", session_id="s1")
+        await worker.append_event(session, event(f"turn {i}", state={f"seen_{i}": True}))
+
+    for worker in (worker_a, worker_b):
+        session = await worker.get_session(app_name=APP, user_id="u1", session_id="s1")
+        assert texts(session) == [f"turn {i}" for i in range(5)]
+        assert all(session.state[f"seen_{i}"] for i in range(5))
+
+    with pytest.raises(ValueError, match="already exists"):
+        await worker_b.create_session(app_name=APP, user_id="u1", session_id="s1")
+
+
+@pytest.mark.asyncio
+async def test_stale_session_object_does_not_lose_events_in_snapshots(store):
+    worker_a = EventLogSessionService(store, snapshot_interval=2)
+    worker_b = EventLogSessionService(store, snapshot_interval=2)
+    await worker_a.create_session(app_name=APP, user_id="u1", session_id="s1")
+    stale = await worker_a.get_session(app_name=APP, user_id="u1", session_id="s1")
+
+    fresh = await worker_b.get_session(app_name=APP, user_id="u1", session_id="s1")
+    await worker_b.append_event(fresh, event("from b"))
+    await worker_a.append_event(stale, event("from a"))
+
+    loaded = await worker_b.get_session(app_name=APP, user_id="u1", session_id="s1")
+    assert texts(loaded) == ["from b", "from a"]
+    assert store.load(APP, "u1", "s1")[0] == 2
+
+
+@pytest.mark.asyncio
+async def test_list_delete_and_recent_events(store):
+    service = EventLogSessionService(store)
+    session = await service.create_session(app_name=APP, user_id="u1", session_id="s1")
+    await service.create_session(app_name=APP, user_id="u1", session_id="s2")
+    for i in range(4):
+        await service.append_event(session, event(f"e{i}", timestamp=1000.0 + i))
+    partial = event("streaming")
+    partial.partial = True
+    await service.append_event(session, partial)
+
+    listed = {s.id: s.last_update_time for s in (await service.list_sessions(app_name=APP, user_id="u1")).sessions}
+    assert set(listed) == {"s1", "s2"}
+    assert listed["s1"] == 1003.0
+
+    recent = await service.get_session(
+        app_name=APP, user_id="u1", session_id="s1", config=GetSessionConfig(num_recent_events=2)
+    )
+    assert texts(recent) == ["e2", "e3"]
+    after = await service.get_session(
+        app_name=APP, user_id="u1", session_id="s1", config=GetSessionConfig(after_timestamp=1001.0)
+    )
+    assert texts(after) == ["e1", "e2", "e3"]
+
+    await service.delete_session(app_name=APP, user_id="u1", session_id="s1")
+    assert await service.get_session(app_name=APP, user_id="u1", session_id="s1") is None
+    assert [s.id for s in (await service.list_sessions(app_name=APP, user_id="u1")).sessions] == ["s2"]
+
+
+class FailingIndex(InMemoryKeyValue):
+    """Key-value client whose index writes fail, like a connection dropping mid-create."""
+
+    def hset(self, *args, **kwargs):
+        raise ConnectionError("connection lost")
+
+
+@pytest.mark.unit
+def test_key_value_create_claims_the_snapshot_before_the_index():
+    client = FailingIndex()
+    store = KeyValueSessionStore(client)
+
+    with pytest.raises(ConnectionError):
+        store.create_session(APP, "u1", "s1", '{"id": "s1"}', 1.0)
+
+    # The session exists and cannot be created twice, even though the index write failed
+    assert store.load(APP, "u1", "s1") == (0, '{"id": "s1"}', [])
+    assert store.create_session(APP, "u1", "s1", '{"id": "other"}', 2.0) is False
+    assert store.load(APP, "u1", "s1")[1] == '{"id": "s1"}'
+
+
+class FailingConnection:
+    """SQLite connection wrapper whose snapshot writes fail, like a full disk."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, *args):
+        if "session_snapshots" in sql:
+            raise OSError("disk full")
+        return self.db.execute(sql, *args)
+
+
+@pytest.mark.unit
+def test_sqlite_writes_roll_back_on_failure(tmp_path):
+    store = SqliteSessionStore(tmp_path / "sessions.sqlite3")
+    store.create_session(APP, "u1", "s1", '{"id": "s1"}', 1.0)
+    store._db = FailingConnection(store._db)
+
+    with pytest.raises(OSError):
+        store.create_session(APP, "u1", "s2", '{"id": "s2"}', 1.0)
+    with pytest.raises(OSError):
+        store.delete_session(APP, "u1", "s1")
+
+    store._db = store._db.db
+    assert store.list_sessions(APP, "u1") == [("s1", 1.0)]
+    assert store.load(APP, "u1", "s1") == (0, '{"id": "s1"}', [])
+    store.close()
+
+
+class DeletingWorker(InMemoryKeyValue):
+    """Key-value client on which another worker deletes the session right after an append checks it."""
+
+    def __init__(self, store_factory):
+        super().__init__()
+        self.other_worker = store_factory(self)
+        self.checks = 0
+
+    def exists(self, *keys):
+        found = super().exists(*keys)
+        self.checks += 1
+        if self.checks == 1:
+            self.other_worker.delete_session(APP, "u1", "s1")
+        return found
+
+
+@pytest.mark.unit
+def test_key_value_append_racing_a_delete_does_not_recreate_the_log():
+    client = DeletingWorker(KeyValueSessionStore)
+    store = KeyValueSessionStore(client)
+    store.create_session(APP, "u1", "s1", '{"id": "s1"}', 1.0)
+
+    with pytest.raises(KeyError):
+        store.append_event(APP, "u1", "s1", '{"e": 1}', 2.0)
+
+    assert client.checks == 2
+    assert client.lrange("motion:events:soap_agents:u1:s1", 0, -1) == []
+    assert store.list_sessions(APP, "u1") == []
+
+
+@pytest.mark.unit
+def test_appending_to_a_missing_session_fails(store):
+    with pytest.raises(KeyError):
+        store.append_event(APP, "u1", "missing", '{"e": 1}', 1.0)
+
+
+@pytest.mark.unit
+def test_create_session_store_urls(tmp_path, monkeypatch):
+    sqlite_store = create_session_store(f"sqlite:///{tmp_path / 'x.db'}")
+    assert isinstance(sqlite_store, SqliteSessionStore)
+    sqlite_store.close()
+    assert isinstance(create_session_store("memory://"), KeyValueSessionStore)
+
+    # Stand-in for the optional redis client: only the URL hand-off is under test
+    redis = SimpleNamespace(Redis=SimpleNamespace(from_url=lambda url: InMemoryKeyValue()))
+    monkeypatch.setitem(sys.modules, "redis", redis)
+    assert isinstance(create_session_store("rediss://cache:6380/0"), KeyValueSessionStore)
+    with pytest.raises(ValueError):
+        create_session_store("postgres://db")
+
+
+@pytest.mark.integration
+def test_app_uses_the_configured_store(scripted_agent, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    from motion.api.app import create_app
+
+    monkeypatch.setenv("MOTION_SESSION_STORE", f"sqlite:///{tmp_path / 'sessions.db'}")
+    url = f"/apps/{APP}/users/u1/sessions/s1"
+    with TestClient(create_app()) as first_worker:
+        first_worker.post(url, json={"patient": "Ann"})
+    with TestClient(create_app()) as second_worker:
+        assert second_worker.get(url).json()["state"] == {"patient": "Ann"}
@@ -0,0 +1,171 @@
+"""Tests for single-flight request coalescing."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from motion.tools.single_flight import SingleFlight
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_concurrent_async_callers_share_one_execution():
+    flight = SingleFlight()
+    executions = 0
+
+    async def fetch():
+        nonlocal executions
+        executions += 1
+        await asyncio.sleep(0.05)
+        return {"value": executions}
+
+    results = await asyncio.gather(*(flight.do_async("bridge", fetch) for _ in range(5)))
+
+    assert executions == 1
+    assert results == [{"value": 1}] * 5
+    assert flight.stats() == {"calls": 5, "executions": 1, "coalesced": 4, "in_flight": 0}
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_different_keys_and_later_calls_run_separately():
+    flight = SingleFlight()
+
+    async def fetch(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    assert await asyncio.gather(
+        flight.do_async("a", lambda: fetch("a")), flight.do_async("b", lambda: fetch("b"))
+    ) == ["a", "b"]
+    assert await flight.do_async("a", lambda: fetch("again")) == "again"
+    assert flight.stats()["executions"] == 3
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_errors_are_shared_and_not_remembered():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    outcomes = await asyncio.gather(
+        flight.do_async("k", fail), flight.do_async("k", fail), return_exceptions=True
+    )
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert flight.stats()["executions"] == 1
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.do_async("k", succeed) == "ok"
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_cancelling_the_leader_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    leader = asyncio.ensure_future(flight.do_async("k", fetch))
+    await asyncio.sleep(0)
+    follower = asyncio.ensure_future(flight.do_async("k", fetch))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    assert await follower == "done"
+    assert leader.cancelled()
+
+
+@pytest.mark.unit
+@pytest.mark.asyncio
+async def test_a_cancelled_shared_call_cancels_every_caller_and_is_not_remembered():
+    flight = SingleFlight()
+
+    async def cancelled():
+        await asyncio.sleep(0.01)
+        raise asyncio.CancelledError()
+
+    outcomes = await asyncio.gather(
+        flight.do_async("k", cancelled), flight.do_async("k", cancelled), return_exceptions=True
+    )
+    assert all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes)
+    assert flight.stats()["in_flight"] == 0
+
+    async def succeed():
+        return "ok"
+
+    assert await flight.do_async("k", succeed) == "ok"
+
+
+@pytest.mark.unit
+def test_threads_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+    barrier = threading.Barrier(4)
+    results = []
+
+    def fetch():
+        executions.append(1)
+        time.sleep(0.1)
+        return "shared"
+
+    def call():
+        barrier.wait()
+        results.append(flight.do("k", fetch))
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["shared"] * 4
+    assert len(executions) == 1
+
+
+@pytest.mark.unit
+def test_thread_errors_propagate_to_every_caller():
+    flight = SingleFlight()
+
+    def fail():
+        raise KeyError("missing")
+
+    with pytest.raises(KeyError):
+        flight.do("k", fail)
+    assert flight.stats()["in_flight"] == 0
+    assert flight.do("k", lambda: 1) == 1
+
+
+@pytest.mark.unit
+def test_thread_and_coroutine_callers_share_one_execution():
+    flight = SingleFlight()
+    executions = []
+    started = threading.Event()
+
+    def blocking_fetch():
+        executions.append("thread")
+        started.set()
+        time.sleep(0.1)
+        return "from thread"
+
+    thread_result = []
+    thread = threading.Thread(target=lambda: thread_result.append(flight.do("k", blocking_fetch)))
+    thread.start()
+    started.wait(5)
+
+    async def async_fetch():
+        executions.append("coroutine")
+        return "from coroutine"
+
+    assert asyncio.run(flight.do_async("k", async_fetch)) == "from thread"
+    thread.join(5)
+    assert thread_result == ["from thread"]
+    assert executions == ["thread"]
@@ -0,0 +1,167 @@
+"""Tests for the server entry point and the cold-start profiler."""
+
+import json
+import os
+
+import pytest
+
+from motion import main as main_module
+from motion import startup_profile
+from motion.agents.soap_agents import agent as agent_module
+
+
+IMPORTTIME = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   json.decoder
+import time:       300 |        420 | json
+import time:      2000 |       2000 |     google.genai.types
+import time:       500 |       2500 |   google.genai
+not an importtime line
+import time: broken | line
+"""
+
+
+@pytest.fixture
+def fake_profile(monkeypatch):
+    calls = []
+
+    def profile(include_app=True, top=15):
+        calls.append({"include_app": include_app, "top": top})
+        return {
+            "phases_ms": {"import_agent_module": 40.0, "create_app": 60.0},
+            "total_ms": 100.0,
+            "modules_imported": 3,
+            "top_modules": [{"module": "json", "self_ms": 0.3, "cumulative_ms": 0.42}],
+            "top_packages": [{"package": "google", "self_ms": 2.5}],
+        }
+
+    monkeypatch.setattr(startup_profile, "profile_startup", profile)
+    return calls
+
+
+@pytest.mark.unit
+def test_parse_importtime_skips_header_and_noise():
+    modules = startup_profile.parse_importtime(IMPORTTIME)
+    assert [m["module"] for m in modules] == ["json.decoder", "json", "google.genai.types", "google.genai"]
+    assert modules[2] == {"module": "google.genai.types", "self_us": 2000, "cumulative_us": 2000}
+
+
+@pytest.mark.unit
+def test_profiler_budget_sets_exit_code(fake_profile, capsys):
+    assert startup_profile.main(["--budget-ms", "50"]) == 1
+    assert "over the 50 ms budget" in capsys.readouterr().err
+    assert startup_profile.main(["--budget-ms", "500", "--top", "3", "--no-app"]) == 0
+    assert fake_profile[-1] == {"include_app": False, "top": 3}
+    assert "budget 500 ms" in capsys.readouterr().out
+    assert startup_profile.main([]) == 0
+    assert "budget" not in capsys.readouterr().out
+
+
+@pytest.mark.unit
+def test_profile_startup_reports_a_failed_start(monkeypatch):
+    monkeypatch.setattr(startup_profile, "_PHASES_SCRIPT", "raise ImportError('no module named motion')")
+    with pytest.raises(RuntimeError, match="(?s)Startup failed while profiling.*no module named motion"):
+        startup_profile.profile_startup()
+
+
+@pytest.mark.unit
+def test_profiler_json_output(fake_profile, capsys):
+    startup_profile.main(["--json"])
+    assert json.loads(capsys.readouterr().out)["total_ms"] == 100.0
+
+
+@pytest.mark.unit
+def test_main_forwards_profiler_options(fake_profile, capsys):
+    assert main_module.main(["--profile-startup", "--budget-ms", "50", "--top", "5"]) == 1
+    assert fake_profile == [{"include_app": True, "top": 5}]
+
+
+@pytest.mark.unit
+def test_main_rejects_unknown_options_when_serving():
+    with pytest.raises(SystemExit):
+        main_module.main(["--budget-ms", "50"])
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    runs = []
+    monkeypatch.delenv("MOTION_SESSION_STORE", raising=False)
+    monkeypatch.delenv("MOTION_SESSION_DB_URL", raising=False)
+    monkeypatch.delenv("MOTION_WORKERS", raising=False)
+    monkeypatch.setattr("uvicorn.run", lambda *args, **kwargs: runs.append(kwargs))
+    return runs
+
+
+@pytest.mark.unit
+def test_main_runs_workers_on_a_shared_session_store(serve, monkeypatch, tmp_path):
+    monkeypatch.setenv("MOTION_SESSION_STORE", f"sqlite:///{tmp_path / 'sessions.sqlite3'}")
+
+    main_module.main(["--workers", "3", "--port", "9001"])
+
+    assert serve[0]["workers"] == 3
+    assert serve[0]["port"] == 9001
+    assert serve[0]["factory"] is True
+    assert os.environ["MOTION_WORKERS"] == "3"
+
+
+@pytest.mark.unit
+def test_main_defaults_to_one_worker_per_core_with_a_session_store(serve, monkeypatch):
+    monkeypatch.setenv("MOTION_SESSION_STORE", "redis://sessions:6379/0")
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    main_module.main([])
+
+    assert serve[0]["workers"] == 4
+
+
+@pytest.mark.unit
+def test_main_defaults_to_one_worker_without_a_session_store(serve, monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    main_module.main([])
+
+    assert serve[0]["workers"] == 1
+    assert "MOTION_SESSION_STORE" not in os.environ
+
+
+@pytest.mark.unit
+def test_main_refuses_workers_without_a_session_store(serve, capsys):
+    with pytest.raises(SystemExit):
+        main_module.main(["--workers", "3"])
+
+    assert "MOTION_SESSION_STORE" in capsys.readouterr().err
+    assert serve == []
+    assert "MOTION_SESSION_STORE" not in os.environ
+
+
+@pytest.mark.unit
+def test_root_agent_is_built_lazily_once(monkeypatch):
+    built = []
+    monkeypatch.setattr(agent_module, "_root_agent", None)
+    monkeypatch.setattr(agent_module, "create_root_agent", lambda: built.append(object()) or built[-1])
+
+    first = agent_module.get_root_agent()
+    assert agent_module.root_agent is first
+    assert built == [first]
+    with pytest.raises(AttributeError):
+        agent_module.no_such_attribute
+
+
+@pytest.mark.unit
+def test_create_root_agent_builds_the_soap_agent_from_the_environment(monkeypatch):
+    monkeypatch.setenv("MODEL_GEMINI_2_0_FLASH", "gemini-test")
+
+    agent = agent_module.create_root_agent()
+
+    assert (agent.name, agent.model) == ("soap_agent", "gemini-test")
+    assert {tool.__name__ for tool in agent.tools} >= {"search_exercise_illustrations"}
+    assert agent.before_agent_callback and agent.before_model_callback and agent.after_model_callback
+
+
+@pytest.mark.slow
+@pytest.mark.integration
+def test_profile_startup_runs_a_real_cold_start(monkeypatch):
+    monkeypatch.setenv("MODEL_GEMINI_2_0_FLASH", "gemini-2.0-flash")
+    report = startup_profile.profile_startup(include_app=False, top=5)
+    assert set(report["phases_ms"]) == {"import_message_types", "import_agent_module", "build_root_agent"}
+    assert report["modules_imported"] > 0
+    assert len(report["top_packages"]) == 5
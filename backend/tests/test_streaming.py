@@ -0,0 +1,177 @@
+"""Tests for incremental parsing of streamed structured replies."""
+
+import json
+
+import pytest
+
+from motion.agents.soap_agents.streaming import IncrementalJSONParser, StructuredStreamParser
+
+
+DRAFT = {
+    "type": "soap_draft",
+    "timestamp": "2024-01-01T10:00:00Z",
+    "soap_report": {
+        "patient_name": "John \"JD\" Doe",
+        "patient_age": 45,
+        "subjective": "Pain 7/10, worse when sitting.\nEases on walking.",
+        "exercises": [
+            {"name": "Cat-cow", "description": "10 reps"},
+            {"name": "Bridge", "description": "Hold 10 s"},
+        ],
+    },
+}
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("size", [1, 3, 17, 10_000])
+def test_parser_rebuilds_the_object_from_any_chunking(size):
+    parser = IncrementalJSONParser()
+    completed = []
+    for chunk in chunks("```json\n" + json.dumps(DRAFT, indent=2) + "\n```", size):
+        completed.extend(parser.feed(chunk))
+
+    assert parser.done
+    assert parser.root == DRAFT
+    assert completed[-1] == ((), DRAFT)
+    paths = [path for path, _ in completed]
+    assert ("soap_report", "exercises", 0, "name") in paths
+    assert paths.index(("soap_report", "exercises", 0)) < paths.index(("soap_report", "exercises", 1, "name"))
+
+
+@pytest.mark.unit
+def test_parser_reports_values_as_soon_as_they_close():
+    parser = IncrementalJSONParser()
+    assert parser.feed('{"a": "x') == []
+    assert parser.feed('", "b": 1') == [(("a",), "x")]
+    assert parser.feed(", ") == [(("b",), 1)]
+    assert parser.feed('"c": [true, null]}') == [
+        (("c", 0), True),
+        (("c", 1), None),
+        (("c",), [True, None]),
+        ((), {"a": "x", "b": 1, "c": [True, None]}),
+    ]
+    assert parser.feed(' trailing {"ignored": 1}') == []
+
+
+@pytest.mark.unit
+def test_parser_tolerates_malformed_input():
+    assert IncrementalJSONParser().feed(']{"a": 1}') == [(("a",), 1), ((), {"a": 1})]
+    parser = IncrementalJSONParser()
+    completed = parser.feed('{"a": tru, "b": "bad \\x escape"]}')
+    assert (("a",), "tru") in completed
+    assert (("b",), "bad \\x escape") in completed
+
+
+@pytest.mark.unit
+def test_structured_parser_emits_one_partial_per_field_and_item():
+    parser = StructuredStreamParser()
+    partials = []
+    for chunk in chunks(json.dumps(DRAFT), 5):
+        partials.extend(parser.feed(chunk))
+
+    assert parser.message_type == "soap_draft"
+    assert parser.message == DRAFT
+    assert all(p["type"] == "partial" and p["parent_type"] == "soap_draft" for p in partials)
+    fields = [(p["field"], p.get("index")) for p in partials]
+    assert fields == [
+        ("soap_report.patient_name", None),
+        ("soap_report.patient_age", None),
+        ("soap_report.subjective", None),
+        ("soap_report.exercises", 0),
+        ("soap_report.exercises", 1),
+    ]
+    assert partials[2]["value"] == DRAFT["soap_report"]["subjective"]
+    assert partials[4]["value"] == {"name": "Bridge", "description": "Hold 10 s"}
+
+
+@pytest.mark.unit
+def test_structured_parser_reports_nested_lists_with_their_item():
+    parser = StructuredStreamParser()
+    message = {"type": "soap_draft", "soap_report": {"exercises": [{"name": "Bridge", "cues": ["Breathe"]}]}}
+    partials = parser.feed(json.dumps(message))
+    assert [(p["field"], p.get("index"), p["value"]) for p in partials] == [
+        ("soap_report.exercises", 0, message["soap_report"]["exercises"][0]),
+    ]
+
+
+@pytest.mark.unit
+def test_structured_parser_reports_top_level_fields_and_lists():
+    parser = StructuredStreamParser()
+    message = {"type": "chat_message", "content": "Hold each stretch for 30 seconds.", "suggestions": ["a", "b"]}
+    partials = parser.feed(json.dumps(message))
+
+    assert [(p["field"], p.get("index"), p["value"]) for p in partials] == [
+        ("content", None, "Hold each stretch for 30 seconds."),
+        ("suggestions", 0, "a"),
+        ("suggestions", 1, "b"),
+    ]
+
+
+@pytest.mark.unit
+def test_structured_parser_waits_for_the_message_type():
+    parser = StructuredStreamParser()
+    assert parser.feed('{"content": "early", "type": "chat_message"}') == []
+    assert parser.message == {"content": "early", "type": "chat_message"}
+
+
+@pytest.mark.integration
+def test_run_sse_structured_streams_partials_then_the_message(api_client, scripted_agent):
+    from motion.api.dependencies import APP_NAME
+
+    scripted_agent.replies.append(DRAFT)
+    api_client.post(f"/apps/{APP_NAME}/users/u1/sessions/s1")
+    response = api_client.post("/run_sse_structured", json={
+        "app_name": APP_NAME,
+        "user_id": "u1",
+        "session_id": "s1",
+        "new_message": {"role": "user", "parts": [{"text": "Patient John Doe, 45, lower back pain..."}]},
+    })
+
+    messages = [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+    assert [m["type"] for m in messages] == ["partial"] * 5 + ["soap_draft"]
+    assert messages[-1]["soap_report"]["exercises"][1]["name"] == "Bridge"
+
+
+def structured_run(api_client):
+    from motion.api.dependencies import APP_NAME
+
+    api_client.post(f"/apps/{APP_NAME}/users/u1/sessions/s1")
+    response = api_client.post("/run_sse_structured", json={
+        "app_name": APP_NAME,
+        "user_id": "u1",
+        "session_id": "s1",
+        "new_message": {"role": "user", "parts": [{"text": "How long should I hold a stretch?"}]},
+    })
+    return [json.loads(line[len("data: "):]) for line in response.text.splitlines() if line.startswith("data: ")]
+
+
+@pytest.mark.integration
+def test_run_sse_structured_parses_streamed_chunks_once(api_client, scripted_agent):
+    from google.adk.events import Event
+    from google.genai import types
+
+    def text_event(text, partial):
+        return Event(author="", partial=partial, content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+    reply = json.dumps({"type": "chat_message", "content": "Hold for 30 s"})
+    scripted_agent.replies.append([
+        text_event(reply[:20], True), text_event(reply[20:], True),
+        Event(author="", turn_complete=True),
+        text_event(reply, False),
+    ])
+
+    messages = structured_run(api_client)
+
+    assert [(m["type"], m.get("field")) for m in messages] == [("partial", "content"), ("chat_message", None)]
+    assert messages[-1]["content"] == "Hold for 30 s"
+
+
+@pytest.mark.integration
+def test_run_sse_structured_reports_agent_failures(api_client, scripted_agent):
+    scripted_agent.replies.append(RuntimeError("model unavailable"))
+    messages = structured_run(api_client)
+    assert [(m["type"], m["error"], m["details"]) for m in messages] == [("error", "Agent run failed", "model unavailable")]
@@ -0,0 +1,200 @@
+"""Tests for metrics, spans and model call metrics."""
+
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models import LlmResponse
+from google.genai import types
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+from motion import telemetry
+from motion.agents.soap_agents import model_metrics
+from motion.api.routes import ops
+from motion.telemetry import SPAN_SECONDS, MetricsRegistry, span, timed
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(telemetry, "_tracer", provider.get_tracer("test"))
+    return exporter
+
+
+@pytest.mark.unit
+def test_counter_and_histogram_render_prometheus_text():
+    registry = MetricsRegistry()
+    requests = registry.counter("t_requests_total", "Requests", ("route",))
+    requests.inc("/run")
+    requests.inc("/run", amount=2)
+    requests.inc('say "hi"\n')
+    latency = registry.histogram("t_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+    latency.observe(0.05, "/run")
+    latency.observe(0.5, "/run")
+    latency.observe(5.0, "/run")
+    registry.register_stats("t_cache", lambda: {"hits": 3, "ratio": 0.75, "enabled": True, "name": "x", "tier": {"disk": 2}})
+    registry.register_stats("t_broken", lambda: 1 / 0)
+
+    text = registry.render()
+
+    assert requests.value("/run") == 3
+    assert latency.count("/run") == 3
+    assert "# TYPE t_requests_total counter" in text
+    assert 't_requests_total{route="/run"} 3' in text
+    assert 't_requests_total{route="say \\"hi\\"\\n"} 1' in text
+    assert 't_seconds_bucket{route="/run",le="0.1"} 1' in text
+    assert 't_seconds_bucket{route="/run",le="1"} 2' in text
+    assert 't_seconds_bucket{route="/run",le="+Inf"} 3' in text
+    assert 't_seconds_sum{route="/run"} 5.55' in text
+    assert 't_seconds_count{route="/run"} 3' in text
+    assert "t_cache_hits 3" in text and "t_cache_ratio 0.75" in text and "t_cache_enabled 1" in text
+    assert "t_cache_tier_disk 2" in text and "t_cache_name" not in text
+    assert "# t_broken unavailable: division by zero" in text
+    assert "motion_process_info{pid=" in text
+
+
+@pytest.mark.unit
+def test_registry_returns_existing_metrics_and_rejects_type_clashes():
+    registry = MetricsRegistry()
+    assert registry.counter("t_total", "x") is registry.counter("t_total", "x")
+    with pytest.raises(ValueError, match="already registered"):
+        registry.histogram("t_total", "x")
+
+
+@pytest.mark.unit
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(telemetry, "METRICS_ENABLED", False)
+    counter = MetricsRegistry().counter("t_total", "x")
+    counter.inc()
+    assert counter.value() == 0
+    histogram = MetricsRegistry().histogram("t_seconds", "x")
+    histogram.observe(1.0)
+    assert histogram.count() == 0
+    assert timed("t.op") is telemetry._NOOP_SPAN
+    monkeypatch.setattr(telemetry, "TRACING_ENABLED", False)
+    with span("t.op") as s:
+        s.set_attribute("k", "v")
+        s.set_error("ignored")
+
+
+@pytest.mark.unit
+def test_untraced_span_still_records_its_outcome(monkeypatch):
+    monkeypatch.setattr(telemetry, "TRACING_ENABLED", False)
+    before = SPAN_SECONDS.count("t.untraced", "error")
+    with span("t.untraced") as s:
+        s.set_attribute("k", "v")
+        s.set_error("failed")
+    assert SPAN_SECONDS.count("t.untraced", "error") == before + 1
+
+
+@pytest.mark.unit
+def test_span_records_outcome_and_exports_trace(exporter):
+    before_ok = SPAN_SECONDS.count("t.span", "ok")
+    before_error = SPAN_SECONDS.count("t.span", "error")
+
+    with span("t.span", exercise="Bridge") as s:
+        s.set_attribute("results", 3)
+    with span("t.span") as s:
+        s.set_error("no results")
+    with pytest.raises(RuntimeError):
+        with span("t.span"):
+            raise RuntimeError("boom")
+
+    assert SPAN_SECONDS.count("t.span", "ok") == before_ok + 1
+    assert SPAN_SECONDS.count("t.span", "error") == before_error + 2
+    finished = exporter.get_finished_spans()
+    assert [s.name for s in finished] == ["t.span"] * 3
+    assert dict(finished[0].attributes) == {"exercise": "Bridge", "results": 3}
+    assert finished[1].status.status_code == StatusCode.ERROR
+
+
+@pytest.mark.unit
+def test_cancelled_blocks_are_not_errors(exporter):
+    import asyncio
+
+    before = SPAN_SECONDS.count("t.cancel", "cancelled")
+    with pytest.raises(asyncio.CancelledError):
+        with span("t.cancel"):
+            raise asyncio.CancelledError()
+    assert SPAN_SECONDS.count("t.cancel", "cancelled") == before + 1
+
+
+@pytest.mark.unit
+def test_timed_records_without_tracing(exporter):
+    before = SPAN_SECONDS.count("t.timed", "ok")
+    with timed("t.timed"):
+        pass
+    assert SPAN_SECONDS.count("t.timed", "ok") == before + 1
+    assert exporter.get_finished_spans() == ()
+
+
+@pytest.mark.unit
+def test_model_metrics_record_latency_first_chunk_and_tokens():
+    model = "t-model"
+    context = SimpleNamespace(invocation_id="inv-metrics")
+    latency_before = model_metrics.LLM_SECONDS.count(model, "ok")
+    prompt_before = model_metrics.LLM_TOKENS.value(model, "prompt")
+
+    model_metrics.start_model_timer(context, SimpleNamespace(model=model))
+    model_metrics.record_model_response(context, LlmResponse(partial=True))
+    model_metrics.record_model_response(context, LlmResponse(partial=True))
+    model_metrics.record_model_response(context, LlmResponse(usage_metadata=types.GenerateContentResponseUsageMetadata(
+        prompt_token_count=120, candidates_token_count=40, cached_content_token_count=100,
+    )))
+    # A response without a started call is ignored
+    model_metrics.record_model_response(context, LlmResponse())
+
+    assert model_metrics.LLM_FIRST_CHUNK_SECONDS.count(model) >= 1
+    assert model_metrics.LLM_SECONDS.count(model, "ok") == latency_before + 1
+    assert model_metrics.LLM_TOKENS.value(model, "prompt") == prompt_before + 120
+    assert model_metrics.LLM_TOKENS.value(model, "cached") >= 100
+
+
+@pytest.mark.unit
+def test_model_errors_are_labelled():
+    context = SimpleNamespace(invocation_id="inv-error")
+    before = model_metrics.LLM_SECONDS.count("t-model", "error")
+    model_metrics.start_model_timer(context, SimpleNamespace(model="t-model"))
+    model_metrics.record_model_response(context, LlmResponse(error_code="RESOURCE_EXHAUSTED"))
+    assert model_metrics.LLM_SECONDS.count("t-model", "error") == before + 1
+
+
+@pytest.mark.unit
+def test_model_metrics_skip_empty_usage_and_bound_tracked_calls(monkeypatch):
+    context = SimpleNamespace(invocation_id="inv-empty")
+    before = model_metrics.LLM_TOKENS.value("t-empty", "prompt")
+    model_metrics.start_model_timer(context, SimpleNamespace(model="t-empty"))
+    model_metrics.record_model_response(context, LlmResponse(usage_metadata=types.GenerateContentResponseUsageMetadata()))
+    assert model_metrics.LLM_TOKENS.value("t-empty", "prompt") == before
+
+    monkeypatch.setattr(model_metrics, "_MAX_TRACKED_CALLS", 1)
+    monkeypatch.setattr(model_metrics, "_calls", OrderedDict())
+    model_metrics.start_model_timer(SimpleNamespace(invocation_id="inv-a"), SimpleNamespace(model=None))
+    model_metrics.start_model_timer(SimpleNamespace(invocation_id="inv-b"), SimpleNamespace(model=None))
+    assert list(model_metrics._calls) == ["inv-b"]
+    assert model_metrics._calls["inv-b"].model == "unknown"
+
+
+@pytest.mark.unit
+def test_disabled_model_metrics_track_nothing(monkeypatch):
+    monkeypatch.setattr(model_metrics, "METRICS_ENABLED", False)
+    context = SimpleNamespace(invocation_id="inv-disabled")
+    assert model_metrics.start_model_timer(context, SimpleNamespace(model="t-model")) is None
+    assert "inv-disabled" not in model_metrics._calls
+    assert model_metrics.record_model_response(context, LlmResponse()) is None
+
+
+@pytest.mark.integration
+def test_metrics_endpoint(api_client, monkeypatch):
+    response = api_client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "motion_process_info" in response.text
+
+    monkeypatch.setattr(ops, "METRICS_ENABLED", False)
+    assert api_client.get("/metrics").status_code == 404